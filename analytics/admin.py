@@ -198,11 +198,13 @@ class AlertAdmin(admin.ModelAdmin):
         عمل دسته‌ای برای حل هشدارها
         """
         from django.utils import timezone
+        from .utils.alerting import invalidate_alert_state
         
         updated = queryset.filter(status='firing').update(
             status='resolved',
             resolved_at=timezone.now()
         )
+        invalidate_alert_state()
         
         self.message_user(
             request,
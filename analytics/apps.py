@@ -16,4 +16,5 @@ class AnalyticsConfig(AppConfig):
         """
         تنظیمات هنگام آماده شدن اپ
         """
-        pass
\ No newline at end of file
+        # اتصال سیگنال به‌روزرسانی sketch های زمان پاسخ
+        from . import signals  # noqa: F401
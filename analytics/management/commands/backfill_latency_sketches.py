@@ -0,0 +1,38 @@
+"""
+ساخت sketch های زمان پاسخ برای متریک‌های قدیمی
+Backfill latency sketches from existing performance metrics
+"""
+
+from django.core.management.base import BaseCommand
+
+from analytics.utils.sketches import backfill_latency_sketches
+
+
+class Command(BaseCommand):
+    """
+    ادغام PerformanceMetric های قبل از اولین sketch در جدول LatencySketch
+
+    پس از استقرار sketch ها یک بار اجرا می‌شود تا percentile های داشبورد
+    بازه‌های قبلی را هم پوشش دهند؛ ثبت‌های جدید از مسیر درج دسته‌ای به‌روز
+    می‌شوند و اجرای مجدد دستور ردیفی را دوباره نمی‌شمارد.
+
+    استفاده:
+        python manage.py backfill_latency_sketches
+        python manage.py backfill_latency_sketches --batch-size 2000
+    """
+    help = 'ساخت sketch های زمان پاسخ برای متریک‌های عملکرد موجود'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='تعداد متریک در هر ادغام',
+        )
+
+    def handle(self, *args, **options):
+        """اجرای backfill"""
+        batch_size = max(options['batch_size'], 1)
+        count = backfill_latency_sketches(batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f"{count} متریک عملکرد در sketch ها ادغام شد"))
@@ -4,8 +4,10 @@ Middleware برای ردیابی عملکرد درخواست‌های API
 import time
 import logging
 from django.utils.deprecation import MiddlewareMixin
-from django.urls import resolve
 from django.conf import settings
+from django.utils import timezone
+
+from ..utils.ingestion import get_endpoint_name, performance_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -40,32 +42,23 @@ class PerformanceTrackingMiddleware(MiddlewareMixin):
         else:
             response_time_ms = 0
         
-        # ثبت متریک عملکرد به صورت async
+        # ثبت متریک عملکرد در بافر درون‌پروسه (flush دسته‌ای)
         try:
-            from ..tasks import record_performance_metric_async
-            
-            # دریافت اطلاعات endpoint
-            try:
-                url_name = resolve(request.path_info).url_name or 'unknown'
-                endpoint = f"{resolve(request.path_info).namespace}:{url_name}" if resolve(request.path_info).namespace else url_name
-            except:
-                endpoint = request.path_info
-            
-            # ثبت متریک به صورت async
-            record_performance_metric_async.delay(
-                endpoint=endpoint,
-                method=request.method,
-                response_time_ms=response_time_ms,
-                status_code=response.status_code,
-                user_id=request.user.id if request.user.is_authenticated else None,
-                error_message=getattr(response, 'reason_phrase', '') if response.status_code >= 400 else '',
-                metadata={
+            performance_buffer.add({
+                'endpoint': get_endpoint_name(request),
+                'method': request.method,
+                'response_time_ms': response_time_ms,
+                'status_code': response.status_code,
+                'user_id': request.user.id if request.user.is_authenticated else None,
+                'error_message': getattr(response, 'reason_phrase', '') if response.status_code >= 400 else '',
+                'metadata': {
                     'path': request.path_info,
                     'query_params': dict(request.GET),
                     'content_type': response.get('Content-Type', ''),
                     'content_length': response.get('Content-Length', 0),
-                }
-            )
+                },
+                'timestamp': timezone.now(),
+            })
             
         except Exception as e:
             # در صورت خطا در ثبت متریک، لاگ کنیم اما response را متوقف نکنیم
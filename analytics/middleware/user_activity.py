@@ -4,7 +4,9 @@ Middleware برای ردیابی فعالیت‌های کاربران
 import logging
 from django.utils.deprecation import MiddlewareMixin
 from django.conf import settings
-from django.urls import resolve
+from django.utils import timezone
+
+from ..utils.ingestion import activity_buffer, get_resource_name
 
 logger = logging.getLogger(__name__)
 
@@ -39,8 +41,6 @@ class UserActivityTrackingMiddleware(MiddlewareMixin):
             return response
         
         try:
-            from ..tasks import record_user_activity_async
-            
             # تعیین نوع عمل بر اساس متد HTTP
             action_map = {
                 'POST': 'create',
@@ -51,12 +51,8 @@ class UserActivityTrackingMiddleware(MiddlewareMixin):
             }
             action = action_map.get(request.method, 'unknown')
             
-            # دریافت اطلاعات resource
-            try:
-                resolved = resolve(request.path_info)
-                resource = resolved.namespace or resolved.url_name or 'unknown'
-            except:
-                resource = request.path_info.split('/')[1] if len(request.path_info.split('/')) > 1 else 'unknown'
+            # دریافت اطلاعات resource (از resolver_match؛ بدون resolve مجدد)
+            resource = get_resource_name(request)
             
             # استخراج resource_id از path (در صورت وجود)
             resource_id = None
@@ -70,22 +66,23 @@ class UserActivityTrackingMiddleware(MiddlewareMixin):
             except:
                 pass
             
-            # ثبت فعالیت به صورت async
-            record_user_activity_async.delay(
-                user_id=request.user.id,
-                action=action,
-                resource=resource,
-                resource_id=resource_id,
-                ip_address=self._get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                session_id=request.session.session_key or '',
-                metadata={
+            # ثبت فعالیت در بافر درون‌پروسه (flush دسته‌ای)
+            activity_buffer.add({
+                'user_id': request.user.id,
+                'action': action,
+                'resource': resource,
+                'resource_id': resource_id,
+                'ip_address': self._get_client_ip(request),
+                'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+                'session_id': request.session.session_key or '',
+                'metadata': {
                     'path': request.path_info,
                     'method': request.method,
                     'status_code': response.status_code,
                     'content_type': response.get('Content-Type', ''),
-                }
-            )
+                },
+                'timestamp': timezone.now(),
+            })
             
         except Exception as e:
             # در صورت خطا در ثبت فعالیت، لاگ کنیم اما response را متوقف نکنیم
@@ -181,6 +181,152 @@ class PerformanceMetric(models.Model):
         return f"{self.method} {self.endpoint}: {self.response_time_ms}ms ({self.status_code})"
 
 
+class LatencySketch(models.Model):
+    """
+    sketch قابل ادغام زمان پاسخ برای هر endpoint در هر بازهٔ زمانی
+    """
+    endpoint = models.CharField(
+        max_length=255,
+        verbose_name='نقطه انتهایی',
+        help_text='مسیر API endpoint یا * برای همهٔ endpoint ها'
+    )
+    bucket_start = models.DateTimeField(
+        verbose_name='شروع بازه'
+    )
+    count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='تعداد درخواست'
+    )
+    total_ms = models.FloatField(
+        default=0,
+        verbose_name='مجموع زمان پاسخ (میلی‌ثانیه)'
+    )
+    sketch = models.JSONField(
+        default=dict,
+        verbose_name='sketch',
+        help_text='bucket های لگاریتمی DDSketch'
+    )
+
+    class Meta:
+        verbose_name = 'sketch زمان پاسخ'
+        verbose_name_plural = 'sketch های زمان پاسخ'
+        ordering = ['-bucket_start']
+        unique_together = ['endpoint', 'bucket_start']
+        indexes = [
+            models.Index(fields=['endpoint', 'bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} @ {self.bucket_start}: {self.count}"
+
+
+class AnalyticsRollup(models.Model):
+    """
+    ردیف تجمیعی از پیش محاسبه‌شده برای یک بازهٔ دقیقه‌ای، ساعتی یا روزانه
+    """
+    GRANULARITY_CHOICES = [
+        ('minute', 'دقیقه‌ای'),
+        ('hour', 'ساعتی'),
+        ('day', 'روزانه'),
+    ]
+
+    granularity = models.CharField(
+        max_length=10,
+        choices=GRANULARITY_CHOICES,
+        verbose_name='دانه‌بندی'
+    )
+    bucket_start = models.DateTimeField(
+        verbose_name='شروع بازه'
+    )
+    request_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='تعداد درخواست'
+    )
+    error_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='تعداد خطا'
+    )
+    response_time_sum = models.FloatField(
+        default=0,
+        verbose_name='مجموع زمان پاسخ (میلی‌ثانیه)'
+    )
+    activity_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='تعداد فعالیت'
+    )
+    encounter_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='تعداد ملاقات'
+    )
+    completed_encounter_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='تعداد ملاقات تکمیل شده'
+    )
+    active_users_hll = models.BinaryField(
+        null=True,
+        blank=True,
+        verbose_name='HyperLogLog کاربران فعال'
+    )
+    action_counts = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='تعداد هر عمل'
+    )
+    resource_counts = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='تعداد هر منبع'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='زمان بروزرسانی'
+    )
+
+    class Meta:
+        verbose_name = 'rollup تحلیلی'
+        verbose_name_plural = 'rollup های تحلیلی'
+        ordering = ['-bucket_start']
+        unique_together = ['granularity', 'bucket_start']
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} @ {self.bucket_start}: {self.request_count} req, {self.activity_count} act"
+
+
+class RollupCursor(models.Model):
+    """
+    آخرین شناسهٔ ردیف خام پردازش‌شده برای هر منبع rollup
+    """
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name='نام منبع'
+    )
+    position = models.BigIntegerField(
+        default=0,
+        verbose_name='آخرین شناسه'
+    )
+    pending_gaps = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='شکاف‌های شناسه',
+        help_text='بازه‌های [شروع، پایان، زمان مشاهده] از شناسه‌های کمتر از position که هنوز دیده نشده‌اند'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='زمان بروزرسانی'
+    )
+
+    class Meta:
+        verbose_name = 'نشانگر rollup'
+        verbose_name_plural = 'نشانگرهای rollup'
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+
 class BusinessMetric(models.Model):
     """
     مدل برای متریک‌های کسب و کار
@@ -8,7 +8,10 @@ from django.db.models import Count, Avg, Sum, Q
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
-from .models import Metric, UserActivity, PerformanceMetric, BusinessMetric, AlertRule, Alert
+from .models import Metric, UserActivity, PerformanceMetric, BusinessMetric, Alert
+from .utils.alerting import AlertRuleEngine
+from .utils.rollups import refresh_rollups, rollup_pipeline
+from .utils.sketches import merge_window
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -113,41 +116,16 @@ class AnalyticsService:
         Returns:
             دیکشنری شامل متریک‌های کسب و کار
         """
-        # متریک‌های encounter (در صورت وجود)
-        try:
-            from encounters.models import Encounter
-            total_encounters = Encounter.objects.filter(
-                created_at__range=[period_start, period_end]
-            ).count()
-            
-            completed_encounters = Encounter.objects.filter(
-                created_at__range=[period_start, period_end],
-                status='completed'
-            ).count()
-        except ImportError:
-            total_encounters = 0
-            completed_encounters = 0
-        
-        # متریک‌های فعالیت کاربر
-        active_users = UserActivity.objects.filter(
-            timestamp__range=[period_start, period_end]
-        ).values('user').distinct().count()
-        
-        # متریک‌های عملکرد
-        avg_response_time = PerformanceMetric.objects.filter(
-            timestamp__range=[period_start, period_end]
-        ).aggregate(avg_time=Avg('response_time_ms'))['avg_time'] or 0
-        
-        error_rate = PerformanceMetric.objects.filter(
-            timestamp__range=[period_start, period_end],
-            status_code__gte=400
-        ).count()
-        
-        total_requests = PerformanceMetric.objects.filter(
-            timestamp__range=[period_start, period_end]
-        ).count()
-        
-        error_rate_percent = (error_rate / total_requests * 100) if total_requests > 0 else 0
+        # همهٔ مقادیر از rollup های از پیش محاسبه‌شده خوانده می‌شوند
+        refresh_rollups()
+        summary = rollup_pipeline.summarize(period_start, period_end)
+        
+        total_encounters = summary['encounter_count']
+        completed_encounters = summary['completed_encounter_count']
+        active_users = summary['active_users']
+        total_requests = summary['request_count']
+        avg_response_time = summary['response_time_sum'] / total_requests if total_requests > 0 else 0
+        error_rate_percent = (summary['error_count'] / total_requests * 100) if total_requests > 0 else 0
         
         metrics = {
             'total_encounters': total_encounters,
@@ -183,9 +161,11 @@ class AnalyticsService:
         """
         cutoff_date = timezone.now() - timedelta(days=days)
         
-        queryset = UserActivity.objects.filter(timestamp__gte=cutoff_date)
-        if user_id:
-            queryset = queryset.filter(user_id=user_id)
+        if not user_id:
+            return self._get_user_analytics_from_rollups(cutoff_date, days)
+        
+        # تحلیل یک کاربر خاص با ایندکس (user, timestamp) محدود به فعالیت‌های همان کاربر است
+        queryset = UserActivity.objects.filter(timestamp__gte=cutoff_date, user_id=user_id)
         
         # تفکیک فعالیت‌ها
         activity_breakdown = queryset.values('action').annotate(
@@ -219,6 +199,31 @@ class AnalyticsService:
             'daily_activity': list(daily_activity)
         }
     
+    def _get_user_analytics_from_rollups(self, cutoff_date: datetime, days: int) -> Dict[str, Any]:
+        """تحلیل فعالیت همهٔ کاربران فقط از روی rollup ها"""
+        refresh_rollups()
+        summary = rollup_pipeline.summarize(cutoff_date)
+        
+        unique_users = summary['active_users']
+        total_activities = summary['activity_count']
+        avg_activities_per_user = total_activities / unique_users if unique_users > 0 else 0
+        
+        return {
+            'period_days': days,
+            'total_activities': total_activities,
+            'unique_users': unique_users,
+            'avg_activities_per_user': round(avg_activities_per_user, 2),
+            'activity_breakdown': [
+                {'action': action, 'count': count}
+                for action, count in summary['action_counts'].most_common()
+            ],
+            'resource_usage': [
+                {'resource': resource, 'count': count}
+                for resource, count in summary['resource_counts'].most_common(10)
+            ],
+            'daily_activity': summary['daily_activity']
+        }
+    
     def get_performance_analytics(self, days: int = 7) -> Dict[str, Any]:
         """
         دریافت تحلیل‌های عملکرد API
@@ -256,23 +261,20 @@ class AnalyticsService:
             count=Count('id')
         ).order_by('-count')[:10]
         
-        # محاسبه percentile (ساده شده)
-        response_times = list(metrics.values_list('response_time_ms', flat=True))
-        response_times.sort()
+        # percentile ها از ادغام sketch های بازه‌ها (بدون بارگذاری همهٔ زمان‌ها)
+        latency = merge_window(cutoff_date)
         
-        def percentile(data, p):
-            if not data:
-                return 0
-            index = int(len(data) * p / 100)
-            return data[min(index, len(data) - 1)]
+        def percentile(p):
+            value = latency.quantile(p / 100)
+            return round(value, 2) if value is not None else 0
         
         return {
             'period_days': days,
             'total_requests': total_requests,
             'avg_response_time_ms': round(avg_response_time, 2),
-            'p50_response_time_ms': percentile(response_times, 50),
-            'p95_response_time_ms': percentile(response_times, 95),
-            'p99_response_time_ms': percentile(response_times, 99),
+            'p50_response_time_ms': percentile(50),
+            'p95_response_time_ms': percentile(95),
+            'p99_response_time_ms': percentile(99),
             'status_breakdown': list(status_breakdown),
             'slowest_endpoints': list(slowest_endpoints),
             'error_breakdown': list(error_breakdown),
@@ -286,82 +288,12 @@ class AnalyticsService:
         Returns:
             لیست هشدارهای تولید شده
         """
-        triggered_alerts = []
-        
-        for rule in AlertRule.objects.filter(is_active=True):
-            try:
-                # دریافت مقادیر متریک اخیر
-                recent_metrics = Metric.objects.filter(
-                    name=rule.metric_name,
-                    timestamp__gte=timezone.now() - timedelta(minutes=5)
-                )
-                
-                if not recent_metrics.exists():
-                    continue
-                
-                # دریافت آخرین مقدار
-                latest_metric = recent_metrics.latest('timestamp')
-                metric_value = latest_metric.value
-                
-                # بررسی آستانه
-                should_fire = False
-                if rule.operator == 'gt' and metric_value > rule.threshold:
-                    should_fire = True
-                elif rule.operator == 'gte' and metric_value >= rule.threshold:
-                    should_fire = True
-                elif rule.operator == 'lt' and metric_value < rule.threshold:
-                    should_fire = True
-                elif rule.operator == 'lte' and metric_value <= rule.threshold:
-                    should_fire = True
-                elif rule.operator == 'eq' and metric_value == rule.threshold:
-                    should_fire = True
-                elif rule.operator == 'ne' and metric_value != rule.threshold:
-                    should_fire = True
-                
-                if should_fire:
-                    # بررسی اینکه آیا هشدار از قبل وجود دارد و در حال اجرا است
-                    existing_alert = Alert.objects.filter(
-                        rule=rule,
-                        status='firing'
-                    ).first()
-                    
-                    if not existing_alert:
-                        # ایجاد هشدار جدید
-                        alert = Alert.objects.create(
-                            rule=rule,
-                            status='firing',
-                            metric_value=metric_value,
-                            message=f"{rule.name}: {rule.metric_name} برابر {metric_value} است (آستانه: {rule.threshold})",
-                            metadata={
-                                'metric_timestamp': latest_metric.timestamp.isoformat(),
-                                'tags': latest_metric.tags
-                            }
-                        )
-                        
-                        triggered_alerts.append({
-                            'alert_id': alert.id,
-                            'rule_name': rule.name,
-                            'severity': rule.severity,
-                            'message': alert.message,
-                            'metric_value': metric_value,
-                            'threshold': rule.threshold
-                        })
-                
-                else:
-                    # حل هشدارهای در حال اجرا برای این قانون
-                    Alert.objects.filter(
-                        rule=rule,
-                        status='firing'
-                    ).update(
-                        status='resolved',
-                        resolved_at=timezone.now()
-                    )
-            
-            except Exception as e:
-                logger.error(f"خطا در بررسی قانون هشدار {rule.name}: {str(e)}")
-                continue
-        
-        return triggered_alerts
+        # یک کوئری برای آخرین مقدار همهٔ متریک‌ها، ارزیابی برداری و ثبت فقط تغییر وضعیت‌ها
+        try:
+            return AlertRuleEngine().run()
+        except Exception as e:
+            logger.error(f"خطا در بررسی قوانین هشدار: {str(e)}")
+            return []
     
     def get_system_overview(self) -> Dict[str, Any]:
         """
@@ -374,35 +306,17 @@ class AnalyticsService:
         last_24h = now - timedelta(hours=24)
         last_7d = now - timedelta(days=7)
         
-        # متریک‌های encounter
-        try:
-            from encounters.models import Encounter
-            encounters_24h = Encounter.objects.filter(created_at__gte=last_24h).count()
-            encounters_7d = Encounter.objects.filter(created_at__gte=last_7d).count()
-        except ImportError:
-            encounters_24h = 0
-            encounters_7d = 0
-        
-        # فعالیت کاربر
-        active_users_24h = UserActivity.objects.filter(
-            timestamp__gte=last_24h
-        ).values('user').distinct().count()
-        
-        # متریک‌های عملکرد
-        avg_response_time_24h = PerformanceMetric.objects.filter(
-            timestamp__gte=last_24h
-        ).aggregate(avg_time=Avg('response_time_ms'))['avg_time'] or 0
-        
-        error_rate_24h = PerformanceMetric.objects.filter(
-            timestamp__gte=last_24h,
-            status_code__gte=400
-        ).count()
-        
-        total_requests_24h = PerformanceMetric.objects.filter(
-            timestamp__gte=last_24h
-        ).count()
-        
-        error_rate_percent = (error_rate_24h / total_requests_24h * 100) if total_requests_24h > 0 else 0
+        # متریک‌ها از rollup ها؛ هزینه به حجم جداول خام وابسته نیست
+        refresh_rollups()
+        summary_24h = rollup_pipeline.summarize(last_24h, now)
+        summary_7d = rollup_pipeline.summarize(last_7d, now)
+        
+        encounters_24h = summary_24h['encounter_count']
+        encounters_7d = summary_7d['encounter_count']
+        active_users_24h = summary_24h['active_users']
+        total_requests_24h = summary_24h['request_count']
+        avg_response_time_24h = summary_24h['response_time_sum'] / total_requests_24h if total_requests_24h > 0 else 0
+        error_rate_percent = (summary_24h['error_count'] / total_requests_24h * 100) if total_requests_24h > 0 else 0
         
         # هشدارهای فعال
         active_alerts = Alert.objects.filter(status='firing').count()
@@ -35,6 +35,14 @@ ANALYTICS_SETTINGS = {
         'TRACK_ANONYMOUS_USERS': getattr(settings, 'ANALYTICS_TRACK_ANONYMOUS_USERS', False),
     },
     
+    # تنظیمات بافر ثبت دسته‌ای رویدادها
+    'INGESTION_BUFFER': {
+        'FLUSH_EVENTS': getattr(settings, 'ANALYTICS_BUFFER_FLUSH_EVENTS', 500),
+        'FLUSH_INTERVAL_MS': getattr(settings, 'ANALYTICS_BUFFER_FLUSH_INTERVAL_MS', 1000),
+        'CAPACITY': getattr(settings, 'ANALYTICS_BUFFER_CAPACITY', 20000),
+        'FLUSH_VIA_CELERY': getattr(settings, 'ANALYTICS_FLUSH_VIA_CELERY', False),
+    },
+    
     # تنظیمات هشدارها
     'ALERTS': {
         'ENABLED': getattr(settings, 'ANALYTICS_ALERTS_ENABLED', True),
@@ -50,6 +58,9 @@ ANALYTICS_SETTINGS = {
         'PERFORMANCE_METRICS_DAYS': getattr(settings, 'ANALYTICS_PERFORMANCE_RETENTION_DAYS', 30),
         'BUSINESS_METRICS_DAYS': getattr(settings, 'ANALYTICS_BUSINESS_METRICS_RETENTION_DAYS', 365),
         'ALERTS_DAYS': getattr(settings, 'ANALYTICS_ALERTS_RETENTION_DAYS', 90),
+        'ROLLUP_MINUTE_DAYS': getattr(settings, 'ANALYTICS_ROLLUP_MINUTE_RETENTION_DAYS', 2),
+        'ROLLUP_HOUR_DAYS': getattr(settings, 'ANALYTICS_ROLLUP_HOUR_RETENTION_DAYS', 90),
+        'ROLLUP_DAY_DAYS': getattr(settings, 'ANALYTICS_ROLLUP_DAY_RETENTION_DAYS', 730),
     },
     
     # تنظیمات گزارش‌گیری
@@ -63,6 +74,7 @@ ANALYTICS_SETTINGS = {
     # تنظیمات Celery Tasks
     'CELERY_TASKS': {
         'ALERT_CHECK_SCHEDULE': getattr(settings, 'ANALYTICS_ALERT_CHECK_SCHEDULE', 300.0),  # 5 دقیقه
+        'ROLLUP_SCHEDULE': getattr(settings, 'ANALYTICS_ROLLUP_SCHEDULE', 60.0),  # 1 دقیقه
         'HOURLY_METRICS_SCHEDULE': getattr(settings, 'ANALYTICS_HOURLY_METRICS_SCHEDULE', 3600.0),  # 1 ساعت
         'DAILY_METRICS_SCHEDULE': getattr(settings, 'ANALYTICS_DAILY_METRICS_SCHEDULE', 86400.0),  # 24 ساعت
         'CLEANUP_SCHEDULE': getattr(settings, 'ANALYTICS_CLEANUP_SCHEDULE', 86400.0),  # 24 ساعت
@@ -0,0 +1,26 @@
+"""
+سیگنال‌های اپ Analytics
+به‌روزرسانی sketch های زمان پاسخ برای متریک‌هایی که تکی ذخیره می‌شوند
+و باطل‌کردن وضعیت کش‌شدهٔ هشدارها
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Alert, PerformanceMetric
+from .utils.alerting import invalidate_alert_state
+from .utils.sketches import update_latency_sketches
+
+
+@receiver(post_save, sender=PerformanceMetric)
+def handle_performance_metric_saved(sender, instance, created, **kwargs):
+    """متریک عملکرد جدید: ادغام در sketch بازهٔ زمانی آن"""
+    if created:
+        update_latency_sketches([(instance.endpoint, instance.timestamp, instance.response_time_ms)])
+
+
+@receiver(post_save, sender=Alert)
+@receiver(post_delete, sender=Alert)
+def handle_alert_changed(sender, instance, **kwargs):
+    """تغییر هشدار خارج از موتور قوانین: بازخوانی وضعیت firing در اجرای بعدی"""
+    invalidate_alert_state()
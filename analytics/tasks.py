@@ -36,6 +36,25 @@ def check_alert_rules():
         }
 
 
+@shared_task
+def update_analytics_rollups():
+    """
+    پردازش افزایشی ردیف‌های خام جدید در rollup های دقیقه‌ای/ساعتی/روزانه
+    """
+    try:
+        from .utils.rollups import rollup_pipeline
+        
+        processed = rollup_pipeline.ingest()
+        return {'status': 'success', 'processed': processed}
+        
+    except Exception as e:
+        logger.error(f"خطا در به‌روزرسانی rollup ها: {str(e)}")
+        return {
+            'status': 'error',
+            'error': str(e)
+        }
+
+
 @shared_task
 def calculate_hourly_metrics():
     """
@@ -43,12 +62,17 @@ def calculate_hourly_metrics():
     """
     try:
         from .services import AnalyticsService
+        from .utils.rollups import rollup_pipeline
         
         # محاسبه متریک‌ها برای ساعت گذشته
         now = timezone.now()
         hour_start = now.replace(minute=0, second=0, microsecond=0)
         hour_end = hour_start + timedelta(hours=1)
         
+        # به‌روزرسانی rollup ها و شمارش ملاقات‌های امروز پیش از خواندن آن‌ها
+        rollup_pipeline.ingest()
+        rollup_pipeline.refresh_encounters(hour_start - timedelta(hours=1), hour_end)
+        
         analytics_service = AnalyticsService()
         metrics = analytics_service.calculate_business_metrics(hour_start, hour_end)
         
@@ -76,6 +100,7 @@ def calculate_daily_metrics():
     """
     try:
         from .services import AnalyticsService
+        from .utils.rollups import rollup_pipeline
         from datetime import date
         
         # محاسبه متریک‌ها برای دیروز
@@ -83,6 +108,10 @@ def calculate_daily_metrics():
         period_start = timezone.make_aware(datetime.combine(yesterday, datetime.min.time()))
         period_end = timezone.make_aware(datetime.combine(yesterday, datetime.max.time()))
         
+        # وضعیت نهایی ملاقات‌های دیروز در rollup ها
+        rollup_pipeline.ingest()
+        rollup_pipeline.refresh_encounters(period_start, period_end)
+        
         analytics_service = AnalyticsService()
         metrics = analytics_service.calculate_business_metrics(period_start, period_end)
         
@@ -108,19 +137,39 @@ def cleanup_old_metrics():
     پاک‌سازی متریک‌های قدیمی
     """
     try:
-        from .models import Metric, UserActivity, PerformanceMetric
+        from .models import Metric, UserActivity, PerformanceMetric, LatencySketch
+        from .utils.rollups import rollup_pipeline
         
         # پاک‌سازی داده‌های قدیمی‌تر از 30 روز
         cutoff_date = timezone.now() - timedelta(days=30)
         
+        # rollup ها پیش از حذف داده‌های خام به‌روز می‌شوند؛ فقط ردیف‌هایی حذف
+        # می‌شوند که cursor از آن‌ها گذشته و در شکاف‌های در انتظار بازخوانی
+        # نیستند (اگر ingest هم‌زمان در جریان باشد، بقیه در دور بعد پاک می‌شوند)
+        rollup_pipeline.ingest()
+        
         # حذف متریک‌های قدیمی
         deleted_metrics = Metric.objects.filter(timestamp__lt=cutoff_date).delete()
         
         # حذف فعالیت‌های قدیمی
-        deleted_activities = UserActivity.objects.filter(timestamp__lt=cutoff_date).delete()
+        deleted_activities = UserActivity.objects.filter(
+            rollup_pipeline.ingested_filter('activity'),
+            timestamp__lt=cutoff_date
+        ).delete()
         
         # حذف متریک‌های عملکرد قدیمی
-        deleted_performance = PerformanceMetric.objects.filter(timestamp__lt=cutoff_date).delete()
+        deleted_performance = PerformanceMetric.objects.filter(
+            rollup_pipeline.ingested_filter('performance'),
+            timestamp__lt=cutoff_date
+        ).delete()
+        
+        # sketch های زمان پاسخ کم‌حجم هستند و یک سال نگه داشته می‌شوند
+        deleted_sketches = LatencySketch.objects.filter(
+            bucket_start__lt=timezone.now() - timedelta(days=365)
+        ).delete()
+        
+        # rollup ها طبق دورهٔ نگهداری هر دانه‌بندی پاک می‌شوند
+        deleted_rollups = rollup_pipeline.prune()
         
         logger.info(f"پاک‌سازی داده‌های قدیمی کامل شد. حذف شده: {deleted_metrics[0]} متریک، {deleted_activities[0]} فعالیت، {deleted_performance[0]} متریک عملکرد")
         
@@ -129,7 +178,9 @@ def cleanup_old_metrics():
             'cutoff_date': cutoff_date.isoformat(),
             'deleted_metrics': deleted_metrics[0],
             'deleted_activities': deleted_activities[0],
-            'deleted_performance_metrics': deleted_performance[0]
+            'deleted_performance_metrics': deleted_performance[0],
+            'deleted_latency_sketches': deleted_sketches[0],
+            'deleted_rollups': deleted_rollups
         }
         
     except Exception as e:
@@ -259,4 +310,45 @@ def record_user_activity_async(user_id, action, resource='', resource_id=None,
         
     except Exception as e:
         logger.error(f"خطا در ثبت فعالیت کاربر async: {str(e)}")
-        return {'status': 'error', 'error': str(e)}
\ No newline at end of file
+        return {'status': 'error', 'error': str(e)}
+
+
+def _parse_batch_timestamps(rows):
+    from django.utils.dateparse import parse_datetime
+    
+    for row in rows:
+        if isinstance(row.get('timestamp'), str):
+            row['timestamp'] = parse_datetime(row['timestamp']) or timezone.now()
+    return rows
+
+
+@shared_task
+def record_performance_metrics_batch(rows):
+    """
+    ثبت دسته‌ای متریک‌های عملکرد (یک task برای هر flush بافر)
+    """
+    try:
+        from .utils.ingestion import write_performance_metrics
+        
+        write_performance_metrics(_parse_batch_timestamps(rows))
+        return {'status': 'success', 'count': len(rows)}
+        
+    except Exception as e:
+        logger.error(f"خطا در ثبت دسته‌ای متریک‌های عملکرد: {str(e)}")
+        return {'status': 'error', 'error': str(e)}
+
+
+@shared_task
+def record_user_activities_batch(rows):
+    """
+    ثبت دسته‌ای فعالیت‌های کاربران (یک task برای هر flush بافر)
+    """
+    try:
+        from .utils.ingestion import write_user_activities
+        
+        write_user_activities(_parse_batch_timestamps(rows))
+        return {'status': 'success', 'count': len(rows)}
+        
+    except Exception as e:
+        logger.error(f"خطا در ثبت دسته‌ای فعالیت‌های کاربران: {str(e)}")
+        return {'status': 'error', 'error': str(e)}
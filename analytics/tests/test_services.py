@@ -287,4 +287,360 @@ class InsightsServiceTest(TestCase):
         self.assertIn('uptime', metrics)
         self.assertIn('users_active', metrics)
         self.assertEqual(metrics['uptime'], 100)
-        self.assertEqual(metrics['users_active'], 0)
\ No newline at end of file
+        self.assertEqual(metrics['users_active'], 0)
+
+
+class IngestionBufferTest(TestCase):
+    """
+    تست‌های بافر ثبت دسته‌ای رویدادها
+    """
+    
+    def setUp(self):
+        """
+        تنظیمات اولیه برای تست‌ها
+        """
+        self.user = User.objects.create_user(
+            username='bufferuser',
+            password='testpass123'
+        )
+    
+    def test_flush_writes_batch(self):
+        """
+        تست نوشتن دسته‌ای متریک‌ها با یک flush
+        """
+        from ..utils.ingestion import EventBuffer, write_performance_metrics
+        
+        buffer = EventBuffer('test', write_performance_metrics, flush_every=1000, interval_ms=60000)
+        for i in range(5):
+            buffer.add({
+                'endpoint': 'api:test',
+                'method': 'GET',
+                'response_time_ms': 10 + i,
+                'status_code': 200,
+                'user_id': self.user.id,
+                'error_message': '',
+                'metadata': {},
+                'timestamp': timezone.now(),
+            })
+        
+        self.assertEqual(PerformanceMetric.objects.count(), 0)
+        self.assertEqual(buffer.flush(), 5)
+        self.assertEqual(PerformanceMetric.objects.filter(endpoint='api:test').count(), 5)
+        self.assertEqual(len(buffer), 0)
+    
+    def test_ring_buffer_drops_oldest_when_full(self):
+        """
+        تست محدود ماندن حافظه بافر
+        """
+        from ..utils.ingestion import EventBuffer
+        
+        flushed = []
+        buffer = EventBuffer('test', flushed.extend, flush_every=1000, interval_ms=60000, capacity=3)
+        for i in range(5):
+            buffer.add({'i': i})
+        
+        self.assertEqual(buffer.dropped, 2)
+        buffer.flush()
+        self.assertEqual([e['i'] for e in flushed], [2, 3, 4])
+    
+    def test_flush_skips_deleted_users(self):
+        """
+        تست اینکه کاربر حذف‌شده کل دستهٔ بافر را از بین نمی‌برد
+        """
+        from ..utils.ingestion import write_performance_metrics, write_user_activities
+        
+        deleted_user = User.objects.create_user(username='deleteduser', password='testpass123')
+        deleted_id = deleted_user.id
+        deleted_user.delete()
+        now = timezone.now()
+        
+        write_user_activities([
+            {'user_id': user_id, 'action': 'view', 'resource': 'test', 'timestamp': now}
+            for user_id in (self.user.id, deleted_id)
+        ])
+        write_performance_metrics([
+            {
+                'endpoint': 'api:deleted',
+                'method': 'GET',
+                'response_time_ms': 10,
+                'status_code': 200,
+                'user_id': user_id,
+                'timestamp': now,
+            }
+            for user_id in (self.user.id, deleted_id)
+        ])
+        
+        self.assertEqual(
+            list(UserActivity.objects.filter(resource='test').values_list('user_id', flat=True)),
+            [self.user.id]
+        )
+        self.assertEqual(
+            sorted(
+                PerformanceMetric.objects.filter(endpoint='api:deleted').values_list('user_id', flat=True),
+                key=lambda user_id: user_id or 0
+            ),
+            [None, self.user.id]
+        )
+
+
+class LatencySketchTest(TestCase):
+    """
+    تست‌های sketch های زمان پاسخ
+    """
+    
+    def test_sketch_merge_and_quantiles(self):
+        """
+        تست دقت نسبی quantile پس از ادغام sketch ها
+        """
+        from ..utils.sketches import DDSketch
+        
+        first, second = DDSketch(), DDSketch()
+        for value in range(1, 501):
+            first.add(value)
+        for value in range(501, 1001):
+            second.add(value)
+        merged = DDSketch.from_dict(first.to_dict()).merge(second)
+        
+        self.assertEqual(merged.count, 1000)
+        self.assertAlmostEqual(merged.quantile(0.5), 500, delta=500 * 0.01 + 1)
+        self.assertAlmostEqual(merged.quantile(0.99), 990, delta=990 * 0.01 + 1)
+    
+    def test_performance_analytics_uses_sketches(self):
+        """
+        تست به‌روزرسانی sketch ها هنگام ثبت و محاسبه percentile از آن‌ها
+        """
+        from ..models import LatencySketch
+        from ..utils.ingestion import write_performance_metrics
+        
+        now = timezone.now()
+        write_performance_metrics([
+            {
+                'endpoint': 'api:sketch',
+                'method': 'GET',
+                'response_time_ms': value,
+                'status_code': 200,
+                'timestamp': now,
+            }
+            for value in range(1, 101)
+        ])
+        
+        self.assertTrue(LatencySketch.objects.filter(endpoint='api:sketch', count=100).exists())
+        self.assertTrue(LatencySketch.objects.filter(endpoint='*', count=100).exists())
+        
+        analytics = AnalyticsService().get_performance_analytics(days=1)
+        self.assertEqual(analytics['total_requests'], 100)
+        self.assertAlmostEqual(analytics['p50_response_time_ms'], 50, delta=2)
+        self.assertAlmostEqual(analytics['p99_response_time_ms'], 99, delta=2)
+    
+    def test_backfill_covers_rows_before_first_sketch(self):
+        """
+        تست ساخت sketch برای متریک‌های ثبت‌شده پیش از استقرار sketch ها
+        """
+        from ..models import LatencySketch
+        from ..utils.ingestion import write_performance_metrics
+        from ..utils.sketches import backfill_latency_sketches
+        
+        old = timezone.now() - timedelta(hours=3)
+        # bulk_create مستقیم: ردیف‌های قدیمی که هیچ sketch ای ندارند
+        PerformanceMetric.objects.bulk_create([
+            PerformanceMetric(
+                endpoint='api:old',
+                method='GET',
+                response_time_ms=value,
+                status_code=200,
+                timestamp=old,
+            )
+            for value in range(1, 51)
+        ])
+        write_performance_metrics([
+            {
+                'endpoint': 'api:new',
+                'method': 'GET',
+                'response_time_ms': 10,
+                'status_code': 200,
+                'timestamp': timezone.now(),
+            }
+        ])
+        
+        self.assertEqual(backfill_latency_sketches(batch_size=20), 50)
+        self.assertEqual(backfill_latency_sketches(), 0)
+        self.assertTrue(LatencySketch.objects.filter(endpoint='api:old', count=50).exists())
+        
+        analytics = AnalyticsService().get_performance_analytics(days=1)
+        self.assertEqual(analytics['total_requests'], 51)
+        self.assertAlmostEqual(analytics['p50_response_time_ms'], 25, delta=2)
+
+
+class RollupPipelineTest(TestCase):
+    """
+    تست‌های rollup های افزایشی داشبورد
+    """
+    
+    def setUp(self):
+        """
+        تنظیمات اولیه برای تست‌ها
+        """
+        self.users = [
+            User.objects.create_user(username=f'rollupuser{i}', password='testpass123')
+            for i in range(3)
+        ]
+    
+    def test_hyperloglog_counts_distinct_values(self):
+        """
+        تست تخمین کاربران یکتا پس از ادغام
+        """
+        from ..utils.rollups import HyperLogLog
+        
+        first, second = HyperLogLog(), HyperLogLog()
+        for value in range(500):
+            first.add(value)
+        for value in range(250, 1000):
+            second.add(value)
+        merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+        
+        self.assertAlmostEqual(merged.count(), 1000, delta=50)
+    
+    def test_ingest_is_incremental(self):
+        """
+        تست پردازش فقط ردیف‌های خام جدید و خواندن پنجره از rollup ها
+        """
+        from ..models import AnalyticsRollup
+        from ..utils.rollups import RollupPipeline
+        
+        pipeline = RollupPipeline()
+        for user in self.users:
+            UserActivity.objects.create(user=user, action='login', resource='auth')
+        UserActivity.objects.create(user=self.users[0], action='view_profile', resource='profile')
+        PerformanceMetric.objects.create(endpoint='api:a', method='GET', response_time_ms=100, status_code=200)
+        PerformanceMetric.objects.create(endpoint='api:a', method='GET', response_time_ms=300, status_code=500)
+        
+        self.assertEqual(pipeline.ingest(), 6)
+        self.assertEqual(pipeline.ingest(), 0)
+        self.assertEqual(AnalyticsRollup.objects.filter(granularity='day').count(), 1)
+        
+        summary = pipeline.summarize(timezone.now() - timedelta(days=1))
+        self.assertEqual(summary['activity_count'], 4)
+        self.assertEqual(summary['active_users'], 3)
+        self.assertEqual(summary['request_count'], 2)
+        self.assertEqual(summary['error_count'], 1)
+        self.assertEqual(summary['response_time_sum'], 400)
+        self.assertEqual(summary['action_counts']['login'], 3)
+        
+        overview = AnalyticsService().get_system_overview()
+        self.assertEqual(overview['total_requests_24h'], 2)
+        self.assertEqual(overview['active_users_24h'], 3)
+        self.assertEqual(overview['error_rate_24h_percent'], 50.0)
+    
+    def test_ingest_picks_up_rows_committed_behind_cursor(self):
+        """
+        تست شمارش ردیفی که پس از عبور cursor با شناسهٔ کوچک‌تر commit می‌شود
+        """
+        from ..utils.rollups import RollupPipeline
+        
+        pipeline = RollupPipeline()
+        first = UserActivity.objects.create(user=self.users[0], action='login')
+        UserActivity.objects.create(id=first.id + 2, user=self.users[1], action='login')
+        self.assertEqual(pipeline.ingest(), 2)
+        
+        # تراکنشی که شناسهٔ first.id + 1 را گرفته بود دیرتر commit می‌شود
+        late = UserActivity.objects.create(id=first.id + 1, user=self.users[2], action='login')
+        ingested = UserActivity.objects.filter(pipeline.ingested_filter('activity'))
+        self.assertFalse(ingested.filter(pk=late.pk).exists())
+        
+        self.assertEqual(pipeline.ingest(), 1)
+        self.assertEqual(pipeline.ingest(), 0)
+        ingested = UserActivity.objects.filter(pipeline.ingested_filter('activity'))
+        self.assertTrue(ingested.filter(pk=late.pk).exists())
+        summary = pipeline.summarize(timezone.now() - timedelta(days=1))
+        self.assertEqual(summary['activity_count'], 3)
+        self.assertEqual(summary['active_users'], 3)
+    
+    def test_ingest_max_chunks_leaves_backlog(self):
+        """
+        تست محدود بودن به‌روزرسانی درون‌درخواستی به یک دور
+        """
+        from ..utils.rollups import RollupPipeline
+        
+        pipeline = RollupPipeline(chunk_size=2)
+        for _ in range(5):
+            UserActivity.objects.create(user=self.users[0], action='login', resource='auth')
+        
+        self.assertEqual(pipeline.ingest(max_chunks=1), 2)
+        self.assertEqual(pipeline.ingest(), 3)
+    
+    def test_cleanup_ingests_before_deleting_raw_rows(self):
+        """
+        تست ثبت ردیف‌های قدیمی در rollup پیش از حذف داده‌های خام
+        """
+        from ..models import AnalyticsRollup
+        from ..tasks import cleanup_old_metrics
+        
+        activity = UserActivity.objects.create(user=self.users[0], action='login', resource='auth')
+        old = timezone.now() - timedelta(days=31)
+        UserActivity.objects.filter(pk=activity.pk).update(timestamp=old)
+        
+        result = cleanup_old_metrics()
+        
+        self.assertEqual(result['deleted_activities'], 1)
+        self.assertEqual(
+            sum(AnalyticsRollup.objects.filter(granularity='day').values_list('activity_count', flat=True)),
+            1
+        )
+
+
+class AlertRuleEngineTest(TestCase):
+    """
+    تست‌های موتور ارزیابی دسته‌ای قوانین هشدار
+    """
+    
+    def setUp(self):
+        """
+        تنظیمات اولیه برای تست‌ها
+        """
+        from ..utils.alerting import invalidate_alert_state
+        
+        invalidate_alert_state()
+        self.addCleanup(invalidate_alert_state)
+    
+    def test_vectorized_operators(self):
+        """
+        تست ارزیابی برداری همهٔ عملگرها
+        """
+        import numpy as np
+        from ..utils.alerting import evaluate_operators
+        
+        operators = np.array(['gt', 'gte', 'lt', 'lte', 'eq', 'ne', 'gt'])
+        values = np.array([10.0, 5.0, 1.0, 5.0, 5.0, 5.0, 1.0])
+        thresholds = np.full(7, 5.0)
+        
+        result = evaluate_operators(values, operators, thresholds)
+        self.assertEqual(result.tolist(), [True, True, True, True, True, False, False])
+    
+    def test_only_state_transitions_hit_database(self):
+        """
+        تست ایجاد یک هشدار برای چند اجرای پیاپی و حل آن پس از برگشت مقدار
+        """
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from ..utils.alerting import AlertRuleEngine
+        
+        rules = [
+            AlertRule.objects.create(name=f'rule-{i}', metric_name=f'metric_{i}', operator='gt', threshold=50.0)
+            for i in range(5)
+        ]
+        for i in range(5):
+            Metric.objects.create(name=f'metric_{i}', value=100.0 if i < 3 else 10.0)
+        
+        engine = AlertRuleEngine()
+        self.assertEqual(len(engine.run()), 3)
+        
+        # بدون تغییر وضعیت: فقط خواندن قوانین و آخرین مقدارها
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(engine.run(), [])
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(Alert.objects.filter(status='firing').count(), 3)
+        
+        Metric.objects.create(name='metric_0', value=1.0)
+        engine.run()
+        self.assertFalse(Alert.objects.filter(rule=rules[0], status='firing').exists())
+        self.assertEqual(Alert.objects.filter(status='firing').count(), 2)
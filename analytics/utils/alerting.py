@@ -0,0 +1,142 @@
+"""
+موتور ارزیابی دسته‌ای قوانین هشدار
+Batched AlertRule evaluation
+
+در هر اجرا:
+- آخرین مقدار همهٔ متریک‌های مورد ارجاع با یک کوئری (subquery همبسته) خوانده می‌شود
+- عملگرهای همهٔ قوانین به‌صورت برداری با numpy ارزیابی می‌شوند
+- وضعیت firing قوانین در کش نگه داشته می‌شود و فقط تغییر وضعیت‌ها
+  (ایجاد یا حل هشدار) به دیتابیس نوشته می‌شوند
+"""
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ALERT_STATE_CACHE_KEY = 'analytics:alerts:firing'
+ALERT_STATE_TTL = getattr(settings, 'ANALYTICS_ALERT_STATE_TTL', 300)
+METRIC_LOOKBACK = timedelta(minutes=getattr(settings, 'ANALYTICS_ALERT_LOOKBACK_MINUTES', 5))
+
+OPERATORS = ('gt', 'gte', 'lt', 'lte', 'eq', 'ne')
+
+
+def get_firing_rule_ids() -> Set[int]:
+    """شناسهٔ قوانینی که هشدار firing دارند (از کش، در نبود آن از دیتابیس)"""
+    from ..models import Alert
+
+    firing = cache.get(ALERT_STATE_CACHE_KEY)
+    if firing is None:
+        firing = set(Alert.objects.filter(status='firing').values_list('rule_id', flat=True))
+        cache.set(ALERT_STATE_CACHE_KEY, firing, ALERT_STATE_TTL)
+    return set(firing)
+
+
+def invalidate_alert_state() -> None:
+    """پس از تغییر هشدارها خارج از موتور (ادمین، API) فراخوانی می‌شود"""
+    cache.delete(ALERT_STATE_CACHE_KEY)
+
+
+def latest_metric_values(names, since) -> Dict[str, Dict[str, Any]]:
+    """آخرین مقدار هر متریک از زمان since، با یک کوئری"""
+    from ..models import Metric
+
+    if not names:
+        return {}
+    latest_id = Metric.objects.filter(
+        name=OuterRef('name'), timestamp__gte=since
+    ).order_by('-timestamp', '-id').values('id')[:1]
+    rows = Metric.objects.filter(
+        name__in=names, timestamp__gte=since, id=Subquery(latest_id)
+    ).values('name', 'value', 'timestamp', 'tags')
+    return {row['name']: row for row in rows}
+
+
+def evaluate_operators(values: np.ndarray, operators: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """ارزیابی برداری ``value <op> threshold`` برای همهٔ قوانین"""
+    conditions = [operators == op for op in OPERATORS]
+    choices = [
+        values > thresholds,
+        values >= thresholds,
+        values < thresholds,
+        values <= thresholds,
+        values == thresholds,
+        values != thresholds,
+    ]
+    return np.select(conditions, choices, default=False)
+
+
+class AlertRuleEngine:
+    """
+    ارزیابی همهٔ قوانین فعال در یک اجرا و ثبت فقط تغییر وضعیت‌ها
+    """
+
+    def __init__(self, lookback: timedelta = METRIC_LOOKBACK):
+        self.lookback = lookback
+
+    def run(self, now: Optional[Any] = None) -> List[Dict[str, Any]]:
+        from ..models import Alert, AlertRule
+
+        now = now or timezone.now()
+        rules = list(AlertRule.objects.filter(is_active=True).only(
+            'id', 'name', 'metric_name', 'operator', 'threshold', 'severity'
+        ))
+        if not rules:
+            return []
+
+        latest = latest_metric_values({rule.metric_name for rule in rules}, now - self.lookback)
+        # قوانین بدون مقدار اخیر بدون تغییر وضعیت رد می‌شوند
+        rules = [rule for rule in rules if rule.metric_name in latest]
+        if not rules:
+            return []
+
+        values = np.array([latest[rule.metric_name]['value'] for rule in rules], dtype=np.float64)
+        thresholds = np.array([rule.threshold for rule in rules], dtype=np.float64)
+        operators = np.array([rule.operator for rule in rules])
+        should_fire = evaluate_operators(values, operators, thresholds)
+
+        firing = get_firing_rule_ids()
+        to_fire = [rule for rule, fire in zip(rules, should_fire) if fire and rule.id not in firing]
+        to_resolve = [rule.id for rule, fire in zip(rules, should_fire) if not fire and rule.id in firing]
+
+        triggered_alerts = []
+        if to_fire:
+            alerts = Alert.objects.bulk_create([
+                Alert(
+                    rule=rule,
+                    status='firing',
+                    metric_value=latest[rule.metric_name]['value'],
+                    message=f"{rule.name}: {rule.metric_name} برابر {latest[rule.metric_name]['value']} است (آستانه: {rule.threshold})",
+                    metadata={
+                        'metric_timestamp': latest[rule.metric_name]['timestamp'].isoformat(),
+                        'tags': latest[rule.metric_name]['tags'],
+                    },
+                    fired_at=now,
+                )
+                for rule in to_fire
+            ])
+            for rule, alert in zip(to_fire, alerts):
+                triggered_alerts.append({
+                    'alert_id': alert.id,
+                    'rule_name': rule.name,
+                    'severity': rule.severity,
+                    'message': alert.message,
+                    'metric_value': alert.metric_value,
+                    'threshold': rule.threshold
+                })
+                firing.add(rule.id)
+        if to_resolve:
+            Alert.objects.filter(rule_id__in=to_resolve, status='firing').update(
+                status='resolved',
+                resolved_at=now
+            )
+            firing.difference_update(to_resolve)
+        if to_fire or to_resolve:
+            cache.set(ALERT_STATE_CACHE_KEY, firing, ALERT_STATE_TTL)
+        return triggered_alerts
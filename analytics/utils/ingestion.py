@@ -0,0 +1,236 @@
+"""
+بافر درون‌پروسه برای ثبت دسته‌ای PerformanceMetric و UserActivity
+
+به‌جای یک Celery task و یک INSERT برای هر درخواست HTTP، رویدادها در یک
+ring buffer جمع می‌شوند و هر N رویداد یا هر T میلی‌ثانیه با bulk_create
+نوشته می‌شوند (یا در صورت تنظیم، به‌صورت یک task دسته‌ای به Celery ارسال
+می‌شوند).
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+FLUSH_EVERY_EVENTS = getattr(settings, 'ANALYTICS_BUFFER_FLUSH_EVENTS', 500)
+FLUSH_INTERVAL_MS = getattr(settings, 'ANALYTICS_BUFFER_FLUSH_INTERVAL_MS', 1000)
+BUFFER_CAPACITY = getattr(settings, 'ANALYTICS_BUFFER_CAPACITY', 20000)
+FLUSH_VIA_CELERY = getattr(settings, 'ANALYTICS_FLUSH_VIA_CELERY', False)
+
+
+class EventBuffer:
+    """
+    ring buffer با ظرفیت ثابت و flush دسته‌ای در thread پس‌زمینه
+
+    در صورت پر شدن بافر (مثلاً قطعی دیتابیس) قدیمی‌ترین رویدادها کنار
+    گذاشته می‌شوند تا حافظهٔ پروسه محدود بماند.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_func: Callable[[List[Dict[str, Any]]], None],
+        flush_every: int = FLUSH_EVERY_EVENTS,
+        interval_ms: int = FLUSH_INTERVAL_MS,
+        capacity: int = BUFFER_CAPACITY,
+    ):
+        self.name = name
+        self.flush_func = flush_func
+        self.flush_every = flush_every
+        self.interval = interval_ms / 1000.0
+        self._events = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def add(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            should_wake = len(self._events) >= self.flush_every
+        self._ensure_worker()
+        if should_wake:
+            self._wakeup.set()
+
+    def drain(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def flush(self) -> int:
+        """نوشتن همهٔ رویدادهای بافر؛ تعداد رویدادها را برمی‌گرداند"""
+        with self._flush_lock:
+            events = self.drain()
+            if not events:
+                return 0
+            for start in range(0, len(events), self.flush_every):
+                batch = events[start:start + self.flush_every]
+                try:
+                    self.flush_func(batch)
+                except Exception as e:
+                    logger.error(f"خطا در flush بافر {self.name} ({len(batch)} رویداد): {str(e)}")
+            return len(events)
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, name=f'analytics-{self.name}-flusher', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+def _existing_user_ids(rows: List[Dict[str, Any]]) -> set:
+    """
+    شناسهٔ کاربرانی از دسته که هنوز وجود دارند؛ کاربر حذف‌شده نباید کل
+    bulk_create دسته را با خطای کلید خارجی از بین ببرد
+    """
+    from django.contrib.auth import get_user_model
+
+    user_ids = {row['user_id'] for row in rows if row.get('user_id')}
+    if not user_ids:
+        return set()
+    return set(
+        get_user_model().objects.filter(id__in=user_ids).values_list('id', flat=True)
+    )
+
+
+def write_performance_metrics(rows: List[Dict[str, Any]]) -> None:
+    """درج دسته‌ای متریک‌های عملکرد"""
+    from ..models import PerformanceMetric
+    from .sketches import update_latency_sketches
+
+    # مانند ثبت تکی، متریک کاربر حذف‌شده بدون کاربر ذخیره می‌شود
+    user_ids = _existing_user_ids(rows)
+    for row in rows:
+        if row.get('user_id') and row['user_id'] not in user_ids:
+            row['user_id'] = None
+
+    metrics = PerformanceMetric.objects.bulk_create(
+        [PerformanceMetric(**row) for row in rows],
+        batch_size=FLUSH_EVERY_EVENTS,
+    )
+    # bulk_create سیگنال post_save ندارد؛ sketch ها اینجا به‌روز می‌شوند
+    update_latency_sketches(
+        (metric.endpoint, metric.timestamp, metric.response_time_ms) for metric in metrics
+    )
+
+
+def write_user_activities(rows: List[Dict[str, Any]]) -> None:
+    """درج دسته‌ای فعالیت‌های کاربران"""
+    from ..models import UserActivity
+
+    # مانند ثبت تکی، فعالیت کاربر حذف‌شده کنار گذاشته می‌شود
+    user_ids = _existing_user_ids(rows)
+    skipped = [row for row in rows if row.get('user_id') not in user_ids]
+    if skipped:
+        logger.error(f"{len(skipped)} فعالیت به دلیل یافت نشدن کاربر ثبت نشد")
+
+    UserActivity.objects.bulk_create(
+        [UserActivity(**row) for row in rows if row.get('user_id') in user_ids],
+        batch_size=FLUSH_EVERY_EVENTS,
+    )
+
+
+def _flush_performance(rows: List[Dict[str, Any]]) -> None:
+    if FLUSH_VIA_CELERY:
+        from ..tasks import record_performance_metrics_batch
+
+        record_performance_metrics_batch.delay(rows)
+    else:
+        write_performance_metrics(rows)
+
+
+def _flush_activities(rows: List[Dict[str, Any]]) -> None:
+    if FLUSH_VIA_CELERY:
+        from ..tasks import record_user_activities_batch
+
+        record_user_activities_batch.delay(rows)
+    else:
+        write_user_activities(rows)
+
+
+performance_buffer = EventBuffer('performance', _flush_performance)
+activity_buffer = EventBuffer('activity', _flush_activities)
+
+
+@atexit.register
+def _flush_on_exit():
+    for buffer in (performance_buffer, activity_buffer):
+        try:
+            buffer.flush()
+        except Exception:
+            pass
+
+
+def _format_endpoint(namespace: str, url_name: Optional[str]) -> str:
+    url_name = url_name or 'unknown'
+    return f"{namespace}:{url_name}" if namespace else url_name
+
+
+@lru_cache(maxsize=4096)
+def _endpoint_for_route(route: str, namespace: str, url_name: Optional[str]) -> str:
+    return _format_endpoint(namespace, url_name)
+
+
+@lru_cache(maxsize=2048)
+def _resolve_path(path: str) -> Optional[tuple]:
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    return match.namespace, match.url_name
+
+
+def get_endpoint_name(request) -> str:
+    """
+    نام endpoint درخواست: از resolver_match که Django قبلاً ساخته استفاده
+    می‌شود و نتیجه برای هر الگوی URL کش می‌شود؛ فقط در نبود آن resolve
+    (با کش مسیر) اجرا می‌شود.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        return _endpoint_for_route(match.route, match.namespace, match.url_name)
+    resolved = _resolve_path(request.path_info)
+    if resolved is None:
+        return request.path_info
+    return _format_endpoint(*resolved)
+
+
+def get_resource_name(request) -> str:
+    """نام منبع برای فعالیت کاربر (namespace یا نام URL)"""
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        return match.namespace or match.url_name or 'unknown'
+    resolved = _resolve_path(request.path_info)
+    if resolved is not None:
+        namespace, url_name = resolved
+        return namespace or url_name or 'unknown'
+    parts = request.path_info.split('/')
+    return parts[1] if len(parts) > 1 else 'unknown'
@@ -0,0 +1,256 @@
+"""
+sketch های quantile قابل ادغام برای زمان پاسخ (به سبک DDSketch)
+Mergeable latency sketches for streaming percentiles
+
+هر مقدار در bucket لگاریتمی ``ceil(log_gamma(v))`` شمرده می‌شود که در آن
+``gamma = (1 + alpha) / (1 - alpha)``؛ بنابراین هر quantile با خطای نسبی
+حداکثر ``alpha`` برگردانده می‌شود. ادغام دو sketch جمع شمارنده‌های bucket ها
+است، پس sketch های هر endpoint در هر بازهٔ زمانی هنگام ثبت به‌روز می‌شوند و
+percentile هر پنجرهٔ دلخواه از ادغام چند صد sketch به‌دست می‌آید.
+"""
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+RELATIVE_ACCURACY = getattr(settings, 'ANALYTICS_SKETCH_RELATIVE_ACCURACY', 0.01)
+MAX_BINS = getattr(settings, 'ANALYTICS_SKETCH_MAX_BINS', 2048)
+BUCKET_SECONDS = getattr(settings, 'ANALYTICS_SKETCH_BUCKET_SECONDS', 3600)
+
+# ردیف تجمیعی همهٔ endpoint ها تا داشبورد کلی فقط یک sketch در هر بازه بخواند
+ALL_ENDPOINTS = '*'
+
+
+class DDSketch:
+    """
+    sketch با bucket های لگاریتمی و حافظهٔ محدود (حداکثر ``max_bins`` bucket)
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, max_bins: int = MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _key(self, value: float) -> int:
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _value(self, key: int) -> float:
+        # نقطهٔ میانی bucket از نظر خطای نسبی
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        if count <= 0:
+            return
+        value = float(value)
+        if value <= 0:
+            self.zero_count += count
+        else:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: 'DDSketch') -> 'DDSketch':
+        if other.gamma != self.gamma:
+            raise ValueError('Cannot merge sketches with different relative accuracy')
+        if not other.count:
+            return self
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def _collapse(self) -> None:
+        """ادغام کوچک‌ترین bucket ها؛ دقت quantile های بالا حفظ می‌شود"""
+        keys = sorted(self.bins)
+        overflow = len(keys) - self.max_bins
+        target = keys[overflow]
+        for key in keys[:overflow]:
+            self.bins[target] += self.bins.pop(key)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        q = min(max(q, 0.0), 1.0)
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return min(max(self._value(key), self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'alpha': self.relative_accuracy,
+            'bins': {str(key): count for key, count in self.bins.items()},
+            'zero': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> 'DDSketch':
+        data = data or {}
+        sketch = cls(relative_accuracy=data.get('alpha', RELATIVE_ACCURACY))
+        sketch.bins = {int(key): int(count) for key, count in (data.get('bins') or {}).items()}
+        sketch.zero_count = int(data.get('zero', 0))
+        sketch.count = int(data.get('count', 0))
+        sketch.sum = float(data.get('sum', 0.0))
+        sketch.min = data.get('min')
+        sketch.max = data.get('max')
+        return sketch
+
+
+def bucket_start(timestamp: datetime) -> datetime:
+    """ابتدای بازهٔ sketch ای که timestamp در آن قرار می‌گیرد"""
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % BUCKET_SECONDS, tz=timestamp.tzinfo)
+
+
+def update_latency_sketches(samples: Iterable[Tuple[str, datetime, float]]) -> int:
+    """
+    ادغام نمونه‌های (endpoint, timestamp, response_time_ms) در sketch های ذخیره‌شده
+
+    نمونه‌ها ابتدا در حافظه بر اساس (endpoint, بازه) گروه‌بندی می‌شوند و سپس
+    برای هر گروه یک ردیف LatencySketch قفل، ادغام و ذخیره می‌شود.
+    خروجی: تعداد ردیف‌های sketch به‌روز شده
+    """
+    groups: Dict[Tuple[str, datetime], DDSketch] = {}
+    for endpoint, timestamp, response_time_ms in samples:
+        start = bucket_start(timestamp)
+        for key in ((endpoint, start), (ALL_ENDPOINTS, start)):
+            sketch = groups.get(key)
+            if sketch is None:
+                sketch = groups[key] = DDSketch()
+            sketch.add(response_time_ms)
+    if not groups:
+        return 0
+
+    try:
+        _persist_sketches(groups)
+    except IntegrityError:
+        # ردیف همان بازه هم‌زمان در پروسهٔ دیگری ساخته شده؛ این بار ادغام می‌شود
+        _persist_sketches(groups)
+    return len(groups)
+
+
+def _persist_sketches(groups: Dict[Tuple[str, datetime], DDSketch]) -> None:
+    from ..models import LatencySketch
+
+    endpoints = {endpoint for endpoint, _ in groups}
+    starts = {start for _, start in groups}
+    with transaction.atomic():
+        existing = LatencySketch.objects.select_for_update().filter(
+            endpoint__in=endpoints, bucket_start__in=starts
+        )
+        to_update = []
+        seen = set()
+        for row in existing:
+            key = (row.endpoint, row.bucket_start)
+            incoming = groups.get(key)
+            if incoming is None:
+                continue
+            merged = DDSketch.from_dict(row.sketch).merge(incoming)
+            row.sketch = merged.to_dict()
+            row.count = merged.count
+            row.total_ms = merged.sum
+            to_update.append(row)
+            seen.add(key)
+        if to_update:
+            LatencySketch.objects.bulk_update(to_update, ['sketch', 'count', 'total_ms'])
+        to_create = [
+            LatencySketch(
+                endpoint=endpoint,
+                bucket_start=start,
+                sketch=sketch.to_dict(),
+                count=sketch.count,
+                total_ms=sketch.sum,
+            )
+            for (endpoint, start), sketch in groups.items()
+            if (endpoint, start) not in seen
+        ]
+        if to_create:
+            LatencySketch.objects.bulk_create(to_create)
+
+
+def backfill_latency_sketches(before: Optional[datetime] = None, batch_size: int = 5000) -> int:
+    """
+    ساخت sketch برای PerformanceMetric های ثبت‌شده پیش از اولین sketch
+
+    ردیف‌های قبل از ``before`` (پیش‌فرض: ابتدای قدیمی‌ترین بازهٔ sketch موجود)
+    خوانده و در sketch ها ادغام می‌شوند؛ بازه‌هایی که از ثبت زنده sketch دارند
+    دوباره شمرده نمی‌شوند و اجرای مجدد کاری انجام نمی‌دهد.
+    خروجی: تعداد ردیف‌های خوانده‌شده
+    """
+    from django.utils import timezone
+    from ..models import LatencySketch, PerformanceMetric
+
+    if before is None:
+        earliest = (
+            LatencySketch.objects.filter(endpoint=ALL_ENDPOINTS)
+            .order_by('bucket_start')
+            .values_list('bucket_start', flat=True)
+            .first()
+        )
+        before = earliest or timezone.now()
+
+    rows = (
+        PerformanceMetric.objects.filter(timestamp__lt=before)
+        .order_by('id')
+        .values_list('endpoint', 'timestamp', 'response_time_ms')
+    )
+    processed = 0
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            update_latency_sketches(batch)
+            processed += len(batch)
+            batch = []
+    if batch:
+        update_latency_sketches(batch)
+        processed += len(batch)
+    return processed
+
+
+def merge_window(since: datetime, until: Optional[datetime] = None, endpoint: str = ALL_ENDPOINTS) -> DDSketch:
+    """
+    sketch ادغام‌شدهٔ یک پنجرهٔ زمانی؛ بازهٔ ابتدایی کامل در نظر گرفته می‌شود
+    (دقت لبهٔ پنجره به اندازهٔ ``BUCKET_SECONDS`` است)
+    """
+    from ..models import LatencySketch
+
+    queryset = LatencySketch.objects.filter(endpoint=endpoint, bucket_start__gte=bucket_start(since))
+    if until is not None:
+        queryset = queryset.filter(bucket_start__lte=until)
+    merged = DDSketch()
+    for data in queryset.values_list('sketch', flat=True).iterator(chunk_size=500):
+        merged.merge(DDSketch.from_dict(data))
+    return merged
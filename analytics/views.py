@@ -19,6 +19,7 @@ from .serializers import (
     PerformanceAnalyticsQuerySerializer, BusinessMetricsQuerySerializer
 )
 from .services import AnalyticsService
+from .utils.alerting import invalidate_alert_state
 
 logger = logging.getLogger(__name__)
 
@@ -205,6 +206,7 @@ class AlertViewSet(viewsets.ReadOnlyModelViewSet):
                 status='resolved',
                 resolved_at=timezone.now()
             )
+            invalidate_alert_state()
             
             return Response({
                 'message': f'{updated_count} هشدار حل شد',
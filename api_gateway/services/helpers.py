@@ -5,10 +5,11 @@ import logging
 from typing import Dict, Tuple, Any, Optional
 from datetime import datetime, timedelta
 from django.utils import timezone
-from django.core.cache import cache
 from django.conf import settings
 from rest_framework.request import Request
 
+from helssa.rate_limiter import rate_limiter
+
 from ..models import RateLimitTracker
 
 
@@ -78,75 +79,24 @@ class GatewayHelpers:
             if not getattr(settings, 'API_GATEWAY_RATE_LIMIT_ENABLED', True):
                 return True, {'rate_limit': 'disabled'}
             
-            window_start = timezone.now() - timedelta(minutes=window_minutes)
-            
-            # کلید cache برای سرعت بیشتر
-            cache_key = f"rate_limit:{user.id if user else 'anon'}:{ip_address}:{endpoint}"
+            # شمارنده‌های اتمیک پنجرهٔ لغزان (بدون read-modify-write و بدون نوشتن در دیتابیس)
+            identifier = f"api_gateway:{user.id if user else 'anon'}:{ip_address}:{endpoint}"
+            result = rate_limiter.hit(identifier, limit, window_minutes * 60)
             
-            # بررسی cache
-            cached_count = cache.get(cache_key)
-            if cached_count is not None:
-                if cached_count >= limit:
-                    return False, {
-                        'error': 'Rate limit exceeded',
-                        'message': 'تعداد درخواست‌ها بیش از حد مجاز است',
-                        'limit': limit,
-                        'window_minutes': window_minutes,
-                        'retry_after': window_minutes * 60
-                    }
-                
-                # افزایش شمارنده
-                cache.set(cache_key, cached_count + 1, window_minutes * 60)
-                
-                return True, {
-                    'requests_count': cached_count + 1,
+            if not result.allowed:
+                return False, {
+                    'error': 'Rate limit exceeded',
+                    'message': 'تعداد درخواست‌ها بیش از حد مجاز است',
                     'limit': limit,
-                    'remaining': limit - (cached_count + 1)
+                    'window_minutes': window_minutes,
+                    'retry_after': result.retry_after
                 }
             
-            # اگر در cache نبود، از دیتابیس بررسی کن
-            if user:
-                tracker, created = RateLimitTracker.objects.get_or_create(
-                    user=user,
-                    ip_address=ip_address,
-                    endpoint=endpoint,
-                    window_start__gte=window_start,
-                    defaults={
-                        'request_count': 1,
-                        'window_start': timezone.now()
-                    }
-                )
-                
-                if not created:
-                    if tracker.request_count >= limit:
-                        return False, {
-                            'error': 'Rate limit exceeded',
-                            'message': 'تعداد درخواست‌ها بیش از حد مجاز است',
-                            'limit': limit,
-                            'window_minutes': window_minutes,
-                            'retry_after': window_minutes * 60
-                        }
-                    
-                    tracker.request_count += 1
-                    tracker.save()
-                
-                # ذخیره در cache
-                cache.set(cache_key, tracker.request_count, window_minutes * 60)
-                
-                return True, {
-                    'requests_count': tracker.request_count,
-                    'limit': limit,
-                    'remaining': limit - tracker.request_count
-                }
-            else:
-                # برای کاربران ناشناس از cache استفاده کن
-                cache.set(cache_key, 1, window_minutes * 60)
-                
-                return True, {
-                    'requests_count': 1,
-                    'limit': limit,
-                    'remaining': limit - 1
-                }
+            return True, {
+                'requests_count': result.count,
+                'limit': limit,
+                'remaining': result.remaining
+            }
                 
         except Exception as e:
             self.logger.error(f"Rate limit check error: {str(e)}")
@@ -15,4 +15,7 @@ class BillingConfig(AppConfig):
     
     def ready(self):
         """راه‌اندازی اولیه اپ"""
-        import billing.signals  # noqa F401
\ No newline at end of file
+        try:
+            import billing.signals  # noqa F401
+        except ImportError:
+            pass
\ No newline at end of file
@@ -464,7 +464,7 @@ class BillingOrchestrator:
         transaction = transaction_service.create_transaction(
             wallet=user.wallet,
             amount=-amount,  # منفی برای پرداخت
-            type='payment',
+            transaction_type='payment',
             description=input_data.get('description', ''),
             metadata=input_data.get('metadata', {})
         )
@@ -482,11 +482,20 @@ class BillingOrchestrator:
     
     def _update_user_balance(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """به‌روزرسانی موجودی کاربر"""
+        from ..services.ledger_service import LedgerService, LedgerEntry
+        
         user = context['user']
         amount = context['results']['validate_payment_request']['amount']
+        pending = context['results']['create_payment_transaction'].get('transaction')
         
-        # به‌روزرسانی موجودی
-        user.wallet.withdraw(amount, "Payment processed")
+        # کسر موجودی و تکمیل تراکنش پرداخت زیر قفل کیف پول
+        LedgerService().post(LedgerEntry(
+            wallet=user.wallet,
+            amount=-amount,
+            type='payment',
+            description='Payment processed',
+            transaction=pending
+        ))
         
         return {
             'balance_updated': True,
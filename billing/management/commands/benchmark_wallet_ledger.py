@@ -0,0 +1,153 @@
+"""
+بنچمارک رقابت هم‌زمان روی دفتر کل کیف پول
+Wallet ledger contention benchmark
+"""
+
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from billing.models import Transaction, TransactionType, Wallet
+from billing.services.ledger_service import LedgerEntry, LedgerService
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    چند thread هم‌زمان روی یک کیف پول واریز و برداشت ثبت می‌کنند
+
+    در پایان موجودی نهایی با مقدار مورد انتظار و تعداد تراکنش‌ها با تعداد
+    ثبت‌های موفق مقایسه می‌شود (به‌روزرسانی گم‌شده نباید وجود داشته باشد).
+
+    استفاده:
+        python manage.py benchmark_wallet_ledger --threads 8 --operations 200
+        python manage.py benchmark_wallet_ledger --batch-size 50
+    """
+    help = 'بنچمارک رقابت هم‌زمان ثبت‌های دفتر کل روی یک کیف پول'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='تعداد thread هم‌زمان',
+        )
+        parser.add_argument(
+            '--operations',
+            type=int,
+            default=200,
+            help='تعداد ثبت هر thread',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1,
+            help='تعداد ثبت در هر فراخوانی post_batch (1 یعنی ثبت تکی)',
+        )
+        parser.add_argument(
+            '--amount',
+            type=int,
+            default=1000,
+            help='مبلغ هر ثبت به ریال',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='حذف‌نکردن کیف پول و تراکنش‌های آزمایشی',
+        )
+
+    def handle(self, *args, **options):
+        """اجرای بنچمارک"""
+        threads = options['threads']
+        operations = options['operations']
+        batch_size = max(options['batch_size'], 1)
+        amount = Decimal(options['amount'])
+
+        user = User.objects.create_user(
+            phone_number='09' + ''.join(random.choices('0123456789', k=9)),
+            user_type='patient'
+        )
+        # موجودی اولیه برای بدترین حالت (همهٔ برداشت‌ها پیش از واریزها)
+        initial = amount * threads * operations
+        wallet = Wallet.objects.create(user=user, balance=initial)
+
+        lock = threading.Lock()
+        latencies = []
+        stats = {'entries': 0, 'net': Decimal('0'), 'errors': 0}
+
+        def worker(seed: int):
+            ledger = LedgerService()
+            rng = random.Random(seed)
+            try:
+                local_wallet = Wallet.objects.get(pk=wallet.pk)
+                remaining = operations
+                while remaining > 0:
+                    size = min(batch_size, remaining)
+                    remaining -= size
+                    entries = []
+                    for _ in range(size):
+                        deposit = rng.random() < 0.5
+                        entries.append(LedgerEntry(
+                            wallet=local_wallet,
+                            amount=amount if deposit else -amount,
+                            type=TransactionType.DEPOSIT if deposit else TransactionType.WITHDRAWAL,
+                            description='benchmark'
+                        ))
+                    started = time.perf_counter()
+                    try:
+                        ledger.post_batch(entries)
+                    except Exception:
+                        with lock:
+                            stats['errors'] += 1
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        stats['entries'] += size
+                        stats['net'] += sum(entry.amount for entry in entries)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        duration = time.perf_counter() - started
+
+        wallet.refresh_from_db()
+        recorded = Transaction.objects.filter(wallet=wallet).count()
+        expected = initial + stats['net']
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000 if latencies else 0
+
+        self.stdout.write(f"threads={threads} operations={operations} batch_size={batch_size}")
+        self.stdout.write(
+            f"ثبت موفق: {stats['entries']} | خطا: {stats['errors']} | "
+            f"زمان: {duration:.2f}s | توان: {stats['entries'] / duration:.0f} ثبت/ثانیه"
+        )
+        self.stdout.write(f"تاخیر هر فراخوانی: p50={p50:.1f}ms p99={p99:.1f}ms")
+
+        consistent = wallet.balance == expected and recorded == stats['entries']
+        message = (
+            f"موجودی نهایی {wallet.balance:,} (مورد انتظار {expected:,})، "
+            f"تراکنش‌ها {recorded} (مورد انتظار {stats['entries']})"
+        )
+        if consistent:
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stdout.write(self.style.ERROR(message))
+
+        if not options['keep']:
+            Transaction.objects.filter(wallet=wallet).delete()
+            wallet.delete()
+            user.delete()
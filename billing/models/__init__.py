@@ -5,11 +5,11 @@ Financial System Models
 
 from .base import BaseModel
 from .wallet import Wallet
-from .transaction import Transaction, TransactionType, TransactionStatus
-from .plan import SubscriptionPlan
-from .subscription import Subscription
-from .invoice import Invoice
-from .commission import Commission
+from .transaction import Transaction, TransactionType, TransactionStatus, PaymentGateway
+from .plan import SubscriptionPlan, PlanType, FeatureType
+from .subscription import Subscription, SubscriptionStatus, BillingCycle, PaymentMethod
+from .invoice import Invoice, InvoiceItem, InvoiceStatus, InvoiceType
+from .commission import Commission, CommissionStatus, CommissionType, Settlement
 
 __all__ = [
     'BaseModel',
@@ -17,8 +17,20 @@ __all__ = [
     'Transaction',
     'TransactionType',
     'TransactionStatus',
+    'PaymentGateway',
     'SubscriptionPlan',
+    'PlanType',
+    'FeatureType',
     'Subscription',
+    'SubscriptionStatus',
+    'BillingCycle',
+    'PaymentMethod',
     'Invoice',
+    'InvoiceItem',
+    'InvoiceStatus',
+    'InvoiceType',
     'Commission',
-]
\ No newline at end of file
+    'CommissionStatus',
+    'CommissionType',
+    'Settlement',
+]
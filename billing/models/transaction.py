@@ -229,7 +229,11 @@ class Transaction(BaseModel):
         )
         
     def create_refund(self, amount: Decimal = None, description: str = '') -> 'Transaction':
-        """ایجاد تراکنش بازگشت"""
+        """
+        ایجاد تراکنش بازگشت در وضعیت در انتظار
+        
+        واریز مبلغ و تکمیل تراکنش با LedgerService انجام می‌شود.
+        """
         if not self.can_be_refunded():
             raise ValueError("این تراکنش قابل بازگشت نیست")
             
@@ -241,7 +245,7 @@ class Transaction(BaseModel):
             wallet=self.wallet,
             amount=refund_amount,
             type=TransactionType.REFUND,
-            status=TransactionStatus.COMPLETED,
+            status=TransactionStatus.PENDING,
             reference_number=f"REF_{self.reference_number}",
             related_transaction=self,
             description=description or f"بازگشت تراکنش {self.reference_number}",
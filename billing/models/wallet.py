@@ -4,7 +4,7 @@ Digital Wallet Model
 """
 
 from decimal import Decimal
-from django.db import models, transaction
+from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.utils import timezone
@@ -85,6 +85,35 @@ class Wallet(BaseModel):
         verbose_name='محدودیت برداشت ماهانه'
     )
     
+    # شمارنده‌های جاری برداشت (با دفتر کل و زیر قفل کیف پول به‌روز می‌شوند؛
+    # با رسیدن روز/ماه جدید به‌صورت تنبل صفر در نظر گرفته می‌شوند)
+    daily_withdrawn = models.DecimalField(
+        max_digits=12,
+        decimal_places=0,
+        default=0,
+        verbose_name='برداشت روز جاری'
+    )
+    
+    daily_withdrawn_date = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name='روز شمارنده برداشت'
+    )
+    
+    monthly_withdrawn = models.DecimalField(
+        max_digits=12,
+        decimal_places=0,
+        default=0,
+        verbose_name='برداشت ماه جاری'
+    )
+    
+    monthly_withdrawn_period = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name='ماه شمارنده برداشت',
+        help_text='روز اول ماه شمارنده؛ خالی یعنی شمارنده‌ها هنوز مقداردهی نشده‌اند'
+    )
+    
     # زمان آخرین تراکنش
     last_transaction_at = models.DateTimeField(
         null=True,
@@ -118,6 +147,20 @@ class Wallet(BaseModel):
                 gift_amount = self.gift_credit
         return self.available_balance + gift_amount
         
+    def daily_withdrawal_total(self, today=None) -> Decimal:
+        """کل برداشت روز جاری از شمارنده"""
+        today = today or timezone.localdate()
+        if self.daily_withdrawn_date != today:
+            return Decimal('0')
+        return self.daily_withdrawn
+        
+    def monthly_withdrawal_total(self, today=None) -> Decimal:
+        """کل برداشت ماه جاری از شمارنده"""
+        today = today or timezone.localdate()
+        if self.monthly_withdrawn_period != today.replace(day=1):
+            return Decimal('0')
+        return self.monthly_withdrawn
+        
     def has_sufficient_balance(self, amount: Decimal) -> bool:
         """بررسی کفایت موجودی"""
         return self.total_credit >= amount
@@ -130,59 +173,84 @@ class Wallet(BaseModel):
             amount > 0
         )
         
-    @transaction.atomic
     def deposit(self, amount: Decimal, description: str = '') -> bool:
-        """واریز به کیف پول"""
+        """
+        واریز به کیف پول
+        
+        فقط موجودی را با یک UPDATE اتمیک تغییر می‌دهد و تراکنشی ثبت نمی‌کند؛
+        واریزهای دارای تراکنش از LedgerService عبور می‌کنند.
+        """
         if amount <= 0:
             return False
             
-        self.balance += amount
-        self.last_transaction_at = timezone.now()
-        self.save()
-        
-        return True
+        return self._update_balances(
+            Wallet.objects.filter(pk=self.pk, is_active=True),
+            balance=models.F('balance') + amount,
+            last_transaction_at=timezone.now()
+        )
         
-    @transaction.atomic
     def withdraw(self, amount: Decimal, description: str = '') -> bool:
-        """برداشت از کیف پول"""
-        if not self.can_withdraw(amount):
+        """
+        برداشت از کیف پول
+        
+        کفایت موجودی قابل استفاده در شرط همان UPDATE بررسی می‌شود. تراکنش و
+        شمارنده‌های سقف برداشت فقط در LedgerService به‌روز می‌شوند.
+        """
+        if amount <= 0:
             return False
             
-        self.balance -= amount
-        self.last_transaction_at = timezone.now()
-        self.save()
-        
-        return True
+        return self._update_balances(
+            Wallet.objects.filter(
+                pk=self.pk,
+                is_active=True,
+                balance__gte=models.F('blocked_balance') + amount
+            ),
+            balance=models.F('balance') - amount,
+            last_transaction_at=timezone.now()
+        )
         
-    @transaction.atomic
     def block_amount(self, amount: Decimal) -> bool:
-        """بلوک کردن مبلغ"""
-        if self.available_balance < amount:
-            return False
-            
-        self.blocked_balance += amount
-        self.save()
-        return True
+        """بلوک کردن مبلغ با یک UPDATE شرطی روی موجودی قابل استفاده"""
+        return self._update_balances(
+            Wallet.objects.filter(
+                pk=self.pk,
+                is_active=True,
+                balance__gte=models.F('blocked_balance') + amount
+            ),
+            blocked_balance=models.F('blocked_balance') + amount
+        )
         
-    @transaction.atomic
     def unblock_amount(self, amount: Decimal) -> bool:
-        """آزاد کردن مبلغ بلوک شده"""
-        if self.blocked_balance < amount:
+        """آزاد کردن مبلغ بلوک‌شده با یک UPDATE شرطی"""
+        return self._update_balances(
+            Wallet.objects.filter(pk=self.pk, blocked_balance__gte=amount),
+            blocked_balance=models.F('blocked_balance') - amount
+        )
+        
+    def _update_balances(self, queryset, **changes) -> bool:
+        """
+        اعمال تغییر موجودی روی ردیف پایگاه داده (نه نمونهٔ حافظه)
+        
+        نمونه پس از تغییر از پایگاه داده خوانده می‌شود تا ذخیرهٔ کامل بعدی
+        مقدار قدیمی را بازنویسی نکند.
+        """
+        changes['updated_at'] = timezone.now()
+        if not queryset.update(**changes):
             return False
-            
-        self.blocked_balance -= amount
-        self.save()
+        self.refresh_from_db(
+            fields=['balance', 'blocked_balance', 'last_transaction_at', 'updated_at']
+        )
         return True
         
     def verify_wallet(self):
         """تأیید کیف پول"""
         self.is_verified = True
         self.verified_at = timezone.now()
-        self.save()
+        self.save(update_fields=['is_verified', 'verified_at', 'updated_at'])
         
     def expire_gift_credit(self):
         """منقضی کردن اعتبار هدیه"""
         if self.gift_credit > 0:
             self.gift_credit = 0
             self.gift_credit_expires_at = None
-            self.save()
\ No newline at end of file
+            self.save(update_fields=['gift_credit', 'gift_credit_expires_at', 'updated_at'])
\ No newline at end of file
@@ -5,6 +5,10 @@ Financial System Services
 
 from .base_service import BaseService
 from .wallet_service import WalletService
+from .ledger_service import (
+    LedgerService, LedgerEntry, LedgerError,
+    InsufficientBalanceError, InactiveWalletError, WithdrawalLimitError
+)
 from .transaction_service import TransactionService
 from .payment_service import PaymentService
 from .subscription_service import SubscriptionService
@@ -16,6 +20,12 @@ from .security_service import SecurityService
 __all__ = [
     'BaseService',
     'WalletService',
+    'LedgerService',
+    'LedgerEntry',
+    'LedgerError',
+    'InsufficientBalanceError',
+    'InactiveWalletError',
+    'WithdrawalLimitError',
     'TransactionService',
     'PaymentService',
     'SubscriptionService',
@@ -0,0 +1,352 @@
+"""
+موتور دفتر کل کیف پول
+Wallet Ledger Engine
+
+هر ثبت (تکی یا دسته‌ای) در یک تراکنش پایگاه داده انجام می‌شود: کیف پول‌های
+درگیر به ترتیب شناسه قفل می‌شوند (select_for_update، بدون deadlock)، کفایت
+موجودی قابل استفاده برای برداشت خالص هر کیف پول بررسی می‌شود، موجودی‌ها با یک
+bulk_update و تراکنش‌های تکمیل‌شده با یک bulk_create نوشته می‌شوند. تعداد
+queryها مستقل از تعداد ثبت‌ها است و به‌روزرسانی هم‌زمان گم نمی‌شود.
+
+شمارنده‌های برداشت روزانه/ماهانه روی همان ردیف کیف پول و در همان تراکنش
+به‌روز می‌شوند؛ بررسی سقف برداشت یک مقایسهٔ ساده زیر قفل است و با شروع
+روز یا ماه جدید شمارنده به‌صورت تنبل صفر می‌شود.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.db import transaction as db_transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .base_service import BaseService
+from ..models import Wallet, Transaction, TransactionStatus, TransactionType
+
+
+class LedgerError(Exception):
+    """خطای ثبت در دفتر کل"""
+    
+    code = 'ledger_error'
+    
+    def __init__(self, message: str, wallet_id: Optional[str] = None):
+        super().__init__(message)
+        self.wallet_id = wallet_id
+
+
+class InsufficientBalanceError(LedgerError):
+    """موجودی قابل استفاده کافی نیست"""
+    
+    code = 'insufficient_balance'
+    
+    def __init__(self, wallet_id: str, available: Decimal, required: Decimal):
+        super().__init__(
+            f'موجودی کافی نیست. موجودی قابل استفاده: {available:,} ریال',
+            wallet_id
+        )
+        self.available = available
+        self.required = required
+
+
+class InactiveWalletError(LedgerError):
+    """کیف پول غیرفعال یا ناموجود است"""
+    
+    code = 'wallet_inactive'
+
+
+class WithdrawalLimitError(LedgerError):
+    """سقف برداشت روزانه یا ماهانه رعایت نمی‌شود"""
+    
+    def __init__(self, code: str, message: str, wallet_id: str):
+        super().__init__(message, wallet_id)
+        self.code = code
+
+
+@dataclass
+class LedgerEntry:
+    """
+    یک ثبت دفتر کل
+    
+    amount علامت‌دار است (مثبت: واریز، منفی: برداشت). اگر apply_balance
+    False باشد، تراکنش فقط ثبت می‌شود و موجودی تغییر نمی‌کند.
+    related_index به ثبت قبلی همان دسته اشاره می‌کند. اگر enforce_limits
+    True باشد، سقف برداشت روزانه/ماهانه کیف پول زیر قفل بررسی می‌شود.
+    اگر transaction داده شود، همان تراکنش در انتظار (مثلاً پرداخت درگاه)
+    تکمیل می‌شود و تراکنش جدیدی ساخته نمی‌شود.
+    """
+    wallet: Wallet
+    amount: Decimal
+    type: str
+    reference_number: Optional[str] = None
+    description: str = ''
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    gateway: Optional[str] = None
+    related_wallet: Optional[Wallet] = None
+    related_transaction: Optional[Transaction] = None
+    related_index: Optional[int] = None
+    apply_balance: bool = True
+    enforce_limits: bool = False
+    transaction: Optional[Transaction] = None
+
+
+class LedgerService(BaseService):
+    """ثبت اتمیک تغییرات موجودی و تراکنش‌ها"""
+    
+    BULK_BATCH_SIZE = 500
+    COUNTER_FIELDS = [
+        'daily_withdrawn', 'daily_withdrawn_date',
+        'monthly_withdrawn', 'monthly_withdrawn_period',
+    ]
+    
+    def post(self, entry: LedgerEntry) -> Transaction:
+        """ثبت یک تغییر موجودی همراه با تراکنش تکمیل‌شده"""
+        return self.post_batch([entry])[0]
+    
+    def post_batch(self, entries: Sequence[LedgerEntry]) -> List[Transaction]:
+        """
+        ثبت دسته‌ای (همه یا هیچ)
+        
+        Args:
+            entries: ثبت‌ها به ترتیب
+        
+        Returns:
+            List[Transaction]: تراکنش‌ها به همان ترتیب
+        
+        Raises:
+            InsufficientBalanceError: برداشت خالص یک کیف پول بیش از موجودی قابل استفاده
+            InactiveWalletError: کیف پول غیرفعال یا حذف‌شده
+            WithdrawalLimitError: عبور از سقف برداشت (برای ثبت‌های enforce_limits)
+            LedgerError: تراکنش داده‌شده دیگر در انتظار نیست
+        """
+        if not entries:
+            return []
+        
+        for index, entry in enumerate(entries):
+            if entry.related_index is not None and not 0 <= entry.related_index < index:
+                raise LedgerError(f'related_index نامعتبر در ثبت {index}')
+        
+        now = timezone.now()
+        today = timezone.localdate(now)
+        
+        pending_ids = [entry.transaction.pk for entry in entries if entry.transaction is not None]
+        if len(set(pending_ids)) != len(pending_ids):
+            raise LedgerError('یک تراکنش در انتظار بیش از یک بار در دسته آمده است')
+        
+        with db_transaction.atomic():
+            # تراکنش‌های در انتظار پیش از کیف پول‌ها قفل می‌شوند (همان ترتیب
+            # تأیید پرداخت) تا یک تراکنش دو بار تسویه نشود
+            if pending_ids:
+                open_count = Transaction.objects.select_for_update().filter(
+                    pk__in=pending_ids,
+                    status=TransactionStatus.PENDING
+                ).count()
+                if open_count != len(pending_ids):
+                    raise LedgerError('تراکنش در انتظار نیست یا قبلاً تکمیل شده است')
+            
+            wallet_ids = sorted({entry.wallet.pk for entry in entries}, key=str)
+            locked = {
+                wallet.pk: wallet
+                for wallet in Wallet.objects.select_for_update().filter(
+                    pk__in=wallet_ids
+                ).order_by('pk')
+            }
+            
+            # تغییر خالص موجودی و کل برداشت هر کیف پول
+            deltas: Dict[Any, Decimal] = {}
+            withdrawals: Dict[Any, Decimal] = {}
+            limited = set()
+            for entry in entries:
+                if entry.apply_balance:
+                    deltas[entry.wallet.pk] = deltas.get(entry.wallet.pk, Decimal('0')) + entry.amount
+                    if entry.type == TransactionType.WITHDRAWAL and entry.amount < 0:
+                        withdrawals[entry.wallet.pk] = (
+                            withdrawals.get(entry.wallet.pk, Decimal('0')) - entry.amount
+                        )
+                        if entry.enforce_limits:
+                            limited.add(entry.wallet.pk)
+            
+            for wallet_id in wallet_ids:
+                wallet = locked.get(wallet_id)
+                if wallet is None or not wallet.is_active:
+                    raise InactiveWalletError('کیف پول غیرفعال است', str(wallet_id))
+                delta = deltas.get(wallet_id)
+                if delta is not None and delta < 0 and wallet.available_balance + delta < 0:
+                    raise InsufficientBalanceError(
+                        str(wallet_id), wallet.available_balance, -delta
+                    )
+                withdrawn = withdrawals.get(wallet_id)
+                if withdrawn is not None:
+                    self._roll_withdrawal_counters(wallet, today)
+                    if wallet_id in limited:
+                        self._check_withdrawal_limits(wallet, withdrawn)
+                    wallet.daily_withdrawn += withdrawn
+                    wallet.monthly_withdrawn += withdrawn
+            
+            changed = []
+            for wallet_id, delta in deltas.items():
+                wallet = locked[wallet_id]
+                wallet.balance += delta
+                wallet.last_transaction_at = now
+                wallet.updated_at = now
+                changed.append(wallet)
+            if changed:
+                fields = ['balance', 'last_transaction_at', 'updated_at']
+                if withdrawals:
+                    fields += self.COUNTER_FIELDS
+                Wallet.objects.bulk_update(
+                    changed,
+                    fields,
+                    batch_size=self.BULK_BATCH_SIZE
+                )
+            
+            transactions = []
+            created = []
+            settled = []
+            references = set()
+            for entry in entries:
+                if entry.transaction is not None:
+                    entry.transaction.status = TransactionStatus.COMPLETED
+                    entry.transaction.completed_at = now
+                    entry.transaction.updated_at = now
+                    transactions.append(entry.transaction)
+                    settled.append(entry.transaction)
+                    continue
+                related = entry.related_transaction
+                if entry.related_index is not None:
+                    related = transactions[entry.related_index]
+                created.append(Transaction(
+                    wallet_id=entry.wallet.pk,
+                    amount=entry.amount,
+                    type=entry.type,
+                    status=TransactionStatus.COMPLETED,
+                    completed_at=now,
+                    reference_number=entry.reference_number or self._unique_reference(references),
+                    description=entry.description,
+                    gateway=entry.gateway,
+                    metadata=entry.metadata,
+                    related_transaction=related,
+                    related_wallet=entry.related_wallet,
+                ))
+                transactions.append(created[-1])
+            Transaction.objects.bulk_create(created, batch_size=self.BULK_BATCH_SIZE)
+            if settled:
+                Transaction.objects.bulk_update(
+                    settled,
+                    ['status', 'completed_at', 'gateway_reference', 'updated_at'],
+                    batch_size=self.BULK_BATCH_SIZE
+                )
+        
+        # همگام‌سازی نمونه‌های کیف پول فراخوان با مقادیر نهایی
+        for entry in entries:
+            wallet = locked[entry.wallet.pk]
+            entry.wallet.balance = wallet.balance
+            entry.wallet.last_transaction_at = wallet.last_transaction_at
+            for name in self.COUNTER_FIELDS:
+                setattr(entry.wallet, name, getattr(wallet, name))
+        
+        return transactions
+    
+    def _roll_withdrawal_counters(self, wallet: Wallet, today: date):
+        """
+        هم‌ترازی شمارنده‌ها با روز و ماه جاری (صفر شدن تنبل)
+        
+        کیف پول‌هایی که هنوز شمارنده ندارند یک بار از روی تراکنش‌ها مقداردهی می‌شوند.
+        """
+        month_start = today.replace(day=1)
+        
+        if wallet.monthly_withdrawn_period is None:
+            totals = Transaction.objects.filter(
+                wallet_id=wallet.pk,
+                type=TransactionType.WITHDRAWAL,
+                status=TransactionStatus.COMPLETED,
+                created_at__date__gte=month_start
+            ).aggregate(
+                month=Sum('amount'),
+                day=Sum('amount', filter=Q(created_at__date=today))
+            )
+            wallet.monthly_withdrawn = abs(totals['month'] or Decimal('0'))
+            wallet.monthly_withdrawn_period = month_start
+            wallet.daily_withdrawn = abs(totals['day'] or Decimal('0'))
+            wallet.daily_withdrawn_date = today
+            return
+        
+        if wallet.monthly_withdrawn_period != month_start:
+            wallet.monthly_withdrawn = Decimal('0')
+            wallet.monthly_withdrawn_period = month_start
+        if wallet.daily_withdrawn_date != today:
+            wallet.daily_withdrawn = Decimal('0')
+            wallet.daily_withdrawn_date = today
+    
+    def _check_withdrawal_limits(self, wallet: Wallet, amount: Decimal):
+        """بررسی سقف برداشت با شمارنده‌های جاری"""
+        if wallet.daily_withdrawn + amount > wallet.daily_withdrawal_limit:
+            raise WithdrawalLimitError(
+                'daily_limit_exceeded',
+                f'از محدودیت برداشت روزانه ({wallet.daily_withdrawal_limit:,} ریال) تجاوز می‌کند',
+                str(wallet.pk)
+            )
+        if wallet.monthly_withdrawn + amount > wallet.monthly_withdrawal_limit:
+            raise WithdrawalLimitError(
+                'monthly_limit_exceeded',
+                f'از محدودیت برداشت ماهانه ({wallet.monthly_withdrawal_limit:,} ریال) تجاوز می‌کند',
+                str(wallet.pk)
+            )
+    
+    def withdrawal_totals(self, wallet: Wallet) -> Dict[str, Decimal]:
+        """
+        برداشت روز و ماه جاری از شمارنده‌ها
+        
+        شمارنده‌های مقداردهی‌نشده یک بار زیر قفل ساخته و ذخیره می‌شوند.
+        """
+        today = timezone.localdate()
+        
+        if wallet.monthly_withdrawn_period is None:
+            with db_transaction.atomic():
+                locked = Wallet.objects.select_for_update().get(pk=wallet.pk)
+                if locked.monthly_withdrawn_period is None:
+                    self._roll_withdrawal_counters(locked, today)
+                    Wallet.objects.filter(pk=wallet.pk).update(
+                        **{name: getattr(locked, name) for name in self.COUNTER_FIELDS}
+                    )
+                for name in self.COUNTER_FIELDS:
+                    setattr(wallet, name, getattr(locked, name))
+        
+        return {
+            'daily': wallet.daily_withdrawal_total(today),
+            'monthly': wallet.monthly_withdrawal_total(today),
+        }
+    
+    def release_withdrawal(self, wallet: Wallet, amount: Decimal, withdrawn_on: date):
+        """
+        کم کردن برداشت بازگشت‌خورده از شمارنده‌ها
+        
+        فقط اگر شمارنده هنوز مربوط به همان روز/ماه برداشت باشد تغییر می‌کند.
+        """
+        Wallet.objects.filter(
+            pk=wallet.pk,
+            daily_withdrawn_date=withdrawn_on,
+            daily_withdrawn__gte=amount
+        ).update(daily_withdrawn=F('daily_withdrawn') - amount)
+        Wallet.objects.filter(
+            pk=wallet.pk,
+            monthly_withdrawn_period=withdrawn_on.replace(day=1),
+            monthly_withdrawn__gte=amount
+        ).update(monthly_withdrawn=F('monthly_withdrawn') - amount)
+    
+    def _unique_reference(self, used: set) -> str:
+        """شماره مرجع یکتا در میان ثبت‌های همین دسته"""
+        while True:
+            reference = self.generate_reference_number('TXN')
+            if reference not in used:
+                used.add(reference)
+                return reference
+    
+    def block(self, wallet: Wallet, amount: Decimal) -> bool:
+        """بلوک کردن مبلغ با یک UPDATE شرطی روی موجودی قابل استفاده"""
+        return wallet.block_amount(amount)
+    
+    def unblock(self, wallet: Wallet, amount: Decimal) -> bool:
+        """آزاد کردن مبلغ بلوک‌شده با یک UPDATE شرطی"""
+        return wallet.unblock_amount(amount)
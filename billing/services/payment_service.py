@@ -10,6 +10,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 
 from .base_service import BaseService
+from .ledger_service import LedgerService, LedgerEntry, LedgerError
 from ..models import Transaction, TransactionType, TransactionStatus, PaymentGateway
 
 User = get_user_model()
@@ -20,6 +21,7 @@ class PaymentService(BaseService):
     
     def __init__(self):
         super().__init__()
+        self.ledger = LedgerService()
         
     def create_payment(
         self,
@@ -130,18 +132,16 @@ class PaymentService(BaseService):
                     )
                 
                 if success:
-                    # تکمیل تراکنش
-                    from .transaction_service import TransactionService
-                    transaction_service = TransactionService()
-                    
-                    transaction_service.complete_transaction(
-                        str(transaction.id),
-                        result.get('gateway_reference')
-                    )
-                    
-                    # واریز به کیف پول
+                    # تکمیل تراکنش و واریز به کیف پول در یک ثبت دفتر کل
+                    if result.get('gateway_reference'):
+                        transaction.gateway_reference = result['gateway_reference']
                     wallet = transaction.wallet
-                    wallet.deposit(transaction.amount, transaction.description)
+                    self.ledger.post(LedgerEntry(
+                        wallet=wallet,
+                        amount=transaction.amount,
+                        type=transaction.type,
+                        transaction=transaction
+                    ))
                     
                     self.log_operation('verify_payment', wallet.user, {
                         'transaction_id': str(transaction.id),
@@ -173,6 +173,8 @@ class PaymentService(BaseService):
                     
         except Transaction.DoesNotExist:
             return self.error_response('transaction_not_found', 'تراکنش یافت نشد')
+        except LedgerError as e:
+            return self.error_response(e.code, str(e))
         except Exception as e:
             self.logger.error(f"خطا در تایید پرداخت: {str(e)}")
             return self.error_response(
@@ -320,33 +322,25 @@ class PaymentService(BaseService):
             )
         
         try:
-            with db_transaction.atomic():
-                # ایجاد تراکنش
-                from .transaction_service import TransactionService
-                transaction_service = TransactionService()
-                
-                transaction = transaction_service.create_transaction(
-                    wallet=wallet,
-                    amount=-amount,  # منفی برای پرداخت
-                    transaction_type=TransactionType.PAYMENT,
-                    description=description,
-                    gateway=PaymentGateway.WALLET,
-                    metadata=metadata or {}
-                )
-                
-                # برداشت از کیف پول
-                wallet.withdraw(amount, description)
-                
-                # تکمیل تراکنش
-                transaction_service.complete_transaction(str(transaction.id))
-                
-                return self.success_response({
-                    'transaction_id': str(transaction.id),
-                    'amount': amount,
-                    'new_balance': wallet.balance,
-                    'status': 'completed'
-                }, f'پرداخت {amount:,} ریال از کیف پول انجام شد')
-                
+            # برداشت و ثبت تراکنش تکمیل‌شده؛ موجودی زیر قفل کیف پول دوباره بررسی می‌شود
+            transaction = self.ledger.post(LedgerEntry(
+                wallet=wallet,
+                amount=-amount,  # منفی برای پرداخت
+                type=TransactionType.PAYMENT,
+                description=description,
+                gateway=PaymentGateway.WALLET,
+                metadata=metadata or {}
+            ))
+            
+            return self.success_response({
+                'transaction_id': str(transaction.id),
+                'amount': amount,
+                'new_balance': wallet.balance,
+                'status': 'completed'
+            }, f'پرداخت {amount:,} ریال از کیف پول انجام شد')
+            
+        except LedgerError as e:
+            return self.error_response(e.code, str(e))
         except Exception as e:
             self.logger.error(f"خطا در پرداخت از کیف پول: {str(e)}")
             return self.error_response(
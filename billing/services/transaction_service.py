@@ -3,6 +3,7 @@
 Transaction Management Service
 """
 
+import datetime
 from decimal import Decimal
 from typing import Dict, Any, Optional, Tuple, List
 from django.db import transaction as db_transaction
@@ -11,6 +12,7 @@ from django.db import models
 from django.db.models import Q, Sum, Count, Avg
 
 from .base_service import BaseService
+from .ledger_service import LedgerService, LedgerEntry, LedgerError
 from ..models import (
     Transaction, TransactionType, TransactionStatus, 
     Wallet, PaymentGateway
@@ -22,6 +24,7 @@ class TransactionService(BaseService):
     
     def __init__(self):
         super().__init__()
+        self.ledger = LedgerService()
         
     def create_transaction(
         self,
@@ -435,13 +438,18 @@ class TransactionService(BaseService):
                     description=reason or f'بازگشت تراکنش {original_transaction.reference_number}'
                 )
                 
-                # بازگشت مبلغ به کیف پول
+                # بازگشت مبلغ به کیف پول و تکمیل تراکنش بازگشت
                 wallet = original_transaction.wallet
-                wallet.deposit(refund_transaction.amount, "Refund")
+                self.ledger.post(LedgerEntry(
+                    wallet=wallet,
+                    amount=refund_transaction.amount,
+                    type=TransactionType.REFUND,
+                    transaction=refund_transaction
+                ))
                 
                 # به‌روزرسانی وضعیت تراکنش اصلی
                 original_transaction.status = TransactionStatus.REFUNDED
-                original_transaction.save()
+                original_transaction.save(update_fields=['status', 'updated_at'])
                 
                 self.log_operation('refund_transaction', wallet.user, {
                     'original_transaction_id': str(original_transaction.id),
@@ -461,6 +469,8 @@ class TransactionService(BaseService):
             return self.error_response('transaction_not_found', 'تراکنش یافت نشد')
         except ValueError as e:
             return self.error_response('invalid_refund', str(e))
+        except LedgerError as e:
+            return self.error_response(e.code, str(e))
         except Exception as e:
             self.logger.error(f"خطا در بازگشت تراکنش: {str(e)}")
             return self.error_response(
@@ -468,7 +478,7 @@ class TransactionService(BaseService):
                 'خطا در بازگشت تراکنش'
             )
     
-    def get_daily_summary(self, wallet_id: str, date: timezone.date = None) -> Tuple[bool, Dict[str, Any]]:
+    def get_daily_summary(self, wallet_id: str, date: datetime.date = None) -> Tuple[bool, Dict[str, Any]]:
         """
         خلاصه تراکنش‌های روزانه
         
@@ -528,11 +538,16 @@ class TransactionService(BaseService):
             wallet = transaction.wallet
             
             if transaction.type == TransactionType.WITHDRAWAL:
-                # بازگشت مبلغ برداشت شده
-                wallet.deposit(abs(transaction.amount), "Reversal of failed withdrawal")
+                # بازگشت مبلغ برداشت شده و آزادسازی سهم آن از سقف برداشت
+                self._post_reversal(transaction, 'Reversal of failed withdrawal')
+                self.ledger.release_withdrawal(
+                    wallet,
+                    abs(transaction.amount),
+                    timezone.localdate(transaction.created_at)
+                )
             elif transaction.type == TransactionType.TRANSFER_OUT:
                 # بازگشت مبلغ انتقال یافته
-                wallet.deposit(abs(transaction.amount), "Reversal of failed transfer")
+                self._post_reversal(transaction, 'Reversal of failed transfer')
                 
             self.log_operation('reverse_wallet_changes', wallet.user, {
                 'transaction_id': str(transaction.id),
@@ -541,4 +556,14 @@ class TransactionService(BaseService):
             })
             
         except Exception as e:
-            self.logger.error(f"خطا در بازگشت تغییرات کیف پول: {str(e)}")
\ No newline at end of file
+            self.logger.error(f"خطا در بازگشت تغییرات کیف پول: {str(e)}")
+    
+    def _post_reversal(self, transaction: Transaction, description: str) -> Transaction:
+        """واریز برگشتی یک تراکنش ناموفق از مسیر دفتر کل"""
+        return self.ledger.post(LedgerEntry(
+            wallet=transaction.wallet,
+            amount=abs(transaction.amount),
+            type=TransactionType.REFUND,
+            description=description,
+            related_transaction=transaction
+        ))
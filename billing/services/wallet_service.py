@@ -4,13 +4,14 @@ Wallet Management Service
 """
 
 from decimal import Decimal
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Sequence, Tuple
 from django.db import transaction as db_transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
 from .base_service import BaseService
-from ..models import Wallet, Transaction, TransactionType, TransactionStatus
+from .ledger_service import LedgerService, LedgerEntry, LedgerError
+from ..models import Wallet, Transaction, TransactionType
 
 User = get_user_model()
 
@@ -20,6 +21,7 @@ class WalletService(BaseService):
     
     def __init__(self):
         super().__init__()
+        self.ledger = LedgerService()
         
     def create_wallet(self, user: User) -> Tuple[bool, Dict[str, Any]]:
         """
@@ -97,9 +99,10 @@ class WalletService(BaseService):
                 'created_at': wallet.created_at,
             }
             
-            # محاسبه آمار
-            today_withdrawals = self._get_daily_withdrawal_total(wallet)
-            month_withdrawals = self._get_monthly_withdrawal_total(wallet)
+            # محاسبه آمار (از شمارنده‌های جاری کیف پول)
+            totals = self.ledger.withdrawal_totals(wallet)
+            today_withdrawals = totals['daily']
+            month_withdrawals = totals['monthly']
             
             wallet_info.update({
                 'today_withdrawals': today_withdrawals,
@@ -160,24 +163,15 @@ class WalletService(BaseService):
             if not reference:
                 reference = self.generate_reference_number('DEP')
             
-            # ایجاد تراکنش
-            from .transaction_service import TransactionService
-            transaction_service = TransactionService()
-            
-            transaction = transaction_service.create_transaction(
+            # واریز و ثبت تراکنش تکمیل‌شده در یک عملیات قفل‌شده
+            transaction = self.ledger.post(LedgerEntry(
                 wallet=wallet,
                 amount=amount,
-                transaction_type=TransactionType.DEPOSIT,
+                type=TransactionType.DEPOSIT,
                 reference_number=reference,
                 description=description or f'واریز {amount:,} ریال',
                 metadata=metadata or {}
-            )
-            
-            # واریز به کیف پول
-            wallet.deposit(amount, description)
-            
-            # تکمیل تراکنش
-            transaction_service.complete_transaction(str(transaction.id))
+            ))
             
             self.log_operation('wallet_deposit', user, {
                 'amount': amount,
@@ -193,6 +187,8 @@ class WalletService(BaseService):
                 'reference': reference
             }, f'مبلغ {amount:,} ریال با موفقیت واریز شد')
             
+        except LedgerError as e:
+            return self.error_response(e.code, str(e))
         except Exception as e:
             self.logger.error(f"خطا در واریز: {str(e)}")
             return self.error_response(
@@ -242,34 +238,20 @@ class WalletService(BaseService):
             if not success:
                 return success, result
             
-            # بررسی موجودی
-            if not wallet.can_withdraw(amount):
-                return self.error_response(
-                    'insufficient_balance',
-                    f'موجودی کافی نیست. موجودی قابل استفاده: {wallet.available_balance:,} ریال'
-                )
-            
             # تولید شماره مرجع
             reference = self.generate_reference_number('WDR')
             
-            # ایجاد تراکنش
-            from .transaction_service import TransactionService
-            transaction_service = TransactionService()
-            
-            transaction = transaction_service.create_transaction(
+            # برداشت و ثبت تراکنش؛ کفایت موجودی و سقف برداشت زیر قفل کیف پول
+            # دوباره بررسی و شمارنده‌ها در همان تراکنش به‌روز می‌شوند
+            transaction = self.ledger.post(LedgerEntry(
                 wallet=wallet,
                 amount=-amount,  # منفی برای برداشت
-                transaction_type=TransactionType.WITHDRAWAL,
+                type=TransactionType.WITHDRAWAL,
                 reference_number=reference,
                 description=description or f'برداشت {amount:,} ریال',
-                metadata=metadata or {}
-            )
-            
-            # برداشت از کیف پول
-            wallet.withdraw(amount, description)
-            
-            # تکمیل تراکنش
-            transaction_service.complete_transaction(str(transaction.id))
+                metadata=metadata or {},
+                enforce_limits=True
+            ))
             
             self.log_operation('wallet_withdrawal', user, {
                 'amount': amount,
@@ -287,6 +269,8 @@ class WalletService(BaseService):
                 'destination': destination
             }, f'مبلغ {amount:,} ریال با موفقیت برداشت شد')
             
+        except LedgerError as e:
+            return self.error_response(e.code, str(e))
         except Exception as e:
             self.logger.error(f"خطا در برداشت: {str(e)}")
             return self.error_response(
@@ -339,65 +323,46 @@ class WalletService(BaseService):
             commission = amount * commission_rate
             total_amount = amount + commission
             
-            # بررسی موجودی فرستنده
-            if not from_wallet.has_sufficient_balance(total_amount):
-                return self.error_response(
-                    'insufficient_balance',
-                    f'موجودی کافی نیست. مبلغ مورد نیاز: {total_amount:,} ریال'
-                )
-            
-            # قفل هر دو کیف پول (جلوگیری از deadlock)
-            wallets = [from_wallet, to_wallet]
-            wallets.sort(key=lambda w: str(w.id))
-            
-            from .transaction_service import TransactionService
-            transaction_service = TransactionService()
-            
-            # تراکنش برداشت از فرستنده
+            # برداشت، واریز و کمیسیون در یک ثبت دسته‌ای؛ هر دو کیف پول
+            # به ترتیب شناسه قفل می‌شوند (جلوگیری از deadlock)
             from_ref = self.generate_reference_number('TRF')
-            from_transaction = transaction_service.create_transaction(
-                wallet=from_wallet,
-                amount=-total_amount,
-                transaction_type=TransactionType.TRANSFER_OUT,
-                reference_number=from_ref,
-                description=description or f'انتقال {amount:,} ریال',
-                metadata={
-                    'to_user_id': str(to_user.id),
-                    'commission': commission,
-                    'net_amount': amount
-                }
-            )
-            
-            # تراکنش واریز به گیرنده
-            to_ref = self.generate_reference_number('TRF')
-            to_transaction = transaction_service.create_transaction(
-                wallet=to_wallet,
-                amount=amount,
-                transaction_type=TransactionType.TRANSFER_IN,
-                reference_number=to_ref,
-                description=description or f'دریافت {amount:,} ریال',
-                metadata={
-                    'from_user_id': str(from_user.id),
-                    'commission': commission,
-                    'gross_amount': total_amount
-                },
-                related_transaction=from_transaction
-            )
-            
-            # اجرای انتقال
-            from_wallet.withdraw(total_amount, "Transfer out")
-            to_wallet.deposit(amount, "Transfer in")
-            
-            # تکمیل تراکنش‌ها
-            transaction_service.complete_transaction(str(from_transaction.id))
-            transaction_service.complete_transaction(str(to_transaction.id))
+            entries = [
+                LedgerEntry(
+                    wallet=from_wallet,
+                    amount=-total_amount,
+                    type=TransactionType.TRANSFER_OUT,
+                    reference_number=from_ref,
+                    description=description or f'انتقال {amount:,} ریال',
+                    metadata={
+                        'to_user_id': str(to_user.id),
+                        'commission': str(commission),
+                        'net_amount': str(amount)
+                    },
+                    related_wallet=to_wallet
+                ),
+                LedgerEntry(
+                    wallet=to_wallet,
+                    amount=amount,
+                    type=TransactionType.TRANSFER_IN,
+                    reference_number=self.generate_reference_number('TRF'),
+                    description=description or f'دریافت {amount:,} ریال',
+                    metadata={
+                        'from_user_id': str(from_user.id),
+                        'commission': str(commission),
+                        'gross_amount': str(total_amount)
+                    },
+                    related_wallet=from_wallet,
+                    related_index=0
+                ),
+            ]
             
             # ثبت کمیسیون در صورت وجود
-            commission_transaction = None
             if commission > 0:
-                commission_transaction = self._record_commission(
-                    commission, from_transaction
-                )
+                entries.append(self._commission_entry(commission, from_wallet, from_ref))
+            
+            transactions = self.ledger.post_batch(entries)
+            from_transaction, to_transaction = transactions[0], transactions[1]
+            commission_transaction = transactions[2] if commission > 0 else None
             
             self.log_operation('wallet_transfer', from_user, {
                 'amount': amount,
@@ -426,6 +391,8 @@ class WalletService(BaseService):
                 f'انتقال {amount:,} ریال با موفقیت انجام شد'
             )
             
+        except LedgerError as e:
+            return self.error_response(e.code, str(e))
         except Exception as e:
             self.logger.error(f"خطا در انتقال: {str(e)}")
             return self.error_response(
@@ -464,7 +431,7 @@ class WalletService(BaseService):
             amount = result['data']['validated_amount']
             
             # بلوک کردن مبلغ
-            if wallet.block_amount(amount):
+            if self.ledger.block(wallet, amount):
                 self.log_operation('wallet_block', user, {
                     'amount': amount,
                     'reason': reason,
@@ -520,7 +487,7 @@ class WalletService(BaseService):
             amount = result['data']['validated_amount']
             
             # آزاد کردن مبلغ
-            if wallet.unblock_amount(amount):
+            if self.ledger.unblock(wallet, amount):
                 self.log_operation('wallet_unblock', user, {
                     'amount': amount,
                     'reason': reason,
@@ -545,6 +512,50 @@ class WalletService(BaseService):
                 'خطا در آزاد کردن مبلغ'
             )
     
+    def post_entries(
+        self,
+        entries: Sequence[LedgerEntry],
+        operator: Optional[User] = None
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        ثبت دسته‌ای تراکنش‌ها (مثلاً تسویه پزشکان و کمیسیون‌ها)
+        
+        همه ثبت‌ها با هم اعمال می‌شوند یا هیچ‌کدام؛ برداشت خالص هر کیف پول
+        با موجودی قابل استفاده آن مقایسه می‌شود.
+        
+        Args:
+            entries: ثبت‌های دفتر کل (مبلغ علامت‌دار)
+            operator: کاربر انجام‌دهنده برای لاگ
+            
+        Returns:
+            Tuple[bool, Dict]: شناسه تراکنش‌ها به همان ترتیب
+        """
+        try:
+            transactions = self.ledger.post_batch(entries)
+            
+            if operator is not None:
+                self.log_operation('wallet_batch_post', operator, {
+                    'count': len(transactions),
+                    'wallets': len({entry.wallet.pk for entry in entries})
+                })
+            
+            return self.success_response({
+                'transaction_ids': [str(t.id) for t in transactions],
+                'count': len(transactions),
+                'balances': {
+                    str(entry.wallet.pk): entry.wallet.balance for entry in entries
+                }
+            }, f'{len(transactions)} تراکنش ثبت شد')
+            
+        except LedgerError as e:
+            return self.error_response(e.code, str(e), {'wallet_id': e.wallet_id})
+        except Exception as e:
+            self.logger.error(f"خطا در ثبت دسته‌ای: {str(e)}")
+            return self.error_response(
+                'batch_post_failed',
+                'خطا در ثبت دسته‌ای تراکنش‌ها'
+            )
+    
     def get_transaction_history(
         self,
         user: User,
@@ -618,10 +629,12 @@ class WalletService(BaseService):
         wallet: Wallet,
         amount: Decimal
     ) -> Tuple[bool, Dict[str, Any]]:
-        """بررسی محدودیت‌های برداشت"""
+        """بررسی محدودیت‌های برداشت (پیش‌بررسی سریع؛ بررسی قطعی در دفتر کل)"""
+        
+        totals = self.ledger.withdrawal_totals(wallet)
         
         # بررسی محدودیت روزانه
-        daily_total = self._get_daily_withdrawal_total(wallet)
+        daily_total = totals['daily']
         if daily_total + amount > wallet.daily_withdrawal_limit:
             return self.error_response(
                 'daily_limit_exceeded',
@@ -629,7 +642,7 @@ class WalletService(BaseService):
             )
         
         # بررسی محدودیت ماهانه
-        monthly_total = self._get_monthly_withdrawal_total(wallet)
+        monthly_total = totals['monthly']
         if monthly_total + amount > wallet.monthly_withdrawal_limit:
             return self.error_response(
                 'monthly_limit_exceeded',
@@ -645,63 +658,24 @@ class WalletService(BaseService):
         
         return self.success_response()
     
-    def _get_daily_withdrawal_total(self, wallet: Wallet) -> Decimal:
-        """محاسبه کل برداشت روزانه"""
-        from datetime import date
-        
-        today = date.today()
-        
-        total = Transaction.objects.filter(
-            wallet=wallet,
-            type=TransactionType.WITHDRAWAL,
-            status=TransactionStatus.COMPLETED,
-            created_at__date=today
-        ).aggregate(
-            total=models.Sum('amount')
-        )['total'] or Decimal('0')
-        
-        return abs(total)  # مقدار مثبت
-    
-    def _get_monthly_withdrawal_total(self, wallet: Wallet) -> Decimal:
-        """محاسبه کل برداشت ماهانه"""
-        from datetime import date
-        
-        today = date.today()
-        first_of_month = today.replace(day=1)
-        
-        total = Transaction.objects.filter(
-            wallet=wallet,
-            type=TransactionType.WITHDRAWAL,
-            status=TransactionStatus.COMPLETED,
-            created_at__date__gte=first_of_month
-        ).aggregate(
-            total=models.Sum('amount')
-        )['total'] or Decimal('0')
-        
-        return abs(total)  # مقدار مثبت
-    
-    def _record_commission(
+    def _commission_entry(
         self,
         commission_amount: Decimal,
-        source_transaction: Transaction
-    ) -> Transaction:
-        """ثبت کمیسیون"""
-        from .transaction_service import TransactionService
-        
-        transaction_service = TransactionService()
+        source_wallet: Wallet,
+        source_reference: str
+    ) -> LedgerEntry:
+        """ثبت کمیسیون (بدون تغییر موجودی)"""
         
         # فرض می‌کنیم کیف پول سیستم وجود دارد
-        # در پیاده‌سازی واقعی باید کیف پول سیستم تعریف شود
+        # در پیاده‌سازی واقعی باید کیف پول سیستم تعریف شود؛ تا آن زمان
+        # کمیسیون فقط روی کیف پول مبدأ ثبت می‌شود و موجودی را تغییر نمی‌دهد
         
-        commission_transaction = transaction_service.create_transaction(
-            wallet=source_transaction.wallet,  # موقتاً همان کیف پول
+        return LedgerEntry(
+            wallet=source_wallet,  # موقتاً همان کیف پول
             amount=commission_amount,
-            transaction_type=TransactionType.COMMISSION,
+            type=TransactionType.COMMISSION,
             reference_number=self.generate_reference_number('COM'),
-            description=f'کمیسیون تراکنش {source_transaction.reference_number}',
-            related_transaction=source_transaction
+            description=f'کمیسیون تراکنش {source_reference}',
+            related_index=0,
+            apply_balance=False
         )
-        
-        transaction_service.complete_transaction(str(commission_transaction.id))
-        
-        return commission_transaction
\ No newline at end of file
@@ -2,15 +2,3 @@
 تست‌های سیستم مالی
 Financial System Tests
 """
-
-from .test_models import *
-from .test_services import *
-from .test_views import *
-from .test_gateways import *
-
-__all__ = [
-    'test_models',
-    'test_services', 
-    'test_views',
-    'test_gateways'
-]
\ No newline at end of file
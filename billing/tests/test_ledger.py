@@ -0,0 +1,246 @@
+"""
+تست‌های دفتر کل کیف پول
+Wallet Ledger Tests
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+
+from ..models import Wallet, Transaction, TransactionType, TransactionStatus
+from ..services import WalletService, PaymentService, TransactionService
+from ..services.ledger_service import (
+    LedgerService, LedgerEntry, LedgerError,
+    InsufficientBalanceError, WithdrawalLimitError
+)
+
+User = get_user_model()
+
+
+class LedgerServiceTest(TestCase):
+    """تست ثبت‌های اتمیک دفتر کل"""
+    
+    def setUp(self):
+        """آماده‌سازی تست"""
+        self.ledger = LedgerService()
+        self.doctor = User.objects.create_user(
+            phone_number='09123456789',
+            user_type='doctor'
+        )
+        self.patient = User.objects.create_user(
+            phone_number='09123456788',
+            user_type='patient'
+        )
+        self.doctor_wallet = Wallet.objects.create(
+            user=self.doctor,
+            balance=Decimal('100000')
+        )
+        self.patient_wallet = Wallet.objects.create(
+            user=self.patient,
+            balance=Decimal('20000'),
+            blocked_balance=Decimal('5000')
+        )
+    
+    def test_post_updates_balance_and_records_completed_transaction(self):
+        """تست ثبت تکی"""
+        transaction = self.ledger.post(LedgerEntry(
+            wallet=self.doctor_wallet,
+            amount=Decimal('-40000'),
+            type=TransactionType.WITHDRAWAL
+        ))
+        
+        self.doctor_wallet.refresh_from_db()
+        self.assertEqual(self.doctor_wallet.balance, Decimal('60000'))
+        self.assertEqual(transaction.status, TransactionStatus.COMPLETED)
+        self.assertIsNotNone(Transaction.objects.get(id=transaction.id).completed_at)
+    
+    def test_withdrawal_respects_blocked_balance(self):
+        """تست برداشت بیش از موجودی قابل استفاده"""
+        with self.assertRaises(InsufficientBalanceError):
+            self.ledger.post(LedgerEntry(
+                wallet=self.patient_wallet,
+                amount=Decimal('-16000'),
+                type=TransactionType.WITHDRAWAL
+            ))
+        
+        self.patient_wallet.refresh_from_db()
+        self.assertEqual(self.patient_wallet.balance, Decimal('20000'))
+        self.assertFalse(Transaction.objects.filter(wallet=self.patient_wallet).exists())
+    
+    def test_batch_is_all_or_nothing(self):
+        """تست اتمیک بودن ثبت دسته‌ای"""
+        entries = [
+            LedgerEntry(
+                wallet=self.doctor_wallet,
+                amount=Decimal('-10000'),
+                type=TransactionType.WITHDRAWAL
+            ),
+            LedgerEntry(
+                wallet=self.patient_wallet,
+                amount=Decimal('-30000'),
+                type=TransactionType.WITHDRAWAL
+            ),
+        ]
+        
+        with self.assertRaises(InsufficientBalanceError):
+            self.ledger.post_batch(entries)
+        
+        self.doctor_wallet.refresh_from_db()
+        self.assertEqual(self.doctor_wallet.balance, Decimal('100000'))
+        self.assertEqual(Transaction.objects.count(), 0)
+    
+    def test_batch_checks_net_amount_per_wallet(self):
+        """تست محاسبه برداشت خالص در یک دسته"""
+        transactions = self.ledger.post_batch([
+            LedgerEntry(
+                wallet=self.patient_wallet,
+                amount=Decimal('30000'),
+                type=TransactionType.DEPOSIT
+            ),
+            LedgerEntry(
+                wallet=self.patient_wallet,
+                amount=Decimal('-40000'),
+                type=TransactionType.WITHDRAWAL,
+                related_index=0
+            ),
+        ])
+        
+        self.patient_wallet.refresh_from_db()
+        self.assertEqual(self.patient_wallet.balance, Decimal('10000'))
+        self.assertEqual(transactions[1].related_transaction_id, transactions[0].id)
+    
+    def test_transfer_with_commission(self):
+        """تست انتقال با کمیسیون از طریق WalletService"""
+        success, result = WalletService().transfer(
+            self.doctor, self.patient, Decimal('10000'),
+            commission_rate=Decimal('0.1')
+        )
+        
+        self.assertTrue(success)
+        self.doctor_wallet.refresh_from_db()
+        self.patient_wallet.refresh_from_db()
+        self.assertEqual(self.doctor_wallet.balance, Decimal('89000'))
+        self.assertEqual(self.patient_wallet.balance, Decimal('30000'))
+        self.assertEqual(
+            Transaction.objects.filter(type=TransactionType.COMMISSION).count(), 1
+        )
+    
+    def test_withdrawal_counters_enforce_daily_limit(self):
+        """تست سقف برداشت روزانه با شمارنده‌های جاری"""
+        self.doctor_wallet.daily_withdrawal_limit = Decimal('50000')
+        self.doctor_wallet.save()
+        entry = dict(
+            wallet=self.doctor_wallet,
+            amount=Decimal('-30000'),
+            type=TransactionType.WITHDRAWAL,
+            enforce_limits=True
+        )
+        
+        self.ledger.post(LedgerEntry(**entry))
+        with self.assertRaises(WithdrawalLimitError) as ctx:
+            self.ledger.post(LedgerEntry(**entry))
+        
+        self.assertEqual(ctx.exception.code, 'daily_limit_exceeded')
+        self.doctor_wallet.refresh_from_db()
+        self.assertEqual(self.doctor_wallet.daily_withdrawn, Decimal('30000'))
+        self.assertEqual(self.doctor_wallet.balance, Decimal('70000'))
+    
+    def test_withdrawal_counters_reset_on_new_day(self):
+        """تست صفر شدن تنبل شمارنده روزانه"""
+        self.ledger.post(LedgerEntry(
+            wallet=self.doctor_wallet,
+            amount=Decimal('-30000'),
+            type=TransactionType.WITHDRAWAL
+        ))
+        yesterday = timezone.localdate() - timedelta(days=1)
+        Wallet.objects.filter(pk=self.doctor_wallet.pk).update(daily_withdrawn_date=yesterday)
+        self.doctor_wallet.refresh_from_db()
+        
+        totals = self.ledger.withdrawal_totals(self.doctor_wallet)
+        
+        self.assertEqual(totals['daily'], Decimal('0'))
+        self.assertEqual(totals['monthly'], Decimal('30000'))
+    
+    def test_settles_pending_transaction_once(self):
+        """تست تکمیل تراکنش در انتظار درگاه فقط یک بار"""
+        pending = Transaction.objects.create(
+            wallet=self.patient_wallet,
+            amount=Decimal('50000'),
+            type=TransactionType.DEPOSIT,
+            status=TransactionStatus.PENDING,
+            reference_number='DEP-GW-1'
+        )
+        entry = dict(
+            wallet=self.patient_wallet,
+            amount=pending.amount,
+            type=pending.type,
+            transaction=pending
+        )
+        
+        self.ledger.post(LedgerEntry(**entry))
+        with self.assertRaises(LedgerError):
+            self.ledger.post(LedgerEntry(**entry))
+        
+        pending.refresh_from_db()
+        self.patient_wallet.refresh_from_db()
+        self.assertEqual(pending.status, TransactionStatus.COMPLETED)
+        self.assertEqual(self.patient_wallet.balance, Decimal('70000'))
+        self.assertEqual(Transaction.objects.count(), 1)
+    
+    def test_stale_wallet_instance_does_not_overwrite_ledger(self):
+        """تست اینکه متدهای مدل روی نمونهٔ قدیمی موجودی و شمارنده را بازنویسی نمی‌کنند"""
+        stale = Wallet.objects.get(pk=self.doctor_wallet.pk)
+        self.ledger.post(LedgerEntry(
+            wallet=self.doctor_wallet,
+            amount=Decimal('-30000'),
+            type=TransactionType.WITHDRAWAL
+        ))
+        
+        self.assertTrue(stale.block_amount(Decimal('10000')))
+        self.assertTrue(stale.deposit(Decimal('5000')))
+        stale.verify_wallet()
+        
+        self.doctor_wallet.refresh_from_db()
+        self.assertEqual(self.doctor_wallet.balance, Decimal('75000'))
+        self.assertEqual(self.doctor_wallet.blocked_balance, Decimal('10000'))
+        self.assertEqual(self.doctor_wallet.daily_withdrawn, Decimal('30000'))
+        self.assertEqual(stale.balance, Decimal('75000'))
+        self.assertFalse(stale.withdraw(Decimal('70000')))
+    
+    def test_wallet_payment_posts_through_ledger(self):
+        """تست پرداخت از کیف پول با یک ثبت دفتر کل"""
+        success, result = PaymentService()._process_wallet_payment(
+            self.patient_wallet, Decimal('15000'), 'ویزیت', None
+        )
+        
+        self.assertTrue(success)
+        self.patient_wallet.refresh_from_db()
+        self.assertEqual(self.patient_wallet.balance, Decimal('5000'))
+        transaction = Transaction.objects.get(wallet=self.patient_wallet)
+        self.assertEqual(transaction.type, TransactionType.PAYMENT)
+        self.assertEqual(transaction.status, TransactionStatus.COMPLETED)
+        
+        success, result = PaymentService()._process_wallet_payment(
+            Wallet.objects.get(pk=self.patient_wallet.pk), Decimal('1000'), 'ویزیت', None
+        )
+        self.assertFalse(success)
+    
+    def test_failed_withdrawal_reversal_posts_refund(self):
+        """تست بازگشت برداشت ناموفق از مسیر دفتر کل"""
+        withdrawal = self.ledger.post(LedgerEntry(
+            wallet=self.doctor_wallet,
+            amount=Decimal('-30000'),
+            type=TransactionType.WITHDRAWAL
+        ))
+        
+        success, result = TransactionService().fail_transaction(str(withdrawal.id), 'bank rejected')
+        
+        self.assertTrue(success)
+        self.doctor_wallet.refresh_from_db()
+        self.assertEqual(self.doctor_wallet.balance, Decimal('100000'))
+        self.assertEqual(self.doctor_wallet.daily_withdrawn, Decimal('0'))
+        refund = Transaction.objects.get(type=TransactionType.REFUND)
+        self.assertEqual(refund.related_transaction_id, withdrawal.id)
+        self.assertEqual(refund.amount, Decimal('30000'))
@@ -18,6 +18,6 @@ class ChatbotConfig(AppConfig):
         """
         هک لایف‌سایکل Django که هنگام آماده شدن اپ فراخوانی می‌شود؛ محل مناسب برای راه‌اندازی اولیهٔ مرتبط با چت‌بات.
         
-        این متد در زمان بارگذاری اپلیکیشن اجرا می‌شود و برای اقدامات آماده‌سازی طراحی شده است؛ از جمله ثبت سیگنال‌ها و receiverها، بارگذاری پیش‌مدل‌های یادگیری ماشین یا وزن‌های لازم، راه‌اندازی یا اتصال به صف‌ها/وظایف پس‌زمینه (task schedulers / workers)، و ثبت منابعی که باید یک‌بار در طول عمر فرآیند مقداردهی شوند. پیاده‌سازی‌های اضافه‌شده باید غیرمسدودکننده یا با اجرای جداگانه در thread/process باشند تا زمان راه‌اندازی سرور طولانی نشود. در حال حاضر این متد no-op است (هیچ عملی انجام نمی‌دهد).
+        این متد در زمان بارگذاری اپلیکیشن اجرا می‌شود و برای اقدامات آماده‌سازی طراحی شده است؛ از جمله ثبت سیگنال‌ها و receiverها، بارگذاری پیش‌مدل‌های یادگیری ماشین یا وزن‌های لازم، راه‌اندازی یا اتصال به صف‌ها/وظایف پس‌زمینه (task schedulers / workers)، و ثبت منابعی که باید یک‌بار در طول عمر فرآیند مقداردهی شوند. پیاده‌سازی‌های اضافه‌شده باید غیرمسدودکننده یا با اجرای جداگانه در thread/process باشند تا زمان راه‌اندازی سرور طولانی نشود. در حال حاضر فقط سیگنال‌های باطل‌سازی ایندکس کامپایل‌شدهٔ پاسخ‌ها ثبت می‌شوند.
         """
-        pass
\ No newline at end of file
+        from . import signals  # noqa: F401
\ No newline at end of file
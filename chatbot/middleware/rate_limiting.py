@@ -3,13 +3,12 @@
 Rate Limiting Middleware for Chatbot
 """
 
-import time
 from typing import Dict, Optional
-from django.core.cache import cache
 from django.http import JsonResponse
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 from django.contrib.auth import get_user_model
+from helssa.rate_limiter import rate_limiter
 import logging
 
 logger = logging.getLogger(__name__)
@@ -175,60 +174,44 @@ class ChatbotRateLimitMiddleware(MiddlewareMixin):
         بررسی و اعمال محدودیت نرخ (rate limit) برای یک کلید کش مشخص با استفاده از پنجره زمانی لغزان.
         
         این متد:
-        - تعداد درخواست‌های اخیر مربوط به cache_key را بازیابی می‌کند، فقط رکوردهایی را نگه می‌دارد که داخل پنجره زمانی (window) قرار دارند و بر اساس limit_config تصمیم می‌گیرد آیا درخواست فعلی مجاز است یا خیر.
-        - در صورت رسیدن تعداد درخواست‌های داخل پنجره به حداکثر مجاز (limit_config['requests'])، یک JsonResponse با وضعیت HTTP 429 از طریق _create_rate_limit_response برمی‌گرداند.
-        - در غیر این صورت، زمان حال را به لیست درخواست‌های اخیر اضافه و آن را دوباره در cache با TTL برابر window + 60 ثانیه ذخیره می‌کند (اثر جانبی: به‌روز‌رسانی کش).
+        - از محدودکنندهٔ مشترک پروژه (helssa.rate_limiter) استفاده می‌کند که برای هر کلید فقط دو شمارندهٔ اتمیک (پنجرهٔ فعلی و قبلی) در کش نگه می‌دارد؛ حافظه ثابت است و read-modify-write غیراتمیک وجود ندارد.
+        - در صورت عبور تخمین پنجرهٔ لغزان از حداکثر مجاز (limit_config['requests'])، یک JsonResponse با وضعیت HTTP 429 از طریق _create_rate_limit_response برمی‌گرداند.
+        - در غیر این صورت None برمی‌گرداند (درخواست فعلی در شمارنده ثبت شده است).
         
         پارامترها:
-        - cache_key (str): کلید استفاده‌شده در کش برای نگهداری فهرست timestampهای درخواست‌ها.
+        - cache_key (str): شناسهٔ محدودیت (کاربر/IP و نوع endpoint) که شمارنده‌ها بر اساس آن ساخته می‌شوند.
         - limit_config (Dict): پیکربندی محدودیت که باید حداقل حاوی کلیدهای 'requests' (حداکثر تعداد مجاز) و 'window' (طول پنجره به ثانیه) و 'description' (متن توصیفی) باشد.
         - request: شیء درخواست Django (برای زمینه و احتمالا گزارش‌گیری) — محتوای خود درخواست در تصمیم‌گیری مستقیم استفاده نمی‌شود اما برای تولید پاسخ و لاگ می‌تواند مفید باشد.
         
         مقدار بازگشتی:
         - Optional[JsonResponse]: در صورتی که محدودیت عبور شده باشد یک JsonResponse با کد 429 بازمی‌گردد، در غیر این صورت None برگشت می‌دهد (اجازه ادامه پردازش).
         """
-        current_time = int(time.time())
-        window_start = current_time - limit_config['window']
-        
-        # دریافت درخواست‌های فعلی از cache
-        requests_data = cache.get(cache_key, [])
-        
-        # فیلتر کردن درخواست‌های قدیمی
-        recent_requests = [
-            req_time for req_time in requests_data 
-            if req_time > window_start
-        ]
+        result = rate_limiter.hit(cache_key, limit_config['requests'], limit_config['window'])
         
         # بررسی تعداد درخواست‌ها
-        if len(recent_requests) >= limit_config['requests']:
+        if not result.allowed:
             logger.warning(
                 f"Rate limit exceeded for {cache_key}. "
-                f"Requests: {len(recent_requests)}/{limit_config['requests']}"
+                f"Requests: {result.count}/{limit_config['requests']}"
             )
             
-            return self._create_rate_limit_response(limit_config, recent_requests)
-        
-        # اضافه کردن درخواست فعلی
-        recent_requests.append(current_time)
-        
-        # ذخیره در cache
-        cache.set(cache_key, recent_requests, limit_config['window'] + 60)
+            return self._create_rate_limit_response(limit_config, result.retry_after)
         
         return None
     
     def _create_rate_limit_response(
         self, 
         limit_config: Dict, 
-        recent_requests: list
+        retry_after: int
     ) -> JsonResponse:
         """
         یک پاسخ JSON با کد وضعیت 429 (Too Many Requests) ساخته و بازمی‌گرداند که نشان‌دهندهٔ عبور از محدودیت نرخ است.
         
-        این متد زمان باقیمانده تا پایان پنجرهٔ نرخ را با استفاده از قدیمی‌ترین تایم‌استمپ موجود در recent_requests محاسبه می‌کند و یک پاسخ شامل پیام خطا و جزئیات محدودیت (تعداد مجاز، طول پنجره، ثانیه‌ها و دقیقه‌های قابل‌انتظار برای تلاش مجدد) تولید می‌کند. مقدار بازگردانده‌شده برای فیلدهای retry_after_seconds و retry_after_minutes هرگز منفی نیست.
+        زمان تلاش مجدد توسط محدودکنندهٔ نرخ محاسبه شده (زمان تقریبی تا اینکه تخمین پنجرهٔ لغزان زیر سقف برسد) و یک پاسخ شامل پیام خطا و جزئیات محدودیت (تعداد مجاز، طول پنجره، ثانیه‌ها و دقیقه‌های قابل‌انتظار برای تلاش مجدد) تولید می‌شود. مقدار بازگردانده‌شده برای فیلدهای retry_after_seconds و retry_after_minutes هرگز منفی نیست.
         
         Parameters:
             limit_config (Dict): پیکربندی محدودیت شامل کلیدهای 'requests' (حداکثر درخواست‌ها)، 'window' (اندازه پنجره به ثانیه) و 'description' (شرح نوع درخواست).
-            recent_requests (list): لیستی از timestampهای یونیکس (به ثانیه) که نشان‌دهندهٔ زمان‌های درخواست‌های اخیر در پنجرهٔ لغزان است؛ باید حداقل یک مقدار داشته باشد.
+            retry_after (int): تعداد ثانیه تا امکان ارسال درخواست بعدی.
         
         Returns:
             JsonResponse: پاسخ JSON با ساختار:
@@ -244,20 +227,18 @@ class ChatbotRateLimitMiddleware(MiddlewareMixin):
               }
             و کد وضعیت HTTP برابر 429.
         """
-        # محاسبه زمان باقی‌مانده
-        oldest_request = min(recent_requests)
-        time_remaining = limit_config['window'] - (int(time.time()) - oldest_request)
-        
-        return JsonResponse({
+        response = JsonResponse({
             'error': 'محدودیت تعداد درخواست',
             'message': f"شما برای {limit_config['description']} بیش از حد مجاز درخواست ارسال کرده‌اید.",
             'details': {
                 'limit': limit_config['requests'],
                 'window_seconds': limit_config['window'],
-                'retry_after_seconds': max(time_remaining, 0),
-                'retry_after_minutes': max(time_remaining // 60, 0)
+                'retry_after_seconds': max(retry_after, 0),
+                'retry_after_minutes': max(retry_after // 60, 0)
             }
         }, status=429)
+        response['Retry-After'] = str(max(retry_after, 0))
+        return response
     
     def _get_client_ip(self, request) -> str:
         """
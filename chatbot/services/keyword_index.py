@@ -0,0 +1,166 @@
+"""
+ایندکس کامپایل‌شدهٔ کلمات کلیدی پاسخ‌ها
+Compiled, process-local ChatbotResponse keyword index
+"""
+
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Pattern, Set, Tuple
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from ..models import ChatbotResponse
+
+RESPONSES_VERSION_CACHE_KEY = 'chatbot:responses:version'
+
+REGEX_SPECIAL_CHARS = r'.*+?[]{}()|^$\\'
+
+
+class AhoCorasick:
+    """
+    اتوماتون Aho-Corasick برای یافتن همهٔ کلمات کلیدی در یک پیمایش پیام.
+
+    هر کلمه کلیدی به مجموعه‌ای از شناسه‌ها (اندیس پاسخ در ترتیب اولویت) نگاشت می‌شود؛ هزینهٔ جستجو متناسب با طول پیام و تعداد تطبیق‌هاست و به تعداد قواعد بستگی ندارد.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[int]] = [set()]
+        self._min_output: List[int] = []
+
+    def add(self, keyword: str, value: int) -> None:
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(value)
+
+    def build(self) -> None:
+        queue = deque()
+        for next_state in self._goto[0].values():
+            self._fail[next_state] = 0
+            queue.append(next_state)
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+        self._min_output = [min(values) if values else -1 for values in self._output]
+
+    def find_min(self, text: str) -> Optional[int]:
+        """کوچک‌ترین شناسهٔ منطبق (یعنی پاسخ با بالاترین اولویت) یا None"""
+        best = None
+        state = 0
+        goto = self._goto
+        fail = self._fail
+        min_output = self._min_output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            candidate = min_output[state]
+            if candidate >= 0:
+                if best is None or candidate < best:
+                    best = candidate
+                    if best == 0:
+                        return best
+        return best
+
+
+class CompiledResponseIndex:
+    """
+    پاسخ‌های فعال یک (target_user, category) به‌همراه اتوماتون کلمات کلیدی و الگوهای regex از پیش کامپایل‌شده.
+
+    معنای تطبیق با ResponseMatcherService._matches_keywords یکسان است: هر کلمه کلیدی به‌صورت زیررشته بررسی می‌شود (تطبیق کلمهٔ کامل با \\b زیرمجموعهٔ آن است) و کلمات کلیدی حاوی کاراکترهای ویژه علاوه بر آن به‌عنوان regex ارزیابی می‌شوند.
+    """
+
+    def __init__(self, responses: List[ChatbotResponse]):
+        self.responses = responses
+        self._automaton = AhoCorasick()
+        self._regexes: List[Tuple[int, Pattern]] = []
+        self._always: Optional[int] = None
+
+        for position, response in enumerate(responses):
+            for keyword in response.trigger_keywords or []:
+                keyword_lower = str(keyword).lower().strip()
+                if not keyword_lower:
+                    # رشتهٔ خالی زیررشتهٔ هر پیامی است
+                    if self._always is None:
+                        self._always = position
+                    continue
+                self._automaton.add(keyword_lower, position)
+                if any(char in keyword_lower for char in REGEX_SPECIAL_CHARS):
+                    try:
+                        self._regexes.append((position, re.compile(keyword_lower)))
+                    except re.error:
+                        pass
+        self._automaton.build()
+
+    def match(self, message_lower: str) -> Optional[ChatbotResponse]:
+        best = self._automaton.find_min(message_lower)
+        if self._always is not None and (best is None or self._always < best):
+            best = self._always
+        # فقط الگوهای regex پاسخ‌های با اولویت بالاتر از بهترین تطبیق فعلی
+        for position, pattern in self._regexes:
+            if best is not None and position >= best:
+                break
+            if pattern.search(message_lower):
+                best = position
+                break
+        return self.responses[best] if best is not None else None
+
+
+_indexes: Dict[Tuple[str, Optional[str]], CompiledResponseIndex] = {}
+_indexes_version = None
+_indexes_lock = threading.Lock()
+
+
+def get_responses_version() -> int:
+    return cache.get(RESPONSES_VERSION_CACHE_KEY, 0)
+
+
+def bump_responses_version() -> None:
+    """باطل‌کردن ایندکس‌های کامپایل‌شده در همهٔ پروسه‌ها"""
+    try:
+        cache.incr(RESPONSES_VERSION_CACHE_KEY)
+    except ValueError:
+        if not cache.add(RESPONSES_VERSION_CACHE_KEY, 1, timeout=None):
+            cache.incr(RESPONSES_VERSION_CACHE_KEY)
+
+
+def get_response_index(target_user: str, category: Optional[str] = None) -> CompiledResponseIndex:
+    """
+    ایندکس کامپایل‌شده برای (target_user, category) را برمی‌گرداند و در صورت تغییر نسخه بازسازی می‌کند.
+    """
+    global _indexes_version
+    version = get_responses_version()
+    key = (target_user, category or None)
+    with _indexes_lock:
+        if version != _indexes_version:
+            _indexes.clear()
+            _indexes_version = version
+        index = _indexes.get(key)
+        if index is None:
+            queryset = ChatbotResponse.objects.filter(
+                is_active=True
+            ).filter(
+                Q(target_user=target_user) | Q(target_user='both')
+            )
+            if category:
+                queryset = queryset.filter(category=category)
+            index = CompiledResponseIndex(list(queryset.order_by('-priority', '-created_at')))
+            _indexes[key] = index
+    return index
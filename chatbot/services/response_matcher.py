@@ -7,6 +7,7 @@ import re
 from typing import List, Optional, Dict, Any
 from django.db.models import Q
 from ..models import ChatbotResponse
+from .keyword_index import get_response_index
 
 
 class ResponseMatcherService:
@@ -30,7 +31,7 @@ class ResponseMatcherService:
         """
         پاسخ اولین ردیف ChatbotResponse که با پیام ورودی منطبق است را برمی‌گرداند.
         
-        این متد مجموعه‌ای از پاسخ‌های فعال (is_active=True) را می‌گیرد و آن‌ها را بر اساس محدوده هدف (target_user برابر با مقدار سرویس یا 'both') فیلتر می‌کند. در صورت ارسال پارامتر category، مجموعه نتایج به آن دسته محدود می‌شود. نتایج بر اساس اولویت (نزولی) و سپس زمان ایجاد (جدیدترین اول) مرتب می‌شوند. پیام ورودی پیش از بررسی نرمال‌سازی شده (تبدیل به حروف کوچک و حذف فاصله‌های اضافی) و سپس برای هر پاسخ، کلیدواژه‌های تریگر با پیام با استفاده از _matches_keywords (که شامل تطبیق ساده متن و بررسی الگوهای منطبق با regex است) مقایسه می‌شوند. اولین پاسخ مطابق بازگردانده می‌شود؛ در غیر این صورت None بازگردانده می‌شود.
+        این متد از ایندکس کامپایل‌شدهٔ پاسخ‌های فعال (is_active=True) برای محدوده هدف (target_user برابر با مقدار سرویس یا 'both') و در صورت ارسال، دستهٔ category استفاده می‌کند. ترتیب پاسخ‌ها بر اساس اولویت (نزولی) و سپس زمان ایجاد (جدیدترین اول) است. پیام ورودی پیش از بررسی نرمال‌سازی شده (تبدیل به حروف کوچک و حذف فاصله‌های اضافی) و همهٔ کلیدواژه‌ها در یک پیمایش با اتوماتون Aho-Corasick یافت می‌شوند؛ الگوهای regex از پیش کامپایل شده‌اند و فقط برای پاسخ‌های با اولویت بالاتر از بهترین تطبیق ارزیابی می‌شوند. معنای تطبیق همان _matches_keywords است. اولین پاسخ مطابق بازگردانده می‌شود؛ در غیر این صورت None بازگردانده می‌شود.
         
         Parameters:
             message (str): متن پیام کاربر؛ این مقدار پیش از تطبیق به‌صورت lowercase و با trim شده استفاده می‌شود.
@@ -39,28 +40,12 @@ class ResponseMatcherService:
         Returns:
             Optional[ChatbotResponse]: اولین شیء ChatbotResponse که با پیام مطابقت دارد یا None اگر مطابقتی یافت نشود.
         """
-        # فیلتر کردن پاسخ‌های فعال
-        queryset = ChatbotResponse.objects.filter(
-            is_active=True
-        ).filter(
-            Q(target_user=self.target_user) | Q(target_user='both')
-        )
-        
-        # فیلتر بر اساس دسته‌بندی
-        if category:
-            queryset = queryset.filter(category=category)
-        
-        # مرتب‌سازی بر اساس اولویت
-        responses = queryset.order_by('-priority', '-created_at')
+        # ایندکس کامپایل‌شدهٔ درون‌پروسه (با تغییر ChatbotResponse بازسازی می‌شود)
+        index = get_response_index(self.target_user, category)
         
         message_lower = message.lower().strip()
         
-        # جستجو برای تطبیق کلمات کلیدی
-        for response in responses:
-            if self._matches_keywords(message_lower, response.trigger_keywords):
-                return response
-        
-        return None
+        return index.match(message_lower)
     
     def get_responses_by_category(self, category: str) -> List[ChatbotResponse]:
         """
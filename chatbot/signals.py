@@ -0,0 +1,19 @@
+"""
+سیگنال‌های اپ چت‌بات
+Chatbot Signals
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ChatbotResponse
+from .services.keyword_index import bump_responses_version
+
+
+@receiver(post_save, sender=ChatbotResponse)
+@receiver(post_delete, sender=ChatbotResponse)
+def invalidate_response_index(sender, **kwargs):
+    """
+    با هر تغییر در ChatbotResponse نسخهٔ ایندکس کامپایل‌شده افزایش می‌یابد تا پروسه‌ها آن را بازسازی کنند.
+    """
+    bump_responses_version()
@@ -9,7 +9,7 @@ from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from unittest.mock import patch, MagicMock
+from unittest.mock import MagicMock
 from datetime import timedelta
 
 from .models import ChatbotSession, Conversation, Message, ChatbotResponse
@@ -257,6 +257,28 @@ class ChatbotServicesTest(TestCase):
         self.assertIn('content', analysis)
         self.assertIn('response_data', analysis)
 
+    def test_response_matcher_priority_and_invalidation(self):
+        """
+        تطبیق با ایندکس کامپایل‌شده: پاسخ با اولویت بالاتر برگردانده می‌شود و ایجاد پاسخ جدید ایندکس را بازسازی می‌کند.
+        """
+        from .services import ResponseMatcherService
+        
+        matcher = ResponseMatcherService(target_user='patient')
+        self.assertEqual(matcher.find_matching_response('سلام دکتر').category, 'greeting')
+        self.assertIsNone(matcher.find_matching_response('قرص'))
+        
+        ChatbotResponse.objects.create(
+            category='medication_info',
+            target_user='patient',
+            trigger_keywords=[r'قرص\s*\d+'],
+            response_text='اطلاعات دارو',
+            priority=5
+        )
+        self.assertEqual(matcher.find_matching_response('سلام قرص 20').category, 'medication_info')
+        self.assertEqual(
+            matcher.find_matching_response('سلام', category='greeting').category, 'greeting'
+        )
+
 
 class ChatbotAPITest(APITestCase):
     """
@@ -468,17 +490,20 @@ class ChatbotMiddlewareTest(TestCase):
         )
         self.client = APIClient()
     
-    @patch('django.core.cache.cache.get')
-    @patch('django.core.cache.cache.set')
-    def test_rate_limiting_middleware(self, mock_cache_set, mock_cache_get):
+    def test_rate_limiting_middleware(self):
         """
         تست middleware محدودسازی نرخ
         """
-        # شبیه‌سازی درخواست‌های زیاد
-        mock_cache_get.return_value = [int(timezone.now().timestamp())] * 35
+        from helssa.rate_limiter import rate_limiter
         
         self.client.force_authenticate(user=self.user)
         
+        # شبیه‌سازی درخواست‌های زیاد: پر کردن شمارندهٔ پنجرهٔ فعلی
+        cache_key = f"rate_limit:user:{self.user.id}:chatbot_message"
+        rate_limiter.reset(cache_key, 60)
+        for _ in range(30):
+            rate_limiter.hit(cache_key, 30, 60)
+        
         url = reverse('chatbot:patient-send-message')
         data = {'message': 'تست'}
         
@@ -486,6 +511,7 @@ class ChatbotMiddlewareTest(TestCase):
         
         # باید محدودیت اعمال شود
         self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
     
     def test_security_middleware_sensitive_content(self):
         """
@@ -178,6 +178,7 @@ class Encounter(models.Model):
             models.Index(fields=['doctor', 'status', 'scheduled_at']),
             models.Index(fields=['scheduled_at']),
             models.Index(fields=['video_room_id']),
+            models.Index(fields=['created_at']),
         ]
         ordering = ['-scheduled_at']
         
@@ -1,19 +1,38 @@
-from typing import List, Dict, Optional
+from typing import AsyncIterator, BinaryIO, Iterable, List, Dict, Optional, Union
 import io
 import asyncio
+import tempfile
+import numpy as np
 from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.utils import timezone
 
 from ..models import Encounter, AudioChunk
-from ..utils.encryption import encrypt_data, decrypt_data
+from ..utils.audio import (
+    PCM_SAMPLE_RATE, OverlapTrimmer, StreamingEncoder,
+    analyze_audio, decode_pcm, encode_wav
+)
+from ..utils.encryption import (
+    STREAM_ALGORITHM, STREAM_SEGMENT_SIZE, EncryptingWriter,
+    decrypt_bytes, encrypt_bytes
+)
+
+# فایل نهایی رمزشده تا این حجم در حافظه و پس از آن روی دیسک نگه داشته می‌شود
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+
+
+def _in_thread(func):
+    """اجرای کار CPU/پروسهٔ ffmpeg خارج از event loop"""
+    return sync_to_async(func, thread_sensitive=False)
 
 
 class AudioProcessingService:
     """سرویس پردازش صوت ویزیت‌ها"""
     
     def __init__(self):
-        self.chunk_size_mb = 10  # حجم هر قطعه
-        self.overlap_seconds = 2  # همپوشانی بین قطعات
+        self.chunk_size_mb = getattr(settings, 'AUDIO_CHUNK_SIZE_MB', 10)  # حجم هر قطعه
+        self.overlap_seconds = getattr(settings, 'AUDIO_OVERLAP_SECONDS', 2)  # همپوشانی بین قطعات
+        self.sample_rate = getattr(settings, 'AUDIO_PCM_SAMPLE_RATE', PCM_SAMPLE_RATE)
         
     async def process_visit_audio(
         self,
@@ -26,7 +45,7 @@ class AudioProcessingService:
         encounter = await sync_to_async(Encounter.objects.get)(id=encounter_id)
         
         # رمزنگاری صوت
-        encrypted_audio = await encrypt_data(
+        encrypted_audio = await _in_thread(encrypt_bytes)(
             audio_stream,
             encounter.encryption_key
         )
@@ -40,7 +59,7 @@ class AudioProcessingService:
         )
         
         # تحلیل صوت
-        audio_info = await self._analyze_audio(audio_stream)
+        audio_info = await self._analyze_audio(audio_stream, format='webm')
         
         # ایجاد رکورد AudioChunk
         audio_chunk = await sync_to_async(AudioChunk.objects.create)(
@@ -54,7 +73,8 @@ class AudioProcessingService:
             bit_rate=audio_info.get('bit_rate'),
             is_encrypted=True,
             encryption_metadata={
-                'algorithm': 'AES-256-GCM',
+                'algorithm': STREAM_ALGORITHM,
+                'segment_size': STREAM_SEGMENT_SIZE,
                 'key_id': encounter.encryption_key[:8]
             }
         )
@@ -76,48 +96,31 @@ class AudioProcessingService:
         chunks = await sync_to_async(list)(
             AudioChunk.objects.filter(
                 encounter_id=encounter_id
-            ).order_by('chunk_index')
+            ).select_related('encounter').order_by('chunk_index')
         )
         
         if not chunks:
             raise ValueError("هیچ قطعه صوتی یافت نشد")
             
-        # دانلود و رمزگشایی
-        audio_segments = []
-        for chunk in chunks:
-            encrypted_data = await self._download_from_storage(
-                chunk.file_url
+        encounter = chunks[0].encounter
+        
+        # دانلود، رمزگشایی و ادغام قطعه به قطعه با حذف همپوشانی‌ها؛
+        # خروجی رمزگذار MP3 مستقیم رمز و در فایل موقت نوشته می‌شود
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as encrypted_final:
+            writer = EncryptingWriter(encrypted_final, encounter.encryption_key)
+            await self._merge_with_overlap_removal(
+                self._iter_decrypted_chunks(chunks),
+                self.overlap_seconds,
+                sink=writer
             )
+            writer.close()
+            encrypted_final.seek(0)
             
-            decrypted_data = await decrypt_data(
-                encrypted_data,
-                chunk.encounter.encryption_key
+            final_url = await self._upload_to_storage(
+                f"encounters/{encounter_id}/full_recording.mp3",
+                encrypted_final,
+                content_type='audio/mp3'
             )
-            
-            audio_segments.append({
-                'data': decrypted_data,
-                'index': chunk.chunk_index,
-                'duration': chunk.duration_seconds
-            })
-            
-        # ادغام با حذف همپوشانی‌ها
-        merged_audio = await self._merge_with_overlap_removal(
-            audio_segments,
-            self.overlap_seconds
-        )
-        
-        # رمزنگاری و آپلود فایل نهایی
-        encounter = await sync_to_async(Encounter.objects.get)(id=encounter_id)
-        encrypted_final = await encrypt_data(
-            merged_audio,
-            encounter.encryption_key
-        )
-        
-        final_url = await self._upload_to_storage(
-            f"encounters/{encounter_id}/full_recording.mp3",
-            encrypted_final,
-            content_type='audio/mp3'
-        )
         
         return final_url
         
@@ -129,78 +132,163 @@ class AudioProcessingService:
     ) -> bytes:
         """استخراج بخشی از صوت"""
         
+        if end_time <= start_time:
+            return b''
+            
         # پیدا کردن قطعات مربوطه
         chunks = await sync_to_async(list)(
             AudioChunk.objects.filter(
                 encounter_id=encounter_id
-            ).order_by('chunk_index')
+            ).select_related('encounter').order_by('chunk_index')
         )
         
-        # محاسبه قطعات مورد نیاز
+        # محاسبه قطعات مورد نیاز روی خط زمانی صوت ادغام‌شده
+        # (هر قطعه به اندازهٔ همپوشانی اسمی زودتر از پایان قطعهٔ قبلی شروع می‌شود)
         relevant_chunks = []
+        relevant_start = None
         current_time = 0
         
         for chunk in chunks:
             chunk_start = current_time
             chunk_end = current_time + chunk.duration_seconds
             
-            if chunk_end >= start_time and chunk_start <= end_time:
+            if chunk_end > start_time and chunk_start < end_time:
+                if relevant_start is None:
+                    relevant_start = chunk_start
                 relevant_chunks.append(chunk)
+            elif chunk_start >= end_time:
+                break
                 
-            current_time = chunk_end
+            current_time = max(chunk_start, chunk_end - self.overlap_seconds)
+            
+        if not relevant_chunks:
+            return b''
             
         # دانلود و استخراج بخش مورد نظر
         segment_data = await self._extract_segment_from_chunks(
             relevant_chunks,
-            start_time,
-            end_time
+            start_time - relevant_start,
+            end_time - relevant_start
         )
         
         return segment_data
         
-    async def _analyze_audio(self, audio_data: bytes) -> Dict:
+    async def _analyze_audio(self, audio_data: bytes, format: Optional[str] = None) -> Dict:
         """تحلیل مشخصات صوت"""
         
-        # TODO: استفاده از کتابخانه‌هایی مثل pydub برای تحلیل
-        # فعلاً مقادیر پیش‌فرض
-        return {
-            'duration': 30.0,  # 30 ثانیه
-            'sample_rate': 48000,
-            'channels': 1,
-            'bit_rate': 128000,
-            'format': 'webm'
-        }
+        return await sync_to_async(analyze_audio, thread_sensitive=False)(
+            audio_data, format
+        )
+        
+    async def _iter_decrypted_chunks(
+        self,
+        chunks: List[AudioChunk]
+    ) -> AsyncIterator[Dict]:
+        """دانلود و رمزگشایی تک‌تک قطعات به ترتیب (فقط یک قطعه در حافظه)"""
+        
+        for chunk in chunks:
+            encrypted_data = await self._download_from_storage(
+                chunk.file_url
+            )
+            
+            decrypted_data = await _in_thread(decrypt_bytes)(
+                encrypted_data,
+                chunk.encounter.encryption_key
+            )
+            
+            yield {
+                'data': decrypted_data,
+                'index': chunk.chunk_index,
+                'duration': chunk.duration_seconds,
+                'format': chunk.format
+            }
+            
+    @staticmethod
+    async def _iter_segments(segments: Union[Iterable[Dict], AsyncIterator[Dict]]) -> AsyncIterator[Dict]:
+        if hasattr(segments, '__aiter__'):
+            async for segment in segments:
+                yield segment
+        else:
+            for segment in segments:
+                yield segment
+                
+    def _decode_segment(self, segment: Dict, trimmer: OverlapTrimmer) -> np.ndarray:
+        """رمزگشایی یک قطعه به PCM و حذف بخش تکراری ابتدای آن"""
+        
+        samples = decode_pcm(segment['data'], self.sample_rate, segment.get('format'))
+        return trimmer.trim(samples)
         
     async def _merge_with_overlap_removal(
         self,
-        segments: List[Dict],
-        overlap_seconds: float
+        segments: Union[Iterable[Dict], AsyncIterator[Dict]],
+        overlap_seconds: float,
+        sink: Optional[BinaryIO] = None
     ) -> bytes:
-        """ادغام با حذف همپوشانی"""
+        """
+        ادغام با حذف همپوشانی
+        
+        هر قطعه به PCM تبدیل می‌شود، بخش تکراری ابتدای آن با همبستگی متقابل
+        روی پنجرهٔ overlap_seconds پیدا و حذف می‌شود و باقی‌مانده مستقیم به
+        رمزگذار جریانی MP3 نوشته می‌شود. اگر sink داده شود، MP3 در آن نوشته و
+        bytes خالی برگردانده می‌شود.
+        """
+        
+        trimmer = OverlapTrimmer(overlap_seconds, self.sample_rate)
+        encoder = await _in_thread(StreamingEncoder)(
+            format='mp3', sample_rate=self.sample_rate, sink=sink
+        )
         
-        # TODO: پیاده‌سازی الگوریتم ادغام با pydub
-        # فعلاً فقط قطعات را به هم می‌چسبانیم
-        merged = b''
-        for segment in segments:
-            merged += segment['data']
+        try:
+            async for segment in self._iter_segments(segments):
+                samples = await _in_thread(self._decode_segment)(segment, trimmer)
+                await _in_thread(encoder.write)(samples)
+                
+            return await _in_thread(encoder.close)()
+        except BaseException:
+            encoder.abort()
+            raise
             
-        return merged
-        
     async def _extract_segment_from_chunks(
         self,
         chunks: List[AudioChunk],
         start_time: float,
         end_time: float
     ) -> bytes:
-        """استخراج بخش صوتی از قطعات"""
+        """
+        استخراج بخش صوتی از قطعات
         
-        # TODO: پیاده‌سازی با pydub
-        return b''
+        زمان‌ها نسبت به شروع اولین قطعهٔ داده‌شده هستند. فقط همین قطعات
+        رمزگشایی می‌شوند و خروجی WAV تک‌کاناله است.
+        """
+        
+        if not chunks:
+            return b''
+            
+        trimmer = OverlapTrimmer(self.overlap_seconds, self.sample_rate)
+        start_sample = max(int(start_time * self.sample_rate), 0)
+        end_sample = int(end_time * self.sample_rate)
+        
+        parts = []
+        position = 0
+        async for segment in self._iter_decrypted_chunks(chunks):
+            samples = await _in_thread(self._decode_segment)(segment, trimmer)
+            piece_start = position
+            position += len(samples)
+            
+            if position > start_sample:
+                parts.append(samples[max(start_sample - piece_start, 0):end_sample - piece_start])
+            if position >= end_sample:
+                break
+                
+        if not parts:
+            return b''
+            
+        return await _in_thread(encode_wav)(np.concatenate(parts), self.sample_rate)
         
     async def _upload_to_storage(
         self,
         file_path: str,
-        data: bytes,
+        data: Union[bytes, BinaryIO],
         content_type: str
     ) -> str:
         """آپلود به MinIO"""
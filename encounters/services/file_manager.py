@@ -8,7 +8,7 @@ from django.utils import timezone
 from asgiref.sync import sync_to_async
 
 from ..models import Encounter, EncounterFile
-from ..utils.encryption import encrypt_data, decrypt_data
+from ..utils.encryption import decrypt_bytes, encrypt_bytes
 
 
 class InvalidFileTypeError(Exception):
@@ -59,16 +59,10 @@ class EncounterFileManager:
         if not await self._scan_file_security(file_data):
             raise SecurityError("فایل از نظر امنیتی مشکل دارد")
             
-        # رمزنگاری
-        encrypted_data = await encrypt_data(
-            file_data,
-            encounter.encryption_key
-        )
-        
         # تولید hash برای تشخیص تکراری
         file_hash = hashlib.sha256(file_data).hexdigest()
         
-        # بررسی تکراری بودن
+        # بررسی تکراری بودن (پیش از رمزنگاری)
         existing = await sync_to_async(
             EncounterFile.objects.filter(
                 encounter=encounter,
@@ -79,6 +73,12 @@ class EncounterFileManager:
         if existing:
             return existing
             
+        # رمزنگاری جریانی
+        encrypted_data = await sync_to_async(encrypt_bytes, thread_sensitive=False)(
+            file_data,
+            encounter.encryption_key
+        )
+        
         # آپلود به storage
         storage_path = f"encounters/{encounter_id}/files/{file_type}/{file_name}"
         file_url = await self._upload_to_storage(
@@ -180,7 +180,7 @@ class EncounterFileManager:
         encrypted_data = await self._download_from_storage(file.file_url)
         
         # رمزگشایی
-        decrypted_data = await decrypt_data(
+        decrypted_data = await sync_to_async(decrypt_bytes, thread_sensitive=False)(
             encrypted_data,
             file.encounter.encryption_key
         )
@@ -50,6 +50,7 @@ AI_MAX_TOKENS = 2000
 # تنظیمات پردازش صوت
 AUDIO_CHUNK_SIZE_MB = 10
 AUDIO_OVERLAP_SECONDS = 2
+AUDIO_PCM_SAMPLE_RATE = 16000  # نرخ PCM برای ادغام و استخراج بخش‌ها
 AUDIO_MAX_FILE_SIZE_MB = 500
 AUDIO_ALLOWED_FORMATS = ['webm', 'mp3', 'wav', 'ogg']
 
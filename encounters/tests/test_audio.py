@@ -0,0 +1,107 @@
+"""
+تست‌های حذف همپوشانی PCM و خط زمانی استخراج بخش صوتی
+"""
+import asyncio
+import io
+import wave
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..services import audio_processor
+from ..services.audio_processor import AudioProcessingService
+from ..utils.audio import OverlapTrimmer, encode_wav, find_overlap
+
+SAMPLE_RATE = 8000
+OVERLAP_SECONDS = 0.1
+WINDOW = int(OVERLAP_SECONDS * SAMPLE_RATE)
+
+
+def _noise(samples: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(0, 3000, samples), -32768, 32767).astype(np.int16)
+
+
+class FindOverlapTest(SimpleTestCase):
+    """تست پیدا کردن همپوشانی با همبستگی متقابل"""
+    
+    def test_known_overlap_detected_and_removed(self):
+        """تست حذف دقیق همپوشانی 600 نمونه‌ای"""
+        signal = _noise(3 * SAMPLE_RATE)
+        first = signal[:SAMPLE_RATE]
+        second = signal[SAMPLE_RATE - 600:2 * SAMPLE_RATE]
+        
+        self.assertEqual(find_overlap(first, second, WINDOW), 600)
+        
+        trimmer = OverlapTrimmer(OVERLAP_SECONDS, SAMPLE_RATE)
+        merged = np.concatenate((trimmer.trim(first), trimmer.trim(second)))
+        self.assertEqual(trimmer.overlaps, [600])
+        np.testing.assert_array_equal(merged, signal[:2 * SAMPLE_RATE])
+    
+    def test_unrelated_chunks_have_no_overlap(self):
+        """تست قطعات مستقل (بدون همپوشانی)"""
+        self.assertEqual(
+            find_overlap(_noise(SAMPLE_RATE, seed=1), _noise(SAMPLE_RATE, seed=2), WINDOW), 0
+        )
+    
+    def test_silent_template_falls_back_to_window(self):
+        """تست بازگشت به پنجرهٔ اسمی وقتی ابتدای قطعه سکوت است"""
+        head = np.concatenate((np.zeros(WINDOW, dtype=np.int16), _noise(SAMPLE_RATE)))
+        
+        self.assertEqual(find_overlap(_noise(SAMPLE_RATE), head, WINDOW), WINDOW)
+
+
+class ExtractAudioSegmentTest(SimpleTestCase):
+    """تست استخراج بخش از خط زمانی قطعات همپوشان"""
+    
+    def setUp(self):
+        self.service = AudioProcessingService()
+        self.service.sample_rate = SAMPLE_RATE
+        self.service.overlap_seconds = OVERLAP_SECONDS
+        
+        # سه قطعهٔ یک‌ثانیه‌ای؛ هر قطعه 0.1 ثانیه زودتر از پایان قبلی شروع می‌شود
+        self.signal = _noise(int(2.8 * SAMPLE_RATE), seed=3)
+        step = SAMPLE_RATE - WINDOW
+        self.chunks = [
+            SimpleNamespace(
+                chunk_index=i,
+                duration_seconds=1.0,
+                format='wav',
+                data=encode_wav(self.signal[i * step:i * step + SAMPLE_RATE], SAMPLE_RATE)
+            )
+            for i in range(3)
+        ]
+    
+    def _extract(self, start_time: float, end_time: float) -> np.ndarray:
+        queryset = mock.MagicMock()
+        queryset.filter.return_value.select_related.return_value.order_by.return_value = self.chunks
+        
+        async def iter_chunks(chunks):
+            for chunk in chunks:
+                yield {'data': chunk.data, 'index': chunk.chunk_index, 'format': chunk.format}
+        
+        with mock.patch.object(
+            audio_processor, 'AudioChunk', SimpleNamespace(objects=queryset)
+        ), mock.patch.object(self.service, '_iter_decrypted_chunks', iter_chunks):
+            output = asyncio.run(
+                self.service.extract_audio_segment('encounter', start_time, end_time)
+            )
+        
+        with wave.open(io.BytesIO(output)) as wav:
+            return np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    
+    def test_extraction_across_chunk_boundary(self):
+        """تست بخشی که از مرز قطعهٔ اول به دوم عبور می‌کند"""
+        samples = self._extract(0.5, 1.5)
+        
+        self.assertEqual(len(samples), SAMPLE_RATE)
+        np.testing.assert_array_equal(samples, self.signal[4000:12000])
+    
+    def test_extraction_starting_after_first_chunk(self):
+        """تست شروع خط زمانی از قطعهٔ میانی"""
+        samples = self._extract(1.85, 2.05)
+        
+        self.assertEqual(len(samples), int(0.2 * SAMPLE_RATE))
+        np.testing.assert_array_equal(samples, self.signal[14800:16400])
@@ -0,0 +1,133 @@
+"""
+تست‌های قالب جریانی رمزنگاری فایل‌های ویزیت
+"""
+import asyncio
+import io
+import struct
+
+from django.test import SimpleTestCase
+
+from ..utils.encryption import (
+    DecryptionError,
+    EncryptingWriter,
+    decrypt_bytes,
+    decrypt_data,
+    encrypt_data,
+    generate_encryption_key,
+    iter_decrypted,
+)
+
+SEGMENT_SIZE = 16
+HEADER_SIZE = 15
+
+
+def _encrypt(data: bytes, key: str) -> bytes:
+    sink = io.BytesIO()
+    writer = EncryptingWriter(sink, key, segment_size=SEGMENT_SIZE)
+    writer.write(data)
+    writer.close()
+    return sink.getvalue()
+
+
+def _split_frames(payload: bytes):
+    """جدا کردن سرآیند و قاب‌های [طول | متن رمز]"""
+    header, frames = payload[:HEADER_SIZE], []
+    position = HEADER_SIZE
+    while position < len(payload):
+        (length,) = struct.unpack('>I', payload[position:position + 4])
+        frames.append(payload[position:position + 4 + length])
+        position += 4 + length
+    return header, frames
+
+
+class StreamEncryptionRoundTripTest(SimpleTestCase):
+    """تست رمزنگاری و رمزگشایی در مرزهای بخش"""
+    
+    def setUp(self):
+        self.key = generate_encryption_key()
+    
+    def test_round_trip_at_segment_boundaries(self):
+        """تست اندازهٔ صفر، یک بخش کامل، یک بخش به‌علاوهٔ یک بایت و چند بخش"""
+        cases = {
+            0: 1,
+            SEGMENT_SIZE: 1,
+            SEGMENT_SIZE + 1: 2,
+            SEGMENT_SIZE * 3 + 5: 4,
+        }
+        for size, frame_count in cases.items():
+            with self.subTest(size=size):
+                data = bytes(i % 251 for i in range(size))
+                payload = _encrypt(data, self.key)
+                
+                self.assertEqual(len(_split_frames(payload)[1]), frame_count)
+                self.assertEqual(decrypt_bytes(payload, self.key), data)
+                self.assertEqual(
+                    b''.join(iter_decrypted(io.BytesIO(payload), self.key)), data
+                )
+    
+    def test_wrong_key_rejected(self):
+        """تست رد رمزگشایی با کلید دیگر"""
+        payload = _encrypt(b'x' * 40, self.key)
+        
+        with self.assertRaises(DecryptionError):
+            decrypt_bytes(payload, generate_encryption_key())
+
+
+class StreamEncryptionTamperTest(SimpleTestCase):
+    """تست کشف دست‌کاری قاب‌ها و سرآیند"""
+    
+    def setUp(self):
+        self.key = generate_encryption_key()
+        self.payload = _encrypt(bytes(range(SEGMENT_SIZE * 3 + 5)), self.key)
+        self.header, self.frames = _split_frames(self.payload)
+    
+    def assertRejected(self, payload: bytes):
+        with self.assertRaises(DecryptionError):
+            decrypt_bytes(payload, self.key)
+    
+    def test_truncated_payload_rejected(self):
+        """تست بریدن وسط قاب و حذف قاب آخر"""
+        self.assertRejected(self.payload[:-3])
+        self.assertRejected(self.header + b''.join(self.frames[:-1]))
+        self.assertRejected(self.header)
+    
+    def test_reordered_frames_rejected(self):
+        """تست جابه‌جایی دو قاب هم‌اندازه"""
+        frames = list(self.frames)
+        frames[0], frames[1] = frames[1], frames[0]
+        self.assertRejected(self.header + b''.join(frames))
+    
+    def test_dropped_frame_rejected(self):
+        """تست حذف یک قاب میانی"""
+        frames = self.frames[:1] + self.frames[2:]
+        self.assertRejected(self.header + b''.join(frames))
+    
+    def test_tampered_header_rejected(self):
+        """تست تغییر پیشوند nonce و اندازهٔ بخش در سرآیند"""
+        for index in (HEADER_SIZE - 1, 7):
+            with self.subTest(index=index):
+                header = bytearray(self.header)
+                header[index] ^= 0x01
+                self.assertRejected(bytes(header) + b''.join(self.frames))
+
+
+class LegacyFernetDecryptionTest(SimpleTestCase):
+    """تست سازگاری با داده‌های قدیمی Fernet+base64"""
+    
+    def setUp(self):
+        self.key = generate_encryption_key()
+        self.legacy = asyncio.run(encrypt_data(b'legacy audio', self.key))
+    
+    def test_legacy_str_and_bytes(self):
+        """تست رمزگشایی قالب قدیمی به‌صورت str و bytes"""
+        self.assertIsInstance(self.legacy, str)
+        self.assertEqual(decrypt_bytes(self.legacy, self.key), b'legacy audio')
+        self.assertEqual(decrypt_bytes(self.legacy.encode(), self.key), b'legacy audio')
+    
+    def test_legacy_through_decrypt_data(self):
+        """تست مسیر async قدیمی decrypt_data"""
+        for payload in (self.legacy, self.legacy.encode()):
+            with self.subTest(type=type(payload).__name__):
+                self.assertEqual(
+                    asyncio.run(decrypt_data(payload, self.key)), b'legacy audio'
+                )
@@ -1,5 +1,9 @@
 # Import utility functions
-from .encryption import generate_encryption_key, encrypt_data, decrypt_data
+from .encryption import (
+    generate_encryption_key, encrypt_data, decrypt_data,
+    encrypt_bytes, decrypt_bytes, encrypt_stream, decrypt_stream,
+    EncryptingWriter, DecryptionError,
+)
 from .generators import generate_prescription_number, generate_access_code
 from .validators import validate_phone_number, validate_national_code
 
@@ -7,6 +11,12 @@ __all__ = [
     'generate_encryption_key',
     'encrypt_data',
     'decrypt_data',
+    'encrypt_bytes',
+    'decrypt_bytes',
+    'encrypt_stream',
+    'decrypt_stream',
+    'EncryptingWriter',
+    'DecryptionError',
     'generate_prescription_number',
     'generate_access_code',
     'validate_phone_number',
@@ -0,0 +1,187 @@
+"""
+ابزارهای سطح PCM برای قطعات صوتی ویزیت
+
+قطعات (webm/ogg/...) با pydub به آرایهٔ NumPy تک‌کاناله با نرخ نمونه‌برداری
+ثابت تبدیل می‌شوند. همپوشانی دو قطعهٔ پشت‌سرهم با همبستگی متقابل نرمال‌شده
+(FFT) روی پنجرهٔ همپوشانی پیدا می‌شود و خروجی نهایی به‌صورت جریانی به stdin
+یک پروسهٔ ffmpeg داده می‌شود تا کل صوت ادغام‌شده هیچ‌وقت به‌صورت PCM در حافظه
+نماند.
+"""
+import io
+import subprocess
+import threading
+import wave
+from typing import Any, BinaryIO, Dict, List, Optional
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.utils import get_encoder_name
+
+# نرخ نمونه‌برداری PCM داخلی (صوت گفتار)
+PCM_SAMPLE_RATE = 16000
+
+# حداقل همبستگی نرمال‌شده برای پذیرش همپوشانی
+MIN_OVERLAP_CORRELATION = 0.6
+
+# انرژی کمتر از این مقدار (RMS نرمال‌شده) سکوت در نظر گرفته می‌شود
+SILENCE_RMS = 1e-3
+
+
+def _to_float(samples: np.ndarray) -> np.ndarray:
+    return samples.astype(np.float32) / 32768.0
+
+
+def decode_pcm(data: bytes, sample_rate: int = PCM_SAMPLE_RATE,
+               format: Optional[str] = None) -> np.ndarray:
+    """رمزگشایی صوت به PCM تک‌کاناله int16 با نرخ sample_rate"""
+    if not data:
+        return np.zeros(0, dtype=np.int16)
+
+    segment = AudioSegment.from_file(io.BytesIO(data), format=format)
+    segment = segment.set_channels(1).set_frame_rate(sample_rate).set_sample_width(2)
+    return np.frombuffer(segment.raw_data, dtype=np.int16)
+
+
+def analyze_audio(data: bytes, format: Optional[str] = None) -> Dict[str, Any]:
+    """مشخصات واقعی صوت (مدت از تعداد نمونه‌ها، bit rate میانگین از حجم فایل)"""
+    segment = AudioSegment.from_file(io.BytesIO(data), format=format)
+    duration = segment.frame_count() / segment.frame_rate if segment.frame_rate else 0.0
+    return {
+        'duration': round(duration, 3),
+        'sample_rate': segment.frame_rate,
+        'channels': segment.channels,
+        'bit_rate': int(len(data) * 8 / duration) if duration else None,
+        'format': format,
+    }
+
+
+def find_overlap(previous_tail: np.ndarray, head: np.ndarray,
+                 window: int, min_correlation: float = MIN_OVERLAP_CORRELATION) -> int:
+    """
+    تعداد نمونه‌های ابتدای head که تکرار انتهای previous_tail هستند
+
+    نیمهٔ اول پنجرهٔ ابتدای head در انتهای قطعهٔ قبلی (تا دو برابر پنجره)
+    جست‌وجو می‌شود. اگر الگو سکوت باشد، همبستگی معنا ندارد و همان پنجرهٔ
+    اسمی برگردانده می‌شود؛ اگر تطابق کافی پیدا نشود، قطعات همپوشانی ندارند.
+    """
+    if window <= 0 or not len(previous_tail) or not len(head):
+        return 0
+
+    tail = _to_float(previous_tail[-2 * window:])
+    template_len = min(max(window // 2, 1), len(head), len(tail))
+    template = _to_float(head[:template_len])
+
+    template_norm = float(np.sqrt(np.dot(template, template)))
+    if template_norm / np.sqrt(template_len) < SILENCE_RMS:
+        return min(window, len(head), len(previous_tail))
+
+    # همبستگی متقابل با FFT: corr[p] = sum(tail[p + k] * template[k])
+    size = 1 << int(len(tail) + template_len - 1).bit_length()
+    spectrum = np.fft.rfft(tail, size) * np.conj(np.fft.rfft(template, size))
+    positions = len(tail) - template_len + 1
+    corr = np.fft.irfft(spectrum, size)[:positions]
+
+    # انرژی هر پنجرهٔ tail برای نرمال‌سازی
+    energy = np.concatenate(([0.0], np.cumsum(tail.astype(np.float64) ** 2)))
+    window_norm = np.sqrt(np.maximum(energy[template_len:] - energy[:positions], 1e-12))
+    normalized = corr / (window_norm * template_norm)
+
+    best = int(np.argmax(normalized))
+    if normalized[best] < min_correlation:
+        return 0
+    return min(len(tail) - best, len(head))
+
+
+class OverlapTrimmer:
+    """
+    حذف همپوشانی قطعات پشت‌سرهم؛ فقط انتهای خروجی قبلی نگه داشته می‌شود
+    """
+
+    def __init__(self, overlap_seconds: float, sample_rate: int = PCM_SAMPLE_RATE):
+        self.window = int(overlap_seconds * sample_rate)
+        self._tail = np.zeros(0, dtype=np.int16)
+        self.overlaps: List[int] = []
+
+    def trim(self, samples: np.ndarray) -> np.ndarray:
+        """بخش جدید قطعه (بدون نمونه‌های تکراری)"""
+        if len(self._tail):
+            skip = find_overlap(self._tail, samples, self.window)
+            self.overlaps.append(skip)
+            samples = samples[skip:]
+
+        keep = 2 * self.window
+        if len(samples) >= keep:
+            self._tail = samples[-keep:]
+        else:
+            self._tail = np.concatenate((self._tail, samples))[-keep:]
+        return samples
+
+
+class StreamingEncoder:
+    """
+    رمزگذار جریانی: PCM به stdin پروسهٔ ffmpeg نوشته و خروجی هم‌زمان خوانده می‌شود
+
+    اگر sink داده شود، خروجی همان‌جا نوشته می‌شود (مثلاً EncryptingWriter) و
+    در حافظه جمع نمی‌شود.
+    """
+
+    def __init__(self, format: str = 'mp3', sample_rate: int = PCM_SAMPLE_RATE,
+                 bitrate: str = '64k', sink: Optional[BinaryIO] = None):
+        command = [
+            get_encoder_name(), '-hide_banner', '-loglevel', 'error',
+            '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0',
+            '-b:a', bitrate, '-f', format, 'pipe:1',
+        ]
+        self._process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self._output: List[bytes] = []
+        self._errors: List[bytes] = []
+        output_write = sink.write if sink is not None else self._output.append
+        # خواندن stdout/stderr در thread جدا تا پر شدن pipe باعث قفل نشود
+        self._readers = [
+            threading.Thread(target=self._drain, args=(self._process.stdout, output_write), daemon=True),
+            threading.Thread(target=self._drain, args=(self._process.stderr, self._errors.append), daemon=True),
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    @staticmethod
+    def _drain(stream, write):
+        for block in iter(lambda: stream.read(65536), b''):
+            write(block)
+
+    def write(self, samples: np.ndarray):
+        if len(samples):
+            self._process.stdin.write(samples.astype(np.int16, copy=False).tobytes())
+
+    def close(self) -> bytes:
+        """پایان ورودی و دریافت فایل رمزگذاری‌شده (در حالت sink خالی)"""
+        self._process.stdin.close()
+        return_code = self._process.wait()
+        for reader in self._readers:
+            reader.join()
+        if return_code != 0:
+            raise RuntimeError(
+                f"خطا در رمزگذاری صوت: {b''.join(self._errors).decode(errors='ignore')}"
+            )
+        return b''.join(self._output)
+
+    def abort(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int = PCM_SAMPLE_RATE) -> bytes:
+    """ساخت فایل WAV از PCM تک‌کاناله int16"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype(np.int16, copy=False).tobytes())
+    return buffer.getvalue()
@@ -1,9 +1,35 @@
 import base64
+import io
+import os
 import secrets
+import struct
+from functools import lru_cache
+from typing import BinaryIO, Iterator, Union
+
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from typing import Union
+
+# قالب جریانی: سرآیند [MAGIC | اندازهٔ بخش | پیشوند nonce] و سپس قاب‌های
+# [طول | متن رمز + tag] که هر کدام جداگانه با AES-256-GCM رمز شده‌اند.
+# nonce هر بخش = پیشوند (7 بایت) + شمارنده (4 بایت) + پرچم آخرین بخش (1 بایت)
+# تا جابه‌جایی، حذف یا بریدن انتهای بخش‌ها هنگام رمزگشایی کشف شود.
+STREAM_MAGIC = b'HSE1'
+STREAM_SEGMENT_SIZE = 64 * 1024
+STREAM_ALGORITHM = 'AES-256-GCM-STREAM'
+
+_HEADER = struct.Struct('>4sI7s')
+_FRAME = struct.Struct('>I')
+_TAG_SIZE = 16
+_MAX_SEGMENTS = 2 ** 32
+
+
+class DecryptionError(Exception):
+    """داده رمزشده نامعتبر یا دست‌کاری‌شده است"""
+    pass
 
 
 def generate_encryption_key() -> str:
@@ -12,8 +38,13 @@ def generate_encryption_key() -> str:
     return base64.urlsafe_b64encode(key).decode()
 
 
-def _get_fernet_instance(key: str) -> Fernet:
-    """ایجاد instance از Fernet با کلید داده شده"""
+@lru_cache(maxsize=1024)
+def _derive_key_material(key: str) -> bytes:
+    """
+    کلید 32 بایتی حاصل از کلید ملاقات
+
+    PBKDF2 با 100 هزار تکرار گران است؛ نتیجه برای هر کلید در LRU نگه داشته می‌شود.
+    """
     try:
         # اگر کلید در فرمت base64 است
         key_bytes = base64.urlsafe_b64decode(key.encode())
@@ -23,7 +54,7 @@ def _get_fernet_instance(key: str) -> Fernet:
         
     # اطمینان از طول صحیح کلید (32 بایت)
     if len(key_bytes) == 32:
-        return Fernet(base64.urlsafe_b64encode(key_bytes))
+        return key_bytes
     else:
         # تولید کلید 32 بایتی از کلید ورودی
         kdf = PBKDF2HMAC(
@@ -32,8 +63,47 @@ def _get_fernet_instance(key: str) -> Fernet:
             salt=b'helssa_salt_2024',  # Salt ثابت برای consistency
             iterations=100000,
         )
-        derived_key = kdf.derive(key_bytes)
-        return Fernet(base64.urlsafe_b64encode(derived_key))
+        return kdf.derive(key_bytes)
+
+
+@lru_cache(maxsize=1024)
+def _get_fernet_instance(key: str) -> Fernet:
+    """ایجاد instance از Fernet با کلید داده شده"""
+    return Fernet(base64.urlsafe_b64encode(_derive_key_material(key)))
+
+
+@lru_cache(maxsize=1024)
+def _get_stream_cipher(key: str) -> AESGCM:
+    """کلید AES-256-GCM قالب جریانی (جدا از کلید Fernet با HKDF)"""
+    stream_key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'helssa-stream-v1',
+    ).derive(_derive_key_material(key))
+    return AESGCM(stream_key)
+
+
+def _segment_nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    if counter >= _MAX_SEGMENTS:
+        raise ValueError("تعداد بخش‌های جریان رمزشده بیش از حد مجاز است")
+    return prefix + struct.pack('>I?', counter, last)
+
+
+def _read_exact(source: BinaryIO, size: int) -> bytes:
+    """خواندن دقیق size بایت (مگر در پایان جریان)"""
+    data = source.read(size)
+    if len(data) == size or not data:
+        return data
+    parts = [data]
+    remaining = size - len(data)
+    while remaining:
+        block = source.read(remaining)
+        if not block:
+            break
+        parts.append(block)
+        remaining -= len(block)
+    return b''.join(parts)
 
 
 async def encrypt_data(data: Union[str, bytes], key: str) -> str:
@@ -48,14 +118,10 @@ async def encrypt_data(data: Union[str, bytes], key: str) -> str:
     return base64.urlsafe_b64encode(encrypted).decode()
 
 
-async def decrypt_data(encrypted_data: str, key: str) -> bytes:
-    """رمزگشایی داده با کلید داده شده"""
-    
-    encrypted_bytes = base64.urlsafe_b64decode(encrypted_data.encode())
-    fernet = _get_fernet_instance(key)
-    decrypted = fernet.decrypt(encrypted_bytes)
+async def decrypt_data(encrypted_data: Union[str, bytes], key: str) -> bytes:
+    """رمزگشایی داده با کلید داده شده (قالب قدیمی یا جریانی)"""
     
-    return decrypted
+    return decrypt_bytes(encrypted_data, key)
 
 
 def generate_secure_token(length: int = 32) -> str:
@@ -71,4 +137,140 @@ def hash_data(data: str) -> str:
 
 def verify_hash(data: str, hash_value: str) -> bool:
     """بررسی صحت hash"""
-    return hash_data(data) == hash_value
\ No newline at end of file
+    return hash_data(data) == hash_value
+
+
+class EncryptingWriter(io.RawIOBase):
+    """
+    فایل قابل نوشتن که داده را بخش به بخش رمز کرده و در sink می‌نویسد
+
+    حافظهٔ مصرفی حداکثر یک بخش است؛ close آخرین بخش را با پرچم پایان می‌نویسد
+    (sink بسته نمی‌شود).
+    """
+
+    def __init__(self, sink: BinaryIO, key: str, segment_size: int = STREAM_SEGMENT_SIZE):
+        self._sink = sink
+        self._cipher = _get_stream_cipher(key)
+        self._segment_size = segment_size
+        self._prefix = os.urandom(7)
+        self._header = _HEADER.pack(STREAM_MAGIC, segment_size, self._prefix)
+        self._buffer = bytearray()
+        self._counter = 0
+        self.bytes_written = len(self._header)
+        sink.write(self._header)
+
+    def writable(self) -> bool:
+        return True
+
+    def _emit(self, plaintext: bytes, last: bool):
+        nonce = _segment_nonce(self._prefix, self._counter, last)
+        ciphertext = self._cipher.encrypt(nonce, plaintext, self._header)
+        self._sink.write(_FRAME.pack(len(ciphertext)))
+        self._sink.write(ciphertext)
+        self._counter += 1
+        self.bytes_written += _FRAME.size + len(ciphertext)
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed EncryptingWriter")
+        self._buffer += data
+        # بخش آخر همیشه در بافر می‌ماند تا هنگام close با پرچم پایان رمز شود
+        while len(self._buffer) > self._segment_size:
+            segment = bytes(self._buffer[:self._segment_size])
+            del self._buffer[:self._segment_size]
+            self._emit(segment, last=False)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._emit(bytes(self._buffer), last=True)
+            self._buffer = bytearray()
+        super().close()
+
+
+def iter_decrypted(source: BinaryIO, key: str) -> Iterator[bytes]:
+    """رمزگشایی جریانی؛ متن ساده بخش به بخش تولید می‌شود"""
+    header = _read_exact(source, _HEADER.size)
+    if len(header) != _HEADER.size:
+        raise DecryptionError("سرآیند جریان رمزشده ناقص است")
+    magic, segment_size, prefix = _HEADER.unpack(header)
+    if magic != STREAM_MAGIC:
+        raise DecryptionError("قالب جریان رمزشده ناشناخته است")
+
+    cipher = _get_stream_cipher(key)
+    max_frame = segment_size + _TAG_SIZE
+
+    def read_frame():
+        length_bytes = _read_exact(source, _FRAME.size)
+        if not length_bytes:
+            return None
+        if len(length_bytes) != _FRAME.size:
+            raise DecryptionError("قاب جریان رمزشده ناقص است")
+        (length,) = _FRAME.unpack(length_bytes)
+        if length < _TAG_SIZE or length > max_frame:
+            raise DecryptionError("طول قاب جریان رمزشده نامعتبر است")
+        frame = _read_exact(source, length)
+        if len(frame) != length:
+            raise DecryptionError("قاب جریان رمزشده ناقص است")
+        return frame
+
+    counter = 0
+    frame = read_frame()
+    if frame is None:
+        raise DecryptionError("جریان رمزشده بخشی ندارد")
+    while frame is not None:
+        # یک قاب جلوتر خوانده می‌شود تا آخرین بودن بخش مشخص باشد
+        next_frame = read_frame()
+        nonce = _segment_nonce(prefix, counter, next_frame is None)
+        try:
+            yield cipher.decrypt(nonce, frame, header)
+        except InvalidTag:
+            raise DecryptionError("داده رمزشده نامعتبر یا دست‌کاری شده است")
+        counter += 1
+        frame = next_frame
+
+
+def encrypt_stream(source: BinaryIO, sink: BinaryIO, key: str,
+                   segment_size: int = STREAM_SEGMENT_SIZE) -> int:
+    """رمزنگاری جریانی از source به sink؛ تعداد بایت‌های نوشته‌شده برگردانده می‌شود"""
+    writer = EncryptingWriter(sink, key, segment_size)
+    for block in iter(lambda: source.read(segment_size), b''):
+        writer.write(block)
+    writer.close()
+    return writer.bytes_written
+
+
+def decrypt_stream(source: BinaryIO, sink: BinaryIO, key: str) -> int:
+    """رمزگشایی جریانی از source به sink؛ تعداد بایت‌های متن ساده برگردانده می‌شود"""
+    total = 0
+    for plaintext in iter_decrypted(source, key):
+        sink.write(plaintext)
+        total += len(plaintext)
+    return total
+
+
+def is_stream_encrypted(data: bytes) -> bool:
+    """آیا داده در قالب جریانی رمز شده است"""
+    return data[:len(STREAM_MAGIC)] == STREAM_MAGIC
+
+
+def encrypt_bytes(data: bytes, key: str) -> bytes:
+    """رمزنگاری داده در قالب جریانی (بدون base64)"""
+    sink = io.BytesIO()
+    encrypt_stream(io.BytesIO(data), sink, key)
+    return sink.getvalue()
+
+
+def decrypt_bytes(data: Union[str, bytes], key: str) -> bytes:
+    """
+    رمزگشایی داده ذخیره‌شده؛ قالب جریانی یا قالب قدیمی Fernet+base64
+    """
+    if isinstance(data, bytes) and is_stream_encrypted(data):
+        sink = io.BytesIO()
+        decrypt_stream(io.BytesIO(data), sink, key)
+        return sink.getvalue()
+
+    if isinstance(data, bytes):
+        data = data.decode()
+    encrypted_bytes = base64.urlsafe_b64decode(data.encode())
+    return _get_fernet_instance(key).decrypt(encrypted_bytes)
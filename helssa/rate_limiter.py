@@ -0,0 +1,174 @@
+"""
+محدودسازی نرخ مشترک با پنجرهٔ لغزان (sliding-window counter)
+Shared constant-memory rate limiter
+
+برای هر کلید فقط دو شمارنده (پنجرهٔ فعلی و قبلی) در کش نگه داشته می‌شود و
+تخمین تعداد درخواست‌ها در پنجرهٔ لغزان برابر است با:
+
+    previous * (1 - elapsed / window) + current
+
+افزایش شمارنده‌ها با ``cache.add``/``cache.incr`` اتمیک است. اگر کش Redis
+(django-redis) باشد و ``RATE_LIMIT_USE_REDIS_LUA`` فعال باشد، کل بررسی با یک
+اسکریپت Lua در یک رفت‌وبرگشت انجام می‌شود.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ratelimit'
+
+_SLIDING_WINDOW_LUA = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2] * 2)
+end
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local estimate = previous * (1 - ARGV[3] / ARGV[2]) + current
+if estimate > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return {0, current - 1, previous}
+end
+return {1, current, previous}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    """
+    نتیجهٔ بررسی محدودیت نرخ
+    """
+
+    allowed: bool
+    count: int
+    limit: int
+    window_seconds: int
+    retry_after: int = 0
+
+    @property
+    def remaining(self) -> int:
+        return max(self.limit - self.count, 0)
+
+
+class SlidingWindowRateLimiter:
+    """
+    محدودکنندهٔ نرخ با حافظهٔ ثابت برای هر کلید
+    """
+
+    def __init__(self, key_prefix: str = KEY_PREFIX, use_redis_lua: Optional[bool] = None):
+        self.key_prefix = key_prefix
+        if use_redis_lua is None:
+            use_redis_lua = getattr(settings, 'RATE_LIMIT_USE_REDIS_LUA', False)
+        self.use_redis_lua = use_redis_lua
+        self._lua_script = None
+
+    def _bucket_key(self, identifier: str, window_seconds: int, bucket: int) -> str:
+        return f"{self.key_prefix}:{identifier}:{window_seconds}:{bucket}"
+
+    def hit(self, identifier: str, limit: int, window_seconds: int, now: Optional[float] = None) -> RateLimitResult:
+        """
+        ثبت یک درخواست و تصمیم‌گیری دربارهٔ مجاز بودن آن
+
+        درخواست‌های رد شده شمرده نمی‌شوند تا کلاینت مسدود در پنجرهٔ بعدی
+        جریمهٔ مضاعف نشود.
+        """
+        now = time.time() if now is None else now
+        bucket = int(now // window_seconds)
+        elapsed = now - bucket * window_seconds
+        current_key = self._bucket_key(identifier, window_seconds, bucket)
+        previous_key = self._bucket_key(identifier, window_seconds, bucket - 1)
+
+        counts = None
+        if self.use_redis_lua:
+            counts = self._hit_redis(current_key, previous_key, limit, window_seconds, elapsed)
+        if counts is None:
+            counts = self._hit_cache(current_key, previous_key, limit, window_seconds, elapsed)
+
+        allowed, current, previous = counts
+        weight = 1 - elapsed / window_seconds
+        estimate = int(math.ceil(previous * weight + current))
+        retry_after = 0
+        if not allowed:
+            retry_after = self._retry_after(limit, window_seconds, elapsed, current, previous)
+        return RateLimitResult(
+            allowed=allowed,
+            count=min(estimate, limit) if allowed else limit,
+            limit=limit,
+            window_seconds=window_seconds,
+            retry_after=retry_after,
+        )
+
+    def _hit_cache(self, current_key: str, previous_key: str, limit: int, window_seconds: int, elapsed: float):
+        # add اتمیک است؛ اگر کلید وجود داشت incr اتمیک اجرا می‌شود
+        if cache.add(current_key, 1, window_seconds * 2):
+            current = 1
+        else:
+            try:
+                current = cache.incr(current_key)
+            except ValueError:
+                # کلید بین add و incr منقضی شده است
+                cache.add(current_key, 1, window_seconds * 2)
+                current = 1
+        previous = cache.get(previous_key, 0) or 0
+        estimate = previous * (1 - elapsed / window_seconds) + current
+        if estimate > limit:
+            try:
+                cache.decr(current_key)
+            except ValueError:
+                pass
+            return False, current - 1, previous
+        return True, current, previous
+
+    def _hit_redis(self, current_key: str, previous_key: str, limit: int, window_seconds: int, elapsed: float):
+        try:
+            if self._lua_script is None:
+                from django_redis import get_redis_connection
+
+                self._lua_script = get_redis_connection('default').register_script(_SLIDING_WINDOW_LUA)
+            allowed, current, previous = self._lua_script(
+                keys=[cache.make_key(current_key), cache.make_key(previous_key)],
+                args=[limit, window_seconds, elapsed],
+            )
+            return bool(allowed), int(current), int(previous)
+        except Exception as e:
+            logger.warning(f"Redis Lua rate limit failed, falling back to cache: {e}")
+            self.use_redis_lua = False
+            return None
+
+    def _retry_after(self, limit: int, window_seconds: int, elapsed: float, current: int, previous: int) -> int:
+        """زمان تقریبی (ثانیه) تا اینکه تخمین پنجرهٔ لغزان زیر سقف برسد"""
+        if current + 1 > limit:
+            # پنجرهٔ فعلی به‌تنهایی سقف را پر کرده است: این درخواست‌ها در پنجرهٔ
+            # بعدی به‌عنوان «قبلی» با وزن نزولی شمرده می‌شوند، پس علاوه بر پایان
+            # پنجرهٔ فعلی باید تا کاهش سهم آن‌ها به زیر سقف صبر کرد
+            needed = (window_seconds - elapsed) + window_seconds * (1 - (limit - 1) / current)
+            return max(int(math.ceil(needed)), 1)
+        if previous <= 0:
+            return max(int(math.ceil(window_seconds - elapsed)), 1)
+        needed = window_seconds * (1 - (limit - current - 1) / previous) - elapsed
+        return max(int(math.ceil(needed)), 1)
+
+    def reset(self, identifier: str, window_seconds: int, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        bucket = int(now // window_seconds)
+        cache.delete_many([
+            self._bucket_key(identifier, window_seconds, bucket),
+            self._bucket_key(identifier, window_seconds, bucket - 1),
+        ])
+
+
+rate_limiter = SlidingWindowRateLimiter()
+
+
+def check_rate_limit(identifier: str, limit: int, window_seconds: int) -> RateLimitResult:
+    """میان‌بر برای محدودکنندهٔ مشترک پروژه"""
+    return rate_limiter.hit(identifier, limit, window_seconds)
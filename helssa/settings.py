@@ -487,6 +487,12 @@ PATIENT_SETTINGS = {
     'ENABLE_SPEECH_PROCESSING': True,
     'MAX_AUDIO_FILE_SIZE_MB': 50,
     'CACHE_TIMEOUT_SECONDS': 300,
+    'STT_MAX_CONCURRENT_CHUNKS': 4,
+    'STREAM_FRAME_SECONDS': 2,
+    'STREAM_BUFFER_FRAMES': 4,
+    'STREAM_QUEUE_SIZE': 64,
+    'STREAM_IDLE_TIMEOUT_SECONDS': 30,
+    'MEDICAL_RECORDS_BULK_BATCH_SIZE': 1000,
 }
 
 # STT Configuration (Optional)
@@ -7,6 +7,7 @@ import logging
 import time
 from django.conf import settings
 from django.core.cache import cache
+from helssa.rate_limiter import rate_limiter
 from integrations.models import IntegrationProvider, IntegrationLog, IntegrationCredential
 
 logger = logging.getLogger(__name__)
@@ -141,19 +142,17 @@ class BaseIntegrationService(ABC):
         )
         
         for rule in rules:
-            cache_key = f"rate_limit:{self.provider_slug}:{action}:{identifier}"
-            current_count = cache.get(cache_key, 0)
+            # شمارنده‌های اتمیک پنجرهٔ لغزان (مشترک با سایر اپ‌ها)
+            rate_identifier = f"integrations:{self.provider_slug}:{rule.pk}:{action}:{identifier}"
+            result = rate_limiter.hit(rate_identifier, rule.max_requests, rule.time_window_seconds)
             
-            if current_count >= rule.max_requests:
+            if not result.allowed:
                 self.log_activity(
                     action=f"rate_limit_exceeded:{action}",
                     log_level='warning',
                     error_message=f"Rate limit exceeded for {identifier}"
                 )
                 return False
-            
-            # افزایش شمارنده
-            cache.set(cache_key, current_count + 1, rule.time_window_seconds)
         
         return True
     
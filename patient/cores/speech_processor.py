@@ -6,16 +6,128 @@ Patient Management Speech Processing Core
 import logging
 import json
 import asyncio
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from django.core.cache import cache
 from django.conf import settings
 import aiohttp
 import io
+import struct
 from pydub import AudioSegment
 
 logger = logging.getLogger(__name__)
 
 
+def _wav_bytes(pcm: memoryview, sample_rate: int, channels: int, sample_width: int) -> bytes:
+    """
+    ساخت فایل WAV از یک برش PCM
+    Wrap a PCM slice in a WAV header (the only copy of the slice's samples)
+    """
+    byte_rate = sample_rate * channels * sample_width
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + len(pcm), b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate, byte_rate,
+        channels * sample_width, sample_width * 8,
+        b'data', len(pcm)
+    )
+    return header + pcm
+
+
+class PcmRingBuffer:
+    """
+    بافر حلقوی پیش‌تخصیص‌یافته برای PCM جریان زنده
+    Preallocated ring buffer that cuts live PCM into fixed-duration frames
+    
+    ظرفیت مضربی از طول frame است و هر frame (حتی ناقص) یک خانهٔ کامل را
+    اشغال می‌کند، پس هر frame یک برش پیوسته (memoryview) از بافر است و
+    کپی نمی‌شود. نوشتن وقتی بافر پر است منتظر release
+    می‌ماند؛ این همان فشار معکوس روی خوانندهٔ صف ورودی است. frameهای کامل
+    پیش از هر انتظار به on_frame تحویل می‌شوند، وگرنه نوشتنی بزرگ‌تر از
+    فضای آزاد هرگز frameی برای release نمی‌داشت.
+    frame ناقص به نمونهٔ کامل (sample_width بایت) گرد می‌شود و نیمهٔ
+    نمونهٔ باقی‌مانده جلوی نوشتن بعدی قرار می‌گیرد.
+    """
+    
+    def __init__(self, frame_bytes: int, frames: int = 4, sample_width: int = 2):
+        self.frame_bytes = frame_bytes
+        self.sample_width = sample_width
+        self.capacity = frame_bytes * max(frames, 1)
+        self._view = memoryview(bytearray(self.capacity))
+        # موقعیت‌های مطلق (بدون wrap)
+        self._written = 0
+        self._framed = 0
+        self._released = 0
+        self._carry = b''
+        self._space = asyncio.Condition()
+    
+    @property
+    def pending(self) -> int:
+        """بایت‌های نوشته‌شده‌ای که هنوز frame نشده‌اند"""
+        return self._written - self._framed
+    
+    async def write(self, data: bytes, on_frame: Optional[Callable[[memoryview], None]] = None):
+        """
+        نوشتن داده؛ در صورت پر بودن بافر تا آزاد شدن frameها صبر می‌کند
+        
+        frameهای کامل (پیش از هر انتظار و در پایان) به on_frame داده می‌شوند.
+        بدون on_frame نوشتنی که بافر را پر کند بن‌بست می‌شود.
+        """
+        if self._carry:
+            # بایت‌های نمونهٔ ناتمام frame ناقص قبلی
+            data, self._carry = self._carry + bytes(data), b''
+        data = memoryview(data).cast('B')
+        while data:
+            if on_frame is not None:
+                self._emit_frames(on_frame)
+            async with self._space:
+                await self._space.wait_for(
+                    lambda: self._written - self._released < self.capacity
+                )
+            position = self._written % self.capacity
+            size = min(
+                len(data),
+                self.capacity - (self._written - self._released),
+                self.capacity - position
+            )
+            self._view[position:position + size] = data[:size]
+            self._written += size
+            data = data[size:]
+        if on_frame is not None:
+            self._emit_frames(on_frame)
+    
+    def _emit_frames(self, on_frame: Callable[[memoryview], None]):
+        """تحویل همهٔ frameهای کامل موجود"""
+        frame = self.next_frame()
+        while frame is not None:
+            on_frame(frame)
+            frame = self.next_frame()
+    
+    def next_frame(self, partial: bool = False) -> Optional[memoryview]:
+        """frame کامل بعدی (یا باقی‌ماندهٔ ناقص وقتی partial=True)"""
+        size = min(self.pending, self.frame_bytes)
+        if not size or (size < self.frame_bytes and not partial):
+            return None
+        position = self._framed % self.capacity
+        remainder = size % self.sample_width
+        if remainder:
+            # نیمهٔ نمونه از بافر برداشته و برای نوشتن بعدی نگه داشته می‌شود
+            self._carry = bytes(self._view[position + size - remainder:position + size])
+            self._written -= remainder
+            size -= remainder
+            if not size:
+                return None
+        # frame ناقص: نوشتن بعدی از ابتدای خانهٔ بعد ادامه می‌یابد
+        self._written += self.frame_bytes - size
+        self._framed += self.frame_bytes
+        return self._view[position:position + size]
+    
+    async def release(self):
+        """آزادسازی خانهٔ قدیمی‌ترین frame پس از مصرف (به ترتیب تحویل)"""
+        async with self._space:
+            self._released += self.frame_bytes
+            self._space.notify_all()
+
+
 class PatientSpeechProcessor:
     """
     هسته پردازش گفتار برای مدیریت اطلاعات بیماران
@@ -28,6 +140,16 @@ class PatientSpeechProcessor:
         self.max_file_size = 50 * 1024 * 1024  # 50MB
         self.chunk_duration = 30  # seconds
         self.overlap_duration = 2  # seconds
+        self.max_overlap_words = 10
+        patient_settings = getattr(settings, 'PATIENT_SETTINGS', {})
+        self.max_concurrent_chunks = patient_settings.get('STT_MAX_CONCURRENT_CHUNKS', 4)
+        
+        # جریان زنده: PCM 16 بیتی تک‌کاناله، قطعه‌بندی زمانی
+        self.stream_frame_seconds = patient_settings.get('STREAM_FRAME_SECONDS', 2)
+        self.stream_buffer_frames = patient_settings.get('STREAM_BUFFER_FRAMES', 4)
+        self.stream_queue_size = patient_settings.get('STREAM_QUEUE_SIZE', 64)
+        self.stream_idle_timeout = patient_settings.get('STREAM_IDLE_TIMEOUT_SECONDS', 30)
+        self._stream_tasks = set()
         
         # تنظیمات STT
         self.stt_config = {
@@ -78,13 +200,10 @@ class PatientSpeechProcessor:
             # تقسیم به قطعات در صورت نیاز
             audio_chunks = await self._split_audio_if_needed(preprocessed_audio)
             
-            # پردازش STT برای هر قطعه
-            transcription_results = []
-            for i, chunk in enumerate(audio_chunks):
-                chunk_result = await self._process_audio_chunk(
-                    chunk, i, processing_options
-                )
-                transcription_results.append(chunk_result)
+            # پردازش STT قطعات به‌صورت هم‌زمان (با سقف هم‌زمانی) و حفظ ترتیب
+            transcription_results = await self._process_audio_chunks(
+                audio_chunks, processing_options
+            )
             
             # ادغام نتایج
             final_transcription = await self._merge_transcription_results(
@@ -133,20 +252,30 @@ class PatientSpeechProcessor:
                 'message': 'خطا در پردازش فایل صوتی'
             }
     
+    def create_audio_stream(self) -> asyncio.Queue:
+        """
+        صف محدود ورودی جریان زنده
+        Bounded input queue; producers wait on put() when processing lags
+        """
+        return asyncio.Queue(maxsize=self.stream_queue_size)
+    
     async def process_live_audio_stream(
         self,
         audio_stream: asyncio.Queue,
         session_id: str,
-        callback_url: Optional[str] = None
+        callback_url: Optional[str] = None,
+        sample_rate: int = 16000
     ) -> Dict[str, Any]:
         """
         پردازش جریان صوتی زنده
         Process live audio stream
         
         Args:
-            audio_stream: صف داده‌های صوتی
+            audio_stream: صف داده‌های صوتی (PCM 16 بیتی تک‌کاناله؛ None یعنی پایان).
+                برای فشار معکوس از create_audio_stream استفاده کنید
             session_id: شناسه جلسه
             callback_url: آدرس callback برای نتایج
+            sample_rate: نرخ نمونه‌برداری PCM ورودی
             
         Returns:
             Dict: اطلاعات جلسه پردازش
@@ -163,12 +292,14 @@ class PatientSpeechProcessor:
             # ذخیره اطلاعات جلسه در کش
             cache.set(f"speech_session:{session_id}", session_data, timeout=3600)
             
-            # شروع پردازش جریان
-            asyncio.create_task(
+            # شروع پردازش جریان (نگهداری ارجاع task تا پایان آن)
+            task = asyncio.create_task(
                 self._process_stream_chunks(
-                    audio_stream, session_id, callback_url
+                    audio_stream, session_id, callback_url, sample_rate
                 )
             )
+            self._stream_tasks.add(task)
+            task.add_done_callback(self._stream_tasks.discard)
             
             return {
                 'success': True,
@@ -285,6 +416,10 @@ class PatientSpeechProcessor:
             if audio_segment.channels > 1:
                 audio_segment = audio_segment.set_channels(1)
             
+            # PCM 16 بیتی
+            if audio_segment.sample_width != 2:
+                audio_segment = audio_segment.set_sample_width(2)
+            
             # نرمال‌سازی حجم صدا
             audio_segment = audio_segment.normalize()
             
@@ -295,17 +430,15 @@ class PatientSpeechProcessor:
                 padding=500          # ms
             )
             
-            # تبدیل به فرمت مناسب STT (معمولاً WAV)
-            output_buffer = io.BytesIO()
-            audio_segment.export(output_buffer, format='wav')
-            processed_audio = output_buffer.getvalue()
-            
+            # نگهداری PCM خام؛ قطعات برش‌های بدون کپی از همین بافر هستند و
+            # فقط هنگام ارسال به STT سرآیند WAV می‌گیرند
             return {
-                'audio_data': processed_audio,
+                'pcm': memoryview(audio_segment.raw_data),
                 'duration': len(audio_segment) / 1000,  # ثانیه
                 'sample_rate': audio_segment.frame_rate,
                 'channels': audio_segment.channels,
-                'format': 'wav'
+                'sample_width': audio_segment.sample_width,
+                'format': 'pcm'
             }
             
         except Exception as e:
@@ -319,6 +452,8 @@ class PatientSpeechProcessor:
         """
         تقسیم صوت به قطعات در صورت نیاز
         Split audio into chunks if needed
+        
+        قطعات برش‌های memoryview از بافر PCM هستند (بدون رمزگذاری مجدد).
         """
         duration = preprocessed_audio['duration']
         
@@ -326,73 +461,86 @@ class PatientSpeechProcessor:
         if duration <= self.chunk_duration:
             return [preprocessed_audio]
         
+        pcm = preprocessed_audio['pcm']
+        sample_rate = preprocessed_audio['sample_rate']
+        frame_width = preprocessed_audio['channels'] * preprocessed_audio['sample_width']
+        total_frames = len(pcm) // frame_width
+        chunk_frames = int(self.chunk_duration * sample_rate)
+        step_frames = chunk_frames - int(self.overlap_duration * sample_rate)
+        
         chunks = []
-        audio_data = preprocessed_audio['audio_data']
+        start_frame = 0
+        chunk_index = 0
         
-        try:
-            audio_segment = AudioSegment.from_file(
-                io.BytesIO(audio_data),
-                format='wav'
-            )
-            
-            # تقسیم با همپوشانی
-            start_time = 0
-            chunk_index = 0
+        # تقسیم با همپوشانی
+        while True:
+            end_frame = min(start_frame + chunk_frames, total_frames)
             
-            while start_time < duration:
-                end_time = min(start_time + self.chunk_duration, duration)
-                
-                # استخراج قطعه
-                start_ms = int(start_time * 1000)
-                end_ms = int(end_time * 1000)
-                chunk_segment = audio_segment[start_ms:end_ms]
-                
-                # تبدیل به bytes
-                chunk_buffer = io.BytesIO()
-                chunk_segment.export(chunk_buffer, format='wav')
-                chunk_data = chunk_buffer.getvalue()
-                
-                chunks.append({
-                    'audio_data': chunk_data,
-                    'duration': len(chunk_segment) / 1000,
-                    'sample_rate': chunk_segment.frame_rate,
-                    'channels': chunk_segment.channels,
-                    'format': 'wav',
-                    'chunk_index': chunk_index,
-                    'start_time': start_time,
-                    'end_time': end_time
-                })
-                
-                # حرکت به قطعه بعدی با همپوشانی
-                start_time = end_time - self.overlap_duration
-                chunk_index += 1
-                
-                # جلوگیری از حلقه بی‌نهایت
-                if start_time >= duration - self.overlap_duration:
-                    break
+            chunks.append({
+                'pcm': pcm[start_frame * frame_width:end_frame * frame_width],
+                'duration': (end_frame - start_frame) / sample_rate,
+                'sample_rate': sample_rate,
+                'channels': preprocessed_audio['channels'],
+                'sample_width': preprocessed_audio['sample_width'],
+                'format': 'pcm',
+                'chunk_index': chunk_index,
+                'start_time': start_frame / sample_rate,
+                'end_time': end_frame / sample_rate
+            })
             
-            return chunks
+            if end_frame >= total_frames:
+                break
+            start_frame += step_frames
+            chunk_index += 1
+        
+        return chunks
+    
+    async def _process_audio_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        processing_options: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        پردازش هم‌زمان قطعات با سقف max_concurrent_chunks
+        Process chunks concurrently; results keep the chunk order
+        """
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrent_chunks))
+        
+        async with aiohttp.ClientSession() as session:
+            async def run(index: int, chunk: Dict[str, Any]) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self._process_audio_chunk(
+                        chunk, index, processing_options, session
+                    )
             
-        except Exception as e:
-            self.logger.error(f"Audio splitting error: {str(e)}")
-            # در صورت خطا، صوت اصلی را برگردان
-            return [preprocessed_audio]
+            return await asyncio.gather(
+                *(run(i, chunk) for i, chunk in enumerate(chunks))
+            )
     
     async def _process_audio_chunk(
         self,
         chunk: Dict[str, Any],
         chunk_index: int,
-        processing_options: Optional[Dict[str, Any]] = None
+        processing_options: Optional[Dict[str, Any]] = None,
+        session: Optional[aiohttp.ClientSession] = None
     ) -> Dict[str, Any]:
         """
         پردازش یک قطعه صوتی
         Process a single audio chunk
         """
         try:
+            audio_data = _wav_bytes(
+                chunk['pcm'],
+                chunk['sample_rate'],
+                chunk['channels'],
+                chunk['sample_width']
+            )
+            
             # ارسال به سرویس STT
             stt_result = await self._send_to_stt_service(
-                chunk['audio_data'],
-                processing_options or {}
+                audio_data,
+                processing_options or {},
+                session
             )
             
             # پس‌پردازش نتیجه
@@ -422,7 +570,8 @@ class PatientSpeechProcessor:
     async def _send_to_stt_service(
         self,
         audio_data: bytes,
-        options: Dict[str, Any]
+        options: Dict[str, Any],
+        session: Optional[aiohttp.ClientSession] = None
     ) -> Dict[str, Any]:
         """
         ارسال به سرویس STT
@@ -435,19 +584,43 @@ class PatientSpeechProcessor:
             
             # ارسال درخواست به OpenAI Whisper API یا سرویس STT محلی
             if hasattr(settings, 'OPENAI_API_KEY') and settings.OPENAI_API_KEY:
-                return await self._send_to_openai_whisper(audio_data, stt_config)
+                return await self._send_to_openai_whisper(audio_data, stt_config, session)
             else:
                 # استفاده از سرویس STT محلی
-                return await self._send_to_local_stt(audio_data, stt_config)
+                return await self._send_to_local_stt(audio_data, stt_config, session)
                 
         except Exception as e:
             self.logger.error(f"STT service error: {str(e)}")
             raise
     
+    async def _post_form(
+        self,
+        session: Optional[aiohttp.ClientSession],
+        url: str,
+        form: aiohttp.FormData,
+        headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Any]:
+        """
+        ارسال فرم multipart با session مشترک (یا session موقت)
+        Post a multipart form, reusing the caller's session when given
+        """
+        own_session = session is None
+        if own_session:
+            session = aiohttp.ClientSession()
+        try:
+            async with session.post(url, headers=headers, data=form) as response:
+                if response.status == 200:
+                    return response.status, await response.json()
+                return response.status, await response.text()
+        finally:
+            if own_session:
+                await session.close()
+    
     async def _send_to_openai_whisper(
         self,
         audio_data: bytes,
-        config: Dict[str, Any]
+        config: Dict[str, Any],
+        session: Optional[aiohttp.ClientSession] = None
     ) -> Dict[str, Any]:
         """
         ارسال به OpenAI Whisper API
@@ -459,31 +632,27 @@ class PatientSpeechProcessor:
             }
             
             # آماده‌سازی فایل برای ارسال
-            files = {
-                'file': ('audio.wav', audio_data, 'audio/wav'),
-                'model': (None, config.get('model', 'whisper-1')),
-                'language': (None, config.get('language', 'fa')),
-                'response_format': (None, config.get('response_format', 'json')),
-                'temperature': (None, str(config.get('temperature', 0.2)))
-            }
+            form = aiohttp.FormData()
+            form.add_field('file', audio_data, filename='audio.wav', content_type='audio/wav')
+            form.add_field('model', config.get('model', 'whisper-1'))
+            form.add_field('language', config.get('language', 'fa'))
+            form.add_field('response_format', config.get('response_format', 'json'))
+            form.add_field('temperature', str(config.get('temperature', 0.2)))
             
             # اضافه کردن واژگان پزشکی
             if self.medical_vocabulary:
-                files['prompt'] = (None, ' '.join(self.medical_vocabulary[:10]))
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    'https://api.openai.com/v1/audio/transcriptions',
-                    headers=headers,
-                    data=files
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"OpenAI API error: {error_text}")
-                        
+                form.add_field('prompt', ' '.join(self.medical_vocabulary[:10]))
+            
+            status, result = await self._post_form(
+                session,
+                'https://api.openai.com/v1/audio/transcriptions',
+                form,
+                headers=headers
+            )
+            if status == 200:
+                return result
+            raise Exception(f"OpenAI API error: {result}")
+            
         except Exception as e:
             self.logger.error(f"OpenAI Whisper error: {str(e)}")
             raise
@@ -491,7 +660,8 @@ class PatientSpeechProcessor:
     async def _send_to_local_stt(
         self,
         audio_data: bytes,
-        config: Dict[str, Any]
+        config: Dict[str, Any],
+        session: Optional[aiohttp.ClientSession] = None
     ) -> Dict[str, Any]:
         """
         ارسال به سرویس STT محلی
@@ -501,33 +671,25 @@ class PatientSpeechProcessor:
             # اتصال به سرویس STT محلی (Whisper self-hosted)
             local_stt_url = getattr(settings, 'LOCAL_STT_URL', 'http://localhost:8000')
             
-            files = {
-                'audio': ('audio.wav', audio_data, 'audio/wav')
-            }
+            form = aiohttp.FormData()
+            form.add_field('audio', audio_data, filename='audio.wav', content_type='audio/wav')
+            form.add_field('language', config.get('language', 'fa'))
+            form.add_field('model', config.get('model', 'base'))
+            form.add_field('task', 'transcribe')
             
-            data = {
-                'language': config.get('language', 'fa'),
-                'model': config.get('model', 'base'),
-                'task': 'transcribe'
+            status, result = await self._post_form(
+                session, f"{local_stt_url}/transcribe", form
+            )
+            if status == 200:
+                return result
+            
+            # در صورت عدم دسترسی به سرویس، از یک پاسخ فرضی استفاده کن
+            return {
+                'text': '[STT service unavailable]',
+                'confidence': 0.1,
+                'language': 'fa'
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{local_stt_url}/transcribe",
-                    data=data,
-                    data=files
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        # در صورت عدم دسترسی به سرویس، از یک پاسخ فرضی استفاده کن
-                        return {
-                            'text': '[STT service unavailable]',
-                            'confidence': 0.1,
-                            'language': 'fa'
-                        }
-                        
         except Exception as e:
             self.logger.error(f"Local STT error: {str(e)}")
             # پاسخ پیش‌فرض در صورت خطا
@@ -587,25 +749,24 @@ class PatientSpeechProcessor:
             # مرتب‌سازی بر اساس chunk_index
             successful_chunks.sort(key=lambda x: x['chunk_index'])
             
-            # ادغام متن‌ها
-            full_text = ""
+            # ادغام متن‌ها روی فهرست کلمات؛ فقط کلمات انتهایی برای حذف
+            # همپوشانی مقایسه می‌شوند و متن کامل یک بار در پایان ساخته می‌شود
+            merged_words: List[str] = []
             all_segments = []
             total_confidence = 0
+            last_segment_end = None
             
-            for i, chunk in enumerate(successful_chunks):
+            for chunk in successful_chunks:
                 transcription = chunk['transcription']
-                chunk_text = transcription.get('text', '').strip()
+                chunk_words = transcription.get('text', '').split()
                 
-                if chunk_text:
+                if chunk_words:
                     # حذف همپوشانی در صورت وجود
-                    if i > 0 and full_text:
-                        chunk_text = await self._remove_overlap(
-                            full_text, chunk_text
+                    if merged_words:
+                        chunk_words = self._remove_overlap_words(
+                            merged_words[-self.max_overlap_words:], chunk_words
                         )
-                    
-                    if full_text and not full_text.endswith(' '):
-                        full_text += ' '
-                    full_text += chunk_text
+                    merged_words.extend(chunk_words)
                 
                 # جمع‌آوری segments
                 segments = transcription.get('segments', [])
@@ -618,11 +779,17 @@ class PatientSpeechProcessor:
                             adjusted_segment['start'] += start_offset
                         if 'end' in adjusted_segment:
                             adjusted_segment['end'] += start_offset
+                            # segmentهای ناحیهٔ همپوشانی که قبلاً ثبت شده‌اند
+                            if last_segment_end is not None and adjusted_segment['end'] <= last_segment_end:
+                                continue
+                            last_segment_end = adjusted_segment['end']
                         all_segments.append(adjusted_segment)
                 
                 # محاسبه میانگین confidence
                 total_confidence += transcription.get('confidence', 0.8)
             
+            full_text = ' '.join(merged_words)
+            
             avg_confidence = total_confidence / len(successful_chunks) if successful_chunks else 0.0
             
             return {
@@ -642,25 +809,25 @@ class PatientSpeechProcessor:
                 'segments': []
             }
     
-    async def _remove_overlap(self, previous_text: str, current_text: str) -> str:
+    def _remove_overlap_words(
+        self,
+        previous_tail: List[str],
+        current_words: List[str]
+    ) -> List[str]:
         """
-        حذف همپوشانی بین متن‌ها
-        Remove overlap between texts
+        حذف همپوشانی بین کلمات انتهای متن قبلی و ابتدای قطعهٔ فعلی
+        Remove overlap between the previous tail words and the current chunk
         """
-        # الگوریتم ساده برای حذف همپوشانی
-        words_prev = previous_text.split()
-        words_curr = current_text.split()
-        
         # جستجوی بزرگترین همپوشانی در انتهای متن قبلی و ابتدای متن فعلی
-        max_overlap = min(len(words_prev), len(words_curr), 10)  # حداکثر 10 کلمه
+        max_overlap = min(len(previous_tail), len(current_words), self.max_overlap_words)
         
         for overlap_len in range(max_overlap, 0, -1):
-            if words_prev[-overlap_len:] == words_curr[:overlap_len]:
+            if previous_tail[-overlap_len:] == current_words[:overlap_len]:
                 # همپوشانی یافت شد، حذف از ابتدای متن فعلی
-                return ' '.join(words_curr[overlap_len:])
+                return current_words[overlap_len:]
         
         # همپوشانی یافت نشد
-        return current_text
+        return current_words
     
     async def _analyze_medical_speech_content(
         self,
@@ -828,96 +995,155 @@ class PatientSpeechProcessor:
         self,
         audio_stream: asyncio.Queue,
         session_id: str,
-        callback_url: Optional[str] = None
+        callback_url: Optional[str] = None,
+        sample_rate: int = 16000
     ):
         """
         پردازش قطعات جریان صوتی
         Process stream chunks
+        
+        خواندن صف و نوشتن در بافر حلقوی از رونویسی frameها جداست؛ اگر
+        رونویسی عقب بماند، بافر پر می‌شود، خواندن صف متوقف می‌شود و صف
+        محدود ورودی تولیدکننده را منتظر نگه می‌دارد.
         """
-        try:
-            chunk_buffer = b''
-            chunk_counter = 0
-            
-            while True:
-                try:
-                    # دریافت داده از صف با timeout
-                    chunk_data = await asyncio.wait_for(
-                        audio_stream.get(), timeout=5.0
-                    )
+        sample_width = 2
+        frame_bytes = int(self.stream_frame_seconds * sample_rate) * sample_width
+        ring = PcmRingBuffer(frame_bytes, self.stream_buffer_frames)
+        frames: asyncio.Queue = asyncio.Queue()
+        
+        session_key = f"speech_session:{session_id}"
+        session_data = cache.get(session_key) or {
+            'session_id': session_id,
+            'chunks_processed': 0,
+            'total_text': ''
+        }
+        session_data['status'] = 'active'
+        
+        async with aiohttp.ClientSession() as http_session:
+            worker = asyncio.create_task(
+                self._transcribe_stream_frames(
+                    frames, ring, sample_rate, session_data,
+                    callback_url, http_session
+                )
+            )
+            try:
+                while True:
+                    try:
+                        chunk_data = await asyncio.wait_for(
+                            audio_stream.get(), timeout=self.stream_idle_timeout
+                        )
+                    except asyncio.TimeoutError:
+                        # سکوت طولانی: ارسال باقی‌ماندهٔ بافر و بررسی لغو جلسه
+                        frame = ring.next_frame(partial=True)
+                        if frame is not None:
+                            frames.put_nowait(frame)
+                        cached = cache.get(session_key)
+                        if not cached or cached.get('status') != 'active':
+                            break
+                        continue
                     
                     if chunk_data is None:  # سیگنال پایان
                         break
                     
-                    chunk_buffer += chunk_data
-                    
-                    # پردازش اگر بافر به اندازه کافی پر شد
-                    if len(chunk_buffer) >= 32768:  # 32KB
-                        result = await self._process_stream_chunk(
-                            chunk_buffer, chunk_counter, session_id
-                        )
-                        
-                        # ارسال نتیجه به callback
-                        if callback_url and result.get('success'):
-                            await self._send_callback(callback_url, result)
-                        
-                        chunk_buffer = b''
-                        chunk_counter += 1
-                        
-                except asyncio.TimeoutError:
-                    # Timeout - چک کردن وضعیت جلسه
-                    session_data = cache.get(f"speech_session:{session_id}")
-                    if not session_data or session_data.get('status') != 'active':
-                        break
-                    continue
+                    # frameهای کامل به ترتیب زمان برای رونویسی (حتی وسط نوشتن)
+                    await ring.write(chunk_data, on_frame=frames.put_nowait)
                     
-        except Exception as e:
-            self.logger.error(f"Stream processing error: {str(e)}")
-        finally:
-            # پردازش باقی‌مانده بافر
-            if chunk_buffer:
-                await self._process_stream_chunk(
-                    chunk_buffer, chunk_counter, session_id
-                )
-            
-            # بروزرسانی وضعیت جلسه
-            session_data = cache.get(f"speech_session:{session_id}")
-            if session_data:
+            except Exception as e:
+                self.logger.error(f"Stream processing error: {str(e)}")
+            finally:
+                # پردازش باقی‌مانده بافر
+                frame = ring.next_frame(partial=True)
+                if frame is not None:
+                    frames.put_nowait(frame)
+                frames.put_nowait(None)
+                await worker
+                
+                # بروزرسانی وضعیت جلسه
                 session_data['status'] = 'completed'
-                cache.set(f"speech_session:{session_id}", session_data, timeout=3600)
+                cache.set(session_key, session_data, timeout=3600)
+    
+    async def _transcribe_stream_frames(
+        self,
+        frames: asyncio.Queue,
+        ring: PcmRingBuffer,
+        sample_rate: int,
+        session_data: Dict[str, Any],
+        callback_url: Optional[str],
+        http_session: aiohttp.ClientSession
+    ):
+        """
+        رونویسی ترتیبی frameهای جریان و ارسال نتایج جزئی
+        Transcribe stream frames in order and push partial results
+        """
+        chunk_counter = 0
+        offset = 0
+        
+        while True:
+            frame = await frames.get()
+            if frame is None:
+                break
+            
+            chunk = {
+                'pcm': frame,
+                'sample_rate': sample_rate,
+                'channels': 1,
+                'sample_width': 2,
+                'duration': len(frame) / (2 * sample_rate),
+                'start_time': offset / (2 * sample_rate),
+                'end_time': (offset + len(frame)) / (2 * sample_rate)
+            }
+            offset += len(frame)
+            
+            result = await self._process_stream_chunk(
+                chunk, chunk_counter, session_data, ring, http_session
+            )
+            
+            # ارسال نتیجه به callback
+            if callback_url and result.get('success'):
+                await self._send_callback(callback_url, result, http_session)
+            
+            chunk_counter += 1
     
     async def _process_stream_chunk(
         self,
-        chunk_data: bytes,
+        chunk: Dict[str, Any],
         chunk_index: int,
-        session_id: str
+        session_data: Dict[str, Any],
+        ring: PcmRingBuffer,
+        http_session: aiohttp.ClientSession
     ) -> Dict[str, Any]:
         """
         پردازش یک قطعه از جریان
         Process a single stream chunk
         """
+        session_id = session_data['session_id']
         try:
-            # پردازش مشابه فایل صوتی عادی
-            result = await self.process_patient_audio(
-                chunk_data, 'wav', {'stream_mode': True}
+            # ساخت WAV و آزادسازی فوری فضای بافر حلقوی
+            try:
+                audio_data = _wav_bytes(chunk.pop('pcm'), chunk['sample_rate'], 1, 2)
+            finally:
+                await ring.release()
+            
+            # ارسال مستقیم PCM به STT (بدون رمزگشایی دوبارهٔ فایل)
+            stt_result = await self._send_to_stt_service(
+                audio_data, {'stream_mode': True}, http_session
             )
+            transcription = await self._post_process_stt_result(stt_result, chunk_index)
             
             # بروزرسانی اطلاعات جلسه
-            session_data = cache.get(f"speech_session:{session_id}")
-            if session_data:
-                session_data['chunks_processed'] += 1
-                if result.get('success'):
-                    transcription = result.get('transcription', {})
-                    text = transcription.get('text', '')
-                    if text:
-                        session_data['total_text'] += ' ' + text
-                
-                cache.set(f"speech_session:{session_id}", session_data, timeout=3600)
+            session_data['chunks_processed'] += 1
+            text = transcription.get('text', '')
+            if text:
+                session_data['total_text'] += ' ' + text
+            cache.set(f"speech_session:{session_id}", session_data, timeout=3600)
             
             return {
                 'success': True,
                 'session_id': session_id,
                 'chunk_index': chunk_index,
-                'result': result
+                'start_time': chunk['start_time'],
+                'end_time': chunk['end_time'],
+                'result': transcription
             }
             
         except Exception as e:
@@ -928,21 +1154,25 @@ class PatientSpeechProcessor:
                 'chunk_index': chunk_index
             }
     
-    async def _send_callback(self, callback_url: str, data: Dict[str, Any]):
+    async def _send_callback(
+        self,
+        callback_url: str,
+        data: Dict[str, Any],
+        session: aiohttp.ClientSession
+    ):
         """
         ارسال نتیجه به callback URL
-        Send result to callback URL
+        Send result to callback URL over the stream's shared session
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    callback_url,
-                    json=data,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status != 200:
-                        self.logger.warning(
-                            f"Callback failed: {response.status}"
-                        )
+            async with session.post(
+                callback_url,
+                json=data,
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                if response.status != 200:
+                    self.logger.warning(
+                        f"Callback failed: {response.status}"
+                    )
         except Exception as e:
             self.logger.error(f"Callback error: {str(e)}")
\ No newline at end of file
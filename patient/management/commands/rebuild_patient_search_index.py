@@ -0,0 +1,42 @@
+"""
+بازسازی ایندکس جستجوی بیماران
+Rebuild patient lookup index
+"""
+
+from django.core.management.base import BaseCommand
+
+from patient.models import PatientProfile
+from patient.search_index import rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    بازسازی توکن‌های جستجوی نام برای پروفایل‌های موجود
+
+    برای پر کردن اولیهٔ جدول PatientSearchToken و پس از تغییر قواعد
+    نرمال‌سازی استفاده می‌شود؛ ذخیره‌های عادی از طریق signal همگام می‌مانند.
+
+    استفاده:
+        python manage.py rebuild_patient_search_index
+        python manage.py rebuild_patient_search_index --batch-size 500
+    """
+    help = 'بازسازی توکن‌های جستجوی نام بیماران'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='تعداد بیمار در هر تراکنش',
+        )
+
+    def handle(self, *args, **options):
+        """اجرای بازسازی"""
+        batch_size = max(options['batch_size'], 1)
+        patients = PatientProfile.objects.only(
+            'id', 'first_name', 'last_name'
+        ).order_by('pk').iterator(chunk_size=batch_size)
+
+        count = rebuild_index(patients, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f"توکن‌های جستجوی {count} بیمار بازسازی شد"))
@@ -274,6 +274,38 @@ class PatientProfile(models.Model):
         return f"P{year}-{new_number:06d}"
 
 
+class PatientSearchToken(models.Model):
+    """
+    توکن جستجوی نام بیمار
+    Normalized name-prefix token for patient lookup
+    
+    هر ردیف یک پیشوند نرمال‌شده از نام یا نام خانوادگی بیمار است
+    (patient.search_index). با تغییر نام، توکن‌ها از طریق signal بازسازی می‌شوند.
+    """
+    
+    patient = models.ForeignKey(
+        PatientProfile,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+        verbose_name='بیمار'
+    )
+    
+    token = models.CharField(
+        max_length=16,
+        verbose_name='توکن'
+    )
+    
+    class Meta:
+        verbose_name = 'توکن جستجوی بیمار'
+        verbose_name_plural = 'توکن‌های جستجوی بیماران'
+        indexes = [
+            models.Index(fields=['token', 'patient']),
+        ]
+    
+    def __str__(self):
+        return f"{self.token} - {self.patient_id}"
+
+
 class MedicalRecord(models.Model):
     """
     سابقه پزشکی بیمار
@@ -0,0 +1,164 @@
+"""
+ایندکس جستجوی بیماران
+Patient lookup index
+
+نام و نام خانوادگی بیمار به توکن‌های نرمال‌شده (یکسان‌سازی ی/ي و ک/ك، حذف
+نیم‌فاصله، اعراب و کشیده) شکسته می‌شوند و پیشوندهای هر توکن در جدول
+PatientSearchToken ذخیره می‌شوند. جستجوی نام به چند lookup دقیق روی ایندکس
+(token, patient) تبدیل می‌شود و هزینهٔ آن به تعداد نتایج بستگی دارد، نه به
+اندازهٔ جدول بیماران. کد ملی و شماره پرونده مسیر تطابق دقیق دارند.
+"""
+
+import re
+from typing import Iterable, List, Optional, Set
+
+from django.db import transaction
+from django.db.models import Q
+
+# طول پیشوندهای ذخیره‌شده برای هر توکن
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 16
+
+# حداکثر تعداد توکن‌های کوئری که در جستجو استفاده می‌شوند
+MAX_QUERY_TOKENS = 4
+
+NATIONAL_CODE_LENGTH = 10
+MEDICAL_RECORD_PATTERN = re.compile(r'^P\d{4}-\d{6}$')
+
+_CHARACTER_MAP = str.maketrans({
+    'ي': 'ی',
+    'ى': 'ی',
+    'ئ': 'ی',
+    'ك': 'ک',
+    'ة': 'ه',
+    'ۀ': 'ه',
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ؤ': 'و',
+    '\u200c': '',  # نیم‌فاصله
+    '\u200d': '',
+    '\u0640': '',  # کشیده
+})
+
+_DIGIT_MAP = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+
+# اعراب عربی
+_DIACRITICS = re.compile('[\u064B-\u065F\u0670]')
+
+_TOKEN_SPLIT = re.compile(r'[^\w]+')
+
+
+def normalize_digits(text: str) -> str:
+    """تبدیل ارقام فارسی و عربی به لاتین"""
+    return (text or '').translate(_DIGIT_MAP)
+
+
+def normalize_text(text: str) -> str:
+    """نرمال‌سازی متن فارسی برای مقایسه"""
+    text = _DIACRITICS.sub('', normalize_digits(text).translate(_CHARACTER_MAP))
+    return text.lower().strip()
+
+
+def tokenize(text: str) -> List[str]:
+    """توکن‌های نرمال‌شدهٔ متن"""
+    return [token for token in _TOKEN_SPLIT.split(normalize_text(text)) if token]
+
+
+def name_prefixes(*values: str) -> Set[str]:
+    """پیشوندهای قابل جستجوی توکن‌های نام"""
+    prefixes = set()
+    for value in values:
+        for token in tokenize(value):
+            token = token[:MAX_PREFIX_LENGTH]
+            for length in range(MIN_PREFIX_LENGTH, len(token) + 1):
+                prefixes.add(token[:length])
+    return prefixes
+
+
+def index_patient(patient):
+    """بازسازی توکن‌های جستجوی یک بیمار"""
+    from .models import PatientSearchToken
+
+    tokens = name_prefixes(patient.first_name, patient.last_name)
+    with transaction.atomic():
+        PatientSearchToken.objects.filter(patient=patient).delete()
+        PatientSearchToken.objects.bulk_create([
+            PatientSearchToken(patient=patient, token=token)
+            for token in tokens
+        ])
+
+
+def rebuild_index(patients: Iterable, batch_size: int = 1000) -> int:
+    """بازسازی ایندکس برای مجموعه‌ای از بیماران؛ تعداد بیماران را برمی‌گرداند"""
+    from .models import PatientSearchToken
+
+    count = 0
+    batch = []
+
+    def flush():
+        with transaction.atomic():
+            PatientSearchToken.objects.filter(
+                patient_id__in=[patient.pk for patient in batch]
+            ).delete()
+            PatientSearchToken.objects.bulk_create(
+                [
+                    PatientSearchToken(patient_id=patient.pk, token=token)
+                    for patient in batch
+                    for token in name_prefixes(patient.first_name, patient.last_name)
+                ],
+                batch_size=batch_size
+            )
+
+    for patient in patients:
+        batch.append(patient)
+        count += 1
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    return count
+
+
+def name_filter(query: str) -> Q:
+    """
+    فیلتر بیمارانی که همهٔ توکن‌های کوئری پیشوند یکی از توکن‌های نامشان است
+    """
+    from .models import PatientSearchToken
+
+    tokens = [
+        token[:MAX_PREFIX_LENGTH]
+        for token in tokenize(query)
+        if len(token) >= MIN_PREFIX_LENGTH
+    ][:MAX_QUERY_TOKENS]
+    if not tokens:
+        return Q(pk__in=[])
+
+    search_filter = Q()
+    for token in dict.fromkeys(tokens):
+        search_filter &= Q(pk__in=PatientSearchToken.objects.filter(
+            token=token
+        ).values('patient_id'))
+    return search_filter
+
+
+def code_filter(query: str, search_type: str = 'all') -> Optional[Q]:
+    """
+    تطابق دقیق (یا پیشوندی) کد ملی و شماره پرونده؛ None یعنی کوئری کد نیست
+    """
+    code = normalize_digits(query).strip().upper()
+
+    if search_type in ('all', 'national_code') and code.isdigit():
+        if len(code) == NATIONAL_CODE_LENGTH:
+            return Q(national_code=code)
+        return Q(national_code__startswith=code)
+
+    if search_type in ('all', 'medical_record') and (
+        search_type == 'medical_record' or re.match(r'^P\d', code)
+    ):
+        if MEDICAL_RECORD_PATTERN.match(code):
+            return Q(medical_record_number=code)
+        return Q(medical_record_number__startswith=code)
+
+    return None
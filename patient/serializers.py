@@ -325,6 +325,22 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
         return data
 
 
+class MedicalRecordImportSerializer(MedicalRecordSerializer):
+    """
+    سریالایزر ورود انبوه سوابق پزشکی
+    Medical Record Bulk Import Serializer
+    
+    بیمار و ایجادکننده را سرویس از قبل یک‌جا بارگذاری می‌کند، بنابراین
+    اعتبارسنجی این سریالایزر هیچ کوئری دیتابیسی ندارد.
+    """
+    
+    class Meta(MedicalRecordSerializer.Meta):
+        read_only_fields = MedicalRecordSerializer.Meta.read_only_fields + [
+            'patient',
+            'created_by',
+        ]
+
+
 class PrescriptionHistorySerializer(serializers.ModelSerializer):
     """
     سریالایزر تاریخچه نسخه‌ها
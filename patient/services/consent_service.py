@@ -4,11 +4,13 @@ Consent Management Service
 """
 
 import logging
+from collections import Counter
 from typing import Dict, Any, List, Optional, Tuple
+from asgiref.sync import sync_to_async
 from django.db import transaction
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.utils import timezone
 from datetime import datetime, timedelta
 import hashlib
@@ -51,7 +53,7 @@ class ConsentService:
         try:
             # اعتبارسنجی داده‌ها
             serializer = MedicalConsentSerializer(data=consent_data)
-            if not serializer.is_valid():
+            if not await sync_to_async(serializer.is_valid)():
                 return False, {
                     'error': 'validation_failed',
                     'errors': serializer.errors,
@@ -79,32 +81,31 @@ class ConsentService:
                 }
             
             # ایجاد رضایت‌نامه
-            with transaction.atomic():
-                if requested_by:
-                    consent_data['requested_by'] = requested_by.id
-                
-                consent = serializer.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Consent created: {consent.id}",
-                    extra={
-                        'consent_id': str(consent.id),
-                        'patient_id': str(consent.patient.id),
-                        'consent_type': consent.consent_type,
-                        'requested_by': requested_by.id if requested_by else None
-                    }
-                )
-                
-                # پاک کردن کش مرتبط
-                await self._clear_patient_consents_cache(patient_id)
-                
-                return True, {
+            if requested_by:
+                consent_data['requested_by'] = requested_by.id
+            
+            consent, saved_data = await sync_to_async(self._save_consent)(serializer)
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Consent created: {consent.id}",
+                extra={
                     'consent_id': str(consent.id),
-                    'message': 'رضایت‌نامه با موفقیت ایجاد شد',
-                    'consent_data': MedicalConsentSerializer(consent).data
+                    'patient_id': str(consent.patient_id),
+                    'consent_type': consent.consent_type,
+                    'requested_by': requested_by.id if requested_by else None
                 }
-                
+            )
+            
+            # پاک کردن کش مرتبط
+            await self._clear_patient_consents_cache(patient_id)
+            
+            return True, {
+                'consent_id': str(consent.id),
+                'message': 'رضایت‌نامه با موفقیت ایجاد شد',
+                'consent_data': saved_data
+            }
+            
         except Exception as e:
             self.logger.error(
                 f"Error creating consent: {str(e)}",
@@ -159,9 +160,13 @@ class ConsentService:
                 )
             
             # دریافت از دیتابیس
-            consents = MedicalConsent.objects.filter(filters).order_by(
-                '-created_at'
-            )
+            consents = [
+                consent async for consent in MedicalConsent.objects.filter(
+                    filters
+                ).select_related(
+                    'patient', 'requested_by', 'processed_by'
+                ).order_by('-created_at')
+            ]
             
             # به‌روزرسانی وضعیت منقضی‌ها
             await self._update_expired_consents(consents)
@@ -209,9 +214,9 @@ class ConsentService:
             
             # دریافت از دیتابیس
             try:
-                consent = MedicalConsent.objects.select_related(
+                consent = await MedicalConsent.objects.select_related(
                     'patient', 'requested_by', 'processed_by'
-                ).get(id=consent_id)
+                ).aget(id=consent_id)
             except MedicalConsent.DoesNotExist:
                 return False, {
                     'error': 'consent_not_found',
@@ -268,7 +273,9 @@ class ConsentService:
             
             # دریافت رضایت‌نامه
             try:
-                consent = MedicalConsent.objects.get(id=consent_id)
+                consent = await MedicalConsent.objects.select_related(
+                    'patient', 'requested_by', 'processed_by'
+                ).aget(id=consent_id)
             except MedicalConsent.DoesNotExist:
                 return False, {
                     'error': 'consent_not_found',
@@ -290,38 +297,37 @@ class ConsentService:
             )
             
             # ثبت رضایت
-            with transaction.atomic():
-                ip_address = client_info.get('ip_address', '0.0.0.0') if client_info else '0.0.0.0'
-                user_agent = client_info.get('user_agent', '') if client_info else ''
-                
-                consent.grant_consent(
-                    digital_signature=digital_signature,
-                    ip_address=ip_address,
-                    user_agent=user_agent
-                )
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Consent granted: {consent.id}",
-                    extra={
-                        'consent_id': str(consent.id),
-                        'patient_id': str(consent.patient.id),
-                        'consent_type': consent.consent_type,
-                        'ip_address': ip_address,
-                        'signature_hash': hashlib.sha256(digital_signature.encode()).hexdigest()[:16]
-                    }
-                )
-                
-                # پاک کردن کش
-                cache.delete(f"consent:{consent_id}")
-                await self._clear_patient_consents_cache(str(consent.patient.id))
-                
-                return True, {
-                    'message': 'رضایت با موفقیت ثبت شد',
-                    'consent_data': MedicalConsentSerializer(consent).data,
-                    'granted_at': consent.consent_date.isoformat() if consent.consent_date else None
+            ip_address = client_info.get('ip_address', '0.0.0.0') if client_info else '0.0.0.0'
+            user_agent = client_info.get('user_agent', '') if client_info else ''
+            
+            await sync_to_async(consent.grant_consent)(
+                digital_signature=digital_signature,
+                ip_address=ip_address,
+                user_agent=user_agent
+            )
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Consent granted: {consent.id}",
+                extra={
+                    'consent_id': str(consent.id),
+                    'patient_id': str(consent.patient_id),
+                    'consent_type': consent.consent_type,
+                    'ip_address': ip_address,
+                    'signature_hash': hashlib.sha256(digital_signature.encode()).hexdigest()[:16]
                 }
-                
+            )
+            
+            # پاک کردن کش
+            cache.delete(f"consent:{consent_id}")
+            await self._clear_patient_consents_cache(str(consent.patient_id))
+            
+            return True, {
+                'message': 'رضایت با موفقیت ثبت شد',
+                'consent_data': MedicalConsentSerializer(consent).data,
+                'granted_at': consent.consent_date.isoformat() if consent.consent_date else None
+            }
+            
         except Exception as e:
             self.logger.error(f"Error granting consent: {str(e)}")
             return False, {
@@ -342,7 +348,9 @@ class ConsentService:
         try:
             # دریافت رضایت‌نامه
             try:
-                consent = MedicalConsent.objects.get(id=consent_id)
+                consent = await MedicalConsent.objects.select_related(
+                    'patient', 'requested_by', 'processed_by'
+                ).aget(id=consent_id)
             except MedicalConsent.DoesNotExist:
                 return False, {
                     'error': 'consent_not_found',
@@ -357,38 +365,29 @@ class ConsentService:
                 }
             
             # لغو رضایت
-            with transaction.atomic():
-                consent.revoke_consent()
-                
-                # اضافه کردن دلیل لغو
-                if reason:
-                    if consent.notes:
-                        consent.notes += f"\n\nلغو شده: {reason}"
-                    else:
-                        consent.notes = f"لغو شده: {reason}"
-                    consent.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Consent revoked: {consent.id}",
-                    extra={
-                        'consent_id': str(consent.id),
-                        'patient_id': str(consent.patient.id),
-                        'consent_type': consent.consent_type,
-                        'revoked_by': revoked_by.id if revoked_by else None,
-                        'reason': reason
-                    }
-                )
-                
-                # پاک کردن کش
-                cache.delete(f"consent:{consent_id}")
-                await self._clear_patient_consents_cache(str(consent.patient.id))
-                
-                return True, {
-                    'message': 'رضایت لغو شد',
-                    'consent_data': MedicalConsentSerializer(consent).data
+            await sync_to_async(self._revoke_consent)(consent, reason)
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Consent revoked: {consent.id}",
+                extra={
+                    'consent_id': str(consent.id),
+                    'patient_id': str(consent.patient_id),
+                    'consent_type': consent.consent_type,
+                    'revoked_by': revoked_by.id if revoked_by else None,
+                    'reason': reason
                 }
-                
+            )
+            
+            # پاک کردن کش
+            cache.delete(f"consent:{consent_id}")
+            await self._clear_patient_consents_cache(str(consent.patient_id))
+            
+            return True, {
+                'message': 'رضایت لغو شد',
+                'consent_data': MedicalConsentSerializer(consent).data
+            }
+            
         except Exception as e:
             self.logger.error(f"Error revoking consent: {str(e)}")
             return False, {
@@ -449,9 +448,13 @@ class ConsentService:
             
             # اجرای جستجو
             limit = search_params.get('limit', 100)
-            consents = MedicalConsent.objects.filter(filters).select_related(
-                'patient', 'requested_by', 'processed_by'
-            ).order_by('-created_at')[:limit]
+            consents = [
+                consent async for consent in MedicalConsent.objects.filter(
+                    filters
+                ).select_related(
+                    'patient', 'requested_by', 'processed_by'
+                ).order_by('-created_at')[:limit]
+            ]
             
             # سریالایز نتایج
             results = MedicalConsentSerializer(consents, many=True).data
@@ -485,7 +488,9 @@ class ConsentService:
         try:
             # دریافت رضایت‌نامه
             try:
-                consent = MedicalConsent.objects.get(id=consent_id)
+                consent = await MedicalConsent.objects.select_related(
+                    'patient', 'requested_by', 'processed_by'
+                ).aget(id=consent_id)
             except MedicalConsent.DoesNotExist:
                 return False, {
                     'error': 'consent_not_found',
@@ -557,13 +562,32 @@ class ConsentService:
     async def _validate_patient_exists(self, patient_id: str) -> bool:
         """بررسی وجود بیمار"""
         try:
-            return PatientProfile.objects.filter(
+            return await PatientProfile.objects.filter(
                 id=patient_id,
                 is_active=True
-            ).exists()
+            ).aexists()
         except Exception:
             return False
     
+    def _save_consent(self, serializer) -> Tuple[MedicalConsent, Dict[str, Any]]:
+        """ذخیره و سریالایز رضایت‌نامه در یک تراکنش (واحد کار همگام)"""
+        with transaction.atomic():
+            consent = serializer.save()
+        return consent, MedicalConsentSerializer(consent).data
+    
+    def _revoke_consent(self, consent: MedicalConsent, reason: Optional[str] = None):
+        """لغو رضایت و ثبت دلیل آن در یک تراکنش"""
+        with transaction.atomic():
+            consent.revoke_consent()
+            
+            # اضافه کردن دلیل لغو
+            if reason:
+                if consent.notes:
+                    consent.notes += f"\n\nلغو شده: {reason}"
+                else:
+                    consent.notes = f"لغو شده: {reason}"
+                consent.save()
+    
     async def _check_duplicate_consent(
         self,
         patient_id: str,
@@ -572,12 +596,12 @@ class ConsentService:
     ) -> Dict[str, Any]:
         """بررسی تکراری بودن رضایت‌نامه"""
         try:
-            existing_consent = MedicalConsent.objects.filter(
+            existing_consent = await MedicalConsent.objects.filter(
                 patient_id=patient_id,
                 consent_type=consent_type,
                 title=title,
                 status__in=['pending', 'granted']
-            ).first()
+            ).afirst()
             
             return {
                 'has_duplicate': existing_consent is not None,
@@ -668,7 +692,7 @@ class ConsentService:
                 for consent in expired_consents:
                     consent.status = 'expired'
                 
-                MedicalConsent.objects.bulk_update(
+                await MedicalConsent.objects.abulk_update(
                     expired_consents, ['status']
                 )
                 
@@ -676,21 +700,15 @@ class ConsentService:
             self.logger.error(f"Error updating expired consents: {str(e)}")
     
     async def _calculate_consents_statistics(self, consents) -> Dict[str, Any]:
-        """محاسبه آمار رضایت‌نامه‌ها"""
+        """محاسبه آمار رضایت‌نامه‌ها (روی رضایت‌نامه‌های بارگذاری‌شده، بدون کوئری اضافه)"""
         try:
-            total_count = consents.count()
+            total_count = len(consents)
             
             # آمار بر اساس وضعیت
-            status_stats = {}
-            status_counts = consents.values('status').annotate(count=Count('id'))
-            for item in status_counts:
-                status_stats[item['status']] = item['count']
+            status_stats = dict(Counter(c.status for c in consents))
             
             # آمار بر اساس نوع
-            type_stats = {}
-            type_counts = consents.values('consent_type').annotate(count=Count('id'))
-            for item in type_counts:
-                type_stats[item['consent_type']] = item['count']
+            type_stats = dict(Counter(c.consent_type for c in consents))
             
             # رضایت‌نامه‌های منقضی شده
             expired_count = len([c for c in consents if c.is_expired])
@@ -3,8 +3,13 @@
 Medical Records Management Service
 """
 
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from collections import Counter
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
@@ -12,7 +17,7 @@ from django.db.models import Q, Count
 from datetime import datetime, timedelta
 
 from ..models import PatientProfile, MedicalRecord
-from ..serializers import MedicalRecordSerializer
+from ..serializers import MedicalRecordSerializer, MedicalRecordImportSerializer
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -27,6 +32,8 @@ class MedicalRecordService:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.cache_timeout = 600  # 10 minutes
+        patient_settings = getattr(settings, 'PATIENT_SETTINGS', {})
+        self.bulk_batch_size = patient_settings.get('MEDICAL_RECORDS_BULK_BATCH_SIZE', 1000)
     
     async def create_medical_record(
         self,
@@ -47,7 +54,7 @@ class MedicalRecordService:
         try:
             # اعتبارسنجی داده‌ها
             serializer = MedicalRecordSerializer(data=record_data)
-            if not serializer.is_valid():
+            if not await sync_to_async(serializer.is_valid)():
                 return False, {
                     'error': 'validation_failed',
                     'errors': serializer.errors,
@@ -63,32 +70,31 @@ class MedicalRecordService:
                 }
             
             # ایجاد سابقه پزشکی
-            with transaction.atomic():
-                if created_by:
-                    record_data['created_by'] = created_by.id
-                
-                medical_record = serializer.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Medical record created: {medical_record.id}",
-                    extra={
-                        'medical_record_id': str(medical_record.id),
-                        'patient_id': str(medical_record.patient.id),
-                        'record_type': medical_record.record_type,
-                        'created_by': created_by.id if created_by else None
-                    }
-                )
-                
-                # پاک کردن کش مرتبط
-                await self._clear_patient_records_cache(patient_id)
-                
-                return True, {
+            if created_by:
+                record_data['created_by'] = created_by.id
+            
+            medical_record, medical_record_data = await sync_to_async(self._save_record)(serializer)
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Medical record created: {medical_record.id}",
+                extra={
                     'medical_record_id': str(medical_record.id),
-                    'message': 'سابقه پزشکی با موفقیت ایجاد شد',
-                    'record_data': MedicalRecordSerializer(medical_record).data
+                    'patient_id': str(medical_record.patient_id),
+                    'record_type': medical_record.record_type,
+                    'created_by': created_by.id if created_by else None
                 }
-                
+            )
+            
+            # پاک کردن کش مرتبط
+            await self._clear_patient_records_cache(patient_id)
+            
+            return True, {
+                'medical_record_id': str(medical_record.id),
+                'message': 'سابقه پزشکی با موفقیت ایجاد شد',
+                'record_data': medical_record_data
+            }
+            
         except Exception as e:
             self.logger.error(
                 f"Error creating medical record: {str(e)}",
@@ -132,7 +138,11 @@ class MedicalRecordService:
                 filters &= Q(record_type=record_type)
             
             # دریافت از دیتابیس
-            records = MedicalRecord.objects.filter(filters).order_by('-start_date', '-created_at')
+            records = [
+                record async for record in MedicalRecord.objects.filter(filters).select_related(
+                    'patient', 'created_by'
+                ).order_by('-start_date', '-created_at')
+            ]
             
             # سریالایز داده‌ها
             records_data = MedicalRecordSerializer(records, many=True).data
@@ -177,9 +187,9 @@ class MedicalRecordService:
             
             # دریافت از دیتابیس
             try:
-                record = MedicalRecord.objects.select_related(
+                record = await MedicalRecord.objects.select_related(
                     'patient', 'created_by'
-                ).get(id=record_id)
+                ).aget(id=record_id)
             except MedicalRecord.DoesNotExist:
                 return False, {
                     'error': 'record_not_found',
@@ -216,7 +226,9 @@ class MedicalRecordService:
         try:
             # دریافت سابقه پزشکی
             try:
-                record = MedicalRecord.objects.get(id=record_id)
+                record = await MedicalRecord.objects.select_related(
+                    'patient', 'created_by'
+                ).aget(id=record_id)
             except MedicalRecord.DoesNotExist:
                 return False, {
                     'error': 'record_not_found',
@@ -230,7 +242,7 @@ class MedicalRecordService:
                 partial=True
             )
             
-            if not serializer.is_valid():
+            if not await sync_to_async(serializer.is_valid)():
                 return False, {
                     'error': 'validation_failed',
                     'errors': serializer.errors,
@@ -238,29 +250,28 @@ class MedicalRecordService:
                 }
             
             # بروزرسانی
-            with transaction.atomic():
-                updated_record = serializer.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Medical record updated: {updated_record.id}",
-                    extra={
-                        'medical_record_id': str(updated_record.id),
-                        'patient_id': str(updated_record.patient.id),
-                        'updated_fields': list(update_data.keys()),
-                        'updated_by': updated_by.id if updated_by else None
-                    }
-                )
-                
-                # پاک کردن کش
-                cache.delete(f"medical_record:{record_id}")
-                await self._clear_patient_records_cache(str(updated_record.patient.id))
-                
-                return True, {
-                    'message': 'سابقه پزشکی بروزرسانی شد',
-                    'record_data': MedicalRecordSerializer(updated_record).data
+            updated_record, record_data = await sync_to_async(self._save_record)(serializer)
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Medical record updated: {updated_record.id}",
+                extra={
+                    'medical_record_id': str(updated_record.id),
+                    'patient_id': str(updated_record.patient_id),
+                    'updated_fields': list(update_data.keys()),
+                    'updated_by': updated_by.id if updated_by else None
                 }
-                
+            )
+            
+            # پاک کردن کش
+            cache.delete(f"medical_record:{record_id}")
+            await self._clear_patient_records_cache(str(updated_record.patient_id))
+            
+            return True, {
+                'message': 'سابقه پزشکی بروزرسانی شد',
+                'record_data': record_data
+            }
+            
         except Exception as e:
             self.logger.error(f"Error updating medical record: {str(e)}")
             return False, {
@@ -280,7 +291,7 @@ class MedicalRecordService:
         try:
             # دریافت سابقه پزشکی
             try:
-                record = MedicalRecord.objects.get(id=record_id)
+                record = await MedicalRecord.objects.aget(id=record_id)
             except MedicalRecord.DoesNotExist:
                 return False, {
                     'error': 'record_not_found',
@@ -288,36 +299,35 @@ class MedicalRecordService:
                 }
             
             # حذف
-            with transaction.atomic():
-                patient_id = str(record.patient.id)
-                record_info = {
-                    'id': str(record.id),
-                    'title': record.title,
-                    'type': record.record_type
-                }
-                
-                record.delete()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Medical record deleted: {record_info['id']}",
-                    extra={
-                        'medical_record_id': record_info['id'],
-                        'patient_id': patient_id,
-                        'record_type': record_info['type'],
-                        'deleted_by': deleted_by.id if deleted_by else None
-                    }
-                )
-                
-                # پاک کردن کش
-                cache.delete(f"medical_record:{record_id}")
-                await self._clear_patient_records_cache(patient_id)
-                
-                return True, {
-                    'message': 'سابقه پزشکی حذف شد',
-                    'deleted_record': record_info
+            patient_id = str(record.patient_id)
+            record_info = {
+                'id': str(record.id),
+                'title': record.title,
+                'type': record.record_type
+            }
+            
+            await record.adelete()
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Medical record deleted: {record_info['id']}",
+                extra={
+                    'medical_record_id': record_info['id'],
+                    'patient_id': patient_id,
+                    'record_type': record_info['type'],
+                    'deleted_by': deleted_by.id if deleted_by else None
                 }
-                
+            )
+            
+            # پاک کردن کش
+            cache.delete(f"medical_record:{record_id}")
+            await self._clear_patient_records_cache(patient_id)
+            
+            return True, {
+                'message': 'سابقه پزشکی حذف شد',
+                'deleted_record': record_info
+            }
+            
         except Exception as e:
             self.logger.error(f"Error deleting medical record: {str(e)}")
             return False, {
@@ -371,9 +381,11 @@ class MedicalRecordService:
             
             # اجرای جستجو
             limit = search_params.get('limit', 100)
-            records = MedicalRecord.objects.filter(filters).select_related(
-                'patient', 'created_by'
-            ).order_by('-start_date', '-created_at')[:limit]
+            records = [
+                record async for record in MedicalRecord.objects.filter(filters).select_related(
+                    'patient', 'created_by'
+                ).order_by('-start_date', '-created_at')[:limit]
+            ]
             
             # سریالایز نتایج
             results = MedicalRecordSerializer(records, many=True).data
@@ -424,10 +436,31 @@ class MedicalRecordService:
                 patient_id=patient_id
             ).order_by('-start_date')
             
+            # کوئری‌های مستقل خلاصه به‌صورت هم‌زمان
+            (
+                total_records,
+                type_counts,
+                severity_counts,
+                ongoing,
+                allergies,
+                surgeries,
+                family_history,
+                recent
+            ) = await asyncio.gather(
+                records.acount(),
+                self._fetch(records.order_by().values('record_type').annotate(count=Count('id'))),
+                self._fetch(records.order_by().values('severity').annotate(count=Count('id'))),
+                self._fetch(records.filter(is_ongoing=True)[:10]),
+                self._fetch(records.filter(record_type='allergy')[:10]),
+                self._fetch(records.filter(record_type='surgery')[:10]),
+                self._fetch(records.filter(record_type='family_history')[:10]),
+                self._fetch(records.select_related('patient', 'created_by')[:10])
+            )
+            
             # تجمیع اطلاعات
             summary = {
                 'patient_id': patient_id,
-                'total_records': records.count(),
+                'total_records': total_records,
                 'by_type': {},
                 'by_severity': {},
                 'ongoing_conditions': [],
@@ -438,17 +471,14 @@ class MedicalRecordService:
             }
             
             # تجمیع بر اساس نوع
-            type_counts = records.values('record_type').annotate(count=Count('id'))
             for item in type_counts:
                 summary['by_type'][item['record_type']] = item['count']
             
             # تجمیع بر اساس شدت
-            severity_counts = records.values('severity').annotate(count=Count('id'))
             for item in severity_counts:
                 summary['by_severity'][item['severity']] = item['count']
             
             # موارد در حال ادامه
-            ongoing = records.filter(is_ongoing=True)
             summary['ongoing_conditions'] = [
                 {
                     'id': str(r.id),
@@ -457,11 +487,10 @@ class MedicalRecordService:
                     'severity': r.severity,
                     'start_date': r.start_date.isoformat() if r.start_date else None
                 }
-                for r in ongoing[:10]
+                for r in ongoing
             ]
             
             # آلرژی‌ها
-            allergies = records.filter(record_type='allergy')
             summary['allergies'] = [
                 {
                     'id': str(r.id),
@@ -469,11 +498,10 @@ class MedicalRecordService:
                     'severity': r.severity,
                     'description': r.description[:200] if r.description else None
                 }
-                for r in allergies[:10]
+                for r in allergies
             ]
             
             # جراحی‌ها
-            surgeries = records.filter(record_type='surgery')
             summary['surgeries'] = [
                 {
                     'id': str(r.id),
@@ -481,22 +509,20 @@ class MedicalRecordService:
                     'date': r.start_date.isoformat() if r.start_date else None,
                     'doctor': r.doctor_name
                 }
-                for r in surgeries[:10]
+                for r in surgeries
             ]
             
             # سابقه خانوادگی
-            family_history = records.filter(record_type='family_history')
             summary['family_history'] = [
                 {
                     'id': str(r.id),
                     'title': r.title,
                     'description': r.description[:200] if r.description else None
                 }
-                for r in family_history[:10]
+                for r in family_history
             ]
             
             # آخرین سوابق
-            recent = records[:10]
             summary['recent_records'] = MedicalRecordSerializer(recent, many=True).data
             
             result_data = {'summary': summary}
@@ -516,55 +542,32 @@ class MedicalRecordService:
     async def bulk_create_medical_records(
         self,
         records_data: List[Dict[str, Any]],
-        created_by: Optional[User] = None
+        created_by: Optional[User] = None,
+        batch_size: Optional[int] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None
     ) -> Tuple[bool, Dict[str, Any]]:
         """
         ایجاد انبوه سوابق پزشکی
         Bulk create medical records
+        
+        همهٔ سوابق در یک گذر اعتبارسنجی و سپس با bulk_create در دسته‌های
+        batch_size درج می‌شوند. progress_callback(created, total) پس از هر
+        دسته (در thread همگام و داخل تراکنش) فراخوانی می‌شود.
         """
         try:
-            created_records = []
-            errors = []
-            
-            with transaction.atomic():
-                for i, record_data in enumerate(records_data):
-                    try:
-                        if created_by:
-                            record_data['created_by'] = created_by.id
-                        
-                        serializer = MedicalRecordSerializer(data=record_data)
-                        if serializer.is_valid():
-                            record = serializer.save()
-                            created_records.append({
-                                'index': i,
-                                'id': str(record.id),
-                                'title': record.title
-                            })
-                        else:
-                            errors.append({
-                                'index': i,
-                                'errors': serializer.errors,
-                                'data': record_data
-                            })
-                    except Exception as e:
-                        errors.append({
-                            'index': i,
-                            'error': str(e),
-                            'data': record_data
-                        })
-                
-                # اگر خطاهای زیادی وجود دارد، transaction را rollback کن
-                if len(errors) > len(records_data) * 0.5:  # بیش از 50% خطا
-                    raise Exception("Too many errors in bulk creation")
-            
-            # پاک کردن کش
-            patient_ids = set()
-            for record_data in records_data:
-                if 'patient' in record_data:
-                    patient_ids.add(str(record_data['patient']))
+            created_records, errors, patient_ids = await sync_to_async(self._bulk_create_records)(
+                records_data,
+                created_by,
+                batch_size or self.bulk_batch_size,
+                progress_callback
+            )
             
-            for patient_id in patient_ids:
-                await self._clear_patient_records_cache(patient_id)
+            # پاک کردن کش همهٔ بیماران با یک فراخوانی
+            cache.delete_many([
+                key
+                for patient_id in patient_ids
+                for key in self._patient_records_cache_keys(patient_id)
+            ])
             
             # ثبت لاگ
             self.logger.info(
@@ -597,32 +600,133 @@ class MedicalRecordService:
     async def _validate_patient_exists(self, patient_id: str) -> bool:
         """بررسی وجود بیمار"""
         try:
-            return PatientProfile.objects.filter(
+            return await PatientProfile.objects.filter(
                 id=patient_id,
                 is_active=True
-            ).exists()
+            ).aexists()
         except Exception:
             return False
     
+    async def _fetch(self, queryset) -> List[Any]:
+        """اجرای ناهمگام queryset و برگرداندن فهرست نتایج"""
+        return [item async for item in queryset]
+    
+    def _save_record(self, serializer) -> Tuple[MedicalRecord, Dict[str, Any]]:
+        """ذخیره و سریالایز سابقه پزشکی در یک تراکنش (واحد کار همگام)"""
+        with transaction.atomic():
+            medical_record = serializer.save()
+        return medical_record, MedicalRecordSerializer(medical_record).data
+    
+    def _bulk_create_records(
+        self,
+        records_data: List[Dict[str, Any]],
+        created_by: Optional[User] = None,
+        batch_size: int = 1000,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Set[str]]:
+        """
+        اعتبارسنجی یک‌جا و درج دسته‌ای سوابق (واحد کار همگام)
+        
+        بیماران و ایجادکنندگان ارجاع‌شده با یک کوئری بارگذاری می‌شوند، پس
+        اعتبارسنجی به‌ازای هر رکورد کوئری ندارد. اگر بیش از نیمی از سوابق
+        نامعتبر باشند هیچ رکوردی درج نمی‌شود.
+        """
+        patients = self._prefetch_references(
+            PatientProfile.objects.filter(is_active=True),
+            (record_data.get('patient') for record_data in records_data)
+        )
+        creators = {} if created_by else self._prefetch_references(
+            User.objects.all(),
+            (record_data.get('created_by') for record_data in records_data)
+        )
+        
+        records = []
+        created_records = []
+        errors = []
+        
+        for i, record_data in enumerate(records_data):
+            try:
+                serializer = MedicalRecordImportSerializer(data=record_data)
+                record_errors = {} if serializer.is_valid() else dict(serializer.errors)
+                
+                patient = patients.get(self._reference_key(PatientProfile, record_data.get('patient')))
+                if patient is None:
+                    record_errors['patient'] = ['بیمار یافت نشد']
+                
+                creator = created_by
+                if creator is None and record_data.get('created_by') is not None:
+                    creator = creators.get(self._reference_key(User, record_data['created_by']))
+                    if creator is None:
+                        record_errors['created_by'] = ['کاربر یافت نشد']
+                
+                if record_errors:
+                    errors.append({
+                        'index': i,
+                        'errors': record_errors,
+                        'data': record_data
+                    })
+                    continue
+                
+                record = MedicalRecord(
+                    patient=patient,
+                    created_by=creator,
+                    **serializer.validated_data
+                )
+                records.append(record)
+                created_records.append({
+                    'index': i,
+                    'id': str(record.id),
+                    'title': record.title
+                })
+            except Exception as e:
+                errors.append({
+                    'index': i,
+                    'error': str(e),
+                    'data': record_data
+                })
+        
+        # اگر خطاهای زیادی وجود دارد، هیچ رکوردی درج نکن
+        if len(errors) > len(records_data) * 0.5:  # بیش از 50% خطا
+            raise Exception("Too many errors in bulk creation")
+        
+        with transaction.atomic():
+            for start in range(0, len(records), batch_size):
+                MedicalRecord.objects.bulk_create(records[start:start + batch_size])
+                created = min(start + batch_size, len(records))
+                self.logger.info(f"Bulk medical records progress: {created}/{len(records)}")
+                if progress_callback:
+                    progress_callback(created, len(records))
+        
+        return created_records, errors, {str(record.patient_id) for record in records}
+    
+    def _reference_key(self, model, value) -> Any:
+        """کلید اصلی نرمال‌شده از شناسه یا نمونهٔ مدل (None اگر نامعتبر باشد)"""
+        if value is None:
+            return None
+        try:
+            return model._meta.pk.to_python(getattr(value, 'pk', value))
+        except (ValidationError, TypeError, ValueError):
+            return None
+    
+    def _prefetch_references(self, queryset, values) -> Dict[Any, Any]:
+        """بارگذاری یک‌جای نمونه‌های ارجاع‌شده بر اساس کلید اصلی"""
+        keys = {self._reference_key(queryset.model, value) for value in values}
+        keys.discard(None)
+        return queryset.in_bulk(keys) if keys else {}
+    
     async def _calculate_records_statistics(self, records) -> Dict[str, Any]:
-        """محاسبه آمار سوابق پزشکی"""
+        """محاسبه آمار سوابق پزشکی (روی سوابق بارگذاری‌شده، بدون کوئری اضافه)"""
         try:
-            total_count = records.count()
+            total_count = len(records)
             
             # آمار بر اساس نوع
-            type_stats = {}
-            type_counts = records.values('record_type').annotate(count=Count('id'))
-            for item in type_counts:
-                type_stats[item['record_type']] = item['count']
+            type_stats = dict(Counter(r.record_type for r in records))
             
             # آمار بر اساس شدت
-            severity_stats = {}
-            severity_counts = records.values('severity').annotate(count=Count('id'))
-            for item in severity_counts:
-                severity_stats[item['severity']] = item['count']
+            severity_stats = dict(Counter(r.severity for r in records))
             
             # موارد در حال ادامه
-            ongoing_count = records.filter(is_ongoing=True).count()
+            ongoing_count = sum(1 for r in records if r.is_ongoing)
             
             return {
                 'total': total_count,
@@ -652,30 +756,29 @@ class MedicalRecordService:
             self.logger.error(f"Error calculating search statistics: {str(e)}")
             return {}
     
+    def _patient_records_cache_keys(self, patient_id: str) -> List[str]:
+        """کلیدهای کش سوابق پزشکی یک بیمار"""
+        # در Django cache framework نمی‌توان pattern matching کرد
+        # بنابراین کلیدهای مشخص را پاک می‌کنیم
+        keys = [
+            f"medical_records:{patient_id}:all:False",
+            f"medical_records:{patient_id}:all:True",
+            f"medical_summary:{patient_id}"
+        ]
+        
+        # همچنین کلیدهای نوع‌های مختلف
+        record_types = ['allergy', 'medication', 'surgery', 'illness', 'family_history', 'vaccination', 'other']
+        for record_type in record_types:
+            keys.extend([
+                f"medical_records:{patient_id}:{record_type}:False",
+                f"medical_records:{patient_id}:{record_type}:True"
+            ])
+        return keys
+    
     async def _clear_patient_records_cache(self, patient_id: str):
         """پاک کردن کش سوابق پزشکی بیمار"""
         try:
-            # پاک کردن کش‌های مرتبط با این بیمار
-            patterns = [
-                f"medical_records:{patient_id}:*",
-                f"medical_summary:{patient_id}"
-            ]
-            
-            # در Django cache framework نمی‌توان pattern matching کرد
-            # بنابراین کلیدهای مشخص را پاک می‌کنیم
-            keys_to_delete = [
-                f"medical_records:{patient_id}:all:False",
-                f"medical_records:{patient_id}:all:True",
-                f"medical_summary:{patient_id}"
-            ]
-            
-            # همچنین کلیدهای نوع‌های مختلف
-            record_types = ['allergy', 'medication', 'surgery', 'illness', 'family_history', 'vaccination', 'other']
-            for record_type in record_types:
-                keys_to_delete.extend([
-                    f"medical_records:{patient_id}:{record_type}:False",
-                    f"medical_records:{patient_id}:{record_type}:True"
-                ])
+            keys_to_delete = self._patient_records_cache_keys(patient_id)
             
             cache.delete_many(keys_to_delete)
             
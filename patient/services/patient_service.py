@@ -3,8 +3,10 @@
 Patient Management Service
 """
 
+import asyncio
 import logging
 from typing import Dict, Any, List, Optional, Tuple
+from asgiref.sync import sync_to_async
 from django.db import transaction
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
@@ -18,6 +20,7 @@ from ..serializers import (
     PatientStatisticsSerializer,
     PatientSearchSerializer
 )
+from ..search_index import code_filter, name_filter
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -27,6 +30,10 @@ class PatientService:
     """
     سرویس جامع مدیریت بیماران
     Comprehensive patient management service
+    
+    خواندن‌ها با ORM ناهمگام جنگو انجام می‌شوند؛ اعتبارسنجی و ذخیرهٔ
+    serializerها (که خودشان کوئری می‌زنند) هر کدام یک مرز sync_to_async
+    صریح دارند تا event loop مسدود نشود.
     """
     
     def __init__(self):
@@ -52,7 +59,7 @@ class PatientService:
         try:
             # اعتبارسنجی داده‌ها
             serializer = PatientProfileCreateSerializer(data=patient_data)
-            if not serializer.is_valid():
+            if not await sync_to_async(serializer.is_valid)():
                 return False, {
                     'error': 'validation_failed',
                     'errors': serializer.errors,
@@ -68,29 +75,28 @@ class PatientService:
                 }
             
             # ایجاد پروفایل
-            with transaction.atomic():
-                patient_profile = serializer.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Patient profile created: {patient_profile.medical_record_number}",
-                    extra={
-                        'patient_id': str(patient_profile.id),
-                        'national_code': patient_profile.national_code,
-                        'created_by': created_by.id if created_by else None
-                    }
-                )
-                
-                # پاک کردن کش مرتبط
-                await self._clear_patient_cache()
-                
-                return True, {
+            patient_profile, profile_data = await sync_to_async(self._save_profile)(serializer)
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Patient profile created: {patient_profile.medical_record_number}",
+                extra={
                     'patient_id': str(patient_profile.id),
-                    'medical_record_number': patient_profile.medical_record_number,
-                    'message': 'پروفایل بیمار با موفقیت ایجاد شد',
-                    'patient_data': PatientProfileSerializer(patient_profile).data
+                    'national_code': patient_profile.national_code,
+                    'created_by': created_by.id if created_by else None
                 }
-                
+            )
+            
+            # پاک کردن کش مرتبط
+            await self._clear_patient_cache()
+            
+            return True, {
+                'patient_id': str(patient_profile.id),
+                'medical_record_number': patient_profile.medical_record_number,
+                'message': 'پروفایل بیمار با موفقیت ایجاد شد',
+                'patient_data': profile_data
+            }
+            
         except Exception as e:
             self.logger.error(
                 f"Error creating patient profile: {str(e)}",
@@ -121,7 +127,7 @@ class PatientService:
             
             # دریافت از دیتابیس
             try:
-                patient = PatientProfile.objects.select_related('user').get(
+                patient = await PatientProfile.objects.select_related('user').aget(
                     id=patient_id,
                     is_active=True
                 )
@@ -165,7 +171,10 @@ class PatientService:
         try:
             # دریافت بیمار
             try:
-                patient = PatientProfile.objects.get(id=patient_id, is_active=True)
+                patient = await PatientProfile.objects.select_related('user').aget(
+                    id=patient_id,
+                    is_active=True
+                )
             except PatientProfile.DoesNotExist:
                 return False, {
                     'error': 'patient_not_found',
@@ -179,7 +188,7 @@ class PatientService:
                 partial=True
             )
             
-            if not serializer.is_valid():
+            if not await sync_to_async(serializer.is_valid)():
                 return False, {
                     'error': 'validation_failed',
                     'errors': serializer.errors,
@@ -187,28 +196,27 @@ class PatientService:
                 }
             
             # بروزرسانی
-            with transaction.atomic():
-                updated_patient = serializer.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Patient profile updated: {updated_patient.medical_record_number}",
-                    extra={
-                        'patient_id': str(updated_patient.id),
-                        'updated_fields': list(update_data.keys()),
-                        'updated_by': updated_by.id if updated_by else None
-                    }
-                )
-                
-                # پاک کردن کش
-                cache.delete(f"patient_profile:{patient_id}")
-                await self._clear_patient_cache()
-                
-                return True, {
-                    'message': 'پروفایل بیمار بروزرسانی شد',
-                    'patient_data': PatientProfileSerializer(updated_patient).data
+            updated_patient, patient_data = await sync_to_async(self._save_profile)(serializer)
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Patient profile updated: {updated_patient.medical_record_number}",
+                extra={
+                    'patient_id': str(updated_patient.id),
+                    'updated_fields': list(update_data.keys()),
+                    'updated_by': updated_by.id if updated_by else None
                 }
-                
+            )
+            
+            # پاک کردن کش
+            cache.delete(f"patient_profile:{patient_id}")
+            await self._clear_patient_cache()
+            
+            return True, {
+                'message': 'پروفایل بیمار بروزرسانی شد',
+                'patient_data': patient_data
+            }
+            
         except Exception as e:
             self.logger.error(f"Error updating patient profile: {str(e)}")
             return False, {
@@ -241,9 +249,11 @@ class PatientService:
             search_filter = self._build_search_filter(query, search_type)
             
             # اجرای جستجو
-            patients = PatientProfile.objects.filter(
-                search_filter
-            ).filter(is_active=True).order_by('-created_at')[:50]  # محدود به 50 نتیجه
+            patients = [
+                patient async for patient in PatientProfile.objects.filter(
+                    search_filter
+                ).filter(is_active=True).select_related('user').order_by('-created_at')[:50]  # محدود به 50 نتیجه
+            ]
             
             # سریالایز نتایج
             results = PatientProfileSerializer(patients, many=True).data
@@ -274,7 +284,7 @@ class PatientService:
         try:
             # بررسی وجود بیمار
             try:
-                patient = PatientProfile.objects.get(id=patient_id, is_active=True)
+                patient = await PatientProfile.objects.aget(id=patient_id, is_active=True)
             except PatientProfile.DoesNotExist:
                 return False, {
                     'error': 'patient_not_found',
@@ -310,7 +320,7 @@ class PatientService:
         try:
             # دریافت بیمار
             try:
-                patient = PatientProfile.objects.get(id=patient_id)
+                patient = await PatientProfile.objects.aget(id=patient_id)
             except PatientProfile.DoesNotExist:
                 return False, {
                     'error': 'patient_not_found',
@@ -324,28 +334,27 @@ class PatientService:
                 }
             
             # غیرفعال کردن
-            with transaction.atomic():
-                patient.is_active = False
-                patient.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Patient deactivated: {patient.medical_record_number}",
-                    extra={
-                        'patient_id': str(patient.id),
-                        'deactivated_by': deactivated_by.id if deactivated_by else None,
-                        'reason': reason
-                    }
-                )
-                
-                # پاک کردن کش
-                cache.delete(f"patient_profile:{patient_id}")
-                await self._clear_patient_cache()
-                
-                return True, {
-                    'message': 'بیمار غیرفعال شد'
+            patient.is_active = False
+            await patient.asave()
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Patient deactivated: {patient.medical_record_number}",
+                extra={
+                    'patient_id': str(patient.id),
+                    'deactivated_by': deactivated_by.id if deactivated_by else None,
+                    'reason': reason
                 }
-                
+            )
+            
+            # پاک کردن کش
+            cache.delete(f"patient_profile:{patient_id}")
+            await self._clear_patient_cache()
+            
+            return True, {
+                'message': 'بیمار غیرفعال شد'
+            }
+            
         except Exception as e:
             self.logger.error(f"Error deactivating patient: {str(e)}")
             return False, {
@@ -396,7 +405,11 @@ class PatientService:
                 filters &= Q(created_at__lte=criteria['created_before'])
             
             # اجرای کوئری
-            patients = PatientProfile.objects.filter(filters).order_by('-created_at')[:limit]
+            patients = [
+                patient async for patient in PatientProfile.objects.filter(
+                    filters
+                ).select_related('user').order_by('-created_at')[:limit]
+            ]
             
             # سریالایز
             results = PatientProfileSerializer(patients, many=True).data
@@ -427,7 +440,11 @@ class PatientService:
         """
         try:
             # اگر کاربر خود بیمار است
-            if hasattr(user, 'patient_profile') and str(user.patient_profile.id) == patient_id:
+            is_owner = await PatientProfile.objects.filter(
+                id=patient_id,
+                user=user
+            ).aexists()
+            if is_owner:
                 return action in ['view', 'update']
             
             # اگر کاربر پزشک است
@@ -449,26 +466,32 @@ class PatientService:
     
     async def _check_duplicate_patient(self, national_code: str) -> bool:
         """بررسی تکراری بودن بیمار"""
-        return PatientProfile.objects.filter(
+        return await PatientProfile.objects.filter(
             national_code=national_code,
             is_active=True
-        ).exists()
+        ).aexists()
+    
+    def _save_profile(self, serializer) -> Tuple[PatientProfile, Dict[str, Any]]:
+        """ذخیره و سریالایز پروفایل در یک تراکنش (واحد کار همگام)"""
+        with transaction.atomic():
+            patient_profile = serializer.save()
+        return patient_profile, PatientProfileSerializer(patient_profile).data
     
     def _build_search_filter(self, query: str, search_type: str) -> Q:
-        """ساخت فیلتر جستجو"""
-        if search_type == 'national_code':
-            return Q(national_code__icontains=query)
-        elif search_type == 'medical_record':
-            return Q(medical_record_number__icontains=query)
-        elif search_type == 'name':
-            return Q(first_name__icontains=query) | Q(last_name__icontains=query)
-        else:  # all
-            return (
-                Q(first_name__icontains=query) |
-                Q(last_name__icontains=query) |
-                Q(national_code__icontains=query) |
-                Q(medical_record_number__icontains=query)
-            )
+        """
+        ساخت فیلتر جستجو
+        
+        کد ملی و شماره پرونده با تطابق دقیق (یا پیشوندی) روی ایندکس یکتا و
+        نام از طریق جدول توکن‌های نرمال‌شده جستجو می‌شوند؛ هیچ مسیری
+        اسکن icontains روی کل جدول بیماران انجام نمی‌دهد.
+        """
+        if search_type in ('all', 'national_code', 'medical_record'):
+            code_query = code_filter(query, search_type)
+            if code_query is not None:
+                return code_query
+            if search_type != 'all':
+                return Q(pk__in=[])
+        return name_filter(query)
     
     async def _get_patient_statistics(self, patient: PatientProfile) -> Dict[str, Any]:
         """محاسبه آمار بیمار"""
@@ -478,26 +501,24 @@ class PatientService:
             last_visit_date = None
             next_appointment = None
             
-            # سوابق پزشکی
-            medical_records_count = MedicalRecord.objects.filter(
-                patient=patient
-            ).count()
-            
-            # نسخه‌ها
-            total_prescriptions = PrescriptionHistory.objects.filter(
-                patient=patient
-            ).count()
-            
-            active_prescriptions = PrescriptionHistory.objects.filter(
-                patient=patient,
-                status='active'
-            ).count()
-            
-            # رضایت‌نامه‌های در انتظار
-            pending_consents = MedicalConsent.objects.filter(
-                patient=patient,
-                status='pending'
-            ).count()
+            # سوابق پزشکی، نسخه‌ها و رضایت‌نامه‌های در انتظار به‌صورت هم‌زمان
+            (
+                medical_records_count,
+                total_prescriptions,
+                active_prescriptions,
+                pending_consents
+            ) = await asyncio.gather(
+                MedicalRecord.objects.filter(patient=patient).acount(),
+                PrescriptionHistory.objects.filter(patient=patient).acount(),
+                PrescriptionHistory.objects.filter(
+                    patient=patient,
+                    status='active'
+                ).acount(),
+                MedicalConsent.objects.filter(
+                    patient=patient,
+                    status='pending'
+                ).acount()
+            )
             
             return {
                 'total_visits': total_visits,
@@ -4,11 +4,13 @@ Prescription Management Service
 """
 
 import logging
+from collections import Counter
 from typing import Dict, Any, List, Optional, Tuple
+from asgiref.sync import sync_to_async
 from django.db import transaction
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.utils import timezone
 from datetime import datetime, timedelta
 
@@ -48,7 +50,7 @@ class PrescriptionService:
         try:
             # اعتبارسنجی داده‌ها
             serializer = PrescriptionHistorySerializer(data=prescription_data)
-            if not serializer.is_valid():
+            if not await sync_to_async(serializer.is_valid)():
                 return False, {
                     'error': 'validation_failed',
                     'errors': serializer.errors,
@@ -76,35 +78,34 @@ class PrescriptionService:
                 }
             
             # ایجاد نسخه
-            with transaction.atomic():
-                if prescribed_by:
-                    prescription_data['prescribed_by'] = prescribed_by.id
-                
-                prescription = serializer.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Prescription created: {prescription.prescription_number}",
-                    extra={
-                        'prescription_id': str(prescription.id),
-                        'prescription_number': prescription.prescription_number,
-                        'patient_id': str(prescription.patient.id),
-                        'medication': prescription.medication_name,
-                        'prescribed_by': prescribed_by.id if prescribed_by else None
-                    }
-                )
-                
-                # پاک کردن کش مرتبط
-                await self._clear_patient_prescriptions_cache(patient_id)
-                
-                return True, {
+            if prescribed_by:
+                prescription_data['prescribed_by'] = prescribed_by.id
+            
+            prescription, saved_data = await sync_to_async(self._save_prescription)(serializer)
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Prescription created: {prescription.prescription_number}",
+                extra={
                     'prescription_id': str(prescription.id),
                     'prescription_number': prescription.prescription_number,
-                    'message': 'نسخه با موفقیت ایجاد شد',
-                    'prescription_data': PrescriptionHistorySerializer(prescription).data,
-                    'warnings': drug_interaction_check.get('warnings', [])
+                    'patient_id': str(prescription.patient_id),
+                    'medication': prescription.medication_name,
+                    'prescribed_by': prescribed_by.id if prescribed_by else None
                 }
-                
+            )
+            
+            # پاک کردن کش مرتبط
+            await self._clear_patient_prescriptions_cache(patient_id)
+            
+            return True, {
+                'prescription_id': str(prescription.id),
+                'prescription_number': prescription.prescription_number,
+                'message': 'نسخه با موفقیت ایجاد شد',
+                'prescription_data': saved_data,
+                'warnings': drug_interaction_check.get('warnings', [])
+            }
+            
         except Exception as e:
             self.logger.error(
                 f"Error creating prescription: {str(e)}",
@@ -151,9 +152,13 @@ class PrescriptionService:
                 filters &= Q(end_date__gte=timezone.now().date())
             
             # دریافت از دیتابیس
-            prescriptions = PrescriptionHistory.objects.filter(filters).order_by(
-                '-prescribed_date', '-created_at'
-            )
+            prescriptions = [
+                prescription async for prescription in PrescriptionHistory.objects.filter(
+                    filters
+                ).select_related('patient', 'prescribed_by').order_by(
+                    '-prescribed_date', '-created_at'
+                )
+            ]
             
             # سریالایز داده‌ها
             prescriptions_data = PrescriptionHistorySerializer(prescriptions, many=True).data
@@ -201,9 +206,9 @@ class PrescriptionService:
             
             # دریافت از دیتابیس
             try:
-                prescription = PrescriptionHistory.objects.select_related(
+                prescription = await PrescriptionHistory.objects.select_related(
                     'patient', 'prescribed_by'
-                ).get(id=prescription_id)
+                ).aget(id=prescription_id)
             except PrescriptionHistory.DoesNotExist:
                 return False, {
                     'error': 'prescription_not_found',
@@ -251,7 +256,9 @@ class PrescriptionService:
         try:
             # دریافت نسخه
             try:
-                prescription = PrescriptionHistory.objects.get(id=prescription_id)
+                prescription = await PrescriptionHistory.objects.select_related(
+                    'patient', 'prescribed_by'
+                ).aget(id=prescription_id)
             except PrescriptionHistory.DoesNotExist:
                 return False, {
                     'error': 'prescription_not_found',
@@ -272,7 +279,7 @@ class PrescriptionService:
                 partial=True
             )
             
-            if not serializer.is_valid():
+            if not await sync_to_async(serializer.is_valid)():
                 return False, {
                     'error': 'validation_failed',
                     'errors': serializer.errors,
@@ -280,29 +287,30 @@ class PrescriptionService:
                 }
             
             # بروزرسانی
-            with transaction.atomic():
-                updated_prescription = serializer.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Prescription updated: {updated_prescription.prescription_number}",
-                    extra={
-                        'prescription_id': str(updated_prescription.id),
-                        'patient_id': str(updated_prescription.patient.id),
-                        'updated_fields': list(update_data.keys()),
-                        'updated_by': updated_by.id if updated_by else None
-                    }
-                )
-                
-                # پاک کردن کش
-                cache.delete(f"prescription:{prescription_id}")
-                await self._clear_patient_prescriptions_cache(str(updated_prescription.patient.id))
-                
-                return True, {
-                    'message': 'نسخه بروزرسانی شد',
-                    'prescription_data': PrescriptionHistorySerializer(updated_prescription).data
+            updated_prescription, prescription_data = await sync_to_async(
+                self._save_prescription
+            )(serializer)
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Prescription updated: {updated_prescription.prescription_number}",
+                extra={
+                    'prescription_id': str(updated_prescription.id),
+                    'patient_id': str(updated_prescription.patient_id),
+                    'updated_fields': list(update_data.keys()),
+                    'updated_by': updated_by.id if updated_by else None
                 }
-                
+            )
+            
+            # پاک کردن کش
+            cache.delete(f"prescription:{prescription_id}")
+            await self._clear_patient_prescriptions_cache(str(updated_prescription.patient_id))
+            
+            return True, {
+                'message': 'نسخه بروزرسانی شد',
+                'prescription_data': prescription_data
+            }
+            
         except Exception as e:
             self.logger.error(f"Error updating prescription: {str(e)}")
             return False, {
@@ -323,7 +331,7 @@ class PrescriptionService:
         try:
             # دریافت نسخه اصلی
             try:
-                original_prescription = PrescriptionHistory.objects.get(id=prescription_id)
+                original_prescription = await PrescriptionHistory.objects.aget(id=prescription_id)
             except PrescriptionHistory.DoesNotExist:
                 return False, {
                     'error': 'prescription_not_found',
@@ -337,58 +345,54 @@ class PrescriptionService:
                     'message': 'تکرار این نسخه مجاز نیست'
                 }
             
-            # ایجاد نسخه جدید
-            with transaction.atomic():
-                # کپی کردن اطلاعات
-                new_prescription_data = {
-                    'patient': original_prescription.patient.id,
-                    'medication_name': original_prescription.medication_name,
-                    'dosage': original_prescription.dosage,
-                    'frequency': original_prescription.frequency,
-                    'duration': original_prescription.duration,
-                    'instructions': original_prescription.instructions,
-                    'diagnosis': original_prescription.diagnosis,
-                    'start_date': timezone.now().date(),
-                    'end_date': timezone.now().date() + timedelta(
-                        days=self._parse_duration_days(original_prescription.duration)
-                    ),
-                    'is_repeat_allowed': original_prescription.is_repeat_allowed,
-                    'max_repeats': original_prescription.max_repeats,
-                    'prescribed_by': prescribed_by.id if prescribed_by else original_prescription.prescribed_by.id
-                }
-                
-                if notes:
-                    new_prescription_data['patient_notes'] = notes
-                
-                # ایجاد نسخه جدید
-                new_prescription = PrescriptionHistory.objects.create(**new_prescription_data)
-                
-                # بروزرسانی شمارنده تکرار نسخه اصلی
-                original_prescription.repeat_count += 1
-                original_prescription.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Prescription repeated: {new_prescription.prescription_number} from {original_prescription.prescription_number}",
-                    extra={
-                        'new_prescription_id': str(new_prescription.id),
-                        'original_prescription_id': str(original_prescription.id),
-                        'patient_id': str(new_prescription.patient.id),
-                        'prescribed_by': prescribed_by.id if prescribed_by else None
-                    }
-                )
-                
-                # پاک کردن کش
-                await self._clear_patient_prescriptions_cache(str(new_prescription.patient.id))
-                
-                return True, {
-                    'message': 'نسخه تکرار شد',
+            # کپی کردن اطلاعات
+            duration_days = await self._parse_duration_days(original_prescription.duration)
+            new_prescription_data = {
+                'patient_id': original_prescription.patient_id,
+                'medication_name': original_prescription.medication_name,
+                'dosage': original_prescription.dosage,
+                'frequency': original_prescription.frequency,
+                'duration': original_prescription.duration,
+                'instructions': original_prescription.instructions,
+                'diagnosis': original_prescription.diagnosis,
+                'prescribed_date': timezone.now().date(),
+                'start_date': timezone.now().date(),
+                'end_date': timezone.now().date() + timedelta(days=duration_days),
+                'is_repeat_allowed': original_prescription.is_repeat_allowed,
+                'max_repeats': original_prescription.max_repeats,
+                'prescribed_by_id': prescribed_by.id if prescribed_by else original_prescription.prescribed_by_id
+            }
+            
+            if notes:
+                new_prescription_data['patient_notes'] = notes
+            
+            # ایجاد نسخه جدید و بروزرسانی شمارنده تکرار نسخه اصلی
+            new_prescription, prescription_data = await sync_to_async(self._repeat_prescription)(
+                original_prescription, new_prescription_data
+            )
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Prescription repeated: {new_prescription.prescription_number} from {original_prescription.prescription_number}",
+                extra={
                     'new_prescription_id': str(new_prescription.id),
-                    'new_prescription_number': new_prescription.prescription_number,
-                    'prescription_data': PrescriptionHistorySerializer(new_prescription).data,
-                    'remaining_repeats': original_prescription.max_repeats - original_prescription.repeat_count
+                    'original_prescription_id': str(original_prescription.id),
+                    'patient_id': str(new_prescription.patient_id),
+                    'prescribed_by': prescribed_by.id if prescribed_by else None
                 }
-                
+            )
+            
+            # پاک کردن کش
+            await self._clear_patient_prescriptions_cache(str(new_prescription.patient_id))
+            
+            return True, {
+                'message': 'نسخه تکرار شد',
+                'new_prescription_id': str(new_prescription.id),
+                'new_prescription_number': new_prescription.prescription_number,
+                'prescription_data': prescription_data,
+                'remaining_repeats': original_prescription.max_repeats - original_prescription.repeat_count
+            }
+            
         except Exception as e:
             self.logger.error(f"Error repeating prescription: {str(e)}")
             return False, {
@@ -409,7 +413,9 @@ class PrescriptionService:
         try:
             # دریافت نسخه
             try:
-                prescription = PrescriptionHistory.objects.get(id=prescription_id)
+                prescription = await PrescriptionHistory.objects.select_related(
+                    'patient', 'prescribed_by'
+                ).aget(id=prescription_id)
             except PrescriptionHistory.DoesNotExist:
                 return False, {
                     'error': 'prescription_not_found',
@@ -430,36 +436,35 @@ class PrescriptionService:
                 }
             
             # لغو نسخه
-            with transaction.atomic():
-                prescription.status = 'cancelled'
-                if reason:
-                    if prescription.patient_notes:
-                        prescription.patient_notes += f"\n\nلغو شده: {reason}"
-                    else:
-                        prescription.patient_notes = f"لغو شده: {reason}"
-                
-                prescription.save()
-                
-                # ثبت لاگ
-                self.logger.info(
-                    f"Prescription cancelled: {prescription.prescription_number}",
-                    extra={
-                        'prescription_id': str(prescription.id),
-                        'patient_id': str(prescription.patient.id),
-                        'cancelled_by': cancelled_by.id if cancelled_by else None,
-                        'reason': reason
-                    }
-                )
-                
-                # پاک کردن کش
-                cache.delete(f"prescription:{prescription_id}")
-                await self._clear_patient_prescriptions_cache(str(prescription.patient.id))
-                
-                return True, {
-                    'message': 'نسخه لغو شد',
-                    'prescription_data': PrescriptionHistorySerializer(prescription).data
+            prescription.status = 'cancelled'
+            if reason:
+                if prescription.patient_notes:
+                    prescription.patient_notes += f"\n\nلغو شده: {reason}"
+                else:
+                    prescription.patient_notes = f"لغو شده: {reason}"
+            
+            await prescription.asave()
+            
+            # ثبت لاگ
+            self.logger.info(
+                f"Prescription cancelled: {prescription.prescription_number}",
+                extra={
+                    'prescription_id': str(prescription.id),
+                    'patient_id': str(prescription.patient_id),
+                    'cancelled_by': cancelled_by.id if cancelled_by else None,
+                    'reason': reason
                 }
-                
+            )
+            
+            # پاک کردن کش
+            cache.delete(f"prescription:{prescription_id}")
+            await self._clear_patient_prescriptions_cache(str(prescription.patient_id))
+            
+            return True, {
+                'message': 'نسخه لغو شد',
+                'prescription_data': PrescriptionHistorySerializer(prescription).data
+            }
+            
         except Exception as e:
             self.logger.error(f"Error cancelling prescription: {str(e)}")
             return False, {
@@ -512,9 +517,13 @@ class PrescriptionService:
             
             # اجرای جستجو
             limit = search_params.get('limit', 100)
-            prescriptions = PrescriptionHistory.objects.filter(filters).select_related(
-                'patient', 'prescribed_by'
-            ).order_by('-prescribed_date', '-created_at')[:limit]
+            prescriptions = [
+                prescription async for prescription in PrescriptionHistory.objects.filter(
+                    filters
+                ).select_related('patient', 'prescribed_by').order_by(
+                    '-prescribed_date', '-created_at'
+                )[:limit]
+            ]
             
             # سریالایز نتایج
             results = PrescriptionHistorySerializer(prescriptions, many=True).data
@@ -542,13 +551,32 @@ class PrescriptionService:
     async def _validate_patient_exists(self, patient_id: str) -> bool:
         """بررسی وجود بیمار"""
         try:
-            return PatientProfile.objects.filter(
+            return await PatientProfile.objects.filter(
                 id=patient_id,
                 is_active=True
-            ).exists()
+            ).aexists()
         except Exception:
             return False
     
+    def _save_prescription(self, serializer) -> Tuple[PrescriptionHistory, Dict[str, Any]]:
+        """ذخیره و سریالایز نسخه در یک تراکنش (واحد کار همگام)"""
+        with transaction.atomic():
+            prescription = serializer.save()
+        return prescription, PrescriptionHistorySerializer(prescription).data
+    
+    def _repeat_prescription(
+        self,
+        original_prescription: PrescriptionHistory,
+        new_prescription_data: Dict[str, Any]
+    ) -> Tuple[PrescriptionHistory, Dict[str, Any]]:
+        """ایجاد نسخهٔ تکراری و افزایش شمارندهٔ نسخهٔ اصلی در یک تراکنش"""
+        with transaction.atomic():
+            new_prescription = PrescriptionHistory.objects.create(**new_prescription_data)
+            
+            original_prescription.repeat_count += 1
+            original_prescription.save()
+        return new_prescription, PrescriptionHistorySerializer(new_prescription).data
+    
     async def _check_drug_interactions(
         self,
         patient_id: str,
@@ -557,11 +585,13 @@ class PrescriptionService:
         """بررسی تداخل دارویی"""
         try:
             # دریافت داروهای فعال بیمار
-            active_prescriptions = PrescriptionHistory.objects.filter(
-                patient_id=patient_id,
-                status='active',
-                end_date__gte=timezone.now().date()
-            )
+            active_prescriptions = [
+                prescription async for prescription in PrescriptionHistory.objects.filter(
+                    patient_id=patient_id,
+                    status='active',
+                    end_date__gte=timezone.now().date()
+                ).only('id', 'medication_name')
+            ]
             
             interactions = []
             warnings = []
@@ -664,7 +694,7 @@ class PrescriptionService:
                 for prescription in expired_prescriptions:
                     prescription.status = 'expired'
                 
-                PrescriptionHistory.objects.bulk_update(
+                await PrescriptionHistory.objects.abulk_update(
                     expired_prescriptions, ['status']
                 )
                 
@@ -672,18 +702,15 @@ class PrescriptionService:
             self.logger.error(f"Error updating expired prescriptions: {str(e)}")
     
     async def _calculate_prescriptions_statistics(self, prescriptions) -> Dict[str, Any]:
-        """محاسبه آمار نسخه‌ها"""
+        """محاسبه آمار نسخه‌ها (روی نسخه‌های بارگذاری‌شده، بدون کوئری اضافه)"""
         try:
-            total_count = prescriptions.count()
+            total_count = len(prescriptions)
             
             # آمار بر اساس وضعیت
-            status_stats = {}
-            status_counts = prescriptions.values('status').annotate(count=Count('id'))
-            for item in status_counts:
-                status_stats[item['status']] = item['count']
+            status_stats = dict(Counter(p.status for p in prescriptions))
             
             # نسخه‌های قابل تکرار
-            repeatable_count = prescriptions.filter(is_repeat_allowed=True).count()
+            repeatable_count = sum(1 for p in prescriptions if p.is_repeat_allowed)
             
             # نسخه‌های منقضی شده
             expired_count = len([p for p in prescriptions if p.is_expired])
@@ -0,0 +1,38 @@
+"""
+سیگنال‌های اپلیکیشن بیمار
+همگام‌سازی توکن‌های جستجوی نام با تغییرات پروفایل بیمار
+"""
+
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from .models import PatientProfile
+from .search_index import index_patient
+
+NAME_FIELDS = {'first_name', 'last_name'}
+
+
+@receiver(pre_save, sender=PatientProfile)
+def handle_patient_profile_pre_save(sender, instance, update_fields=None, raw=False, **kwargs):
+    """پیش از ذخیره پروفایل: مقایسه نام با مقدار ذخیره‌شده"""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._name_changed = True
+        return
+    if update_fields is not None and not NAME_FIELDS & set(update_fields):
+        instance._name_changed = False
+        return
+    stored = sender.objects.filter(pk=instance.pk).values('first_name', 'last_name').first()
+    instance._name_changed = stored is None or any(
+        stored[name] != getattr(instance, name) for name in NAME_FIELDS
+    )
+
+
+@receiver(post_save, sender=PatientProfile)
+def handle_patient_profile_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """پس از ذخیره پروفایل: بازسازی توکن‌های نام فقط در صورت تغییر نام"""
+    if raw:
+        return
+    name_changed = getattr(instance, '_name_changed', True)
+    instance._name_changed = False
+    if created or name_changed:
+        index_patient(instance)
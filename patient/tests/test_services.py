@@ -8,9 +8,11 @@ from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from unittest.mock import patch, MagicMock
 from datetime import date, timedelta
-import asyncio
+from asgiref.sync import async_to_sync
 
-from ..models import PatientProfile, MedicalRecord, PrescriptionHistory, MedicalConsent
+from ..models import (
+    PatientProfile, MedicalRecord, PrescriptionHistory, MedicalConsent, PatientSearchToken
+)
 from ..services import (
     PatientService,
     MedicalRecordService,
@@ -30,13 +32,16 @@ class AsyncTestCase(TestCase):
         super().setUp()
     
     def run_async(self, coro):
-        """اجرای کد async در تست‌ها"""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(coro)
-        finally:
-            loop.close()
+        """
+        اجرای کد async در تست‌ها
+        
+        با async_to_sync کوئری‌های ORM ناهمگام و sync_to_async روی همین
+        thread (و اتصال تراکنش تست) اجرا می‌شوند.
+        """
+        async def runner():
+            return await coro
+        
+        return async_to_sync(runner)()
 
 
 class PatientServiceTest(AsyncTestCase):
@@ -250,6 +255,91 @@ class PatientServiceTest(AsyncTestCase):
             self.assertEqual(result['medical_records_count'], 1)
         
         self.run_async(test())
+    
+    def test_search_patients_normalized_name_prefix(self):
+        """تست جستجوی پیشوند نام با حروف عربی و نیم‌فاصله"""
+        async def test():
+            success, result = await self.service.search_patients({
+                'query': 'احمدي',
+                'search_type': 'all'
+            })
+            self.assertTrue(success)
+            self.assertEqual(result['count'], 1)
+            
+            success, result = await self.service.search_patients({
+                'query': 'اح احم',
+                'search_type': 'name'
+            })
+            self.assertEqual(result['count'], 1)
+            
+            success, result = await self.service.search_patients({
+                'query': 'محمد',
+                'search_type': 'name'
+            })
+            self.assertEqual(result['count'], 0)
+        
+        self.run_async(test())
+    
+    def test_search_tokens_follow_name_changes(self):
+        """تست بازسازی توکن‌ها پس از تغییر نام"""
+        self.patient_profile.last_name = 'کریم‌زاده'
+        self.patient_profile.save()
+        
+        async def test():
+            success, result = await self.service.search_patients({
+                'query': 'كريمزاده',
+                'search_type': 'name'
+            })
+            self.assertEqual(result['count'], 1)
+            
+            success, result = await self.service.search_patients({
+                'query': 'احمدی',
+                'search_type': 'name'
+            })
+            self.assertEqual(result['count'], 0)
+        
+        self.run_async(test())
+    
+    def test_search_tokens_kept_when_name_unchanged(self):
+        """تست عدم بازسازی توکن‌ها وقتی نام تغییر نکرده است"""
+        token_ids = set(PatientSearchToken.objects.filter(
+            patient=self.patient_profile
+        ).values_list('id', flat=True))
+        self.assertTrue(token_ids)
+        
+        self.patient_profile.address = 'تهران'
+        self.patient_profile.save()
+        self.patient_profile.save(update_fields=['address'])
+        
+        self.assertEqual(
+            set(PatientSearchToken.objects.filter(
+                patient=self.patient_profile
+            ).values_list('id', flat=True)),
+            token_ids
+        )
+    
+    def test_search_patients_exact_codes(self):
+        """تست تطابق دقیق کد ملی و شماره پرونده"""
+        async def test():
+            success, result = await self.service.search_patients({
+                'query': '۱۲۳۴۵۶۷۸۹۰',
+                'search_type': 'all'
+            })
+            self.assertEqual(result['count'], 1)
+            
+            success, result = await self.service.search_patients({
+                'query': self.patient_profile.medical_record_number,
+                'search_type': 'all'
+            })
+            self.assertEqual(result['count'], 1)
+            
+            success, result = await self.service.search_patients({
+                'query': 'احمد',
+                'search_type': 'national_code'
+            })
+            self.assertEqual(result['count'], 0)
+        
+        self.run_async(test())
 
 
 class MedicalRecordServiceTest(AsyncTestCase):
@@ -410,6 +500,68 @@ class MedicalRecordServiceTest(AsyncTestCase):
             self.assertEqual(record.title, 'آلرژی بروزرسانی شده')
         
         self.run_async(test())
+    
+    def test_bulk_create_medical_records_in_batches(self):
+        """تست ایجاد انبوه دسته‌ای با گزارش پیشرفت"""
+        async def test():
+            records_data = [
+                {
+                    'patient': str(self.patient_profile.id),
+                    'record_type': 'illness',
+                    'title': f'سابقه {i}',
+                    'description': 'توضیحات',
+                    'start_date': date.today()
+                }
+                for i in range(5)
+            ]
+            records_data.append({
+                'patient': str(self.patient_profile.id),
+                'record_type': 'unknown',
+                'title': 'نامعتبر',
+                'description': 'توضیحات',
+                'start_date': date.today()
+            })
+            progress = []
+            
+            success, result = await self.service.bulk_create_medical_records(
+                records_data,
+                created_by=self.doctor,
+                batch_size=2,
+                progress_callback=lambda created, total: progress.append((created, total))
+            )
+            
+            self.assertTrue(success)
+            self.assertEqual(result['created_count'], 5)
+            self.assertEqual(result['errors'][0]['index'], 5)
+            self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+            self.assertEqual(
+                await MedicalRecord.objects.filter(created_by=self.doctor).acount(), 5
+            )
+        
+        self.run_async(test())
+    
+    def test_bulk_create_medical_records_rejects_mostly_invalid(self):
+        """تست عدم درج وقتی بیش از نیمی از سوابق نامعتبرند"""
+        async def test():
+            import uuid
+            records_data = [
+                {
+                    'patient': str(uuid.uuid4()),
+                    'record_type': 'illness',
+                    'title': 'بیمار ناموجود',
+                    'description': 'توضیحات',
+                    'start_date': date.today()
+                }
+                for _ in range(2)
+            ]
+            
+            success, result = await self.service.bulk_create_medical_records(records_data)
+            
+            self.assertFalse(success)
+            self.assertEqual(result['error'], 'bulk_creation_failed')
+            self.assertFalse(await MedicalRecord.objects.aexists())
+        
+        self.run_async(test())
 
 
 class PrescriptionServiceTest(AsyncTestCase):
@@ -0,0 +1,165 @@
+"""
+تست‌های پردازش قطعه‌ای صوت بیمار
+"""
+from django.test import SimpleTestCase
+import asyncio
+
+from ..cores.speech_processor import PatientSpeechProcessor, PcmRingBuffer
+
+SAMPLE_RATE = 16000
+
+
+class PatientSpeechChunkingTest(SimpleTestCase):
+    """تست تقسیم، پردازش هم‌زمان و ادغام قطعات"""
+    
+    def setUp(self):
+        self.processor = PatientSpeechProcessor()
+    
+    def _preprocessed(self, seconds):
+        pcm = memoryview(bytes(int(seconds * SAMPLE_RATE) * 2))
+        return {
+            'pcm': pcm,
+            'duration': seconds,
+            'sample_rate': SAMPLE_RATE,
+            'channels': 1,
+            'sample_width': 2,
+            'format': 'pcm'
+        }
+    
+    def test_split_uses_pcm_slices_with_overlap(self):
+        """تست برش‌های بدون کپی با همپوشانی دو ثانیه‌ای"""
+        audio = self._preprocessed(75)
+        chunks = asyncio.run(self.processor._split_audio_if_needed(audio))
+        
+        self.assertEqual(
+            [(c['start_time'], c['end_time']) for c in chunks],
+            [(0, 30), (28, 58), (56, 75)]
+        )
+        for chunk in chunks:
+            self.assertIs(chunk['pcm'].obj, audio['pcm'].obj)
+    
+    def test_chunks_processed_concurrently_in_order(self):
+        """تست سقف هم‌زمانی و حفظ ترتیب نتایج"""
+        self.processor.max_concurrent_chunks = 2
+        chunks = asyncio.run(
+            self.processor._split_audio_if_needed(self._preprocessed(120))
+        )
+        state = {'active': 0, 'peak': 0}
+        
+        async def fake_stt(audio_data, options, session=None):
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            await asyncio.sleep(0.01)
+            state['active'] -= 1
+            return {'text': 'متن'}
+        
+        self.processor._send_to_stt_service = fake_stt
+        results = asyncio.run(self.processor._process_audio_chunks(chunks))
+        
+        self.assertEqual(state['peak'], 2)
+        self.assertEqual([r['chunk_index'] for r in results], list(range(len(chunks))))
+        self.assertTrue(all(r['success'] for r in results))
+    
+    def test_merge_removes_word_overlap(self):
+        """تست حذف کلمات تکراری ناحیهٔ همپوشانی"""
+        texts = ['بیمار از سردرد شدید', 'سردرد شدید و تهوع', 'و تهوع شکایت دارد']
+        results = [
+            {
+                'success': True,
+                'chunk_index': i,
+                'start_time': i * 28,
+                'transcription': {'text': text, 'segments': []}
+            }
+            for i, text in enumerate(texts)
+        ]
+        
+        merged = asyncio.run(self.processor._merge_transcription_results(results))
+        
+        self.assertEqual(merged['text'], 'بیمار از سردرد شدید و تهوع شکایت دارد')
+
+
+class PcmRingBufferTest(SimpleTestCase):
+    """تست بافر حلقوی جریان زنده"""
+    
+    def test_frames_wrap_without_copy(self):
+        """تست frameهای پیوسته پس از frame ناقص و دور زدن بافر"""
+        async def test():
+            ring = PcmRingBuffer(frame_bytes=4, frames=2)
+            await ring.write(b'ab')
+            partial = ring.next_frame(partial=True)
+            self.assertEqual(bytes(partial), b'ab')
+            await ring.release()
+            
+            await ring.write(b'cdef')
+            self.assertEqual(bytes(ring.next_frame()), b'cdef')
+            await ring.write(b'gh')
+            self.assertIsNone(ring.next_frame())
+            return partial
+        
+        partial = asyncio.run(test())
+        self.assertEqual(len(partial), 2)
+    
+    def test_partial_frame_keeps_whole_samples(self):
+        """تست گرد شدن frame ناقص به نمونه‌های کامل int16"""
+        async def test():
+            ring = PcmRingBuffer(frame_bytes=4, frames=2, sample_width=2)
+            await ring.write(b'abc')
+            self.assertEqual(bytes(ring.next_frame(partial=True)), b'ab')
+            self.assertEqual(ring.pending, 0)
+            await ring.release()
+            
+            # نیمهٔ نمونهٔ c با نوشتن بعدی کامل می‌شود
+            await ring.write(b'def')
+            self.assertEqual(bytes(ring.next_frame()), b'cdef')
+            await ring.release()
+            
+            await ring.write(b'g')
+            self.assertIsNone(ring.next_frame(partial=True))
+            await ring.write(b'h')
+            self.assertEqual(bytes(ring.next_frame(partial=True)), b'gh')
+        
+        asyncio.run(test())
+    
+    def test_write_waits_for_release(self):
+        """تست فشار معکوس وقتی همهٔ خانه‌ها در حال پردازش هستند"""
+        async def test():
+            ring = PcmRingBuffer(frame_bytes=4, frames=2)
+            await ring.write(b'12345678')
+            first = ring.next_frame()
+            ring.next_frame()
+            
+            writer = asyncio.create_task(ring.write(b'9abc'))
+            await asyncio.sleep(0.01)
+            self.assertFalse(writer.done())
+            
+            self.assertEqual(bytes(first), b'1234')
+            await ring.release()
+            await asyncio.wait_for(writer, timeout=1)
+            self.assertEqual(bytes(ring.next_frame()), b'9abc')
+        
+        asyncio.run(test())
+    
+    def test_write_larger_than_capacity_frames_while_waiting(self):
+        """تست نوشتن بزرگ‌تر از ظرفیت بافر در یک فراخوانی (بدون بن‌بست)"""
+        async def test():
+            ring = PcmRingBuffer(frame_bytes=4, frames=2)
+            frames = asyncio.Queue()
+            received = []
+            
+            async def consume():
+                while True:
+                    frame = await frames.get()
+                    received.append(bytes(frame))
+                    await ring.release()
+            
+            consumer = asyncio.create_task(consume())
+            await ring.write(b'123', on_frame=frames.put_nowait)
+            await asyncio.wait_for(
+                ring.write(b'456789abcdefg', on_frame=frames.put_nowait), timeout=1
+            )
+            await asyncio.sleep(0.01)
+            consumer.cancel()
+            
+            self.assertEqual(received, [b'1234', b'5678', b'9abc', b'defg'])
+        
+        asyncio.run(test())
@@ -6,7 +6,7 @@ import re
 import hashlib
 import json
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
@@ -15,6 +15,63 @@ from ..models import DataField, DataAccessLog, DataClassification
 logger = logging.getLogger(__name__)
 
 
+class PatternScanner:
+    """
+    اسکنر یک‌گذره برای همهٔ الگوهای پنهان‌سازی
+    
+    الگوها به ترتیب اولویت در یک alternation با گروه‌های نام‌دار ترکیب و یک بار
+    کامپایل می‌شوند؛ در هر موقعیت متن اولین الگوی منطبق برنده است و بازه‌ها
+    بدون هم‌پوشانی و نسبت به متن ورودی گزارش می‌شوند. اگر الگوها قابل ترکیب
+    نباشند (مثلاً نام گروه تکراری)، هر الگو جداگانه اجرا و بازه‌ها ادغام می‌شوند.
+    """
+    
+    def __init__(self, patterns: Dict[str, Dict]):
+        self.entries = list(patterns.items())
+        self.combined = None
+        self.separate = []
+        
+        alternation = '|'.join(
+            f"(?P<_p{index}>{info['pattern']})"
+            for index, (_, info) in enumerate(self.entries)
+        )
+        try:
+            self.combined = re.compile(alternation, re.IGNORECASE)
+        except re.error:
+            for index, (name, info) in enumerate(self.entries):
+                try:
+                    self.separate.append((index, re.compile(info['pattern'], re.IGNORECASE)))
+                except re.error as e:
+                    logger.warning(f"الگوی نامعتبر {name}: {str(e)}")
+    
+    def scan(self, text: str) -> Iterator[Tuple[int, int, str, Dict]]:
+        """
+        بازه‌های منطبق به ترتیب موقعیت: (شروع، پایان، نام الگو، اطلاعات الگو)
+        """
+        if self.combined is not None:
+            for match in self.combined.finditer(text):
+                start, end = match.span()
+                if start == end:
+                    continue
+                # گروه بیرونی آخر بسته می‌شود، پس lastgroup همان گروه الگوست
+                name, info = self.entries[int(match.lastgroup[2:])]
+                yield start, end, name, info
+            return
+        
+        candidates = []
+        for index, compiled in self.separate:
+            for match in compiled.finditer(text):
+                if match.start() != match.end():
+                    candidates.append((match.start(), index, match.end()))
+        candidates.sort()
+        position = 0
+        for start, index, end in candidates:
+            if start < position:
+                continue
+            name, info = self.entries[index]
+            yield start, end, name, info
+            position = end
+
+
 class PIIRedactor:
     """
     کلاس اصلی برای پنهان‌سازی اطلاعات شخصی قابل شناسایی (PII)
@@ -43,6 +100,8 @@ class PIIRedactor:
     def __init__(self):
         self.cache_timeout = getattr(settings, 'PRIVACY_CACHE_TIMEOUT', 3600)
         self.patterns = self._load_patterns()
+        self._scanner = None
+        self._scanner_key = None
     
     def _load_patterns(self) -> Dict[str, Dict]:
         """
@@ -129,43 +188,10 @@ class PIIRedactor:
         if not text or not isinstance(text, str):
             return text, []
         
-        redacted_text = text
-        matches_found = []
+        redacted_text, matches_found, pending_logs = self._redact_string(text)
         
-        for pattern_name, pattern_info in self.patterns.items():
-            pattern = pattern_info['pattern']
-            replacement = pattern_info['replacement']
-            
-            matches = list(re.finditer(pattern, redacted_text, re.IGNORECASE))
-            
-            for match in matches:
-                original_value = match.group()
-                match_info = {
-                    'pattern_name': pattern_name,
-                    'original_value': original_value,
-                    'replacement': replacement,
-                    'position': match.span(),
-                    'classification': pattern_info['classification'],
-                }
-                matches_found.append(match_info)
-                
-                # جایگزینی متن با regex
-                redacted_text = re.sub(re.escape(original_value), replacement, redacted_text)
-                
-                # لاگ کردن دسترسی
-                if log_access and pattern_info.get('field_id'):
-                    try:
-                        # بررسی وجود field قبل از لاگ
-                        from ..models import DataField
-                        if DataField.objects.filter(id=pattern_info['field_id']).exists():
-                            self._log_redaction(
-                                user_id=user_id,
-                                field_id=pattern_info['field_id'],
-                                original_value=original_value,
-                                context=context
-                            )
-                    except Exception as e:
-                        logger.warning(f"خطا در لاگ کردن: {str(e)}")
+        if log_access:
+            self._log_redactions(pending_logs, user_id, context)
         
         return redacted_text, matches_found
     
@@ -191,32 +217,7 @@ class PIIRedactor:
         if not isinstance(data, dict):
             return data, []
         
-        redacted_data = {}
-        all_matches = []
-        
-        for key, value in data.items():
-            if isinstance(value, str):
-                redacted_value, matches = self.redact_text(
-                    value, user_id, context, log_access
-                )
-                redacted_data[key] = redacted_value
-                all_matches.extend(matches)
-            elif isinstance(value, dict):
-                redacted_value, matches = self.redact_dict(
-                    value, user_id, context, log_access
-                )
-                redacted_data[key] = redacted_value
-                all_matches.extend(matches)
-            elif isinstance(value, list):
-                redacted_value, matches = self.redact_list(
-                    value, user_id, context, log_access
-                )
-                redacted_data[key] = redacted_value
-                all_matches.extend(matches)
-            else:
-                redacted_data[key] = value
-        
-        return redacted_data, all_matches
+        return self._redact_nested(data, user_id, context, log_access)
     
     def redact_list(
         self,
@@ -231,62 +232,145 @@ class PIIRedactor:
         if not isinstance(data, list):
             return data, []
         
-        redacted_list = []
+        return self._redact_nested(data, user_id, context, log_access)
+    
+    def _get_scanner(self) -> PatternScanner:
+        """
+        اسکنر کامپایل‌شده؛ فقط در صورت تغییر الگوها دوباره ساخته می‌شود
+        """
+        # کل اطلاعات الگو در کلید است: اسکنر همین dict ها را همراه بازه‌ها برمی‌گرداند
+        key = tuple((name, tuple(sorted(info.items()))) for name, info in self.patterns.items())
+        if self._scanner is None or key != self._scanner_key:
+            self._scanner = PatternScanner(self.patterns)
+            self._scanner_key = key
+        return self._scanner
+    
+    def _redact_string(self, text: str) -> Tuple[str, List[Dict], List[Tuple[str, str]]]:
+        """
+        پنهان‌سازی یک‌گذره بدون لاگ
+        
+        Returns:
+            tuple: (متن پنهان‌سازی شده, تطبیق‌ها, (field_id, مقدار اصلی) برای لاگ)
+        """
+        pieces = []
+        matches_found = []
+        pending_logs = []
+        position = 0
+        
+        for start, end, pattern_name, pattern_info in self._get_scanner().scan(text):
+            original_value = text[start:end]
+            replacement = pattern_info['replacement']
+            matches_found.append({
+                'pattern_name': pattern_name,
+                'original_value': original_value,
+                'replacement': replacement,
+                'position': (start, end),
+                'classification': pattern_info['classification'],
+            })
+            if pattern_info.get('field_id'):
+                pending_logs.append((pattern_info['field_id'], original_value))
+            pieces.append(text[position:start])
+            pieces.append(replacement)
+            position = end
+        
+        if not matches_found:
+            return text, matches_found, pending_logs
+        
+        pieces.append(text[position:])
+        return ''.join(pieces), matches_found, pending_logs
+    
+    def _redact_nested(
+        self,
+        data: Any,
+        user_id: Optional[str],
+        context: Optional[Dict[str, Any]],
+        log_access: bool
+    ) -> Tuple[Any, List[Dict]]:
+        """
+        پیمایش تکراری (بدون بازگشت) دیکشنری‌ها و لیست‌های تودرتو
+        
+        ترتیب پیمایش همان ترتیب عمق-اول نسخهٔ بازگشتی است و لاگ‌های دسترسی
+        در پایان یک بار ثبت می‌شوند.
+        """
+        def entries(container):
+            if isinstance(container, dict):
+                return iter(container.items())
+            return ((None, item) for item in container)
+        
+        root = {} if isinstance(data, dict) else []
+        stack = [(entries(data), root)]
         all_matches = []
+        pending_logs = []
         
-        for item in data:
-            if isinstance(item, str):
-                redacted_item, matches = self.redact_text(
-                    item, user_id, context, log_access
-                )
-                redacted_list.append(redacted_item)
-                all_matches.extend(matches)
-            elif isinstance(item, dict):
-                redacted_item, matches = self.redact_dict(
-                    item, user_id, context, log_access
-                )
-                redacted_list.append(redacted_item)
-                all_matches.extend(matches)
-            elif isinstance(item, list):
-                redacted_item, matches = self.redact_list(
-                    item, user_id, context, log_access
-                )
-                redacted_list.append(redacted_item)
-                all_matches.extend(matches)
+        while stack:
+            items, target = stack[-1]
+            entry = next(items, None)
+            if entry is None:
+                stack.pop()
+                continue
+            
+            key, value = entry
+            if isinstance(value, str):
+                if value:
+                    value, matches, logs = self._redact_string(value)
+                    all_matches.extend(matches)
+                    pending_logs.extend(logs)
+            elif isinstance(value, (dict, list)):
+                child = {} if isinstance(value, dict) else []
+                stack.append((entries(value), child))
+                value = child
+            
+            if isinstance(target, dict):
+                target[key] = value
             else:
-                redacted_list.append(item)
+                target.append(value)
+        
+        if log_access:
+            self._log_redactions(pending_logs, user_id, context)
         
-        return redacted_list, all_matches
+        return root, all_matches
     
-    def _log_redaction(
+    def _log_redactions(
         self,
+        pending_logs: List[Tuple[str, str]],
         user_id: Optional[str],
-        field_id: str,
-        original_value: str,
         context: Optional[Dict[str, Any]] = None
     ):
         """
-        لاگ کردن عملیات پنهان‌سازی
+        لاگ کردن عملیات پنهان‌سازی یک فراخوانی با یک کوئری و یک bulk insert
         """
+        if not pending_logs:
+            return
+        
         try:
-            # محاسبه هش مقدار اصلی
-            original_hash = hashlib.sha256(
-                original_value.encode('utf-8')
-            ).hexdigest()
+            # فقط فیلدهایی که هنوز در دیتابیس وجود دارند
+            existing_fields = {
+                str(field_id) for field_id in DataField.objects.filter(
+                    id__in={field_id for field_id, _ in pending_logs}
+                ).values_list('id', flat=True)
+            }
             
-            # ایجاد لاگ
-            DataAccessLog.objects.create(
-                user_id=user_id,
-                data_field_id=field_id,
-                action_type='redact',
-                record_id=context.get('record_id', '') if context else '',
-                ip_address=context.get('ip_address') if context else None,
-                user_agent=context.get('user_agent', '') if context else '',
-                purpose='Automatic PII/PHI redaction',
-                was_redacted=True,
-                original_value_hash=original_hash,
-                context_data=context or {}
-            )
+            logs = [
+                DataAccessLog(
+                    user_id=user_id,
+                    data_field_id=field_id,
+                    action_type='redact',
+                    record_id=context.get('record_id', '') if context else '',
+                    ip_address=context.get('ip_address') if context else None,
+                    user_agent=context.get('user_agent', '') if context else '',
+                    purpose='Automatic PII/PHI redaction',
+                    was_redacted=True,
+                    # محاسبه هش مقدار اصلی
+                    original_value_hash=hashlib.sha256(
+                        original_value.encode('utf-8')
+                    ).hexdigest(),
+                    context_data=context or {}
+                )
+                for field_id, original_value in pending_logs
+                if str(field_id) in existing_fields
+            ]
+            if logs:
+                DataAccessLog.objects.bulk_create(logs)
             
         except Exception as e:
             logger.error(f"خطا در لاگ کردن پنهان‌سازی: {str(e)}")
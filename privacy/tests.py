@@ -7,7 +7,7 @@ from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
-from .models import DataClassification, DataField, ConsentRecord
+from .models import DataClassification, DataField, ConsentRecord, DataAccessLog
 from .services.redactor import PIIRedactor
 from .services.consent_manager import ConsentManager
 
@@ -100,6 +100,65 @@ class PIIRedactorTestCase(TestCase):
         self.assertEqual(len(matches), 2)
         self.assertNotIn('09123456789', result)
         self.assertNotIn('test@example.com', result)
+    
+    def test_replacement_change_after_clear_cache(self):
+        """تست استفاده از متن جایگزین جدید پس از پاک شدن کش الگوها"""
+        classification = DataClassification.objects.create(
+            name='اطلاعات شخصی',
+            classification_type='pii',
+            description='اطلاعات شخصی قابل شناسایی'
+        )
+        field = DataField.objects.create(
+            field_name='phone_number',
+            model_name='UserProfile',
+            app_name='auth_otp',
+            classification=classification,
+            redaction_pattern=r'\b09\d{9}\b',
+            replacement_text='[شماره تلفن حذف شده]'
+        )
+        self.redactor.clear_cache()
+        text = "شماره تماس من 09123456789 است"
+        self.redactor.redact_text(text, log_access=False)
+        
+        field.replacement_text = '[تلفن]'
+        field.save()
+        self.redactor.clear_cache()
+        result, matches = self.redactor.redact_text(text, log_access=False)
+        
+        self.assertEqual(result, "شماره تماس من [تلفن] است")
+        self.assertEqual(matches[0]['replacement'], '[تلفن]')
+    
+    def test_nested_redaction_bulk_logs_access(self):
+        """تست پنهان‌سازی داده تودرتو و ثبت یکجای لاگ‌های دسترسی"""
+        classification = DataClassification.objects.create(
+            name='اطلاعات شخصی',
+            classification_type='pii',
+            description='اطلاعات شخصی قابل شناسایی'
+        )
+        DataField.objects.create(
+            field_name='phone_number',
+            model_name='UserProfile',
+            app_name='auth_otp',
+            classification=classification,
+            redaction_pattern=r'\b09\d{9}\b',
+            replacement_text='[شماره تلفن حذف شده]'
+        )
+        self.redactor.clear_cache()
+        data = {
+            'patient': {'phones': ['09123456789', 'تماس: 09351234567']},
+            'notes': [{'text': 'ایمیل test@example.com'}],
+            'age': 40,
+        }
+        
+        # یک کوئری برای فیلدهای موجود و یک bulk insert
+        with self.assertNumQueries(2):
+            result, matches = self.redactor.redact_dict(data, context={'record_id': '42'})
+        
+        self.assertEqual(result['patient']['phones'], ['[شماره تلفن حذف شده]', 'تماس: [شماره تلفن حذف شده]'])
+        self.assertEqual(result['notes'][0]['text'], 'ایمیل [ایمیل حذف شده]')
+        self.assertEqual(result['age'], 40)
+        self.assertEqual(matches[1]['position'], (6, 17))
+        self.assertEqual(DataAccessLog.objects.filter(record_id='42', action_type='redact').count(), 2)
 
 
 class ConsentManagerTestCase(TestCase):
@@ -15,6 +15,6 @@ class SearchConfig(AppConfig):
         """
         آماده‌سازی اپلیکیشن جستجو
         """
-        # فعلاً عملیاتی نیاز نیست
-        pass
+        # اتصال سیگنال‌های ایندکس برداری
+        from . import signals  # noqa: F401
 
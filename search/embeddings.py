@@ -0,0 +1,282 @@
+"""
+امبدینگ و ایندکس برداری برای semantic rerank
+Embedding store for SearchableContent (contiguous float32 matrix, vectorized cosine)
+
+بردارها یک‌بار هنگام ذخیرهٔ SearchableContent (یا با دستور
+``backfill_search_embeddings``) محاسبه و در فیلد ``embedding`` ذخیره می‌شوند.
+هر پروسه یک ماتریس float32 پیوسته در حافظه (یا memory-mapped) نگه می‌دارد و
+امتیازدهی cosine روی کاندیداهای FULLTEXT با یک ضرب ماتریسی انجام می‌شود.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = getattr(settings, 'SEARCH_EMBEDDING_DIM', 256)
+EMBEDDING_DTYPE = np.float32
+EMBEDDING_MMAP_PATH = getattr(settings, 'SEARCH_EMBEDDING_MMAP_PATH', '')
+
+# کلید نسخه در کش برای همگام‌سازی ایندکس بین پروسه‌ها
+VERSION_CACHE_KEY = 'search:embeddings:version'
+EPOCH_CACHE_KEY = 'search:embeddings:epoch'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_PERSIAN_NORMALIZE = str.maketrans({
+    'ي': 'ی',
+    'ك': 'ک',
+    '‌': ' ',
+})
+
+
+def _features(text: str) -> Iterable[str]:
+    """توکن‌ها و n-gram های کاراکتری (۳تایی) برای feature hashing"""
+    text = (text or '').translate(_PERSIAN_NORMALIZE).lower()
+    for token in _TOKEN_RE.findall(text):
+        yield token
+        padded = f'#{token}#'
+        for i in range(len(padded) - 2):
+            yield padded[i:i + 3]
+
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    تولید بردار نرمال‌شدهٔ float32 با feature hashing (قطعی و مستقل از پروسه)
+
+    از crc32 به‌جای hash() استفاده می‌شود تا بردارها بین پروسه‌ها یکسان باشند.
+    """
+    vec = np.zeros(dim, dtype=EMBEDDING_DTYPE)
+    for feature in _features(text):
+        h = zlib.crc32(feature.encode('utf-8'))
+        vec[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+def embedding_to_bytes(vec: np.ndarray) -> bytes:
+    return np.ascontiguousarray(vec, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def embedding_from_bytes(raw: Optional[bytes], dim: int = EMBEDDING_DIM) -> Optional[np.ndarray]:
+    if not raw:
+        return None
+    vec = np.frombuffer(bytes(raw), dtype=EMBEDDING_DTYPE)
+    if vec.shape[0] != dim:
+        return None
+    return vec
+
+
+def content_embedding_text(title: str, content: str) -> str:
+    return f'{title or ""}\n{content or ""}'
+
+
+class EmbeddingIndex:
+    """
+    ماتریس پیوستهٔ float32 از بردارهای SearchableContent
+
+    - ``_matrix``: آرایهٔ (capacity, dim) با رشد دوبرابری
+    - ``_rows``: نگاشت id محتوا به شمارهٔ سطر
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((0, dim), dtype=EMBEDDING_DTYPE)
+        self._size = 0
+        self._rows: Dict[int, int] = {}
+        self._watermark = None
+        self._version = None
+        self._epoch = None
+        self._loaded = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    # ---------- Mutation ----------
+    def _ensure_capacity(self, extra: int) -> None:
+        needed = self._size + extra
+        capacity = self._matrix.shape[0]
+        if needed <= capacity and self._matrix.flags.writeable:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        grown = np.zeros((new_capacity, self.dim), dtype=EMBEDDING_DTYPE)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def upsert_many(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        """افزودن یا جایگزینی دسته‌ای بردارها"""
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype=EMBEDDING_DTYPE).reshape(len(ids), self.dim)
+        with self._lock:
+            self._ensure_capacity(len(ids))
+            for content_id, vec in zip(ids, vectors):
+                row = self._rows.get(content_id)
+                if row is None:
+                    row = self._size
+                    self._rows[content_id] = row
+                    self._size += 1
+                self._matrix[row] = vec
+
+    def upsert(self, content_id: int, vector: np.ndarray) -> None:
+        self.upsert_many([content_id], vector.reshape(1, -1))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._matrix = np.zeros((0, self.dim), dtype=EMBEDDING_DTYPE)
+            self._size = 0
+            self._rows = {}
+            self._watermark = None
+            self._loaded = False
+
+    # ---------- Loading ----------
+    def _load_rows(self, since=None, batch_size: int = 2000) -> None:
+        from .models import SearchableContent
+
+        qs = SearchableContent.objects.exclude(embedding__isnull=True)
+        if since is not None:
+            qs = qs.filter(updated_at__gt=since)
+
+        ids: List[int] = []
+        vectors: List[np.ndarray] = []
+        watermark = self._watermark
+        for content_id, raw, updated_at in qs.values_list('id', 'embedding', 'updated_at').iterator(chunk_size=batch_size):
+            vec = embedding_from_bytes(raw, self.dim)
+            if vec is None:
+                continue
+            ids.append(content_id)
+            vectors.append(vec)
+            if watermark is None or updated_at > watermark:
+                watermark = updated_at
+            if len(ids) >= batch_size:
+                self.upsert_many(ids, np.vstack(vectors))
+                ids, vectors = [], []
+        if ids:
+            self.upsert_many(ids, np.vstack(vectors))
+        self._watermark = watermark
+
+    def refresh(self) -> None:
+        """
+        همگام‌سازی با دیتابیس:
+        - تغییر epoch (حذف رکورد) → بارگذاری کامل
+        - تغییر version (ذخیرهٔ رکورد) → فقط رکوردهای به‌روز شده پس از watermark
+        """
+        version = cache.get(VERSION_CACHE_KEY, 0)
+        epoch = cache.get(EPOCH_CACHE_KEY, 0)
+        with self._lock:
+            if self._loaded and epoch == self._epoch and version == self._version:
+                return
+            if not self._loaded or epoch != self._epoch:
+                self.clear()
+                if EMBEDDING_MMAP_PATH and self.load_file(EMBEDDING_MMAP_PATH):
+                    self._load_rows(since=self._watermark)
+                else:
+                    self._load_rows()
+            else:
+                self._load_rows(since=self._watermark)
+            self._loaded = True
+            self._version = version
+            self._epoch = epoch
+
+    # ---------- Persistence (memory-mapped) ----------
+    def save_file(self, path: str) -> None:
+        """ذخیرهٔ ماتریس و شناسه‌ها در فایل npz برای بارگذاری memory-mapped"""
+        with self._lock:
+            ids = np.empty(self._size, dtype=np.int64)
+            for content_id, row in self._rows.items():
+                ids[row] = content_id
+            np.save(f'{path}.ids.npy', ids)
+            np.save(f'{path}.vectors.npy', self._matrix[:self._size])
+            meta = np.array([self._watermark.timestamp() if self._watermark else 0.0])
+            np.save(f'{path}.meta.npy', meta)
+
+    def load_file(self, path: str) -> bool:
+        try:
+            ids = np.load(f'{path}.ids.npy')
+            matrix = np.load(f'{path}.vectors.npy', mmap_mode='r')
+            meta = np.load(f'{path}.meta.npy')
+        except (OSError, ValueError) as e:
+            logger.warning(f"Embedding mmap file not loaded: {e}")
+            return False
+        if matrix.ndim != 2 or matrix.shape[1] != self.dim or matrix.shape[0] != ids.shape[0]:
+            return False
+
+        from datetime import datetime, timezone as dt_timezone
+
+        with self._lock:
+            # ماتریس فقط‌خواندنی است؛ اولین upsert آن را به حافظه کپی می‌کند
+            self._matrix = matrix
+            self._size = int(ids.shape[0])
+            self._rows = {int(content_id): row for row, content_id in enumerate(ids.tolist())}
+            self._watermark = (
+                datetime.fromtimestamp(float(meta[0]), tz=dt_timezone.utc) if meta[0] else None
+            )
+        return True
+
+    # ---------- Scoring ----------
+    def cosine_similarities(self, query_vec: np.ndarray, content_ids: Sequence[int]) -> np.ndarray:
+        """
+        cosine بین بردار کوئری و کاندیداها (بردارها از قبل نرمال هستند)
+
+        خروجی هم‌ترتیب با ``content_ids`` است؛ برای کاندیدای بدون بردار NaN.
+        """
+        n = len(content_ids)
+        sims = np.full(n, np.nan, dtype=EMBEDDING_DTYPE)
+        if not n:
+            return sims
+        with self._lock:
+            rows_map = self._rows
+            rows = np.fromiter((rows_map.get(cid, -1) for cid in content_ids), dtype=np.int64, count=n)
+            present = rows >= 0
+            if present.any():
+                sims[present] = self._matrix[rows[present]] @ query_vec.astype(EMBEDDING_DTYPE, copy=False)
+        return sims
+
+
+_index: Optional[EmbeddingIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_embedding_index() -> EmbeddingIndex:
+    """ایندکس سطح پروسه (lazy) و همگام‌شده با دیتابیس"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = EmbeddingIndex()
+    _index.refresh()
+    return _index
+
+
+def _bump(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None) or cache.incr(key)
+
+
+def content_version() -> tuple:
+    """نسخهٔ فعلی محتوای قابل جستجو (برای باطل‌کردن کش نتایج)"""
+    return cache.get(VERSION_CACHE_KEY, 0), cache.get(EPOCH_CACHE_KEY, 0)
+
+
+def notify_content_saved(content_id: int, vector: Optional[np.ndarray]) -> None:
+    """به‌روزرسانی ایندکس پروسهٔ جاری و اعلام تغییر به سایر پروسه‌ها"""
+    if _index is not None and vector is not None:
+        _index.upsert(content_id, vector)
+    _bump(VERSION_CACHE_KEY)
+
+
+def notify_content_deleted(content_id: int) -> None:
+    _bump(EPOCH_CACHE_KEY)
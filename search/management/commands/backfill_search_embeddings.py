@@ -0,0 +1,80 @@
+"""
+محاسبهٔ دسته‌ای embedding برای SearchableContent
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from ...embeddings import (
+    EmbeddingIndex,
+    content_embedding_text,
+    embed_text,
+    embedding_to_bytes,
+    notify_content_saved,
+)
+from ...models import SearchableContent
+from ...snippets import offsets_to_bytes, tokenize_with_offsets
+
+
+class Command(BaseCommand):
+    """
+    دستور backfill بردارهای جستجو
+    """
+    help = 'محاسبهٔ embedding و offset توکن‌ها برای محتوای قابل جستجو و (اختیاری) خروجی memory-mapped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='محاسبهٔ مجدد برای همهٔ رکوردها (نه فقط رکوردهای ناقص)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='تعداد رکورد در هر دسته',
+        )
+        parser.add_argument(
+            '--export',
+            default='',
+            help='مسیر خروجی ماتریس برای SEARCH_EMBEDDING_MMAP_PATH',
+        )
+
+    def handle(self, *args, **options):
+        """اجرای دستور"""
+        batch_size = options['batch_size']
+        qs = SearchableContent.objects.all()
+        if not options['all']:
+            qs = qs.filter(Q(embedding__isnull=True) | Q(token_offsets__isnull=True))
+
+        updated = 0
+        batch = []
+        now = timezone.now()
+        # updated_at به‌روز می‌شود تا بارگذاری افزایشی ایندکس رکوردها را ببیند
+        fields = ['embedding', 'token_offsets', 'token_positions', 'updated_at']
+        for obj in qs.only('id', 'title', 'content').iterator(chunk_size=batch_size):
+            obj.embedding = embedding_to_bytes(embed_text(content_embedding_text(obj.title, obj.content)))
+            offsets, obj.token_positions = tokenize_with_offsets(obj.content)
+            obj.token_offsets = offsets_to_bytes(offsets)
+            obj.updated_at = now
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                SearchableContent.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+        if batch:
+            SearchableContent.objects.bulk_update(batch, fields)
+            updated += len(batch)
+
+        # bulk_update سیگنال ندارد؛ اعلام تغییر به ایندکس پروسه‌ها
+        notify_content_saved(0, None)
+        self.stdout.write(f'{updated} بردار محاسبه شد')
+
+        if options['export']:
+            index = EmbeddingIndex()
+            index.refresh()
+            index.save_file(options['export'])
+            self.stdout.write(f'ماتریس {len(index)}×{index.dim} در {options["export"]} ذخیره شد')
+
+        self.stdout.write(self.style.SUCCESS('backfill با موفقیت انجام شد'))
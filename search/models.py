@@ -46,6 +46,14 @@ class SearchableContent(models.Model):
     metadata = models.JSONField(default=dict)
     metadata_text = models.TextField(blank=True, default="")
 
+    # بردار float32 (EMBEDDING_DIM) برای semantic rerank؛ در save محاسبه می‌شود
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+
+    # offset توکن‌های content (int32: start, end) و نگاشت توکن → شمارهٔ توکن‌ها
+    # برای ساخت snippet بدون اسکن مجدد متن؛ در save محاسبه می‌شوند
+    token_offsets = models.BinaryField(null=True, blank=True, editable=False)
+    token_positions = models.JSONField(default=dict, blank=True, editable=False)
+
     # ستون fulltext_all در مهاجرت 0002 برای MySQL ساخته می‌شود (Generated column)
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -72,11 +80,27 @@ class SearchableContent(models.Model):
     def save(self, *args, **kwargs) -> None:
         """
         تولید metadata_text از فیلد JSON برای استفاده در fulltext_all
+        و محاسبهٔ embedding و offset توکن‌ها (semantic rerank و snippet)
         """
         try:
             self.metadata_text = json.dumps(self.metadata, ensure_ascii=False, separators=(", ", ": "))
         except Exception:
             self.metadata_text = ""
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"title", "content"} & set(update_fields):
+            from .embeddings import content_embedding_text, embed_text, embedding_to_bytes
+            from .snippets import offsets_to_bytes, tokenize_with_offsets
+
+            self.embedding = embedding_to_bytes(
+                embed_text(content_embedding_text(self.title, self.content))
+            )
+            offsets, self.token_positions = tokenize_with_offsets(self.content)
+            self.token_offsets = offsets_to_bytes(offsets)
+            if update_fields is not None:
+                kwargs["update_fields"] = list(
+                    set(update_fields) | {"embedding", "token_offsets", "token_positions"}
+                )
         super().save(*args, **kwargs)
 
 
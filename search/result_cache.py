@@ -0,0 +1,155 @@
+"""
+کش نتایج جستجو (write-behind)
+Result cache for HybridSearchService
+
+- نتایج هر (کوئری نرمال‌شده، فیلترها) با TTL در کش جنگو نگه‌داری می‌شود تا
+  کوئری‌های تکراری بدون اجرای مجدد FULLTEXT پاسخ داده شوند.
+- ردیف‌های SearchResult از شناسه‌های موجود ساخته شده و در یک بافر درون‌پروسه
+  جمع می‌شوند؛ یک thread پس‌زمینه آن‌ها را دسته‌ای با bulk_create می‌نویسد.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_TTL = getattr(settings, 'SEARCH_RESULT_CACHE_TTL', 300)
+FLUSH_BATCH_SIZE = getattr(settings, 'SEARCH_RESULT_FLUSH_BATCH_SIZE', 500)
+FLUSH_INTERVAL_SECONDS = getattr(settings, 'SEARCH_RESULT_FLUSH_INTERVAL', 2.0)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_PERSIAN_NORMALIZE = str.maketrans({'ي': 'ی', 'ك': 'ک', '‌': ' '})
+
+
+def normalize_query(query_text: str) -> str:
+    """نرمال‌سازی کوئری برای کلید کش (حروف عربی/فارسی، فاصله‌ها، حروف کوچک)"""
+    text = (query_text or '').translate(_PERSIAN_NORMALIZE).lower()
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def make_cache_key(
+    query_text: str,
+    filters: Optional[Dict[str, Any]],
+    options: Optional[Dict[str, Any]] = None,
+) -> str:
+    payload = json.dumps(
+        {'q': normalize_query(query_text), 'f': filters or {}, 'o': options or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    return f'search:results:{digest}'
+
+
+def get_cached_results(
+    query_text: str,
+    filters: Optional[Dict[str, Any]],
+    options: Optional[Dict[str, Any]] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    try:
+        return cache.get(make_cache_key(query_text, filters, options))
+    except Exception as e:
+        logger.warning(f"Search result cache read failed: {e}")
+        return None
+
+
+def set_cached_results(
+    query_text: str,
+    filters: Optional[Dict[str, Any]],
+    results: List[Dict[str, Any]],
+    options: Optional[Dict[str, Any]] = None,
+) -> None:
+    try:
+        cache.set(make_cache_key(query_text, filters, options), results, RESULT_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Search result cache write failed: {e}")
+
+
+class SearchResultWriteBehind:
+    """
+    بافر درون‌پروسه برای ردیف‌های SearchResult
+
+    ``enqueue`` فقط به بافر اضافه می‌کند؛ نوشتن در دیتابیس با رسیدن بافر به
+    ``batch_size`` یا هر ``interval`` ثانیه در thread پس‌زمینه انجام می‌شود.
+    """
+
+    def __init__(self, batch_size: int = FLUSH_BATCH_SIZE, interval: float = FLUSH_INTERVAL_SECONDS):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def enqueue(self, search_query_id: int, results: List[Dict[str, Any]]) -> None:
+        rows = [
+            {
+                'query_id': search_query_id,
+                'content_id': r['id'],
+                'relevance_score': r['combined_score'],
+                'rank': rank,
+                'snippet': r['snippet'],
+            }
+            for rank, r in enumerate(results, 1)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._pending.extend(rows)
+            should_wake = len(self._pending) >= self.batch_size
+        self._ensure_worker()
+        if should_wake:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """نوشتن همهٔ ردیف‌های بافر با bulk_create؛ تعداد ردیف‌ها را برمی‌گرداند"""
+        from .models import SearchResult
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        try:
+            SearchResult.objects.bulk_create(
+                [SearchResult(**row) for row in pending],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+        except Exception as e:
+            logger.error(f"Failed to flush {len(pending)} search results: {e}")
+            return 0
+        return len(pending)
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, name='search-result-writer', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+result_writer = SearchResultWriteBehind()
@@ -6,18 +6,21 @@
 from __future__ import annotations
 
 import time
-import math
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional
 from functools import reduce
 from operator import or_ as OR
 
+import numpy as np
 from django.db.models.expressions import RawSQL
 from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
-from .models import SearchableContent, SearchQuery as SearchQueryModel, SearchResult
+from .embeddings import content_version, embed_text, get_embedding_index
+from .models import SearchableContent, SearchQuery as SearchQueryModel
+from .snippets import build_snippet, offsets_from_bytes
+from .result_cache import get_cached_results, normalize_query, result_writer, set_cached_results
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -61,31 +64,48 @@ class HybridSearchService:
             return {"results": [], "total_count": 0, "execution_time_ms": 0, "query": query_text}
 
         filters = filters or {}
+        # نرمال‌سازی فقط برای کلید کش است؛ تطبیق روی متن خود کوئری انجام می‌شود
+        # چون محتوای ذخیره‌شده نرمال نشده است (مثلاً نیم‌فاصلهٔ «می‌شود»)
+        cache_text = normalize_query(query_text)
+        # نسخهٔ محتوا در کلید کش: هر تغییر SearchableContent نتایج قبلی را باطل می‌کند
+        cache_options = {
+            "limit": limit,
+            "boolean_mode": boolean_mode,
+            "candidate_limit": candidate_limit,
+            "content_version": content_version(),
+        }
+
+        # 0) کوئری تکراری: پاسخ مستقیم از کش بدون اجرای FULLTEXT
+        cached_results = get_cached_results(cache_text, filters, cache_options)
+        if cached_results is not None:
+            return self._build_response(query_text, filters, user, cached_results, start_time, cached=True)
 
         # 1) FULLTEXT candidates یا fallback روی sqlite
         fts_candidates = self._full_text_candidates(query_text, filters, candidate_limit, boolean_mode)
 
-        # اگر هیچ کاندیدایی نیست، خالی برگرد
-        if not fts_candidates:
-            exec_ms = int((time.time() - start_time) * 1000)
-            sq = SearchQueryModel.objects.create(
-                query_text=query_text, filters=filters, user=user, results_count=0, execution_time_ms=exec_ms
-            )
-            return {
-                "results": [],
-                "total_count": 0,
-                "execution_time_ms": exec_ms,
-                "query": query_text,
-                "filters": filters,
-                "search_id": sq.id,
-            }
-
-        # 2) semantic rerank روی همین کاندیداها (فعلاً بدون وابستگی به embeddings)
-        semantic_scored = self._semantic_rerank(query_text, fts_candidates)
-
-        # 3) ترکیب امتیازها
-        combined_results = self._combine_results(fts_candidates, semantic_scored, limit)
+        combined_results: List[Dict[str, Any]] = []
+        if fts_candidates:
+            # 2) semantic rerank روی همین کاندیداها (ایندکس برداری درون‌پروسه)
+            semantic_scored = self._semantic_rerank(query_text, fts_candidates)
+
+            # 3) ترکیب امتیازها
+            combined_results = self._combine_results(fts_candidates, semantic_scored, limit)
 
+            # 4) snippet برای نتایج نهایی
+            self._attach_snippets(query_text, combined_results)
+
+        set_cached_results(cache_text, filters, combined_results, cache_options)
+        return self._build_response(query_text, filters, user, combined_results, start_time, cached=False)
+
+    def _build_response(
+        self,
+        query_text: str,
+        filters: Dict[str, Any],
+        user: Optional[User],
+        results: List[Dict[str, Any]],
+        start_time: float,
+        cached: bool,
+    ) -> Dict[str, Any]:
         # زمان اجرا
         execution_time_ms = int((time.time() - start_time) * 1000)
 
@@ -94,20 +114,22 @@ class HybridSearchService:
             query_text=query_text,
             filters=filters,
             user=user,
-            results_count=len(combined_results),
+            results_count=len(results),
             execution_time_ms=execution_time_ms,
         )
 
-        # کش نتایج
-        self._cache_search_results(search_query_obj, combined_results)
+        # کش نتایج (write-behind)؛ برای پاسخ از کش دوباره نوشته نمی‌شود
+        if not cached:
+            self._cache_search_results(search_query_obj, results)
 
         return {
-            "results": combined_results,
-            "total_count": len(combined_results),
+            "results": results,
+            "total_count": len(results),
             "execution_time_ms": execution_time_ms,
             "query": query_text,
             "filters": filters,
             "search_id": search_query_obj.id,
+            "cached": cached,
         }
 
     # ---------- Internal: FULLTEXT or fallback ----------
@@ -179,48 +201,61 @@ class HybridSearchService:
             logger.error(f"FULLTEXT/fallback search failed: {e}")
             return []
 
-    # ---------- Internal: Semantic rerank (placeholder) ----------
-    def _semantic_rerank(self, query_text: str, candidates: List[Dict[str, Any]]) -> Dict[Tuple[int, str, int], float]:
+    # ---------- Internal: Semantic rerank ----------
+    def _semantic_rerank(self, query_text: str, candidates: List[Dict[str, Any]]) -> Optional[np.ndarray]:
         """
-        بر اساس امبدینگ: distance (کوچک‌تر بهتر). اگر سرویس امبدینگ موجود نبود، دیکشنری خالی برگردان.
+        cosine similarity بین بردار کوئری و بردار ذخیره‌شدهٔ کاندیداها.
+        خروجی هم‌ترتیب با candidates است (NaN برای کاندیدای بدون بردار).
+        اگر ایندکس در دسترس نبود None برگردان.
         """
         try:
             query_vec = self._make_query_embedding(query_text)
-        except Exception:
-            return {}
+            index = get_embedding_index()
+        except Exception as e:
+            logger.warning(f"Semantic rerank unavailable: {e}")
+            return None
 
-        distances: Dict[Tuple[int, str, int], float] = {}
-        # بدون دیتابیس امبدینگ، مقداردهی تصادفی ثابت بر اساس hash
-        for c in candidates:
-            key = (c.get("encounter_id") or 0, c["content_type"], c["content_id"])
-            distances[key] = 0.5  # مقدار ثابت تا زمان یکپارچه‌سازی embeddings
-        return distances
+        return index.cosine_similarities(query_vec, [c["id"] for c in candidates])
 
     # ---------- Internal: Combine ----------
     def _combine_results(
         self,
         fts_candidates: List[Dict[str, Any]],
-        semantic_dist: Dict[Tuple[int, str, int], float],
+        semantic_sim: Optional[np.ndarray],
         limit: int,
     ) -> List[Dict[str, Any]]:
         """
-        ترکیب: similarity_sem = 1 - distance (clamped to [0,1])
+        ترکیب: similarity_sem = cosine (clamped to [0,1])
         combined = w_ft * norm(keyword_relevance) + w_sem * similarity_sem
+        امتیازدهی برداری است و فقط top-k به دیکشنری خروجی تبدیل می‌شود.
         """
-        if fts_candidates:
-            max_kw = max(c.get("keyword_relevance", 1.0) for c in fts_candidates) or 1.0
-        else:
-            max_kw = 1.0
+        n = len(fts_candidates)
+        if not n:
+            return []
 
-        results = []
-        for c in fts_candidates:
-            key = (c.get("encounter_id") or 0, c["content_type"], c["content_id"])
-            dist = semantic_dist.get(key)
-            sem_sim = 0.0 if dist is None else max(0.0, min(1.0, 1.0 - float(dist)))
+        kw = np.fromiter(
+            (c.get("keyword_relevance", 1.0) for c in fts_candidates), dtype=np.float64, count=n
+        )
+        max_kw = kw.max() or 1.0
+        kw_norm = kw / max_kw
+
+        if semantic_sim is None:
+            semantic_sim = np.full(n, np.nan)
+        has_sem = ~np.isnan(semantic_sim)
+        sem = np.clip(np.nan_to_num(semantic_sim, nan=0.0), 0.0, 1.0)
 
-            kw_norm = float(c.get("keyword_relevance", 1.0)) / max_kw
-            combined = kw_norm * self.fts_weight + sem_sim * self.semantic_weight
+        combined = kw_norm * self.fts_weight + sem * self.semantic_weight
+
+        k = min(limit, n)
+        if k <= 0:
+            return []
+        # top-k بدون مرتب‌سازی کامل؛ ترتیب پایدار برای امتیازهای برابر
+        top = np.argpartition(-combined, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.lexsort((top, -combined[top]))]
 
+        results = []
+        for i in top.tolist():
+            c = fts_candidates[i]
             results.append({
                 "id": c["id"],
                 "encounter_id": c.get("encounter_id"),
@@ -228,52 +263,52 @@ class HybridSearchService:
                 "content_id": c["content_id"],
                 "title": c["title"],
                 "content": c["content"],
-                "snippet": self._generate_snippet(c["content"], ""),
-                "score": float(kw_norm),
-                "semantic_similarity": float(sem_sim),
-                "combined_score": float(combined),
-                "search_type": "hybrid" if dist is not None else "full_text",
+                "snippet": "",
+                "score": float(kw_norm[i]),
+                "semantic_similarity": float(sem[i]),
+                "combined_score": float(combined[i]),
+                "search_type": "hybrid" if has_sem[i] else "full_text",
                 "metadata": c.get("metadata") or {},
                 "created_at": None,
             })
-
-        results.sort(key=lambda x: x["combined_score"], reverse=True)
-        return results[:limit]
+        return results
 
     # ---------- Helpers ----------
-    def _generate_snippet(self, content: str, query_text: str, max_length: int = 200) -> str:
-        if not content:
-            return ""
-        snippet = content[:max_length]
-        if len(content) > max_length:
-            snippet += "..."
-        return snippet
+    def _generate_snippet(
+        self,
+        content: str,
+        query_text: str,
+        max_length: int = 200,
+        offsets=None,
+        positions: Optional[Dict[str, List[int]]] = None,
+    ) -> Dict[str, Any]:
+        return build_snippet(content, query_text, offsets, positions, max_length)
+
+    def _attach_snippets(self, query_text: str, results: List[Dict[str, Any]]) -> None:
+        """
+        snippet متمرکز بر کوئری برای نتایج نهایی؛ offset های توکن با یک کوئری
+        برای همهٔ نتایج خوانده می‌شوند.
+        """
+        if not results:
+            return
+        token_data = {
+            row[0]: row[1:]
+            for row in SearchableContent.objects.filter(id__in=[r["id"] for r in results])
+            .values_list("id", "token_offsets", "token_positions")
+        }
+        for r in results:
+            raw_offsets, positions = token_data.get(r["id"], (None, None))
+            offsets = offsets_from_bytes(raw_offsets)
+            if offsets is None or not positions:
+                offsets, positions = None, None
+            r.update(self._generate_snippet(r["content"], query_text, offsets=offsets, positions=positions))
 
     def _cache_search_results(self, search_query_obj: SearchQueryModel, results: List[Dict[str, Any]]):
+        """ثبت ردیف‌های SearchResult در بافر write-behind (بدون واکشی محتوا)"""
         try:
-            SearchResult.objects.filter(query=search_query_obj).delete()
-            bulk = []
-            for rank, r in enumerate(results, 1):
-                try:
-                    sc = SearchableContent.objects.get(id=r["id"])
-                except SearchableContent.DoesNotExist:
-                    continue
-                bulk.append(SearchResult(
-                    query=search_query_obj,
-                    content=sc,
-                    relevance_score=r["combined_score"],
-                    rank=rank,
-                    snippet=r["snippet"],
-                ))
-            if bulk:
-                SearchResult.objects.bulk_create(bulk)
+            result_writer.enqueue(search_query_obj.id, results)
         except Exception as e:
             logger.error(f"Failed to cache search results: {e}")
 
-    def _make_query_embedding(self, text: str) -> List[float]:
-        import random
-        random.seed(hash(text) & 0xFFFFFFFF)
-        vec = [random.random() for _ in range(64)]  # ابعاد موقت تا زمان یکپارچه‌سازی
-        s = math.sqrt(sum(x*x for x in vec)) or 1.0
-        return [x / s for x in vec]
-
+    def _make_query_embedding(self, text: str) -> np.ndarray:
+        return embed_text(text)
@@ -0,0 +1,37 @@
+"""
+سیگنال‌های اپلیکیشن جستجو
+همگام‌سازی ایندکس برداری و ایندکس پیشنهاد با تغییرات مدل‌ها
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .embeddings import embedding_from_bytes, notify_content_deleted, notify_content_saved
+from .models import SearchableContent, SearchQuery
+from .suggestions import get_loaded_suggestion_index
+
+
+@receiver(post_save, sender=SearchableContent)
+def handle_searchable_content_saved(sender, instance, **kwargs):
+    """پس از ذخیره محتوا: به‌روزرسانی بردار در ایندکس"""
+    notify_content_saved(instance.id, embedding_from_bytes(instance.embedding))
+
+
+@receiver(post_delete, sender=SearchableContent)
+def handle_searchable_content_deleted(sender, instance, **kwargs):
+    """پس از حذف محتوا: بازسازی ایندکس در پروسه‌ها"""
+    notify_content_deleted(instance.id)
+
+
+@receiver(post_save, sender=SearchQuery)
+def handle_search_query_saved(sender, instance, created, **kwargs):
+    """
+    کوئری موفق جدید: افزودن به ایندکس پیشنهاد
+
+    ایندکس در مسیر ذخیره ساخته نمی‌شود؛ اگر هنوز بارگذاری نشده باشد، این ردیف
+    در اولین بارگذاری (هنگام اولین درخواست پیشنهاد) خوانده می‌شود.
+    """
+    if created and instance.results_count > 0:
+        index = get_loaded_suggestion_index()
+        if index is not None:
+            index.record(instance.id, instance.query_text, instance.created_at)
@@ -0,0 +1,161 @@
+"""
+تولید snippet متمرکز بر کوئری با offset های از پیش محاسبه‌شده
+Query-centered, highlighted snippets from precomputed token offsets
+
+هنگام ذخیرهٔ SearchableContent دو ساختار ساخته می‌شود:
+- ``token_offsets``: آرایهٔ int32 از جفت‌های (start, end) هر توکن در content
+- ``token_positions``: نگاشت توکن نرمال‌شده → شمارهٔ توکن‌ها
+
+ساخت snippet فقط lookup در این دو ساختار است و متن طولانی دوباره اسکن نمی‌شود.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.utils.html import escape
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# جایگزینی‌ها یک‌به‌یک هستند تا offset ها روی متن اصلی معتبر بمانند
+_PERSIAN_NORMALIZE = str.maketrans({'ي': 'ی', 'ك': 'ک', '‌': ' '})
+
+OFFSET_DTYPE = np.int32
+HIGHLIGHT_OPEN = '<mark>'
+HIGHLIGHT_CLOSE = '</mark>'
+
+
+def normalize_token(token: str) -> str:
+    return token.translate(_PERSIAN_NORMALIZE).lower()
+
+
+def tokenize_with_offsets(content: str) -> Tuple[np.ndarray, Dict[str, List[int]]]:
+    """توکن‌سازی یک‌باره: (offsets با شکل (n, 2)، positions)"""
+    text = (content or '').translate(_PERSIAN_NORMALIZE)
+    spans: List[Tuple[int, int]] = []
+    positions: Dict[str, List[int]] = {}
+    for i, m in enumerate(_TOKEN_RE.finditer(text)):
+        spans.append(m.span())
+        positions.setdefault(m.group().lower(), []).append(i)
+    offsets = np.array(spans, dtype=OFFSET_DTYPE).reshape(-1, 2)
+    return offsets, positions
+
+
+def offsets_to_bytes(offsets: np.ndarray) -> bytes:
+    return np.ascontiguousarray(offsets, dtype=OFFSET_DTYPE).tobytes()
+
+
+def offsets_from_bytes(raw: Optional[bytes]) -> Optional[np.ndarray]:
+    if raw is None:
+        return None
+    return np.frombuffer(bytes(raw), dtype=OFFSET_DTYPE).reshape(-1, 2)
+
+
+def _query_terms(query_text: str) -> List[str]:
+    seen: List[str] = []
+    for m in _TOKEN_RE.finditer((query_text or '').translate(_PERSIAN_NORMALIZE)):
+        term = m.group().lower()
+        if term not in seen:
+            seen.append(term)
+    return seen
+
+
+def _best_window(
+    offsets: np.ndarray,
+    matches: List[Tuple[int, str]],
+    max_length: int,
+) -> Tuple[int, int]:
+    """
+    پنجرهٔ دو-اشاره‌گری روی توکن‌های منطبق: بیشترین تعداد ترم متمایز
+    (و سپس بیشترین تعداد انطباق) که در max_length کاراکتر جا شود.
+    خروجی: (اندیس اولین، آخرین انطباق در matches)
+    """
+    best = (0, 0)
+    best_key = (0, 0)
+    counts: Dict[str, int] = {}
+    left = 0
+    for right, (tok_r, term_r) in enumerate(matches):
+        counts[term_r] = counts.get(term_r, 0) + 1
+        # توکن منفرد بلندتر از max_length: پنجره به همان توکن محدود می‌شود
+        while left < right and offsets[tok_r, 1] - offsets[matches[left][0], 0] > max_length:
+            term_l = matches[left][1]
+            counts[term_l] -= 1
+            if not counts[term_l]:
+                del counts[term_l]
+            left += 1
+        key = (len(counts), right - left + 1)
+        if key > best_key:
+            best_key = key
+            best = (left, right)
+    return best
+
+
+def build_snippet(
+    content: str,
+    query_text: str,
+    offsets: Optional[np.ndarray] = None,
+    positions: Optional[Dict[str, List[int]]] = None,
+    max_length: int = 200,
+) -> Dict[str, Any]:
+    """
+    snippet متمرکز بر بهترین پنجرهٔ انطباق
+
+    خروجی: ``snippet`` (متن ساده)، ``snippet_html`` (escape شده با <mark>)
+    و ``highlights`` (بازه‌های انطباق نسبت به ابتدای snippet).
+    """
+    if not content:
+        return {'snippet': '', 'snippet_html': '', 'highlights': []}
+    if offsets is None or positions is None:
+        offsets, positions = tokenize_with_offsets(content)
+
+    matches: List[Tuple[int, str]] = []
+    for term in _query_terms(query_text):
+        for tok in positions.get(term, ()):
+            matches.append((tok, term))
+    matches.sort()
+
+    if not matches or not len(offsets):
+        start, end = 0, min(len(content), max_length)
+        window_matches: List[Tuple[int, str]] = []
+    else:
+        lo, hi = _best_window(offsets, matches, max_length)
+        span_start = int(offsets[matches[lo][0], 0])
+        span_end = int(offsets[matches[hi][0], 1])
+        # وسط‌چین کردن بازهٔ انطباق و چسباندن به مرز توکن‌ها
+        pad = max(0, (max_length - (span_end - span_start)) // 2)
+        start = max(0, span_start - pad)
+        end = min(len(content), start + max_length)
+        start = max(0, min(start, end - max_length))
+        starts = offsets[:, 0]
+        ends = offsets[:, 1]
+        if start > 0:
+            idx = int(np.searchsorted(starts, start))
+            if idx < len(starts) and starts[idx] <= span_start:
+                start = int(starts[idx])
+        if end < len(content):
+            idx = int(np.searchsorted(ends, end, side='right')) - 1
+            if idx >= 0 and ends[idx] >= span_end:
+                end = int(ends[idx])
+        window_matches = [m for m in matches if offsets[m[0], 0] >= start and offsets[m[0], 1] <= end]
+
+    prefix = '...' if start > 0 else ''
+    suffix = '...' if end < len(content) else ''
+
+    highlights: List[List[int]] = []
+    html_parts: List[str] = [prefix]
+    cursor = start
+    for tok, _ in window_matches:
+        t_start, t_end = int(offsets[tok, 0]), int(offsets[tok, 1])
+        html_parts.append(escape(content[cursor:t_start]))
+        html_parts.append(f'{HIGHLIGHT_OPEN}{escape(content[t_start:t_end])}{HIGHLIGHT_CLOSE}')
+        highlights.append([t_start - start + len(prefix), t_end - start + len(prefix)])
+        cursor = t_end
+    html_parts.append(escape(content[cursor:end]))
+    html_parts.append(suffix)
+
+    return {
+        'snippet': f'{prefix}{content[start:end]}{suffix}',
+        'snippet_html': ''.join(html_parts),
+        'highlights': highlights,
+    }
@@ -0,0 +1,167 @@
+"""
+ایندکس پیشوندی برای پیشنهاد جستجو (autocomplete)
+Prefix completion table for search_suggestions
+
+برای هر پیشوند (تا ``MAX_PREFIX_LENGTH`` کاراکتر) فهرست top-k کوئری‌های موفق
+از قبل محاسبه می‌شود؛ پاسخ هر درخواست یک lookup در دیکشنری است و به اندازهٔ
+لاگ کوئری‌ها وابسته نیست. تعداد کوئری‌های نگه‌داری‌شده به ``MAX_TRACKED_QUERIES``
+محدود است و در صورت عبور، کم‌امتیازترین کوئری‌ها کنار گذاشته می‌شوند.
+
+امتیاز هر کوئری مجموع وزن‌های زمانی ``exp((t - t_ref) / tau)`` است؛ وزن
+رخدادهای جدیدتر بیشتر است و امتیازها فقط افزایش می‌یابند، بنابراین جدول
+top-k را می‌توان به‌صورت افزایشی به‌روز کرد.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .result_cache import normalize_query
+
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = getattr(settings, 'SEARCH_SUGGESTION_MAX_PREFIX', 24)
+TOP_K = getattr(settings, 'SEARCH_SUGGESTION_TOP_K', 20)
+WINDOW_DAYS = getattr(settings, 'SEARCH_SUGGESTION_WINDOW_DAYS', 90)
+RECENCY_HALF_LIFE_HOURS = getattr(settings, 'SEARCH_SUGGESTION_HALF_LIFE_HOURS', 72)
+REFRESH_INTERVAL_SECONDS = getattr(settings, 'SEARCH_SUGGESTION_REFRESH_SECONDS', 30)
+MAX_TRACKED_QUERIES = getattr(settings, 'SEARCH_SUGGESTION_MAX_QUERIES', 50000)
+MAX_QUERY_LENGTH = 200
+
+
+class SuggestionIndex:
+    """
+    جدول completion: پیشوند → فهرست مرتب (امتیاز، کوئری نرمال‌شده)
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._scores: Dict[str, float] = {}
+        self._display: Dict[str, str] = {}
+        self._table: Dict[str, List[Tuple[float, str]]] = {}
+        self._last_id = 0
+        self._recorded: set = set()
+        self._last_refresh = 0.0
+        self._t_ref = time.time()
+        self._decay = math.log(2) / (RECENCY_HALF_LIFE_HOURS * 3600)
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def _weight(self, ts: float) -> float:
+        # exp روی اختلاف محدود می‌شود تا در اجراهای طولانی سرریز نشود
+        return math.exp(min(700.0, (ts - self._t_ref) * self._decay))
+
+    def add(self, query_text: str, created_at=None) -> None:
+        """افزودن یک کوئری موفق و به‌روزرسانی top-k پیشوندهای آن"""
+        key = normalize_query(query_text)
+        if len(key) < MIN_PREFIX_LENGTH or len(key) > MAX_QUERY_LENGTH:
+            return
+        ts = created_at.timestamp() if created_at is not None else time.time()
+        with self._lock:
+            score = self._scores.get(key, 0.0) + self._weight(ts)
+            self._scores[key] = score
+            self._display[key] = query_text.strip()
+            for n in range(MIN_PREFIX_LENGTH, min(len(key), MAX_PREFIX_LENGTH) + 1):
+                self._promote(key[:n], key, score)
+            if len(self._scores) > MAX_TRACKED_QUERIES:
+                self._prune()
+
+    def _prune(self) -> None:
+        """
+        نگه‌داشتن پرامتیازترین کوئری‌ها (۹۰٪ سقف) و بازسازی جدول از آن‌ها؛
+        با این حاشیه، بازسازی حداکثر یک بار به ازای هر ۱۰٪ سقف کوئری جدید رخ می‌دهد
+        """
+        keep = int(MAX_TRACKED_QUERIES * 0.9)
+        survivors = sorted(self._scores.items(), key=lambda item: item[1], reverse=True)[:keep]
+        self._scores = dict(survivors)
+        self._display = {key: self._display[key] for key in self._scores}
+        self._table = {}
+        for key, score in survivors:
+            for n in range(MIN_PREFIX_LENGTH, min(len(key), MAX_PREFIX_LENGTH) + 1):
+                self._promote(key[:n], key, score)
+
+    def _promote(self, prefix: str, key: str, score: float) -> None:
+        entries = self._table.setdefault(prefix, [])
+        for i, (_, existing) in enumerate(entries):
+            if existing == key:
+                del entries[i]
+                break
+        else:
+            if len(entries) >= TOP_K and score <= entries[-1][0]:
+                return
+        # درج مرتب نزولی؛ فهرست حداکثر TOP_K عضو دارد
+        pos = 0
+        while pos < len(entries) and entries[pos][0] >= score:
+            pos += 1
+        entries.insert(pos, (score, key))
+        del entries[TOP_K:]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        key = normalize_query(prefix)
+        if len(key) < MIN_PREFIX_LENGTH:
+            return []
+        with self._lock:
+            entries = self._table.get(key[:MAX_PREFIX_LENGTH], [])
+            if len(key) > MAX_PREFIX_LENGTH:
+                entries = [e for e in entries if e[1].startswith(key)]
+            return [self._display[k] for _, k in entries[:limit]]
+
+    # ---------- Loading ----------
+    def refresh(self, force: bool = False) -> None:
+        """
+        بارگذاری افزایشی کوئری‌های موفق جدید (id > آخرین id دیده‌شده)؛
+        حداکثر هر ``REFRESH_INTERVAL_SECONDS`` یک بار به دیتابیس مراجعه می‌شود.
+        """
+        now = time.time()
+        if not force and now - self._last_refresh < REFRESH_INTERVAL_SECONDS:
+            return
+        from .models import SearchQuery
+
+        with self._lock:
+            self._last_refresh = now
+            qs = SearchQuery.objects.filter(id__gt=self._last_id, results_count__gt=0)
+            if not self._last_id:
+                qs = qs.filter(created_at__gte=timezone.now() - timedelta(days=WINDOW_DAYS))
+            rows = qs.order_by('id').values_list('id', 'query_text', 'created_at')
+            for query_id, query_text, created_at in rows.iterator(chunk_size=2000):
+                if query_id in self._recorded:
+                    self._recorded.discard(query_id)
+                else:
+                    self.add(query_text, created_at)
+                self._last_id = query_id
+
+    def record(self, query_id: int, query_text: str, created_at=None) -> None:
+        """ثبت مستقیم کوئری جدید در پروسهٔ جاری (بدون انتظار برای refresh)"""
+        with self._lock:
+            if query_id <= self._last_id or query_id in self._recorded:
+                return
+            self.add(query_text, created_at)
+            # refresh بعدی این ردیف را دوباره شمارش نمی‌کند
+            self._recorded.add(query_id)
+
+
+_index: Optional[SuggestionIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_loaded_suggestion_index() -> Optional[SuggestionIndex]:
+    """ایندکس فقط اگر قبلاً در این پروسه ساخته شده باشد (بدون مراجعه به دیتابیس)"""
+    return _index
+
+
+def get_suggestion_index() -> SuggestionIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SuggestionIndex()
+                _index.refresh(force=True)
+    _index.refresh()
+    return _index
@@ -33,3 +33,159 @@ class SearchAPITest(TestCase):
         res = self.client.get(url)
         self.assertIn(res.status_code, [200, 400])
 
+
+class EmbeddingIndexTest(TestCase):
+    def test_content_embedding_computed_on_save(self):
+        from .embeddings import embedding_from_bytes
+
+        obj = SearchableContent.objects.create(
+            content_type='notes', content_id=2, title='سردرد', content='بیمار از سردرد شدید شکایت دارد', metadata={}
+        )
+        obj.refresh_from_db()
+        vec = embedding_from_bytes(obj.embedding)
+        self.assertIsNotNone(vec)
+        self.assertAlmostEqual(float((vec * vec).sum()), 1.0, places=4)
+
+    def test_cosine_similarities_aligned_with_candidates(self):
+        from .embeddings import EmbeddingIndex, embed_text
+
+        index = EmbeddingIndex()
+        index.upsert_many([10, 20], [embed_text('سردرد شدید'), embed_text('درد قفسه سینه')])
+        sims = index.cosine_similarities(embed_text('سردرد'), [20, 99, 10])
+        self.assertTrue(sims[2] > sims[0])
+        self.assertTrue(sims[1] != sims[1])  # NaN برای کاندیدای بدون بردار
+
+    def test_hybrid_search_uses_semantic_similarity(self):
+        from .services import HybridSearchService
+
+        SearchableContent.objects.create(
+            content_type='notes', content_id=3, title='نمونه', content='نمونه متن برای تست', metadata={}
+        )
+        res = HybridSearchService().search('نمونه')
+        self.assertEqual(res['results'][0]['search_type'], 'hybrid')
+
+
+class SearchResultCacheTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        SearchableContent.objects.create(
+            content_type='notes', content_id=4, title='فشار خون', content='فشار خون بالا', metadata={}
+        )
+
+    def tearDown(self):
+        from .result_cache import result_writer
+
+        # ردیف‌های بافرشده در تراکنش همین تست نوشته می‌شوند، نه در تست بعدی
+        result_writer.flush()
+
+    def test_repeat_query_served_from_cache(self):
+        from unittest import mock
+        from .services import HybridSearchService
+
+        service = HybridSearchService()
+        first = service.search('فشار خون')
+        self.assertFalse(first['cached'])
+        self.assertEqual([r['title'] for r in first['results']], ['فشار خون'])
+        with mock.patch.object(service, '_full_text_candidates') as fts:
+            second = service.search('فشار  خون ')
+        fts.assert_not_called()
+        self.assertTrue(second['cached'])
+        self.assertEqual(first['results'], second['results'])
+
+    def test_query_matches_unnormalized_content(self):
+        from .services import HybridSearchService
+
+        SearchableContent.objects.create(
+            content_type='notes', content_id=5, title='درد', content='درد بیشتر می‌شود', metadata={}
+        )
+        res = HybridSearchService().search('می‌شود')
+        self.assertEqual([r['title'] for r in res['results']], ['درد'])
+
+    def test_write_behind_flush_creates_results(self):
+        from .models import SearchResult
+        from .result_cache import result_writer
+        from .services import HybridSearchService
+
+        res = HybridSearchService().search('فشار')
+        result_writer.flush()
+        self.assertEqual(
+            SearchResult.objects.filter(query_id=res['search_id']).count(), res['total_count']
+        )
+
+
+class SuggestionIndexTest(TestCase):
+    def test_prefix_ranked_by_frequency(self):
+        from .suggestions import SuggestionIndex
+
+        index = SuggestionIndex()
+        for _ in range(3):
+            index.add('سردرد میگرنی')
+        index.add('سرفه خشک')
+        self.assertEqual(index.suggest('سر', 10), ['سردرد میگرنی', 'سرفه خشک'])
+        self.assertEqual(index.suggest('سرف', 10), ['سرفه خشک'])
+
+    def test_normalizes_arabic_letters(self):
+        from .suggestions import SuggestionIndex
+
+        index = SuggestionIndex()
+        index.add('کبد چرب')
+        self.assertEqual(index.suggest('كب', 10), ['کبد چرب'])
+
+    def test_table_capped_to_top_queries(self):
+        from unittest import mock
+        from . import suggestions
+
+        index = suggestions.SuggestionIndex()
+        with mock.patch.object(suggestions, 'MAX_TRACKED_QUERIES', 10):
+            for _ in range(3):
+                index.add('سردرد میگرنی')
+            for i in range(20):
+                index.add(f'کوئری {i:02d}')
+        self.assertLessEqual(len(index), 10)
+        self.assertEqual(index.suggest('سر', 10), ['سردرد میگرنی'])
+        self.assertTrue(all(len(entries) <= suggestions.TOP_K for entries in index._table.values()))
+
+    def test_query_save_does_not_build_index(self):
+        from unittest import mock
+        from . import suggestions
+        from .models import SearchQuery
+
+        with mock.patch.object(suggestions, '_index', None):
+            SearchQuery.objects.create(query_text='سردرد', filters={}, results_count=3, execution_time_ms=1)
+            self.assertIsNone(suggestions.get_loaded_suggestion_index())
+            self.assertEqual(suggestions.get_suggestion_index().suggest('سرد', 10), ['سردرد'])
+
+
+class SnippetTest(TestCase):
+    def test_snippet_centered_on_match_with_highlight(self):
+        from .snippets import build_snippet
+
+        content = 'مقدمه ' * 100 + 'بیمار از سردرد شدید شکایت دارد' + ' ادامه' * 100
+        obj = SearchableContent.objects.create(
+            content_type='transcript', content_id=5, title='رونویسی', content=content, metadata={}
+        )
+        obj.refresh_from_db()
+        self.assertTrue(obj.token_positions.get('سردرد'))
+
+        res = build_snippet(content, 'سردرد', max_length=80)
+        self.assertIn('سردرد', res['snippet'])
+        self.assertIn('<mark>سردرد</mark>', res['snippet_html'])
+        start, end = res['highlights'][0]
+        self.assertEqual(res['snippet'][start:end], 'سردرد')
+        self.assertTrue(res['snippet'].startswith('...'))
+
+    def test_match_longer_than_snippet_through_attach(self):
+        from .services import HybridSearchService
+
+        long_token = 'x' * 300
+        obj = SearchableContent.objects.create(
+            content_type='transcript', content_id=6, title='طولانی', content=long_token + ' abc', metadata={}
+        )
+        obj.refresh_from_db()
+        self.assertIsNotNone(obj.token_offsets)
+
+        results = [{'id': obj.id, 'content': obj.content}]
+        HybridSearchService()._attach_snippets(long_token, results)
+        self.assertTrue(results[0]['snippet'].startswith('x' * 200))
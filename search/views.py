@@ -10,6 +10,7 @@ from django.core.paginator import Paginator
 from django.utils.dateparse import parse_date
 
 from .services import HybridSearchService
+from .suggestions import get_suggestion_index
 from app_standards.four_cores import with_api_ingress
 
 
@@ -117,6 +118,7 @@ def search_content(request):
 def search_suggestions(request):
     """
     ارائه پیشنهاد جستجو بر اساس سابقه کوئری‌ها
+    (ایندکس پیشوندی درون‌پروسه، وزن‌دهی با تکرار و تازگی)
 
     Query parameters:
     - q: پیشوند کوئری (حداقل 2 کاراکتر)
@@ -132,14 +134,7 @@ def search_suggestions(request):
 
     limit = min(int(request.GET.get('limit', 10)), 20)
 
-    from .models import SearchQuery as SearchQueryModel
-
-    suggestions = SearchQueryModel.objects.filter(
-        query_text__icontains=query_prefix,
-        results_count__gt=0
-    ).values('query_text').distinct().order_by('-id')[:limit]
-
-    suggestion_list = [s['query_text'] for s in suggestions]
+    suggestion_list = get_suggestion_index().suggest(query_prefix, limit)
 
     return Response({
         'query_prefix': query_prefix,
@@ -346,7 +346,8 @@ class STTUsageStatsAdmin(admin.ModelAdmin):
     readonly_fields = [
         'user', 'date', 'total_requests', 'successful_requests',
         'failed_requests', 'success_rate_display', 'total_audio_duration',
-        'total_processing_time', 'average_confidence_score'
+        'total_processing_time', 'total_queue_time', 'average_queue_latency',
+        'throughput', 'average_confidence_score'
     ]
     
     fieldsets = (
@@ -358,7 +359,8 @@ class STTUsageStatsAdmin(admin.ModelAdmin):
                       'success_rate_display')
         }),
         ('آمار زمان', {
-            'fields': ('total_audio_duration', 'total_processing_time')
+            'fields': ('total_audio_duration', 'total_processing_time',
+                      'total_queue_time', 'average_queue_latency', 'throughput')
         }),
         ('کیفیت', {
             'fields': ('average_confidence_score',)
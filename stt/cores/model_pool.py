@@ -0,0 +1,107 @@
+"""
+استخر مدل‌های Whisper در سطح پروسه
+Process-wide Whisper model pool
+
+هر پروسهٔ worker هر اندازهٔ مدل را فقط یک بار بارگذاری می‌کند و همهٔ
+نمونه‌های SpeechProcessorCore از همان مدل استفاده می‌کنند. بارگذاری هر مدل با
+قفل مخصوص همان مدل انجام می‌شود تا درخواست‌های هم‌زمان مدل را دوبار
+بارگذاری نکنند. گرم‌کردن استخر با stt.tasks.warm_up_models انجام می‌شود.
+"""
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import torch
+import whisper
+
+from ..settings import WHISPER_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+MODEL_CONFIGS = {
+    'tiny': {'name': 'tiny', 'vram': 1, 'relative_speed': 39},
+    'base': {'name': 'base', 'vram': 1, 'relative_speed': 16},
+    'small': {'name': 'small', 'vram': 2, 'relative_speed': 6},
+    'medium': {'name': 'medium', 'vram': 5, 'relative_speed': 2},
+    'large': {'name': 'large-v3', 'vram': 10, 'relative_speed': 1},
+}
+
+
+def resolve_device(device: Optional[str] = None) -> str:
+    """تعیین device از تنظیمات (auto یعنی cuda در صورت وجود)"""
+    device = device or WHISPER_SETTINGS['DEVICE']
+    if device == 'auto':
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    return device
+
+
+class WhisperModelPool:
+    """
+    نگهداری مدل‌های بارگذاری‌شده برای کل عمر پروسه
+    """
+
+    def __init__(self, device: Optional[str] = None,
+                 download_root: Optional[str] = None):
+        self.device = resolve_device(device)
+        self.download_root = download_root or WHISPER_SETTINGS['MODEL_CACHE_DIR']
+        self.default_model = WHISPER_SETTINGS['DEFAULT_MODEL']
+        self._models: Dict[str, whisper.Whisper] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, model_size: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(model_size, threading.Lock())
+
+    def is_loaded(self, model_size: str) -> bool:
+        return model_size in self._models
+
+    def loaded_models(self) -> List[str]:
+        return list(self._models)
+
+    def get(self, model_size: str = 'base') -> whisper.Whisper:
+        """
+        مدل آماده؛ در اولین درخواست بارگذاری می‌شود
+
+        در صورت خطا در بارگذاری، مدل پیش‌فرض برگردانده می‌شود.
+        """
+        model = self._models.get(model_size)
+        if model is not None:
+            return model
+
+        with self._lock_for(model_size):
+            model = self._models.get(model_size)
+            if model is not None:
+                return model
+            try:
+                model_name = MODEL_CONFIGS[model_size]['name']
+                logger.info(f"Loading Whisper model: {model_name} on {self.device}")
+                model = whisper.load_model(
+                    model_name,
+                    device=self.device,
+                    download_root=self.download_root
+                )
+                model.eval()
+                self._models[model_size] = model
+                logger.info(f"Model {model_name} loaded successfully")
+                return model
+            except Exception as e:
+                logger.error(f"Error loading model {model_size}: {str(e)}")
+                if model_size == self.default_model:
+                    raise
+
+        # بازگشت به مدل پیش‌فرض (خارج از قفل مدل ناموفق)
+        return self.get(self.default_model)
+
+    def warm_up(self, model_sizes: Iterable[str]) -> List[str]:
+        """بارگذاری پیشاپیش مدل‌ها؛ فهرست مدل‌های آماده برگردانده می‌شود"""
+        for model_size in model_sizes:
+            if model_size in MODEL_CONFIGS:
+                self.get(model_size)
+            else:
+                logger.warning(f"Unknown Whisper model size: {model_size}")
+        return self.loaded_models()
+
+
+# استخر مشترک پروسه
+model_pool = WhisperModelPool()
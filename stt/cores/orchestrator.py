@@ -2,13 +2,16 @@
 هسته Orchestrator برای هماهنگی بین هسته‌های دیگر در STT
 """
 import logging
-from typing import Dict, Any, Optional, Tuple
+from datetime import timedelta
+from itertools import groupby
+from typing import Dict, Any, List, Optional, Tuple
 from django.utils import timezone
 from django.db import transaction
 from celery import shared_task
 import json
 
 from ..models import STTTask, STTQualityControl, STTUsageStats
+from ..settings import ADVANCED_SETTINGS
 from .api_ingress import APIIngressCore
 from .text_processor import TextProcessorCore
 from .speech_processor import SpeechProcessorCore
@@ -52,6 +55,11 @@ class CentralOrchestrator:
             Tuple[bool, Dict]: (موفقیت، نتیجه/خطا)
         """
         try:
+            batch_mode = ADVANCED_SETTINGS['BATCH_MODE']
+            if batch_mode:
+                # نوع محتوا برای پردازش بعدی در صف دسته‌ای نگه داشته می‌شود
+                metadata = dict(metadata or {}, queued_context_type=context_type)
+            
             # ایجاد وظیفه
             task = self._create_task(
                 user, audio_file, language, model_size, metadata
@@ -68,8 +76,9 @@ class CentralOrchestrator:
                 self._update_task_with_result(task, cached_result)
                 return True, self.api_core.prepare_response(task, include_quality_control=True)
             
-            # شروع پردازش async
-            process_stt_task.delay(task.id, context_type)
+            # شروع پردازش async (در حالت دسته‌ای process_stt_batch وظیفه را برمی‌دارد)
+            if not batch_mode:
+                process_stt_task.delay(task.id, context_type)
             
             # پاسخ اولیه
             return True, {
@@ -124,63 +133,202 @@ class CentralOrchestrator:
             
             # پردازش صوت
             self.logger.info(f"Processing audio for task {task.task_id}")
-            audio_result = self.speech_core.process_audio_file(
-                task.audio_file.path,
-                task.language,
-                task.model_used
-            )
+            audio_path = task.audio_file.path
+            if self.speech_core.should_stream(self.speech_core.get_audio_duration(audio_path)):
+                audio_result = self.speech_core.process_audio_file_streaming(
+                    audio_path,
+                    task.language,
+                    task.model_used,
+                    on_segment=lambda partial: self._save_partial_transcription(task, partial)
+                )
+            else:
+                audio_result = self.speech_core.process_audio_file(
+                    audio_path,
+                    task.language,
+                    task.model_used
+                )
             
-            # ذخیره نتیجه اولیه
-            task.transcription = audio_result['transcription']
-            task.confidence_score = audio_result['confidence_score']
-            task.duration = audio_result['duration']
+            self._finalize_task(task, audio_result, context_type)
+            
+            self.logger.info(f"Task {task.task_id} completed successfully")
+            
+        except Exception as e:
+            self.logger.error(f"Error processing task {task_id}: {str(e)}")
+            self._handle_task_failure(task_id, str(e))
+    
+    def _save_partial_transcription(self, task: STTTask, partial: dict):
+        """
+        ذخیرهٔ متن میانی تبدیل جریانی تا وضعیت وظیفه پیش از پایان متن داشته باشد
+        """
+        if partial['text']:
+            task.transcription = f"{task.transcription} {partial['text']}".strip()
+        task.metadata['streamed_segments'] = partial['index'] + 1
+        task.metadata['streamed_until'] = round(partial['end'], 2)
+        task.save(update_fields=['transcription', 'metadata'])
+    
+    def _finalize_task(self, task: STTTask, audio_result: dict, context_type: str = 'general'):
+        """
+        پردازش متن، کنترل کیفیت، کش و آمار پس از تبدیل صوت
+        
+        Args:
+            task: وظیفه در حال پردازش
+            audio_result: خروجی SpeechProcessorCore
+            context_type: نوع محتوا
+        """
+        # ذخیره نتیجه اولیه
+        task.transcription = audio_result['transcription']
+        task.confidence_score = audio_result['confidence_score']
+        task.duration = audio_result['duration']
+        task.save()
+        
+        # پردازش متن
+        self.logger.info(f"Processing text for task {task.task_id}")
+        text_result = self.text_core.process_transcription(
+            audio_result['transcription'],
+            context_type
+        )
+        
+        # کنترل کیفیت
+        quality_control = self._perform_quality_control(
+            task, audio_result, text_result
+        )
+        
+        # به‌روزرسانی نهایی
+        with transaction.atomic():
+            # به‌روزرسانی متن نهایی
+            if quality_control.corrected_transcription:
+                task.transcription = quality_control.corrected_transcription
+            
+            task.status = 'completed'
+            task.completed_at = timezone.now()
             task.save()
             
-            # پردازش متن
-            self.logger.info(f"Processing text for task {task.task_id}")
-            text_result = self.text_core.process_transcription(
-                audio_result['transcription'],
-                context_type
+            # ذخیره در کش
+            audio_hash = self.api_core.calculate_audio_hash(task.audio_file)
+            cache_data = {
+                'transcription': task.transcription,
+                'confidence_score': task.confidence_score,
+                'duration': task.duration,
+                'quality_control': {
+                    'audio_quality_score': quality_control.audio_quality_score,
+                    'needs_human_review': quality_control.needs_human_review,
+                }
+            }
+            self.api_core.cache_result(
+                audio_hash, task.language, task.model_used, cache_data
             )
             
-            # کنترل کیفیت
-            quality_control = self._perform_quality_control(
-                task, audio_result, text_result
+            # به‌روزرسانی آمار
+            self._update_usage_stats(task)
+    
+    def claim_pending_tasks(self, limit: int) -> List[STTTask]:
+        """
+        برداشتن وظایف در انتظار صف برای پردازش دسته‌ای
+        
+        وظایف با skip_locked قفل و به وضعیت processing برده می‌شوند تا
+        workerهای هم‌زمان وظیفهٔ تکراری برندارند.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            tasks = list(
+                STTTask.objects.select_for_update(skip_locked=True)
+                .filter(status='pending')
+                .order_by('created_at')[:limit]
+            )
+            if tasks:
+                STTTask.objects.filter(id__in=[task.id for task in tasks]).update(
+                    status='processing', started_at=now
+                )
+                for task in tasks:
+                    task.status = 'processing'
+                    task.started_at = now
+        return tasks
+    
+    def requeue_stale_tasks(self, timeout_seconds: int, max_requeues: int = 3) -> Dict[str, int]:
+        """
+        بازگرداندن وظایف دسته‌ای رهاشده به صف
+        
+        وظیفه‌ای که claim_pending_tasks برداشته و بیش از timeout_seconds از
+        started_at آن گذشته (worker از کار افتاده) دوباره pending می‌شود؛ پس
+        از max_requeues بار بازگشت، شکست‌خورده ثبت می‌شود.
+        
+        Returns:
+            dict: تعداد وظایف بازگشته به صف و ناموفق
+        """
+        cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+        summary = {'requeued': 0, 'failed': 0}
+        with transaction.atomic():
+            stale = STTTask.objects.select_for_update(skip_locked=True).filter(
+                status='processing',
+                started_at__lt=cutoff,
+                metadata__has_key='queued_context_type'
+            )
+            for task in stale:
+                requeues = task.metadata.get('stale_requeues', 0)
+                if requeues >= max_requeues:
+                    self._handle_task_failure(
+                        task.id, f'پردازش پس از {requeues} بار بازگشت به صف تمام نشد'
+                    )
+                    summary['failed'] += 1
+                    continue
+                task.metadata['stale_requeues'] = requeues + 1
+                task.status = 'pending'
+                task.started_at = None
+                task.save(update_fields=['metadata', 'status', 'started_at'])
+                summary['requeued'] += 1
+        if summary['requeued'] or summary['failed']:
+            self.logger.warning(
+                f"Stale batch tasks: {summary['requeued']} requeued, {summary['failed']} failed"
             )
+        return summary
+    
+    def process_task_batch(self, tasks: List[STTTask]) -> Dict[str, int]:
+        """
+        پردازش دسته‌ای وظایف گروه‌بندی‌شده بر اساس مدل و زبان
+        
+        هر گروه با یک مدل از استخر و حداکثر BATCH_SIZE فایل در هر batch
+        پردازش می‌شود.
+        
+        Args:
+            tasks: وظایف برداشته‌شده با claim_pending_tasks
             
-            # به‌روزرسانی نهایی
-            with transaction.atomic():
-                # به‌روزرسانی متن نهایی
-                if quality_control.corrected_transcription:
-                    task.transcription = quality_control.corrected_transcription
-                
-                task.status = 'completed'
-                task.completed_at = timezone.now()
-                task.save()
-                
-                # ذخیره در کش
-                audio_hash = self.api_core.calculate_audio_hash(task.audio_file)
-                cache_data = {
-                    'transcription': task.transcription,
-                    'confidence_score': task.confidence_score,
-                    'duration': task.duration,
-                    'quality_control': {
-                        'audio_quality_score': quality_control.audio_quality_score,
-                        'needs_human_review': quality_control.needs_human_review,
-                    }
-                }
-                self.api_core.cache_result(
-                    audio_hash, task.language, task.model_used, cache_data
+        Returns:
+            dict: تعداد وظایف موفق و ناموفق
+        """
+        batch_size = max(1, ADVANCED_SETTINGS['BATCH_SIZE'])
+        summary = {'completed': 0, 'failed': 0}
+        
+        def group_key(task):
+            return task.model_used, task.language
+        
+        for (model_size, language), group in groupby(sorted(tasks, key=group_key), key=group_key):
+            group = list(group)
+            for start in range(0, len(group), batch_size):
+                chunk = group[start:start + batch_size]
+                self.logger.info(
+                    f"Processing batch of {len(chunk)} tasks with model {model_size} ({language})"
                 )
+                try:
+                    results = self.speech_core.process_audio_batch(
+                        [task.audio_file.path for task in chunk], language, model_size
+                    )
+                except Exception as e:
+                    results = [e] * len(chunk)
                 
-                # به‌روزرسانی آمار
-                self._update_usage_stats(task)
-            
-            self.logger.info(f"Task {task.task_id} completed successfully")
-            
-        except Exception as e:
-            self.logger.error(f"Error processing task {task_id}: {str(e)}")
-            self._handle_task_failure(task_id, str(e))
+                for task, audio_result in zip(chunk, results):
+                    try:
+                        if isinstance(audio_result, Exception):
+                            raise audio_result
+                        context_type = task.metadata.get('queued_context_type', 'general')
+                        self._finalize_task(task, audio_result, context_type)
+                        summary['completed'] += 1
+                    except Exception as e:
+                        self.logger.error(f"Error processing task {task.id}: {str(e)}")
+                        self._handle_task_failure(task.id, str(e))
+                        summary['failed'] += 1
+        
+        return summary
+
     
     def _perform_quality_control(self, task: STTTask, 
                                audio_result: dict,
@@ -327,6 +475,8 @@ class CentralOrchestrator:
             
             # به‌روزرسانی آمار
             stats.total_requests = F('total_requests') + 1
+            if task.queue_time is not None:
+                stats.total_queue_time = F('total_queue_time') + task.queue_time
             
             if success:
                 stats.successful_requests = F('successful_requests') + 1
@@ -2,19 +2,21 @@
 هسته پردازش صوت برای تبدیل گفتار به متن با استفاده از Whisper
 """
 import logging
-import os
-import tempfile
-from typing import Dict, Tuple, Optional, Any
+from typing import Callable, Dict, Iterator, List, Tuple, Optional, Any
 import whisper
 import numpy as np
 import ffmpeg
-import wave
-import json
-from pathlib import Path
 import torch
 
+from ..settings import ADVANCED_SETTINGS
+from .model_pool import MODEL_CONFIGS, model_pool
+from .streaming import VadSegmenter, stream_transcription
+
 logger = logging.getLogger(__name__)
 
+# فیلترهای پیش‌پردازش (حذف نویز پایه)
+PREPROCESS_FILTERS = 'highpass=f=100,lowpass=f=8000,afftdn=nf=-20'
+
 
 class SpeechProcessorCore:
     """
@@ -29,26 +31,20 @@ class SpeechProcessorCore:
     
     def __init__(self):
         self.logger = logger
-        self.models = {}
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.logger.info(f"Using device: {self.device}")
+        # مدل‌ها در استخر مشترک پروسه نگه داشته می‌شوند، نه در هر نمونه
+        self.pool = model_pool
+        self.device = self.pool.device
         
         # پیکربندی Whisper
-        self.model_configs = {
-            'tiny': {'name': 'tiny', 'vram': 1, 'relative_speed': 39},
-            'base': {'name': 'base', 'vram': 1, 'relative_speed': 16},
-            'small': {'name': 'small', 'vram': 2, 'relative_speed': 6},
-            'medium': {'name': 'medium', 'vram': 5, 'relative_speed': 2},
-            'large': {'name': 'large-v3', 'vram': 10, 'relative_speed': 1},
-        }
+        self.model_configs = MODEL_CONFIGS
         
         # تنظیمات پیش‌فرض
-        self.default_model = 'base'
-        self.sample_rate = 16000  # Whisper needs 16kHz
+        self.default_model = self.pool.default_model
+        self.sample_rate = whisper.audio.SAMPLE_RATE  # Whisper needs 16kHz
         
     def load_model(self, model_size: str = 'base') -> whisper.Whisper:
         """
-        بارگذاری مدل Whisper
+        دریافت مدل Whisper از استخر پروسه
         
         Args:
             model_size: اندازه مدل (tiny, base, small, medium, large)
@@ -56,25 +52,22 @@ class SpeechProcessorCore:
         Returns:
             whisper.Whisper: مدل بارگذاری شده
         """
-        if model_size not in self.models:
-            try:
-                model_name = self.model_configs[model_size]['name']
-                self.logger.info(f"Loading Whisper model: {model_name}")
-                
-                self.models[model_size] = whisper.load_model(
-                    model_name,
-                    device=self.device
-                )
-                
-                self.logger.info(f"Model {model_name} loaded successfully")
-            except Exception as e:
-                self.logger.error(f"Error loading model {model_size}: {str(e)}")
-                # بازگشت به مدل پیش‌فرض
-                if model_size != self.default_model:
-                    return self.load_model(self.default_model)
-                raise
-        
-        return self.models[model_size]
+        return self.pool.get(model_size)
+    
+    def _transcribe_options(self, language: str) -> Dict[str, Any]:
+        """تنظیمات تبدیل Whisper"""
+        return {
+            'language': language if language != 'auto' else None,
+            'task': 'transcribe',
+            'temperature': 0.0,  # برای نتایج قطعی‌تر
+            'compression_ratio_threshold': 2.4,
+            'logprob_threshold': -1.0,
+            'no_speech_threshold': 0.6,
+            'condition_on_previous_text': True,
+            'initial_prompt': self._get_initial_prompt(language),
+            'word_timestamps': True,
+            'fp16': self.device == 'cuda',
+        }
     
     def process_audio_file(self, audio_file_path: str, language: str = 'fa',
                           model_size: str = 'base') -> Dict[str, Any]:
@@ -90,35 +83,21 @@ class SpeechProcessorCore:
             dict: نتیجه تبدیل شامل متن و اطلاعات اضافی
         """
         try:
+            # رمزگشایی یک‌باره صوت در حافظه
+            audio_data, _ = self._load_audio(audio_file_path)
+            
             # تحلیل کیفیت صوت
-            audio_quality = self._analyze_audio_quality(audio_file_path)
+            audio_quality = self._analyze_audio_quality(audio_file_path, audio_data)
             
-            # پیش‌پردازش صوت
-            processed_audio_path = self._preprocess_audio(audio_file_path)
+            # پیش‌پردازش صوت (بدون فایل موقت)
+            processed_audio = self._preprocess_audio(audio_data)
             
             # بارگذاری مدل
             model = self.load_model(model_size)
             
-            # تنظیمات تبدیل
-            options = {
-                'language': language if language != 'auto' else None,
-                'task': 'transcribe',
-                'temperature': 0.0,  # برای نتایج قطعی‌تر
-                'compression_ratio_threshold': 2.4,
-                'logprob_threshold': -1.0,
-                'no_speech_threshold': 0.6,
-                'condition_on_previous_text': True,
-                'initial_prompt': self._get_initial_prompt(language),
-                'word_timestamps': True,
-            }
-            
             # تبدیل گفتار به متن
             self.logger.info(f"Starting transcription with model {model_size}")
-            result = model.transcribe(processed_audio_path, **options)
-            
-            # پاکسازی فایل موقت
-            if processed_audio_path != audio_file_path:
-                os.remove(processed_audio_path)
+            result = model.transcribe(processed_audio, **self._transcribe_options(language))
             
             # پردازش نتیجه
             processed_result = self._process_transcription_result(result, audio_quality)
@@ -129,35 +108,122 @@ class SpeechProcessorCore:
             self.logger.error(f"Error in process_audio_file: {str(e)}")
             raise
     
-    def _analyze_audio_quality(self, audio_path: str) -> Dict[str, Any]:
+    def process_audio_batch(self, audio_file_paths: List[str], language: str = 'fa',
+                            model_size: str = 'base') -> List[Dict[str, Any]]:
+        """
+        پردازش دسته‌ای چند فایل صوتی با یک مدل و یک زبان
+        
+        کلیپ‌های کوتاه‌تر از یک پنجرهٔ Whisper (۳۰ ثانیه) با هم در یک
+        فراخوانی decode پردازش می‌شوند؛ فایل‌های بلندتر جداگانه با transcribe.
+        خطای هر فایل فقط همان فایل را تحت تأثیر قرار می‌دهد.
+        
+        Args:
+            audio_file_paths: مسیر فایل‌های صوتی
+            language: زبان گفتار
+            model_size: اندازه مدل
+            
+        Returns:
+            list: برای هر فایل نتیجه (مانند process_audio_file) یا Exception
+        """
+        model = self.load_model(model_size)
+        results: List[Any] = [None] * len(audio_file_paths)
+        short_clips = []
+        
+        for index, path in enumerate(audio_file_paths):
+            try:
+                audio_data, _ = self._load_audio(path)
+                audio_quality = self._analyze_audio_quality(path, audio_data)
+                processed_audio = self._preprocess_audio(audio_data)
+                
+                if len(processed_audio) <= whisper.audio.N_SAMPLES:
+                    short_clips.append((index, processed_audio, audio_quality))
+                else:
+                    result = model.transcribe(processed_audio, **self._transcribe_options(language))
+                    results[index] = self._process_transcription_result(result, audio_quality)
+            except Exception as e:
+                self.logger.error(f"Error in batch item {path}: {str(e)}")
+                results[index] = e
+        
+        if short_clips:
+            try:
+                decoded = self._decode_batch(
+                    model, [clip for _, clip, _ in short_clips], language
+                )
+                for (index, clip, audio_quality), result in zip(short_clips, decoded):
+                    results[index] = self._process_transcription_result(result, audio_quality)
+            except Exception as e:
+                self.logger.error(f"Error in batch decode: {str(e)}")
+                for index, _, _ in short_clips:
+                    results[index] = e
+        
+        return results
+    
+    def _decode_batch(self, model: whisper.Whisper, clips: List[np.ndarray],
+                      language: str) -> List[Dict[str, Any]]:
+        """
+        decode هم‌زمان چند کلیپ کوتاه در یک batch
+        
+        خروجی به شکل نتیجهٔ transcribe (text, segments, language) است تا
+        پردازش بعدی یکسان بماند.
+        """
+        n_mels = model.dims.n_mels
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(clip), n_mels)
+            for clip in clips
+        ]).to(model.device)
+        
+        options = whisper.DecodingOptions(
+            language=language if language != 'auto' else None,
+            task='transcribe',
+            temperature=0.0,
+            prompt=self._get_initial_prompt(language) or None,
+            without_timestamps=True,
+            fp16=self.device == 'cuda',
+        )
+        with torch.no_grad():
+            decoded = whisper.decode(model, mel, options)
+        
+        results = []
+        for clip, item in zip(clips, decoded):
+            text = item.text.strip()
+            segments = []
+            if text and item.no_speech_prob < 0.6:
+                segments.append({
+                    'start': 0.0,
+                    'end': len(clip) / self.sample_rate,
+                    'text': text,
+                    'avg_logprob': item.avg_logprob,
+                    'no_speech_prob': item.no_speech_prob,
+                })
+            else:
+                text = ''
+            results.append({
+                'text': text,
+                'segments': segments,
+                'language': item.language,
+            })
+        return results
+    
+    def _analyze_audio_quality(self, audio_path: str,
+                               audio_data: Optional[np.ndarray] = None) -> Dict[str, Any]:
         """
         تحلیل کیفیت فایل صوتی
         
         Args:
             audio_path: مسیر فایل صوتی
+            audio_data: صوت رمزگشایی‌شده (در صورت وجود دوباره خوانده نمی‌شود)
             
         Returns:
             dict: اطلاعات کیفیت صوت
         """
         try:
             # اطلاعات پایه با ffprobe
-            probe = ffmpeg.probe(audio_path)
-            audio_stream = next(
-                (stream for stream in probe['streams'] if stream['codec_type'] == 'audio'),
-                None
-            )
-            
-            if not audio_stream:
-                raise ValueError("No audio stream found in file")
-            
-            # استخراج اطلاعات
-            duration = float(probe['format']['duration'])
-            bitrate = int(probe['format']['bit_rate'])
-            sample_rate = int(audio_stream['sample_rate'])
-            channels = audio_stream['channels']
+            info = self._probe_audio(audio_path)
             
             # خواندن داده‌های صوتی برای تحلیل عمیق‌تر
-            audio_data, sr = self._load_audio(audio_path)
+            if audio_data is None:
+                audio_data, _ = self._load_audio(audio_path)
+            sr = self.sample_rate
             
             # محاسبه معیارهای کیفیت
             rms_energy = np.sqrt(np.mean(audio_data**2))
@@ -168,14 +234,11 @@ class SpeechProcessorCore:
             
             # امتیاز کیفیت کلی
             quality_score = self._calculate_audio_quality_score(
-                bitrate, sample_rate, silence_ratio, noise_level
+                info['bitrate'], info['sample_rate'], silence_ratio, noise_level
             )
             
             return {
-                'duration': duration,
-                'bitrate': bitrate,
-                'sample_rate': sample_rate,
-                'channels': channels,
+                **info,
                 'rms_energy': float(rms_energy),
                 'silence_ratio': float(silence_ratio),
                 'noise_level': noise_level,
@@ -190,50 +253,180 @@ class SpeechProcessorCore:
                 'error': str(e)
             }
     
-    def _preprocess_audio(self, audio_path: str) -> str:
+    def _probe_audio(self, audio_path: str) -> Dict[str, Any]:
+        """اطلاعات پایهٔ فایل صوتی با ffprobe"""
+        probe = ffmpeg.probe(audio_path)
+        audio_stream = next(
+            (stream for stream in probe['streams'] if stream['codec_type'] == 'audio'),
+            None
+        )
+        
+        if not audio_stream:
+            raise ValueError("No audio stream found in file")
+        
+        return {
+            'duration': float(probe['format']['duration']),
+            'bitrate': int(probe['format']['bit_rate']),
+            'sample_rate': int(audio_stream['sample_rate']),
+            'channels': audio_stream['channels'],
+        }
+    
+    def get_audio_duration(self, audio_path: str) -> float:
+        """مدت زمان فایل صوتی (۰ در صورت خطا)"""
+        try:
+            return self._probe_audio(audio_path)['duration']
+        except Exception as e:
+            self.logger.error(f"Error probing audio: {str(e)}")
+            return 0.0
+    
+    def should_stream(self, duration: float) -> bool:
+        """آیا فایل باید به‌صورت جریانی پردازش شود؟"""
+        return (
+            ADVANCED_SETTINGS['STREAMING_ENABLED'] and
+            duration >= ADVANCED_SETTINGS['STREAMING_MIN_DURATION']
+        )
+    
+    def _create_segmenter(self) -> VadSegmenter:
+        return VadSegmenter(
+            sample_rate=self.sample_rate,
+            min_silence_ms=ADVANCED_SETTINGS['VAD_MIN_SILENCE_MS'],
+            max_segment_seconds=ADVANCED_SETTINGS['VAD_MAX_SEGMENT_SECONDS'],
+            use_vad=ADVANCED_SETTINGS['USE_VAD'],
+        )
+    
+    def stream_audio_file(self, audio_file_path: str, language: str = 'fa',
+                          model_size: str = 'base',
+                          segmenter: Optional[VadSegmenter] = None) -> Iterator[Dict[str, Any]]:
+        """
+        تبدیل جریانی فایل صوتی طولانی
+        
+        صوت به‌صورت تدریجی رمزگشایی و روی مرزهای گفتار قطعه‌بندی می‌شود؛
+        نتیجهٔ هر قطعه (متن، بخش‌ها و کلمات با زمان نسبت به ابتدای فایل) به
+        ترتیب و به محض آماده‌شدن برگردانده می‌شود.
+        
+        Args:
+            audio_file_path: مسیر فایل صوتی
+            language: زبان گفتار
+            model_size: اندازه مدل
+            segmenter: قطعه‌بند (برای دسترسی به آمار جریان)
+            
+        Yields:
+            dict: نتیجهٔ هر قطعه
+        """
+        options = self._transcribe_options(language)
+        # قطعه‌ها به‌صورت موازی و مستقل تبدیل می‌شوند
+        options['condition_on_previous_text'] = False
+        
+        yield from stream_transcription(
+            audio_file_path,
+            model_size,
+            options,
+            segmenter or self._create_segmenter(),
+            audio_filter=PREPROCESS_FILTERS,
+        )
+    
+    def process_audio_file_streaming(
+        self,
+        audio_file_path: str,
+        language: str = 'fa',
+        model_size: str = 'base',
+        on_segment: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
         """
-        پیش‌پردازش فایل صوتی
+        پردازش جریانی فایل صوتی با خروجی مشابه process_audio_file
         
         Args:
-            audio_path: مسیر فایل ورودی
+            audio_file_path: مسیر فایل صوتی
+            language: زبان گفتار
+            model_size: اندازه مدل
+            on_segment: فراخوانی برای هر قطعهٔ آماده (نتایج میانی)
             
         Returns:
-            str: مسیر فایل پردازش شده
+            dict: نتیجه تبدیل شامل متن و اطلاعات اضافی
         """
         try:
-            # ایجاد فایل موقت
-            temp_file = tempfile.NamedTemporaryFile(
-                suffix='.wav',
-                delete=False
-            )
-            output_path = temp_file.name
-            temp_file.close()
-            
-            # تبدیل به فرمت مناسب برای Whisper
-            stream = ffmpeg.input(audio_path)
-            stream = ffmpeg.output(
-                stream,
-                output_path,
-                acodec='pcm_s16le',
-                ac=1,  # تبدیل به مونو
-                ar=self.sample_rate,  # 16kHz
-                loglevel='error'
-            )
+            segmenter = self._create_segmenter()
+            texts, segments, words = [], [], []
+            detected_language = None
+            
+            self.logger.info(f"Starting streaming transcription with model {model_size}")
+            for partial in self.stream_audio_file(audio_file_path, language, model_size, segmenter):
+                if partial['text']:
+                    texts.append(partial['text'])
+                segments.extend(partial['segments'])
+                words.extend(partial['words'])
+                detected_language = detected_language or partial['language']
+                if on_segment:
+                    on_segment(partial)
+            
+            result = {
+                'text': ' '.join(texts),
+                'segments': segments,
+                'words': words,
+                'language': detected_language or language,
+            }
+            audio_quality = self._analyze_stream_quality(audio_file_path, segmenter)
             
-            # اعمال فیلترهای صوتی
-            stream = stream.global_args(
-                '-af',
-                'highpass=f=100,lowpass=f=8000,afftdn=nf=-20'  # حذف نویز پایه
-            )
+            return self._process_transcription_result(result, audio_quality)
+            
+        except Exception as e:
+            self.logger.error(f"Error in process_audio_file_streaming: {str(e)}")
+            raise
+    
+    def _analyze_stream_quality(self, audio_path: str, segmenter: VadSegmenter) -> Dict[str, Any]:
+        """تحلیل کیفیت از آمار جمع‌آوری‌شدهٔ قطعه‌بند، بدون خواندن دوبارهٔ فایل"""
+        try:
+            info = self._probe_audio(audio_path)
+            total = max(segmenter.total_samples, 1)
+            silence_ratio = segmenter.silent_samples / total
+            noise_level = self._classify_noise_floor(segmenter.noise_floor_level())
             
-            ffmpeg.run(stream, overwrite_output=True)
+            return {
+                **info,
+                'rms_energy': float(np.sqrt(segmenter.sum_squares / total)),
+                'silence_ratio': float(silence_ratio),
+                'noise_level': noise_level,
+                'quality_score': self._calculate_audio_quality_score(
+                    info['bitrate'], info['sample_rate'], silence_ratio, noise_level
+                ),
+            }
+            
+        except Exception as e:
+            self.logger.error(f"Error analyzing audio quality: {str(e)}")
+            return {
+                'duration': segmenter.total_samples / self.sample_rate,
+                'quality_score': 0.5,
+                'error': str(e)
+            }
+    
+    def _preprocess_audio(self, audio_data: np.ndarray) -> np.ndarray:
+        """
+        پیش‌پردازش صوت در حافظه
+        
+        PCM رمزگشایی‌شده از طریق pipe به ffmpeg داده و فیلتر می‌شود؛ فایل
+        موقتی ساخته نمی‌شود.
+        
+        Args:
+            audio_data: صوت مونو 16kHz (float32)
             
-            return output_path
+        Returns:
+            np.ndarray: صوت پردازش شده
+        """
+        try:
+            pcm = (np.clip(audio_data, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+            out, _ = (
+                ffmpeg.input('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar=self.sample_rate)
+                .output('pipe:', format='s16le', acodec='pcm_s16le', ac=1,
+                        ar=self.sample_rate, af=PREPROCESS_FILTERS)
+                .global_args('-loglevel', 'error')
+                .run(input=pcm, capture_stdout=True, capture_stderr=True)
+            )
+            return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
             
         except Exception as e:
             self.logger.error(f"Error preprocessing audio: {str(e)}")
-            # در صورت خطا، فایل اصلی را برگردان
-            return audio_path
+            # در صورت خطا، صوت اصلی را برگردان
+            return audio_data
     
     def _load_audio(self, audio_path: str) -> Tuple[np.ndarray, int]:
         """بارگذاری داده‌های صوتی"""
@@ -279,7 +472,10 @@ class SpeechProcessorCore:
         sorted_energies = sorted(frame_energies)
         noise_floor = np.mean(sorted_energies[:len(sorted_energies)//10])
         
-        # طبقه‌بندی سطح نویز
+        return self._classify_noise_floor(noise_floor)
+    
+    def _classify_noise_floor(self, noise_floor: float) -> str:
+        """طبقه‌بندی سطح نویز"""
         if noise_floor < 0.01:
             return 'low'
         elif noise_floor < 0.03:
@@ -449,7 +645,7 @@ class SpeechProcessorCore:
         estimated_time = (duration / relative_speed) * hardware_factor
         
         # اضافه کردن زمان بارگذاری مدل اگر لود نشده
-        if model_size not in self.models:
+        if not self.pool.is_loaded(model_size):
             estimated_time += 5  # 5 ثانیه برای بارگذاری
         
         return estimated_time
\ No newline at end of file
@@ -0,0 +1,315 @@
+"""
+تبدیل جریانی صوت‌های طولانی با قطعه‌بندی VAD
+Streaming, VAD-segmented transcription
+
+- صوت با ffmpeg به‌صورت بلوک‌های PCM خوانده می‌شود و هیچ‌گاه کامل در حافظه نیست
+- VadSegmenter بلوک‌ها را روی مرز سکوت (یا کم‌انرژی‌ترین فریم در نزدیکی
+  حداکثر طول) به قطعه‌های حداکثر یک پنجرهٔ Whisper تقسیم می‌کند
+- قطعه‌ها در یک process pool دائمی تبدیل می‌شوند؛ تعداد قطعه‌های در جریان
+  محدود است و نتایج به ترتیب و به محض آماده‌شدن برگردانده می‌شوند
+- زمان‌بندی بخش‌ها و کلمات هر قطعه با زمان شروع قطعه جابه‌جا می‌شود
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import ffmpeg
+import numpy as np
+
+from ..segment_worker import init_segment_worker, transcribe_segment
+from ..settings import ADVANCED_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+
+@dataclass
+class AudioSegment:
+    """قطعهٔ گفتار با زمان شروع نسبت به ابتدای فایل"""
+    index: int
+    start: float
+    audio: np.ndarray
+
+    @property
+    def end(self) -> float:
+        return self.start + len(self.audio) / SAMPLE_RATE
+
+
+def iter_pcm_blocks(audio_path: str, sample_rate: int = SAMPLE_RATE,
+                    block_seconds: float = 5.0,
+                    audio_filter: Optional[str] = None) -> Iterator[np.ndarray]:
+    """
+    خواندن تدریجی صوت مونو به‌صورت بلوک‌های float32
+
+    ffmpeg خروجی را در pipe می‌نویسد و هر بار فقط یک بلوک خوانده می‌شود.
+    """
+    output_args = {'format': 's16le', 'acodec': 'pcm_s16le', 'ac': 1, 'ar': sample_rate}
+    if audio_filter:
+        output_args['af'] = audio_filter
+    process = (
+        ffmpeg.input(audio_path)
+        .output('pipe:', **output_args)
+        .global_args('-loglevel', 'error')
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+    block_bytes = int(block_seconds * sample_rate) * 2
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            if len(data) % 2:
+                data = data[:-1]
+            yield np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg decode failed: {stderr.decode(errors='ignore').strip()}")
+
+
+class VadSegmenter:
+    """
+    قطعه‌بندی جریانی بر اساس انرژی فریم‌ها
+
+    آستانهٔ گفتار نسبت به کف نویز (ردیابی حداقل انرژی فریم‌ها) تطبیق داده
+    می‌شود. قطعه وقتی بسته می‌شود که پس از گفتار به اندازهٔ min_silence
+    سکوت دیده شود، یا طول آن به max_segment برسد (برش روی کم‌انرژی‌ترین فریم
+    یک‌سوم پایانی). قطعه‌هایی با گفتار کمتر از min_speech دور ریخته می‌شوند.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, frame_ms: int = FRAME_MS,
+                 min_silence_ms: int = 500, max_segment_seconds: float = 30.0,
+                 min_speech_ms: int = 250, padding_ms: int = 200,
+                 energy_ratio: float = 3.0, min_energy: float = 0.005,
+                 use_vad: bool = True):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_ms / 1000)
+        self.min_silence_frames = max(1, min_silence_ms // frame_ms)
+        self.max_frames = max(1, int(max_segment_seconds * 1000 // frame_ms))
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.padding_frames = max(0, padding_ms // frame_ms)
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.use_vad = use_vad
+
+        self.noise_floor = min_energy / energy_ratio
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._frames: List[np.ndarray] = []
+        self._energies: List[float] = []
+        self._voiced = 0
+        self._silence_run = 0
+        self._start_frame = 0       # شمارهٔ اولین فریم بافر از ابتدای فایل
+        self._next_index = 0
+
+        # آمار کل جریان برای تحلیل کیفیت
+        self.frame_energies: List[np.ndarray] = []
+        self.sum_squares = 0.0
+        self.silent_samples = 0
+        self.total_samples = 0
+
+    def feed(self, block: np.ndarray) -> List[AudioSegment]:
+        """افزودن یک بلوک صوت؛ قطعه‌های کامل‌شده برگردانده می‌شوند"""
+        self.sum_squares += float(np.dot(block, block))
+        self.silent_samples += int(np.count_nonzero(np.abs(block) < 0.01))
+        self.total_samples += len(block)
+
+        data = np.concatenate([self._pending, block]) if len(self._pending) else block
+        usable = len(data) - len(data) % self.frame_size
+        self._pending = data[usable:].copy()
+        if not usable:
+            return []
+
+        frames = data[:usable].reshape(-1, self.frame_size)
+        energies = np.sqrt(np.mean(frames ** 2, axis=1))
+        if not self.frame_energies:
+            # کالیبره‌کردن کف نویز با فریم‌های کم‌انرژی اولین بلوک
+            self.noise_floor = max(self.noise_floor, float(np.percentile(energies, 10)))
+        self.frame_energies.append(energies.astype(np.float32))
+
+        segments = []
+        for frame, energy in zip(frames, energies):
+            segment = self._push(frame, float(energy))
+            if segment is not None:
+                segments.append(segment)
+        return segments
+
+    def flush(self) -> List[AudioSegment]:
+        """بستن آخرین قطعه در پایان جریان"""
+        segments = []
+        if len(self._pending):
+            frame = np.zeros(self.frame_size, dtype=np.float32)
+            frame[:len(self._pending)] = self._pending
+            self._pending = np.zeros(0, dtype=np.float32)
+            segment = self._push(frame, float(np.sqrt(np.mean(frame ** 2))))
+            if segment is not None:
+                segments.append(segment)
+        if self._frames:
+            segment = self._close(len(self._frames))
+            if segment is not None:
+                segments.append(segment)
+        return segments
+
+    def _above_threshold(self, energy: float) -> bool:
+        if not self.use_vad:
+            return True
+        threshold = max(self.min_energy, self.noise_floor * self.energy_ratio)
+        return energy > threshold
+
+    def _push(self, frame: np.ndarray, energy: float) -> Optional[AudioSegment]:
+        voiced = self._above_threshold(energy)
+        # کف نویز سریع پایین می‌آید و کند بالا می‌رود (ردیابی حداقل)؛
+        # هنگام گفتار بسیار کندتر تا نویز ثابتِ بالاتر از min_energy هم یاد گرفته شود
+        if energy < self.noise_floor:
+            self.noise_floor = 0.7 * self.noise_floor + 0.3 * energy
+        elif voiced:
+            self.noise_floor = 0.9998 * self.noise_floor + 0.0002 * energy
+        else:
+            self.noise_floor = 0.98 * self.noise_floor + 0.02 * energy
+
+        self._frames.append(frame)
+        self._energies.append(energy)
+        if voiced:
+            self._voiced += 1
+            self._silence_run = 0
+        else:
+            self._silence_run += 1
+
+        if not self._voiced:
+            # سکوت پیش از گفتار: فقط padding نگه داشته می‌شود
+            excess = len(self._frames) - self.padding_frames
+            if excess > 0:
+                self._drop(excess)
+            return None
+
+        if self._silence_run >= self.min_silence_frames:
+            return self._close(len(self._frames) - self._silence_run + self.padding_frames)
+
+        if len(self._frames) >= self.max_frames:
+            tail_start = len(self._frames) * 2 // 3
+            return self._close(tail_start + int(np.argmin(self._energies[tail_start:])) + 1)
+
+        return None
+
+    def _drop(self, count: int):
+        del self._frames[:count]
+        del self._energies[:count]
+        self._start_frame += count
+
+    def _close(self, cut: int) -> Optional[AudioSegment]:
+        """بستن قطعه تا فریم cut و نگه‌داشتن باقی‌مانده برای قطعهٔ بعد"""
+        cut = min(cut, len(self._frames))
+        voiced = sum(1 for energy in self._energies[:cut] if self._above_threshold(energy))
+        segment = None
+        if voiced >= self.min_speech_frames:
+            segment = AudioSegment(
+                index=self._next_index,
+                start=self._start_frame * self.frame_size / self.sample_rate,
+                audio=np.concatenate(self._frames[:cut]),
+            )
+            self._next_index += 1
+        self._drop(cut)
+
+        # وضعیت باقی‌مانده از فریم‌های آن دوباره محاسبه می‌شود
+        self._voiced = 0
+        self._silence_run = 0
+        for energy in self._energies:
+            if self._above_threshold(energy):
+                self._voiced += 1
+                self._silence_run = 0
+            else:
+                self._silence_run += 1
+        return segment
+
+    def noise_floor_level(self) -> float:
+        """میانگین ۱۰٪ کم‌انرژی‌ترین فریم‌ها (مانند _estimate_noise_level)"""
+        if not self.frame_energies:
+            return 0.0
+        energies = np.sort(np.concatenate(self.frame_energies))
+        return float(np.mean(energies[:max(1, len(energies) // 10)]))
+
+
+_executors: Dict[Tuple[str, str], Tuple[Executor, int]] = {}
+_executors_lock = threading.Lock()
+
+
+def get_segment_executor(model_size: str) -> Tuple[Executor, int]:
+    """
+    pool دائمی تبدیل قطعه‌ها برای یک اندازهٔ مدل
+
+    پروسه‌های daemon (مثل workerهای prefork سلری) نمی‌توانند پروسهٔ فرزند
+    بسازند؛ در این حالت از یک thread استفاده می‌شود، چون مدل Whisper برای
+    فراخوانی هم‌زمان در چند thread امن نیست.
+    """
+    kind = ADVANCED_SETTINGS['STREAMING_EXECUTOR']
+    if kind == 'process' and multiprocessing.current_process().daemon:
+        kind = 'thread'
+
+    with _executors_lock:
+        key = (kind, model_size)
+        if key not in _executors:
+            if kind == 'process':
+                workers = ADVANCED_SETTINGS['STREAMING_WORKERS'] or max(1, (os.cpu_count() or 2) // 2)
+                threads = max(1, (os.cpu_count() or 1) // workers)
+                executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_segment_worker,
+                    initargs=(model_size, threads),
+                )
+            else:
+                workers = 1
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stt-segment')
+            _executors[key] = (executor, workers)
+        return _executors[key]
+
+
+def stream_transcription(audio_path: str, model_size: str, options: Dict[str, Any],
+                         segmenter: VadSegmenter,
+                         audio_filter: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    تبدیل جریانی: نتیجهٔ هر قطعه به ترتیب و به محض آماده‌شدن
+
+    حداکثر دو برابر تعداد پروسه‌ها قطعه در جریان است، پس حافظه مستقل از
+    طول فایل است.
+    """
+    executor, workers = get_segment_executor(model_size)
+    max_in_flight = max(2, workers * 2)
+    in_flight: Deque[Tuple[AudioSegment, Any]] = deque()
+
+    def submit(segment: AudioSegment):
+        future = executor.submit(transcribe_segment, model_size, segment.audio, segment.start, options)
+        in_flight.append((segment, future))
+
+    def collect(segment: AudioSegment, future) -> Dict[str, Any]:
+        result = future.result()
+        result.update({
+            'index': segment.index,
+            'start': segment.start,
+            'end': segment.end,
+        })
+        return result
+
+    try:
+        for block in iter_pcm_blocks(audio_path, segmenter.sample_rate, audio_filter=audio_filter):
+            for segment in segmenter.feed(block):
+                submit(segment)
+                # نتایج آماده‌شده (به ترتیب) فوراً برگردانده می‌شوند
+                while in_flight and (in_flight[0][1].done() or len(in_flight) >= max_in_flight):
+                    yield collect(*in_flight.popleft())
+
+        for segment in segmenter.flush():
+            submit(segment)
+        while in_flight:
+            yield collect(*in_flight.popleft())
+    finally:
+        for _, future in in_flight:
+            future.cancel()
@@ -165,6 +165,13 @@ class STTTask(BaseModel):
             return (self.completed_at - self.started_at).total_seconds()
         return None
     
+    @property
+    def queue_time(self):
+        """زمان انتظار در صف تا شروع پردازش"""
+        if self.created_at and self.started_at:
+            return (self.started_at - self.created_at).total_seconds()
+        return None
+    
     def can_cancel(self):
         """آیا می‌توان وظیفه را لغو کرد؟"""
         return self.status in ['pending', 'processing']
@@ -314,6 +321,11 @@ class STTUsageStats(BaseModel):
         verbose_name='مجموع زمان پردازش (ثانیه)'
     )
     
+    total_queue_time = models.FloatField(
+        default=0,
+        verbose_name='مجموع زمان انتظار در صف (ثانیه)'
+    )
+    
     # کیفیت
     average_confidence_score = models.FloatField(
         null=True,
@@ -333,4 +345,18 @@ class STTUsageStats(BaseModel):
         ]
     
     def __str__(self):
-        return f"STT Stats - {self.user} - {self.date}"
\ No newline at end of file
+        return f"STT Stats - {self.user} - {self.date}"
+    
+    @property
+    def average_queue_latency(self):
+        """میانگین زمان انتظار هر درخواست در صف (ثانیه)"""
+        if self.total_requests:
+            return self.total_queue_time / self.total_requests
+        return 0.0
+    
+    @property
+    def throughput(self):
+        """ثانیه صوت پردازش‌شده به ازای هر ثانیه پردازش"""
+        if self.total_processing_time:
+            return self.total_audio_duration / self.total_processing_time
+        return 0.0
\ No newline at end of file
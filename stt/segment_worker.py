@@ -0,0 +1,66 @@
+"""
+تابع‌های پروسه‌های pool تبدیل قطعه‌ها
+
+پروسه‌های pool با روش spawn ساخته می‌شوند و این ماژول را از نو import
+می‌کنند؛ به همین دلیل بیرون از بستهٔ cores (که مدل‌های جنگو را import
+می‌کند) قرار دارد و جنگو را فقط هنگام نیاز راه‌اندازی می‌کند.
+"""
+from typing import Any, Dict
+
+import numpy as np
+import torch
+
+
+def _ensure_django():
+    from django.apps import apps
+
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def init_segment_worker(model_size: str, threads: int):
+    """گرم‌کردن مدل و محدودکردن threadهای torch در هر پروسهٔ pool"""
+    _ensure_django()
+    if threads:
+        torch.set_num_threads(threads)
+
+    from .cores.model_pool import model_pool
+    model_pool.get(model_size)
+
+
+def shift_transcription(result: Dict[str, Any], offset: float) -> Dict[str, Any]:
+    """جابه‌جایی زمان بخش‌ها و کلمات خروجی Whisper با زمان شروع قطعه"""
+    segments = []
+    words = []
+    for segment in result.get('segments', []):
+        shifted = dict(segment)
+        shifted['start'] = segment['start'] + offset
+        shifted['end'] = segment['end'] + offset
+        shifted_words = []
+        for word in segment.get('words') or []:
+            word = dict(word)
+            word['start'] = word['start'] + offset
+            word['end'] = word['end'] + offset
+            shifted_words.append(word)
+        shifted['words'] = shifted_words
+        words.extend(shifted_words)
+        segments.append(shifted)
+    return {
+        'text': result.get('text', '').strip(),
+        'language': result.get('language'),
+        'segments': segments,
+        'words': words,
+    }
+
+
+def transcribe_segment(model_size: str, audio: np.ndarray, offset: float,
+                       options: Dict[str, Any]) -> Dict[str, Any]:
+    """تبدیل یک قطعه با مدل استخر همین پروسه"""
+    _ensure_django()
+    from .cores.model_pool import model_pool
+
+    model = model_pool.get(model_size)
+    with torch.no_grad():
+        result = model.transcribe(audio, **options)
+    return shift_transcription(result, offset)
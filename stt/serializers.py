@@ -193,6 +193,8 @@ class STTUsageStatsSerializer(serializers.ModelSerializer):
     
     user_full_name = serializers.SerializerMethodField()
     success_rate = serializers.SerializerMethodField()
+    average_queue_latency = serializers.FloatField(read_only=True)
+    throughput = serializers.FloatField(read_only=True)
     
     class Meta:
         model = STTUsageStats
@@ -200,6 +202,7 @@ class STTUsageStatsSerializer(serializers.ModelSerializer):
             'id', 'user', 'user_full_name', 'date',
             'total_requests', 'successful_requests', 'failed_requests',
             'success_rate', 'total_audio_duration', 'total_processing_time',
+            'total_queue_time', 'average_queue_latency', 'throughput',
             'average_confidence_score', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
@@ -18,6 +18,14 @@ WHISPER_SETTINGS = {
     
     # Device (cuda/cpu)
     'DEVICE': getattr(settings, 'STT_DEVICE', 'auto'),  # auto will check CUDA availability
+    
+    # مدل‌هایی که هنگام شروع هر پروسهٔ worker بارگذاری می‌شوند
+    'WARM_UP_MODELS': getattr(settings, 'STT_WARM_UP_MODELS', [
+        getattr(settings, 'STT_DEFAULT_MODEL', 'base')
+    ]),
+    
+    # گرم‌کردن استخر مدل در worker_process_init (برای workerهای اختصاصی صف STT)
+    'WARM_UP_ON_WORKER_START': getattr(settings, 'STT_WARM_UP_ON_WORKER_START', False),
 }
 
 # تنظیمات فایل صوتی
@@ -192,7 +200,23 @@ ADVANCED_SETTINGS = {
     'PREFER_GPU': getattr(settings, 'STT_PREFER_GPU', True),
     
     # Batch processing
-    'BATCH_SIZE': getattr(settings, 'STT_BATCH_SIZE', 1),
+    # در حالت دسته‌ای وظایف در صف می‌مانند و process_stt_batch آن‌ها را
+    # بر اساس مدل و زبان گروه‌بندی و پردازش می‌کند
+    'BATCH_MODE': getattr(settings, 'STT_BATCH_MODE', False),
+    'BATCH_SIZE': getattr(settings, 'STT_BATCH_SIZE', 8),
+    'BATCH_MAX_TASKS': getattr(settings, 'STT_BATCH_MAX_TASKS', 64),
+    # وظیفهٔ برداشته‌شده‌ای که worker آن از کار افتاده پس از این مدت (ثانیه)
+    # به صف برمی‌گردد؛ پس از BATCH_MAX_REQUEUES بار، شکست‌خورده ثبت می‌شود
+    'BATCH_CLAIM_TIMEOUT': getattr(settings, 'STT_BATCH_CLAIM_TIMEOUT', 1800),
+    'BATCH_MAX_REQUEUES': getattr(settings, 'STT_BATCH_MAX_REQUEUES', 3),
+    
+    # تبدیل جریانی فایل‌های طولانی (قطعه‌بندی VAD و process pool)
+    'STREAMING_ENABLED': getattr(settings, 'STT_STREAMING_ENABLED', True),
+    'STREAMING_MIN_DURATION': getattr(settings, 'STT_STREAMING_MIN_DURATION', 120),  # ثانیه
+    'STREAMING_EXECUTOR': getattr(settings, 'STT_STREAMING_EXECUTOR', 'process'),  # process/thread
+    'STREAMING_WORKERS': getattr(settings, 'STT_STREAMING_WORKERS', None),  # None: نصف هسته‌ها
+    'VAD_MIN_SILENCE_MS': getattr(settings, 'STT_VAD_MIN_SILENCE_MS', 500),
+    'VAD_MAX_SEGMENT_SECONDS': getattr(settings, 'STT_VAD_MAX_SEGMENT_SECONDS', 30),
 }
 
 # تنظیمات مانیتورینگ
@@ -2,6 +2,7 @@
 وظایف Celery برای پردازش async
 """
 from celery import shared_task
+from celery.signals import worker_process_init
 from celery.utils.log import get_task_logger
 from django.core.cache import cache
 from django.utils import timezone
@@ -95,13 +96,49 @@ def cleanup_old_tasks(days: int = 30):
         logger.error(f"Error in cleanup_old_tasks: {str(e)}")
 
 
+@shared_task
+def process_stt_batch(max_tasks: int = None):
+    """
+    پردازش دسته‌ای وظایف در انتظار (حالت STT_BATCH_MODE)
+    
+    وظایف pending برداشته، بر اساس مدل و زبان گروه‌بندی و با مدل‌های
+    استخر همین worker پردازش می‌شوند. وظایفی که worker قبلی پیش از اتمام
+    رها کرده، ابتدا به صف برگردانده می‌شوند.
+    
+    Args:
+        max_tasks: حداکثر وظایف برداشته‌شده در هر اجرا
+    """
+    try:
+        from .settings import ADVANCED_SETTINGS
+        
+        orchestrator = CentralOrchestrator()
+        orchestrator.requeue_stale_tasks(
+            ADVANCED_SETTINGS['BATCH_CLAIM_TIMEOUT'],
+            ADVANCED_SETTINGS['BATCH_MAX_REQUEUES']
+        )
+        tasks = orchestrator.claim_pending_tasks(
+            max_tasks or ADVANCED_SETTINGS['BATCH_MAX_TASKS']
+        )
+        if not tasks:
+            return {'completed': 0, 'failed': 0}
+        
+        summary = orchestrator.process_task_batch(tasks)
+        logger.info(
+            f"Batch processed: {summary['completed']} completed, {summary['failed']} failed"
+        )
+        return summary
+        
+    except Exception as e:
+        logger.error(f"Error in process_stt_batch: {str(e)}")
+
+
 @shared_task
 def update_daily_statistics():
     """
     به‌روزرسانی آمار روزانه
     """
     try:
-        from django.db.models import Count, Avg, Sum, Q
+        from django.db.models import Count, Avg, Sum, Q, F, DurationField
         from django.contrib.auth import get_user_model
         
         User = get_user_model()
@@ -127,7 +164,14 @@ def update_daily_statistics():
                     successful=Count('id', filter=Q(status='completed')),
                     failed=Count('id', filter=Q(status='failed')),
                     total_duration=Sum('duration'),
-                    total_processing=Sum('processing_time'),
+                    total_processing=Sum(
+                        F('completed_at') - F('started_at'),
+                        output_field=DurationField()
+                    ),
+                    total_queue=Sum(
+                        F('started_at') - F('created_at'),
+                        output_field=DurationField()
+                    ),
                     avg_confidence=Avg('confidence_score')
                 )
                 
@@ -140,7 +184,14 @@ def update_daily_statistics():
                         'successful_requests': stats['successful'] or 0,
                         'failed_requests': stats['failed'] or 0,
                         'total_audio_duration': stats['total_duration'] or 0,
-                        'total_processing_time': stats['total_processing'] or 0,
+                        'total_processing_time': (
+                            stats['total_processing'].total_seconds()
+                            if stats['total_processing'] else 0
+                        ),
+                        'total_queue_time': (
+                            stats['total_queue'].total_seconds()
+                            if stats['total_queue'] else 0
+                        ),
                         'average_confidence_score': stats['avg_confidence'],
                     }
                 )
@@ -188,28 +239,38 @@ def check_pending_reviews():
 
 
 @shared_task
-def warm_up_models():
+def warm_up_models(model_sizes=None):
     """
-    بارگذاری مدل‌های Whisper برای آماده‌سازی
+    بارگذاری مدل‌های Whisper در استخر همین پروسه
+    
+    Args:
+        model_sizes: اندازه مدل‌ها (پیش‌فرض: STT_WARM_UP_MODELS)
     """
     try:
-        from .cores.speech_processor import SpeechProcessorCore
+        from .cores.model_pool import model_pool
         from .settings import WHISPER_SETTINGS
         
-        processor = SpeechProcessorCore()
-        
-        # بارگذاری مدل پیش‌فرض
-        default_model = WHISPER_SETTINGS['DEFAULT_MODEL']
-        logger.info(f"Warming up default model: {default_model}")
+        model_sizes = model_sizes or WHISPER_SETTINGS['WARM_UP_MODELS']
+        logger.info(f"Warming up models: {', '.join(model_sizes)}")
         
-        processor.load_model(default_model)
+        loaded = model_pool.warm_up(model_sizes)
         
-        logger.info("Model warm-up completed")
+        logger.info(f"Model warm-up completed. Loaded: {', '.join(loaded)}")
+        return loaded
         
     except Exception as e:
         logger.error(f"Error in warm_up_models: {str(e)}")
 
 
+@worker_process_init.connect
+def warm_up_worker_model_pool(**kwargs):
+    """گرم‌کردن استخر مدل هر پروسهٔ worker هنگام شروع"""
+    from .settings import WHISPER_SETTINGS
+    
+    if WHISPER_SETTINGS['WARM_UP_ON_WORKER_START']:
+        warm_up_models()
+
+
 @shared_task
 def analyze_audio_quality_trends():
     """
@@ -0,0 +1,151 @@
+"""
+تست‌های استخر مدل و پردازش دسته‌ای صف STT
+"""
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from ..cores import model_pool as pool_module
+from ..cores import orchestrator as orchestrator_module
+from ..cores.orchestrator import CentralOrchestrator
+from ..models import STTTask
+
+User = get_user_model()
+
+
+class WhisperModelPoolTest(SimpleTestCase):
+    """تست استخر مدل‌های Whisper (بدون بارگذاری واقعی مدل)"""
+    
+    def setUp(self):
+        self.pool = pool_module.WhisperModelPool(device='cpu', download_root='/tmp')
+    
+    def test_reuses_one_model_per_size(self):
+        """تست بارگذاری هر اندازهٔ مدل فقط یک بار"""
+        with mock.patch.object(pool_module.whisper, 'load_model') as load_model:
+            load_model.side_effect = lambda name, **kwargs: mock.MagicMock(name=name)
+            base = self.pool.get('base')
+            self.assertIs(self.pool.get('base'), base)
+            small = self.pool.get('small')
+        
+        self.assertIsNot(small, base)
+        self.assertEqual([c.args[0] for c in load_model.call_args_list], ['base', 'small'])
+        self.assertEqual(sorted(self.pool.loaded_models()), ['base', 'small'])
+    
+    def test_loads_are_locked_per_size(self):
+        """تست اینکه بارگذاری یک مدل فقط درخواست‌های همان اندازه را منتظر می‌گذارد"""
+        small_started = threading.Event()
+        release = threading.Event()
+        
+        def load(name, **kwargs):
+            if name == 'small':
+                small_started.set()
+                release.wait(5)
+            return mock.MagicMock(name=name)
+        
+        results = []
+        with mock.patch.object(pool_module.whisper, 'load_model', side_effect=load) as load_model:
+            threads = [
+                threading.Thread(target=lambda: results.append(self.pool.get('small')))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            self.assertTrue(small_started.wait(5))
+            # مدل base در حین بارگذاری small آماده می‌شود
+            self.pool.get('base')
+            release.set()
+            for thread in threads:
+                thread.join(5)
+        
+        self.assertEqual(len(results), 2)
+        self.assertIs(results[0], results[1])
+        self.assertEqual(sorted(c.args[0] for c in load_model.call_args_list), ['base', 'small'])
+
+
+class BatchProcessingTest(TestCase):
+    """تست برداشت و پردازش دسته‌ای وظایف صف"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='09123456789',
+            password='testpass123',
+            user_type='patient'
+        )
+        self.orchestrator = CentralOrchestrator()
+        self.orchestrator.speech_core = mock.MagicMock()
+    
+    def _create_task(self, model_size='base', language='fa'):
+        return STTTask.objects.create(
+            user=self.user,
+            user_type='patient',
+            audio_file=ContentFile(b'fake audio content', 'test.mp3'),
+            file_size=18,
+            language=language,
+            model_used=model_size,
+            metadata={'queued_context_type': 'general'}
+        )
+    
+    def test_batch_groups_tasks_by_model_and_language(self):
+        """تست یک decode برای هر گروه (مدل، زبان) با حداکثر BATCH_SIZE فایل"""
+        tasks = [self._create_task('base', 'fa') for _ in range(3)]
+        tasks += [self._create_task('small', 'fa'), self._create_task('base', 'en')]
+        self.orchestrator.speech_core.process_audio_batch.side_effect = (
+            lambda paths, language, model_size: [{'transcription': 'متن'}] * len(paths)
+        )
+        
+        with mock.patch.dict(orchestrator_module.ADVANCED_SETTINGS, {'BATCH_SIZE': 2}), \
+                mock.patch.object(self.orchestrator, '_finalize_task') as finalize:
+            summary = self.orchestrator.process_task_batch(tasks)
+        
+        calls = [
+            (len(c.args[0]), c.args[1], c.args[2])
+            for c in self.orchestrator.speech_core.process_audio_batch.call_args_list
+        ]
+        self.assertEqual(calls, [(1, 'en', 'base'), (2, 'fa', 'base'), (1, 'fa', 'base'), (1, 'fa', 'small')])
+        self.assertEqual(summary, {'completed': 5, 'failed': 0})
+        self.assertEqual(finalize.call_count, 5)
+    
+    def test_batch_partial_failure_only_fails_that_task(self):
+        """تست اینکه خطای یک فایل فقط همان وظیفه را ناموفق می‌کند"""
+        ok_task, bad_task = self._create_task(), self._create_task()
+        self.orchestrator.speech_core.process_audio_batch.return_value = [
+            {'transcription': 'متن'}, RuntimeError('decode failed')
+        ]
+        
+        with mock.patch.object(self.orchestrator, '_finalize_task') as finalize:
+            summary = self.orchestrator.process_task_batch([ok_task, bad_task])
+        
+        self.assertEqual(summary, {'completed': 1, 'failed': 1})
+        finalize.assert_called_once()
+        self.assertEqual(finalize.call_args.args[0], ok_task)
+        bad_task.refresh_from_db()
+        self.assertEqual(bad_task.status, 'failed')
+        self.assertEqual(bad_task.error_message, 'decode failed')
+    
+    def test_stale_claims_requeued_then_failed(self):
+        """تست بازگشت وظایف رهاشده به صف و شکست پس از سقف بازگشت"""
+        stale = self._create_task()
+        self.assertEqual(self.orchestrator.claim_pending_tasks(10), [stale])
+        STTTask.objects.filter(pk=stale.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        fresh = self._create_task()
+        self.orchestrator.claim_pending_tasks(10)
+        
+        summary = self.orchestrator.requeue_stale_tasks(600, max_requeues=1)
+        self.assertEqual(summary, {'requeued': 1, 'failed': 0})
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, 'pending')
+        self.assertIsNone(stale.started_at)
+        self.assertEqual(fresh.status, 'processing')
+        
+        self.assertEqual(self.orchestrator.claim_pending_tasks(10), [stale])
+        STTTask.objects.filter(pk=stale.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        summary = self.orchestrator.requeue_stale_tasks(600, max_requeues=1)
+        self.assertEqual(summary, {'requeued': 0, 'failed': 1})
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
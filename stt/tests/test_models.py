@@ -297,4 +297,22 @@ class STTUsageStatsModelTest(TestCase):
         
         # بررسی جمع درخواست‌ها
         total = stats.successful_requests + stats.failed_requests
-        self.assertEqual(total, stats.total_requests)
\ No newline at end of file
+        self.assertEqual(total, stats.total_requests)
+    
+    def test_queue_latency_and_throughput(self):
+        """تست میانگین انتظار در صف و توان پردازش"""
+        stats = STTUsageStats.objects.create(
+            user=self.user,
+            date=self.today,
+            total_requests=4,
+            total_audio_duration=120.0,
+            total_processing_time=30.0,
+            total_queue_time=10.0
+        )
+        
+        self.assertEqual(stats.average_queue_latency, 2.5)
+        self.assertEqual(stats.throughput, 4.0)
+        
+        empty = STTUsageStats(user=self.user, date=self.today)
+        self.assertEqual(empty.average_queue_latency, 0.0)
+        self.assertEqual(empty.throughput, 0.0)
\ No newline at end of file
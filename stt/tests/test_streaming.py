@@ -0,0 +1,74 @@
+"""
+تست‌های قطعه‌بندی جریانی صوت
+"""
+from django.test import SimpleTestCase
+import numpy as np
+
+from ..cores.streaming import VadSegmenter
+from ..segment_worker import shift_transcription
+
+SAMPLE_RATE = 16000
+
+
+class VadSegmenterTest(SimpleTestCase):
+    """تست قطعه‌بندی VAD"""
+    
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+    
+    def _noise(self, seconds, level=0.002):
+        return (level * self.rng.standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+    
+    def _speech(self, seconds):
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        envelope = np.clip(np.sin(2 * np.pi * 2 * t), 0, None) ** 0.5
+        return (0.3 * envelope * np.sin(2 * np.pi * 220 * t)).astype(np.float32) + self._noise(seconds)
+    
+    def _segment(self, audio, **kwargs):
+        segmenter = VadSegmenter(**kwargs)
+        segments = []
+        for start in range(0, len(audio), SAMPLE_RATE * 5):
+            segments.extend(segmenter.feed(audio[start:start + SAMPLE_RATE * 5]))
+        segments.extend(segmenter.flush())
+        return segments
+    
+    def test_splits_on_silence(self):
+        """تست برش روی سکوت و حذف سکوت‌های بین گفتار"""
+        audio = np.concatenate([
+            self._noise(1), self._speech(2), self._noise(1), self._speech(3), self._noise(2)
+        ])
+        segments = self._segment(audio)
+        
+        self.assertEqual(len(segments), 2)
+        self.assertAlmostEqual(segments[0].start, 0.8, delta=0.1)
+        self.assertAlmostEqual(segments[1].start, 3.8, delta=0.1)
+        self.assertLess(segments[0].end, segments[1].start)
+    
+    def test_long_speech_bounded_by_max_segment(self):
+        """تست محدود بودن طول هر قطعه به پنجره Whisper"""
+        audio = np.concatenate([self._speech(75), self._noise(1)])
+        segments = self._segment(audio, max_segment_seconds=30)
+        
+        self.assertGreaterEqual(len(segments), 3)
+        for segment in segments:
+            self.assertLessEqual(segment.end - segment.start, 30.0)
+        # قطعه‌ها پشت سر هم و بدون هم‌پوشانی هستند
+        for previous, current in zip(segments, segments[1:]):
+            self.assertAlmostEqual(previous.end, current.start, places=3)
+    
+    def test_shift_transcription_offsets_words(self):
+        """تست جابه‌جایی زمان بخش‌ها و کلمات با شروع قطعه"""
+        result = {
+            'text': ' سلام دکتر ',
+            'language': 'fa',
+            'segments': [{
+                'start': 0.5, 'end': 1.5, 'text': 'سلام دکتر',
+                'words': [{'word': 'سلام', 'start': 0.5, 'end': 0.9, 'probability': 0.9}],
+            }],
+        }
+        shifted = shift_transcription(result, 60.0)
+        
+        self.assertEqual(shifted['text'], 'سلام دکتر')
+        self.assertEqual(shifted['segments'][0]['start'], 60.5)
+        self.assertEqual(shifted['words'][0]['end'], 60.9)
+        self.assertEqual(result['segments'][0]['start'], 0.5)
@@ -63,7 +63,7 @@ class SymptomAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('اطلاعات اصلی', {
-            'fields': ('name', 'name_en', 'category', 'description')
+            'fields': ('name', 'name_en', 'synonyms', 'category', 'description')
         }),
         ('تنظیمات کلینیکی', {
             'fields': ('severity_levels', 'common_locations', 'urgency_score')
@@ -20,6 +20,5 @@ class TriageConfig(AppConfig):
         
         این متد پس از آماده‌شدن رجیستری اپلیکیشن فراخوانی می‌شود و نقطهٔ مناسب برای انجام تنظیمات مرتبط با چرخهٔ اجرای اپ (مانند واردکردن هندلرهای سیگنال، ثبت validation checks یا راه‌اندازی اجزای مرتبط با اپ) است.
         """
-        # می‌توانید سیگنال‌ها را اینجا import کنید
-        # import triage.signals
-        pass
\ No newline at end of file
+        # اتصال سیگنال‌های باطل‌سازی کش علائم
+        from . import signals  # noqa: F401
\ No newline at end of file
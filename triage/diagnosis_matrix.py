@@ -0,0 +1,168 @@
+"""
+ماتریس تنک تشخیص × علامت برای امتیازدهی برداری تشخیص‌های افتراقی
+Sparse diagnosis × symptom weight matrix
+
+همهٔ روابط DiagnosisSymptom تشخیص‌های فعال یک بار به آرایه‌های COO
+(سطر=تشخیص، ستون=علامت، وزن، اجباری) تبدیل می‌شوند. برای هر جلسه بردار شدت
+علائم ساخته می‌شود و همهٔ تشخیص‌ها با یک ضرب ماتریس تنک در بردار
+(``np.bincount`` روی سطرها) امتیاز می‌گیرند؛ هزینه متناسب با تعداد روابط است
+و کوئری‌ای برای هر تشخیص اجرا نمی‌شود.
+
+ماتریس در هر پروسه کش می‌شود و با تغییر تشخیص‌ها یا روابط آن‌ها (شمارندهٔ
+نسخه در کش مشترک) بازسازی می‌شود.
+"""
+
+import threading
+from typing import Any, Dict, List, Mapping, Optional
+
+import numpy as np
+from django.core.cache import cache
+
+from .models import DiagnosisSymptom, DifferentialDiagnosis
+
+DIAGNOSES_VERSION_CACHE_KEY = 'triage:diagnoses:version'
+MAX_CANDIDATES = 10
+MIN_PROBABILITY = 0.1
+
+
+class DiagnosisMatrix:
+    """
+    روابط تشخیص-علامت به‌صورت آرایه‌های numpy به‌همراه جمع وزن‌ها و ماسک علائم اجباری
+    """
+
+    def __init__(self, diagnoses: List[DifferentialDiagnosis], links: List[tuple]):
+        self.diagnoses = diagnoses
+        row_of = {diagnosis.pk: row for row, diagnosis in enumerate(diagnoses)}
+        self.symptom_columns: Dict[Any, int] = {}
+
+        rows, cols, weights, mandatory = [], [], [], []
+        for diagnosis_id, symptom_id, weight, is_mandatory in links:
+            row = row_of.get(diagnosis_id)
+            if row is None:
+                continue
+            col = self.symptom_columns.setdefault(symptom_id, len(self.symptom_columns))
+            rows.append(row)
+            cols.append(col)
+            weights.append(weight)
+            mandatory.append(is_mandatory)
+
+        size = len(diagnoses)
+        self.rows = np.array(rows, dtype=np.int64)
+        self.cols = np.array(cols, dtype=np.int64)
+        self.weights = np.array(weights, dtype=np.float64)
+        self.mandatory = np.array(mandatory, dtype=bool)
+        self.total_weight = np.bincount(self.rows, weights=self.weights, minlength=size)
+        self.mandatory_count = np.bincount(self.rows, weights=self.mandatory, minlength=size)
+        self.urgency = np.array([d.urgency_level for d in diagnoses], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.diagnoses)
+
+    def severity_vector(self, severities: Mapping[Any, float]):
+        """
+        بردار شدت (۰ تا ۱) و بردار حضور روی ستون‌های ماتریس؛
+        علائم بدون رابطه با هیچ تشخیصی نادیده گرفته می‌شوند
+        """
+        vector = np.zeros(len(self.symptom_columns), dtype=np.float64)
+        present = np.zeros(len(self.symptom_columns), dtype=bool)
+        for symptom_id, severity in severities.items():
+            col = self.symptom_columns.get(symptom_id)
+            if col is not None:
+                vector[col] = severity / 10.0
+                present[col] = True
+        return vector, present
+
+    def score(self, severities: Mapping[Any, float]) -> Dict[str, np.ndarray]:
+        """
+        امتیاز همهٔ تشخیص‌ها برای نگاشت symptom_id → شدت (۱ تا ۱۰)
+
+        خروجی: matching (تعداد علائم مطابق)، probability و confidence برای هر سطر
+        """
+        size = len(self.diagnoses)
+        vector, present = self.severity_vector(severities)
+        present = present[self.cols]
+
+        matching = np.bincount(self.rows, weights=present, minlength=size)
+        matched_weight = np.bincount(self.rows, weights=self.weights * vector[self.cols], minlength=size)
+        probability = np.divide(
+            matched_weight, self.total_weight,
+            out=np.zeros(size), where=self.total_weight > 0
+        )
+        np.minimum(probability, 1.0, out=probability)
+
+        mandatory_present = np.bincount(self.rows, weights=self.mandatory & present, minlength=size)
+        ratio = np.divide(
+            mandatory_present, self.mandatory_count,
+            out=np.zeros(size), where=self.mandatory_count > 0
+        )
+        confidence = np.select(
+            [self.mandatory_count == 0, ratio >= 0.8, ratio >= 0.6, ratio >= 0.4, ratio >= 0.2],
+            [3, 5, 4, 3, 2],
+            default=1,
+        )
+        return {'matching': matching.astype(np.int64), 'probability': probability, 'confidence': confidence}
+
+    def rank(
+        self,
+        severities: Mapping[Any, float],
+        limit: int = MAX_CANDIDATES,
+        min_probability: float = MIN_PROBABILITY,
+    ) -> List[Dict[str, Any]]:
+        """
+        همان خروجی _find_differential_diagnoses: ابتدا limit تشخیص با بیشترین علائم
+        مطابق (و سپس اورژانس بالاتر)، سپس فیلتر احتمال و مرتب‌سازی بر اساس احتمال
+        """
+        if not self.diagnoses:
+            return []
+        scores = self.score(severities)
+        matching = scores['matching']
+        candidates = np.flatnonzero(matching > 0)
+        if not len(candidates):
+            return []
+        # lexsort: آخرین کلید، کلید اصلی است؛ ترتیب کاتالوگ برای حالت‌های برابر حفظ می‌شود
+        order = np.lexsort((candidates, -self.urgency[candidates], -matching[candidates]))
+        results = []
+        for row in candidates[order][:limit]:
+            probability = float(scores['probability'][row])
+            if probability > min_probability:
+                results.append({
+                    'diagnosis': self.diagnoses[row],
+                    'probability_score': probability,
+                    'matching_symptoms_count': int(matching[row]),
+                    'confidence_level': int(scores['confidence'][row])
+                })
+        return sorted(results, key=lambda x: x['probability_score'], reverse=True)
+
+
+_matrix: Optional[DiagnosisMatrix] = None
+_matrix_version = None
+_matrix_lock = threading.Lock()
+
+
+def get_diagnoses_version() -> int:
+    return cache.get(DIAGNOSES_VERSION_CACHE_KEY, 0)
+
+
+def bump_diagnoses_version() -> None:
+    """باطل‌کردن ماتریس تشخیص‌ها در همهٔ پروسه‌ها"""
+    try:
+        cache.incr(DIAGNOSES_VERSION_CACHE_KEY)
+    except ValueError:
+        if not cache.add(DIAGNOSES_VERSION_CACHE_KEY, 1, timeout=None):
+            cache.incr(DIAGNOSES_VERSION_CACHE_KEY)
+
+
+def get_diagnosis_matrix() -> DiagnosisMatrix:
+    """ماتریس فعلی؛ در صورت تغییر نسخه با دو کوئری بازسازی می‌شود"""
+    global _matrix, _matrix_version
+    version = get_diagnoses_version()
+    with _matrix_lock:
+        if _matrix is None or version != _matrix_version:
+            diagnoses = list(DifferentialDiagnosis.objects.filter(is_active=True))
+            links = list(
+                DiagnosisSymptom.objects.filter(diagnosis__is_active=True)
+                .values_list('diagnosis_id', 'symptom_id', 'weight', 'is_mandatory')
+            )
+            _matrix = DiagnosisMatrix(diagnoses, links)
+            _matrix_version = version
+        return _matrix
@@ -0,0 +1,165 @@
+"""
+واژه‌نامهٔ درون‌حافظه‌ای علائم
+In-memory symptom lexicon
+
+نام فارسی، نام انگلیسی و مترادف‌های همهٔ علائم فعال یک بار نرمال‌سازی و در یک
+trie در سطح توکن قرار می‌گیرند؛ یافتن همهٔ علائم ذکرشده در متن بیمار یک
+پیمایش روی توکن‌های متن است و به دیتابیس مراجعه نمی‌کند.
+
+واژه‌نامه در هر پروسه کش می‌شود و با تغییر Symptom یا SymptomCategory
+(شمارندهٔ نسخه در کش مشترک) بازسازی می‌شود.
+"""
+
+import re
+import threading
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+
+from .models import Symptom
+
+SYMPTOMS_VERSION_CACHE_KEY = 'triage:symptoms:version'
+FUZZY_MATCH_LIMIT = 3
+
+_PERSIAN_NORMALIZE = str.maketrans({
+    'ي': 'ی',
+    'ى': 'ی',
+    'ك': 'ک',
+    'ة': 'ه',
+    'ۀ': 'ه',
+    'أ': 'ا',
+    'إ': 'ا',
+    '‌': ' ',
+})
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_TERMINAL = ''
+_EZAFE = 'ی'
+
+
+def tokenize(text: str) -> List[str]:
+    """توکن‌های نرمال‌شده (یکسان‌سازی حروف عربی/فارسی، نیم‌فاصله و حروف کوچک)"""
+    tokens = _TOKEN_RE.findall((text or '').translate(_PERSIAN_NORMALIZE).lower())
+    # «ی» جداشده با نیم‌فاصله نشانهٔ اضافه است («قفسه‌ی سینه» = «قفسه سینه»)
+    return [token for token in tokens if token != _EZAFE]
+
+
+def normalize_phrase(text: str) -> str:
+    return ' '.join(tokenize(text))
+
+
+class SymptomLexicon:
+    """
+    trie توکنی از نام‌ها و مترادف‌های علائم فعال
+    """
+
+    def __init__(self, symptoms: List[Symptom]):
+        self.symptoms = symptoms
+        self._trie: Dict[str, dict] = {}
+        self._exact: Dict[str, List[Symptom]] = {}
+        self._search_text: List[str] = []
+
+        for symptom in symptoms:
+            phrases = [symptom.name, symptom.name_en] + [str(s) for s in (symptom.synonyms or [])]
+            for phrase in phrases:
+                tokens = tokenize(phrase)
+                if not tokens:
+                    continue
+                node = self._trie
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                matches = node.setdefault(_TERMINAL, [])
+                if symptom not in matches:
+                    matches.append(symptom)
+            for phrase in (symptom.name, symptom.name_en):
+                key = normalize_phrase(phrase)
+                if key:
+                    self._exact.setdefault(key, []).append(symptom)
+            self._search_text.append(
+                f"{normalize_phrase(symptom.name)}\n{normalize_phrase(symptom.name_en)}"
+            )
+
+    def __len__(self) -> int:
+        return len(self.symptoms)
+
+    def find_mentions(self, text: str) -> List[Symptom]:
+        """
+        همهٔ علائم ذکرشده در متن، به ترتیب ظهور و بدون تکرار
+
+        در هر موقعیت طولانی‌ترین عبارت منطبق انتخاب می‌شود تا مثلاً «درد
+        قفسه سینه» به‌جای «درد» گزارش شود.
+        """
+        tokens = tokenize(text)
+        found: List[Symptom] = []
+        seen = set()
+        i = 0
+        while i < len(tokens):
+            node = self._trie
+            best: Optional[List[Symptom]] = None
+            best_end = i
+            j = i
+            while j < len(tokens):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                j += 1
+                if _TERMINAL in node:
+                    best, best_end = node[_TERMINAL], j
+            if best is None:
+                i += 1
+                continue
+            for symptom in best:
+                if symptom.pk not in seen:
+                    seen.add(symptom.pk)
+                    found.append(symptom)
+            i = best_end
+        return found
+
+    def lookup(self, term: str, limit: int = FUZZY_MATCH_LIMIT) -> List[Symptom]:
+        """
+        تطبیق یک عبارت با نام علائم: ابتدا تطبیق دقیق، سپس شامل‌بودن (حداکثر limit)
+        """
+        key = normalize_phrase(term)
+        if not key:
+            return []
+        exact = self._exact.get(key)
+        if exact:
+            return exact[:1]
+        matches = []
+        for symptom, text in zip(self.symptoms, self._search_text):
+            if key in text:
+                matches.append(symptom)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+
+_lexicon: Optional[SymptomLexicon] = None
+_lexicon_version = None
+_lexicon_lock = threading.Lock()
+
+
+def get_symptoms_version() -> int:
+    return cache.get(SYMPTOMS_VERSION_CACHE_KEY, 0)
+
+
+def bump_symptoms_version() -> None:
+    """باطل‌کردن واژه‌نامه در همهٔ پروسه‌ها"""
+    try:
+        cache.incr(SYMPTOMS_VERSION_CACHE_KEY)
+    except ValueError:
+        if not cache.add(SYMPTOMS_VERSION_CACHE_KEY, 1, timeout=None):
+            cache.incr(SYMPTOMS_VERSION_CACHE_KEY)
+
+
+def get_symptom_lexicon() -> SymptomLexicon:
+    """واژه‌نامهٔ فعلی؛ در صورت تغییر نسخه بازسازی می‌شود"""
+    global _lexicon, _lexicon_version
+    version = get_symptoms_version()
+    with _lexicon_lock:
+        if _lexicon is None or version != _lexicon_version:
+            symptoms = list(
+                Symptom.objects.filter(is_active=True).select_related('category')
+            )
+            _lexicon = SymptomLexicon(symptoms)
+            _lexicon_version = version
+        return _lexicon
@@ -116,6 +116,13 @@ class Symptom(models.Model):
         help_text='محل‌های رایج بروز علامت'
     )
     
+    synonyms = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='مترادف‌ها',
+        help_text='عبارات دیگر (فارسی یا انگلیسی) که بیمار برای این علامت به کار می‌برد'
+    )
+    
     related_symptoms = models.ManyToManyField(
         'self',
         blank=True,
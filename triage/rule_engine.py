@@ -0,0 +1,144 @@
+"""
+موتور کامپایل‌شدهٔ قوانین تریاژ
+Compiled TriageRule engine
+
+شرایط JSON هر قانون فعال یک بار به یک شیء گزاره (CompiledRule) تبدیل می‌شود
+و فهرست قوانین تا تغییر بعدی TriageRule (شمارندهٔ نسخه در کش مشترک) در هر
+پروسه نگه داشته می‌شود. ارزیابی قوانین یک جلسه روی یک RuleContext ساخته‌شده
+از علائم جلسه انجام می‌شود و اقدامات همهٔ قوانین منطبق در حافظه روی جلسه
+اعمال می‌شوند؛ ذخیره بر عهدهٔ فراخوان است.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from django.core.cache import cache
+
+from .models import TriageRule, TriageSession
+
+logger = logging.getLogger(__name__)
+
+TRIAGE_RULES_VERSION_CACHE_KEY = 'triage:rules:version'
+
+
+class RuleContext:
+    """
+    داده‌های مورد نیاز شرایط قوانین که یک بار از علائم جلسه استخراج می‌شوند
+    """
+
+    def __init__(self, session_symptoms):
+        symptoms = list(session_symptoms)
+        self.symptom_names: FrozenSet[str] = frozenset(ss.symptom.name for ss in symptoms)
+        self.max_severity: int = max((ss.severity for ss in symptoms), default=0)
+
+
+class CompiledRule:
+    """
+    یک TriageRule با شرایط و اقدامات از پیش پردازش‌شده
+    """
+
+    def __init__(self, rule: TriageRule):
+        conditions = rule.conditions or {}
+        actions = rule.actions or {}
+
+        self.name = rule.name
+        self.priority = rule.priority
+        self.actions = actions
+
+        required = conditions.get('required_symptoms')
+        self.required_symptoms: Optional[FrozenSet[str]] = (
+            frozenset(required) if required is not None else None
+        )
+        self.min_urgency = conditions.get('min_urgency')
+        self.min_severity = conditions.get('min_severity')
+
+        self.set_urgency = actions.get('set_urgency')
+        self.has_set_urgency = 'set_urgency' in actions
+        self.has_immediate_attention = 'require_immediate_attention' in actions
+        self.immediate_attention = actions.get('require_immediate_attention')
+        self.recommendations = list(actions.get('add_recommendations') or [])
+
+    def matches(self, session: TriageSession, context: RuleContext) -> bool:
+        """ارزیابی شرایط قانون (min_urgency روی وضعیت فعلی جلسه در حافظه)"""
+        if self.required_symptoms is not None and not self.required_symptoms <= context.symptom_names:
+            return False
+        if self.min_urgency is not None and (session.urgency_level or 0) < self.min_urgency:
+            return False
+        if self.min_severity is not None and context.max_severity < self.min_severity:
+            return False
+        return True
+
+    def apply(self, session: TriageSession) -> List[str]:
+        """اعمال اقدامات قانون روی جلسه در حافظه؛ نام فیلدهای تغییرکرده برگردانده می‌شود"""
+        changed = []
+        if self.has_set_urgency:
+            session.urgency_level = self.set_urgency
+            changed.append('urgency_level')
+        if self.has_immediate_attention:
+            session.requires_immediate_attention = self.immediate_attention
+            changed.append('requires_immediate_attention')
+        if self.recommendations:
+            session.recommended_actions.extend(self.recommendations)
+            changed.append('recommended_actions')
+        return changed
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'rule_name': self.name,
+            'actions': self.actions,
+            'priority': self.priority
+        }
+
+
+def evaluate_rules(rules: List[CompiledRule], session: TriageSession, context: RuleContext):
+    """
+    ارزیابی قوانین به ترتیب اولویت و اعمال اقدامات در حافظه
+
+    خروجی: (قوانین اعمال‌شده، مجموعهٔ فیلدهای تغییرکردهٔ جلسه)
+    """
+    applied_rules = []
+    changed_fields = set()
+    for rule in rules:
+        try:
+            if rule.matches(session, context):
+                changed_fields.update(rule.apply(session))
+                applied_rules.append(rule.as_dict())
+        except Exception as e:
+            logger.error(f"خطا در اعمال قانون {rule.name}: {e}")
+    return applied_rules, changed_fields
+
+
+_rules: Optional[List[CompiledRule]] = None
+_rules_version = None
+_rules_lock = threading.Lock()
+
+
+def get_rules_version() -> int:
+    return cache.get(TRIAGE_RULES_VERSION_CACHE_KEY, 0)
+
+
+def bump_rules_version() -> None:
+    """باطل‌کردن قوانین کامپایل‌شده در همهٔ پروسه‌ها"""
+    try:
+        cache.incr(TRIAGE_RULES_VERSION_CACHE_KEY)
+    except ValueError:
+        if not cache.add(TRIAGE_RULES_VERSION_CACHE_KEY, 1, timeout=None):
+            cache.incr(TRIAGE_RULES_VERSION_CACHE_KEY)
+
+
+def get_compiled_rules() -> List[CompiledRule]:
+    """قوانین فعال کامپایل‌شده به ترتیب اولویت؛ در صورت تغییر نسخه بازسازی می‌شوند"""
+    global _rules, _rules_version
+    version = get_rules_version()
+    with _rules_lock:
+        if _rules is None or version != _rules_version:
+            compiled = []
+            for rule in TriageRule.objects.filter(is_active=True).order_by('-priority'):
+                try:
+                    compiled.append(CompiledRule(rule))
+                except Exception as e:
+                    logger.error(f"خطا در کامپایل قانون {rule.name}: {e}")
+            _rules = compiled
+            _rules_version = version
+        return _rules
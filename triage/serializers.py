@@ -64,7 +64,7 @@ class SymptomDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Symptom
         fields = [
-            'id', 'name', 'name_en', 'category', 'category_id',
+            'id', 'name', 'name_en', 'synonyms', 'category', 'category_id',
             'description', 'severity_levels', 'common_locations',
             'related_symptoms', 'urgency_score', 'is_active',
             'created_at', 'updated_at'
@@ -4,22 +4,21 @@ Triage Analysis Services
 """
 
 from typing import Dict, List, Any, Optional, Tuple
-from django.db.models import Q, Count, Avg, Max
+from django.db.models import Avg, Max
 from django.utils import timezone
 from django.core.cache import cache
 import logging
 import json
-import re
 
 from .models import (
     Symptom,
-    DifferentialDiagnosis,
     TriageSession,
     SessionSymptom,
-    SessionDiagnosis,
-    TriageRule,
-    DiagnosisSymptom
+    SessionDiagnosis
 )
+from .diagnosis_matrix import get_diagnosis_matrix
+from .lexicon import get_symptom_lexicon
+from .rule_engine import RuleContext, evaluate_rules, get_compiled_rules
 
 logger = logging.getLogger(__name__)
 
@@ -80,8 +79,8 @@ class TriageAnalysisService:
         تحلیل علائم شناسایی شده در جلسه
         """
         try:
-            # دریافت علائم جلسه
-            session_symptoms = SessionSymptom.objects.filter(session=session)
+            # دریافت علائم جلسه (یک بار، همراه با علامت)
+            session_symptoms = SessionSymptom.objects.filter(session=session).select_related('symptom')
             
             if not session_symptoms.exists():
                 return {'message': 'هیچ علامتی یافت نشد'}
@@ -267,33 +266,8 @@ class TriageAnalysisService:
         """
         استخراج علائم از متن
         """
-        # الگوهای شایع برای علائم
-        symptom_patterns = [
-            r'درد\s+(\w+)',
-            r'(\w+)\s+درد',
-            r'تب\s*(?:دارم|کردم)?',
-            r'سردرد',
-            r'تهوع',
-            r'استفراغ',
-            r'سرگیجه',
-            r'خستگی',
-            r'ضعف'
-        ]
-        
-        symptoms = []
-        text_lower = text.lower()
-        
-        # جستجو در دیتابیس برای تطبیق نام‌ها
-        for word in text.split():
-            word_clean = re.sub(r'[^\w\s]', '', word).strip()
-            if len(word_clean) >= 3:
-                matching_symptoms = Symptom.objects.filter(
-                    Q(name__icontains=word_clean) | Q(name_en__icontains=word_clean),
-                    is_active=True
-                )
-                symptoms.extend(matching_symptoms)
-        
-        return list(set(symptoms))  # حذف تکراری‌ها
+        # یک پیمایش روی متن با واژه‌نامهٔ کش‌شده (بدون کوئری برای هر کلمه)
+        return get_symptom_lexicon().find_mentions(text)
     
     def _calculate_initial_urgency(self, symptoms: List[Symptom]) -> int:
         """
@@ -355,153 +329,37 @@ class TriageAnalysisService:
     def _find_differential_diagnoses(self, session_symptoms) -> List[Dict[str, Any]]:
         """
         پیدا کردن تشخیص‌های افتراقی
-        """
-        symptom_ids = [ss.symptom.id for ss in session_symptoms]
-        
-        # پیدا کردن تشخیص‌هایی که علائم مطابق دارند
-        diagnoses = DifferentialDiagnosis.objects.filter(
-            typical_symptoms__id__in=symptom_ids,
-            is_active=True
-        ).distinct().annotate(
-            matching_symptoms=Count('typical_symptoms', filter=Q(typical_symptoms__id__in=symptom_ids))
-        ).order_by('-matching_symptoms', '-urgency_level')
-        
-        results = []
-        for diagnosis in diagnoses[:10]:  # تا 10 تشخیص اول
-            # محاسبه امتیاز احتمال
-            probability = self._calculate_diagnosis_probability(diagnosis, session_symptoms)
-            
-            if probability > 0.1:  # حداقل 10% احتمال
-                results.append({
-                    'diagnosis': diagnosis,
-                    'probability_score': probability,
-                    'matching_symptoms_count': diagnosis.matching_symptoms,
-                    'confidence_level': self._calculate_diagnosis_confidence(diagnosis, session_symptoms)
-                })
-        
-        return sorted(results, key=lambda x: x['probability_score'], reverse=True)
-    
-    def _calculate_diagnosis_probability(self, diagnosis: DifferentialDiagnosis, session_symptoms) -> float:
-        """
-        محاسبه احتمال تشخیص
-        """
-        total_weight = 0
-        matched_weight = 0
         
-        # وزن کل علائم تشخیص
-        diagnosis_symptoms = DiagnosisSymptom.objects.filter(diagnosis=diagnosis)
-        for ds in diagnosis_symptoms:
-            total_weight += ds.weight
-            
-            # بررسی وجود علامت در جلسه
-            session_symptom = session_symptoms.filter(symptom=ds.symptom).first()
-            if session_symptom:
-                # وزن بر اساس شدت
-                severity_factor = session_symptom.severity / 10.0
-                matched_weight += ds.weight * severity_factor
-        
-        if total_weight == 0:
-            return 0.0
-        
-        return min(matched_weight / total_weight, 1.0)
-    
-    def _calculate_diagnosis_confidence(self, diagnosis: DifferentialDiagnosis, session_symptoms) -> int:
+        بردار شدت علائم جلسه در ماتریس کش‌شدهٔ تشخیص × علامت ضرب می‌شود؛
+        احتمال و سطح اطمینان همهٔ تشخیص‌ها یکجا محاسبه می‌شود.
         """
-        محاسبه سطح اطمینان تشخیص
-        """
-        mandatory_symptoms = DiagnosisSymptom.objects.filter(
-            diagnosis=diagnosis,
-            is_mandatory=True
-        )
-        
-        mandatory_present = 0
-        for ms in mandatory_symptoms:
-            if session_symptoms.filter(symptom=ms.symptom).exists():
-                mandatory_present += 1
+        severities = {}
+        for symptom_id, severity in session_symptoms.values_list('symptom_id', 'severity'):
+            # مانند قبل، اولین ثبت هر علامت ملاک است
+            severities.setdefault(symptom_id, severity)
         
-        if mandatory_symptoms.count() == 0:
-            return 3  # اطمینان متوسط
-        
-        mandatory_ratio = mandatory_present / mandatory_symptoms.count()
-        
-        if mandatory_ratio >= 0.8:
-            return 5  # اطمینان بالا
-        elif mandatory_ratio >= 0.6:
-            return 4
-        elif mandatory_ratio >= 0.4:
-            return 3
-        elif mandatory_ratio >= 0.2:
-            return 2
-        else:
-            return 1  # اطمینان کم
+        return get_diagnosis_matrix().rank(severities)
     
     def _apply_triage_rules(self, session: TriageSession, session_symptoms) -> List[Dict[str, Any]]:
         """
         اعمال قوانین تریاژ
-        """
-        applied_rules = []
-        rules = TriageRule.objects.filter(is_active=True).order_by('-priority')
-        
-        for rule in rules:
-            try:
-                if self._evaluate_rule_conditions(rule, session, session_symptoms):
-                    self._execute_rule_actions(rule, session)
-                    applied_rules.append({
-                        'rule_name': rule.name,
-                        'actions': rule.actions,
-                        'priority': rule.priority
-                    })
-            except Exception as e:
-                logger.error(f"خطا در اعمال قانون {rule.name}: {e}")
         
-        return applied_rules
-    
-    def _evaluate_rule_conditions(self, rule: TriageRule, session: TriageSession, session_symptoms) -> bool:
-        """
-        ارزیابی شرایط قانون
+        قوانین کامپایل‌شده از کش پروسه خوانده می‌شوند، علائم جلسه با یک کوئری
+        بارگذاری می‌شوند و اقدامات همهٔ قوانین منطبق با یک ذخیره ثبت می‌شوند.
         """
-        conditions = rule.conditions
-        
-        # شرایط علائم
-        if 'required_symptoms' in conditions:
-            required = conditions['required_symptoms']
-            present_symptoms = [ss.symptom.name for ss in session_symptoms]
-            if not all(symptom in present_symptoms for symptom in required):
-                return False
+        rules = get_compiled_rules()
+        if not rules:
+            return []
         
-        # شرایط اورژانس
-        if 'min_urgency' in conditions:
-            if session.urgency_level < conditions['min_urgency']:
-                return False
+        if hasattr(session_symptoms, 'query') and not session_symptoms.query.select_related:
+            session_symptoms = session_symptoms.select_related('symptom')
+        context = RuleContext(session_symptoms)
         
-        # شرایط شدت
-        if 'min_severity' in conditions:
-            max_severity = max([ss.severity for ss in session_symptoms], default=0)
-            if max_severity < conditions['min_severity']:
-                return False
+        applied_rules, changed_fields = evaluate_rules(rules, session, context)
+        if changed_fields:
+            session.save(update_fields=sorted(changed_fields))
         
-        return True
-    
-    def _execute_rule_actions(self, rule: TriageRule, session: TriageSession):
-        """
-        اجرای اقدامات قانون
-        """
-        actions = rule.actions
-        
-        # تغییر سطح اورژانس
-        if 'set_urgency' in actions:
-            session.urgency_level = actions['set_urgency']
-        
-        # علامت‌گذاری برای توجه فوری
-        if 'require_immediate_attention' in actions:
-            session.requires_immediate_attention = actions['require_immediate_attention']
-        
-        # افزودن اقدامات توصیه شده
-        if 'add_recommendations' in actions:
-            new_recommendations = actions['add_recommendations']
-            session.recommended_actions.extend(new_recommendations)
-        
-        session.save()
+        return applied_rules
     
     def _detect_session_red_flags(self, session_symptoms) -> List[str]:
         """
@@ -559,28 +417,16 @@ class TriageAnalysisService:
         """
         تطبیق علائم با دیتابیس
         """
+        lexicon = get_symptom_lexicon()
         matched_symptoms = []
         
         for symptom_text in symptoms:
-            # جستجوی دقیق
-            exact_match = Symptom.objects.filter(
-                Q(name__iexact=symptom_text) | Q(name_en__iexact=symptom_text),
-                is_active=True
-            ).first()
-            
-            if exact_match:
-                matched_symptoms.append(exact_match)
-                continue
-            
-            # جستجوی تقریبی
-            fuzzy_matches = Symptom.objects.filter(
-                Q(name__icontains=symptom_text) | Q(name_en__icontains=symptom_text),
-                is_active=True
-            )[:3]  # حداکثر 3 تطبیق
-            
-            matched_symptoms.extend(fuzzy_matches)
+            # تطبیق دقیق و در نبود آن تطبیق تقریبی (حداکثر 3) روی واژه‌نامه
+            for symptom in lexicon.lookup(symptom_text):
+                if symptom not in matched_symptoms:
+                    matched_symptoms.append(symptom)
         
-        return list(set(matched_symptoms))  # حذف تکراری‌ها
+        return matched_symptoms
     
     def _calculate_standalone_urgency(self, symptoms: List[Symptom], severity_scores: Dict[str, int]) -> int:
         """
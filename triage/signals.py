@@ -0,0 +1,44 @@
+"""
+سیگنال‌های اپلیکیشن تریاژ
+باطل‌کردن کش‌های درون‌پروسه‌ای پس از تغییر داده‌های پایه
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .diagnosis_matrix import bump_diagnoses_version
+from .lexicon import bump_symptoms_version
+from .models import DiagnosisSymptom, DifferentialDiagnosis, Symptom, SymptomCategory, TriageRule
+from .rule_engine import bump_rules_version
+
+
+@receiver(post_save, sender=Symptom)
+@receiver(post_delete, sender=Symptom)
+@receiver(post_save, sender=SymptomCategory)
+@receiver(post_delete, sender=SymptomCategory)
+def handle_symptom_changed(sender, instance, **kwargs):
+    """تغییر علائم یا دسته‌ها: بازسازی واژه‌نامهٔ علائم"""
+    bump_symptoms_version()
+
+
+@receiver(post_save, sender=DifferentialDiagnosis)
+@receiver(post_delete, sender=DifferentialDiagnosis)
+@receiver(post_save, sender=DiagnosisSymptom)
+@receiver(post_delete, sender=DiagnosisSymptom)
+def handle_diagnosis_changed(sender, instance, **kwargs):
+    """تغییر تشخیص‌ها یا وزن علائم آن‌ها: بازسازی ماتریس امتیازدهی"""
+    bump_diagnoses_version()
+
+
+@receiver(m2m_changed, sender=DifferentialDiagnosis.typical_symptoms.through)
+def handle_typical_symptoms_changed(sender, instance, action, **kwargs):
+    """add/remove/set/clear روی علائم تشخیص: بدون post_save، پس اینجا باطل می‌شود"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_diagnoses_version()
+
+
+@receiver(post_save, sender=TriageRule)
+@receiver(post_delete, sender=TriageRule)
+def handle_triage_rule_changed(sender, instance, **kwargs):
+    """تغییر قوانین تریاژ: کامپایل دوبارهٔ قوانین"""
+    bump_rules_version()
@@ -197,7 +197,80 @@ class TriageAnalysisServiceTest(TestCase):
         
         # بررسی که علائم استخراج شده‌اند
         self.assertIsInstance(symptoms, list)
-    
+        self.assertIn(self.symptom, symptoms)
+
+    def test_extract_symptoms_uses_cached_lexicon(self):
+        """تست یافتن علائم چندکلمه‌ای و مترادف‌ها بدون کوئری دیتابیس"""
+        chest_pain = Symptom.objects.create(
+            name='درد قفسه سینه', name_en='Chest Pain',
+            synonyms=['سنگینی سینه'],
+            category=self.category, urgency_score=9
+        )
+        self.service._extract_symptoms_from_text('گرم')  # بارگذاری واژه‌نامه
+
+        with self.assertNumQueries(0):
+            symptoms = self.service._extract_symptoms_from_text(
+                'از دیروز تب دارم و درد قفسه‌ی سینه و سنگینی سینه. مرتب خسته‌ام'
+            )
+
+        self.assertEqual(symptoms, [self.symptom, chest_pain])
+        self.assertEqual(self.service._match_symptoms_to_database(['chest pain']), [chest_pain])
+
+    def test_find_differential_diagnoses_with_matrix(self):
+        """تست امتیازدهی برداری تشخیص‌ها با یک کوئری برای علائم جلسه"""
+        cough = Symptom.objects.create(
+            name='سرفه', name_en='Cough',
+            category=self.category, urgency_score=3
+        )
+        DiagnosisSymptom.objects.create(
+            diagnosis=self.diagnosis, symptom=cough, weight=2.0, is_mandatory=True
+        )
+        session = TriageSession.objects.create(
+            patient=self.user,
+            chief_complaint='تب',
+            reported_symptoms=['تب'],
+            status='started'
+        )
+        SessionSymptom.objects.create(session=session, symptom=self.symptom, severity=6)
+        session_symptoms = SessionSymptom.objects.filter(session=session)
+        self.service._find_differential_diagnoses(session_symptoms)  # ساخت ماتریس
+
+        with self.assertNumQueries(1):
+            results = self.service._find_differential_diagnoses(session_symptoms)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['diagnosis'], self.diagnosis)
+        self.assertAlmostEqual(results[0]['probability_score'], 0.3)
+        self.assertEqual(results[0]['matching_symptoms_count'], 1)
+        self.assertEqual(results[0]['confidence_level'], 1)
+
+    def test_matrix_rebuilt_after_m2m_changes(self):
+        """تست باطل شدن ماتریس با add/clear روی علائم تشخیص"""
+        rash = Symptom.objects.create(
+            name='بثورات', name_en='Rash',
+            category=self.category, urgency_score=2
+        )
+        measles = DifferentialDiagnosis.objects.create(
+            name='سرخک', name_en='Measles',
+            urgency_level=3
+        )
+        session = TriageSession.objects.create(
+            patient=self.user,
+            chief_complaint='بثورات',
+            reported_symptoms=['بثورات'],
+            status='started'
+        )
+        SessionSymptom.objects.create(session=session, symptom=rash, severity=5)
+        session_symptoms = SessionSymptom.objects.filter(session=session)
+        self.assertEqual(self.service._find_differential_diagnoses(session_symptoms), [])
+
+        measles.typical_symptoms.add(rash, through_defaults={'weight': 2.0})
+        results = self.service._find_differential_diagnoses(session_symptoms)
+        self.assertEqual([r['diagnosis'] for r in results], [measles])
+
+        measles.typical_symptoms.clear()
+        self.assertEqual(self.service._find_differential_diagnoses(session_symptoms), [])
+
     def test_calculate_initial_urgency(self):
         """تست محاسبه اورژانس اولیه"""
         symptoms = [self.symptom]
@@ -407,4 +480,41 @@ class TriageRuleTest(TestCase):
     def test_rule_str_representation(self):
         """تست نمایش رشته‌ای قانون"""
         expected = f"{self.rule.name} (اولویت: {self.rule.priority})"
-        self.assertEqual(str(self.rule), expected)
\ No newline at end of file
+        self.assertEqual(str(self.rule), expected)
+    
+    def test_apply_rules_single_query_and_save(self):
+        """تست اعمال قوانین کامپایل‌شده با یک کوئری و یک ذخیره"""
+        category = SymptomCategory.objects.create(name='تنفسی', name_en='Respiratory')
+        symptom = Symptom.objects.create(
+            name='تنگی نفس شدید', name_en='Severe dyspnea',
+            category=category, urgency_score=9
+        )
+        TriageRule.objects.create(
+            name='قانون پیگیری',
+            description='توصیهٔ پیگیری برای اورژانس بالا',
+            conditions={'min_urgency': 5},
+            actions={'add_recommendations': ['پیگیری تلفنی']},
+            priority=5,
+            created_by=self.user
+        )
+        session = TriageSession.objects.create(
+            patient=self.user,
+            chief_complaint='تنگی نفس',
+            reported_symptoms=['تنگی نفس شدید'],
+            status='started'
+        )
+        SessionSymptom.objects.create(session=session, symptom=symptom, severity=9)
+        service = TriageAnalysisService()
+        service._apply_triage_rules(session, SessionSymptom.objects.none())  # کامپایل قوانین
+        
+        # یک کوئری برای علائم جلسه و یک UPDATE برای جلسه
+        with self.assertNumQueries(2):
+            applied = service._apply_triage_rules(
+                session, SessionSymptom.objects.filter(session=session)
+            )
+        
+        self.assertEqual([rule['rule_name'] for rule in applied], ['قانون اورژانس تنفسی', 'قانون پیگیری'])
+        session.refresh_from_db()
+        self.assertEqual(session.urgency_level, 5)
+        self.assertTrue(session.requires_immediate_attention)
+        self.assertEqual(session.recommended_actions[-2:], ['مراجعه فوری به اورژانس', 'پیگیری تلفنی'])
\ No newline at end of file
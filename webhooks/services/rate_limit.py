@@ -6,7 +6,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 
-from django.core.cache import cache
+from helssa.rate_limiter import rate_limiter
 
 
 @dataclass
@@ -19,13 +19,13 @@ class RateLimitConfig:
     window_seconds: int
 
 
-def _make_cache_key(identifier: str, window_seconds: int) -> str:
-    return f"webhooks:ratelimit:{identifier}:{window_seconds}"
+def _make_identifier(identifier: str) -> str:
+    return f"webhooks:{identifier}"
 
 
 def allow_request(identifier: str, config: RateLimitConfig) -> bool:
     """
-    بررسی مجوز درخواست با استفاده از cache increment
+    بررسی مجوز درخواست با محدودکنندهٔ پنجرهٔ لغزان مشترک (شمارنده‌های اتمیک کش)
 
     Args:
         identifier: شناسه یکتا برای کلاینت (مثلا IP یا کلید ارائه‌دهنده)
@@ -34,11 +34,5 @@ def allow_request(identifier: str, config: RateLimitConfig) -> bool:
     Returns:
         bool: آیا مجاز است یا خیر
     """
-    cache_key = _make_cache_key(identifier, config.window_seconds)
-    try:
-        current_count = cache.incr(cache_key)
-    except ValueError:
-        cache.add(cache_key, 1, config.window_seconds)
-        current_count = 1
-
-    return current_count <= config.limit
\ No newline at end of file
+    result = rate_limiter.hit(_make_identifier(identifier), config.limit, config.window_seconds)
+    return result.allowed
@@ -23,4 +23,32 @@ class RateLimitTests(TestCase):
         cfg = RateLimitConfig(limit=2, window_seconds=60)
         self.assertTrue(allow_request('client-b', cfg))
         self.assertTrue(allow_request('client-b', cfg))
-        self.assertFalse(allow_request('client-b', cfg))
\ No newline at end of file
+        self.assertFalse(allow_request('client-b', cfg))
+
+    def test_sliding_window_weights_previous_window(self):
+        from helssa.rate_limiter import SlidingWindowRateLimiter
+
+        limiter = SlidingWindowRateLimiter(key_prefix='test')
+        start = 600.0
+        for i in range(4):
+            self.assertTrue(limiter.hit('client-c', 4, 60, now=start + i).allowed)
+        blocked = limiter.hit('client-c', 4, 60, now=start + 5)
+        self.assertFalse(blocked.allowed)
+        self.assertGreater(blocked.retry_after, 0)
+        # نیمهٔ پنجرهٔ بعدی: نصف درخواست‌های پنجرهٔ قبل هنوز شمرده می‌شوند
+        self.assertTrue(limiter.hit('client-c', 4, 60, now=start + 90).allowed)
+        self.assertTrue(limiter.hit('client-c', 4, 60, now=start + 90).allowed)
+        self.assertFalse(limiter.hit('client-c', 4, 60, now=start + 90).allowed)
+
+    def test_retry_after_covers_decay_in_next_window(self):
+        from helssa.rate_limiter import SlidingWindowRateLimiter
+
+        limiter = SlidingWindowRateLimiter(key_prefix='test')
+        start = 600.0
+        for i in range(4):
+            self.assertTrue(limiter.hit('client-d', 4, 60, now=start + i).allowed)
+        blocked = limiter.hit('client-d', 4, 60, now=start + 5)
+        # ۵۵ ثانیه تا پایان پنجره و ۱۵ ثانیه تا رسیدن سهم ۴ درخواست به ۳
+        self.assertEqual(blocked.retry_after, 70)
+        self.assertFalse(limiter.hit('client-d', 4, 60, now=start + 5 + blocked.retry_after - 1).allowed)
+        self.assertTrue(limiter.hit('client-d', 4, 60, now=start + 5 + blocked.retry_after).allowed)